@@ -0,0 +1,288 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Analizador rápido (incremental) de las respuestas SOAP de los webservices"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# pysimplesoap arma el DOM completo (minidom) de la respuesta y luego lo
+# recorre para convertirlo a diccionarios según los tipos del WSDL. Para
+# respuestas grandes (ej. FECAESolicitar con 250 comprobantes) se puede usar
+# este analizador: compila una vez por operación el mapa de campos (tipos de
+# la respuesta en el WSDL) y convierte los valores a medida que recorre el
+# XML (iterparse), devolviendo los mismos diccionarios.
+# Si la respuesta no se ajusta al mapa (SOAP Fault, multiRef, arrayType,
+# etiquetas no declaradas) se usa el camino normal de pysimplesoap.
+#
+# Las solicitudes de las operaciones indicadas en plantillas se arman con
+# los sobres precompilados (ver plantillas_soap).
+#
+# Uso: ws.AnalizadorRapido = True antes de ws.Conectar(...)
+# Comparación: python -m pyafipws.analizador wsdl operacion respuesta.xml
+
+import io
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+
+from pysimplesoap.client import SoapClient, SimpleXMLElement
+from pysimplesoap.helpers import TYPE_UNMARSHAL_FN
+
+from .plantillas_soap import Plantilla, NoCompatible as PlantillaNoCompatible
+
+DEBUG = False
+
+# clases de nodo del mapa compilado:
+VALOR, ESTRUCTURA, LISTA, LISTA_SIMPLE, LISTA_CONTENEDOR = range(5)
+
+VACIO = ('<soap:Envelope xmlns:soap="%s"><soap:Body><%s/></soap:Body>'
+         '</soap:Envelope>')
+
+
+class NoCompatible(Exception):
+    "La respuesta (o el tipo) no se puede analizar con el mapa compilado"
+
+
+def compilar(tipos):
+    "Convierte los tipos de pysimplesoap en un mapa {etiqueta: (clase, fn, mapa)}"
+    if not isinstance(tipos, dict) or None in tipos:
+        raise NoCompatible("tipo no soportado: %r" % (tipos, ))
+    mapa = {}
+    for nombre, tipo in tipos.items():
+        if isinstance(tipo, dict):
+            mapa[nombre] = (ESTRUCTURA, None, compilar(tipo))
+        elif isinstance(tipo, list):
+            if len(tipo) != 1:
+                raise NoCompatible("lista no soportada: %s" % nombre)
+            sub = tipo[0]
+            if isinstance(sub, dict) and len(sub) > 1:
+                # cada aparición de la etiqueta es un elemento de la lista
+                mapa[nombre] = (LISTA, None, compilar(sub))
+            elif isinstance(sub, dict):
+                # la etiqueta contiene los elementos de la lista
+                mapa[nombre] = (LISTA_CONTENEDOR, None, compilar(sub))
+            elif sub is None or isinstance(sub, (list, tuple)):
+                raise NoCompatible("lista no soportada: %s" % nombre)
+            else:
+                mapa[nombre] = (LISTA_SIMPLE, TYPE_UNMARSHAL_FN.get(sub, sub), None)
+        elif tipo is None or isinstance(tipo, tuple):
+            raise NoCompatible("tipo no soportado: %s" % nombre)
+        else:
+            mapa[nombre] = (VALOR, TYPE_UNMARSHAL_FN.get(tipo, tipo), None)
+    return mapa
+
+
+def nombre_local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def convertir(fn, nombre, texto):
+    "Convierte el texto de un valor simple (igual que unmarshall)"
+    if not texto:
+        return None
+    try:
+        return fn(texto)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Tag: %s: %s" % (nombre, e))
+
+
+def analizar(xml, mapa):
+    "Recorre la respuesta SOAP y devuelve (espacio de nombres soap, valores)"
+    # mapa: mapa compilado de los hijos del Body (ej. {'...Response': ...})
+    if isinstance(xml, str):
+        xml = xml.encode("utf8")
+    soap_uri = resultado = None
+    # pila de [clase, mapa o fn de conversión, valor, destino, clave]
+    # (al cerrar la etiqueta, el valor se asigna en destino[clave] o se
+    # agrega a la lista destino si clave es None)
+    pila = []
+    for evento, elem in ElementTree.iterparse(io.BytesIO(xml),
+                                              events=("start", "end")):
+        nombre = nombre_local(elem.tag)
+        if evento == "start":
+            if soap_uri is None:
+                soap_uri = elem.tag[1:].split("}")[0]   # Envelope
+                continue
+            if not pila:
+                if nombre == "Body":
+                    resultado = {}
+                    pila.append([ESTRUCTURA, mapa, resultado, None, None])
+                continue
+            if nombre == "Fault":
+                raise NoCompatible("SOAP Fault")
+            for atributo in elem.attrib:
+                if atributo == "href" or "arrayType" in atributo:
+                    raise NoCompatible("atributo no soportado: %s" % atributo)
+            clase, info, valor = pila[-1][:3]
+            if clase == LISTA_SIMPLE:
+                pila.append([VALOR, info, None, valor, None])
+                continue
+            if clase == LISTA_CONTENEDOR:
+                # cada hijo del contenedor es un elemento de la lista
+                item = {}
+                valor.append(item)
+                valor = item
+            elif clase != ESTRUCTURA:
+                raise NoCompatible("etiqueta no esperada: %s" % nombre)
+            if nombre not in info:
+                raise NoCompatible("etiqueta no declarada: %s" % nombre)
+            clase_hijo, fn, sub = info[nombre]
+            if clase_hijo == VALOR:
+                pila.append([VALOR, fn, None, valor, nombre])
+            elif clase_hijo == ESTRUCTURA:
+                pila.append([ESTRUCTURA, sub, {}, valor, nombre])
+            elif clase_hijo == LISTA:
+                # cada aparición es un elemento (ya agregado a la lista)
+                item = {}
+                valor.setdefault(nombre, []).append(item)
+                pila.append([ESTRUCTURA, sub, item, None, None])
+            else:
+                pila.append([clase_hijo, fn or sub, valor.setdefault(nombre, []),
+                             None, None])
+        elif pila:
+            clase, info, valor, destino, clave = pila.pop()
+            if not pila:
+                break           # fin del Body
+            if clase == VALOR:
+                valor = convertir(info, nombre, elem.text)
+            elif clase == ESTRUCTURA and not len(elem):
+                valor = None    # estructura vacía (sin hijos)
+            elif clase in (LISTA_SIMPLE, LISTA_CONTENEDOR) and not len(elem):
+                raise NoCompatible("lista vacía: %s" % nombre)
+            if destino is not None:
+                if clave is None:
+                    destino.append(valor)
+                else:
+                    destino[clave] = valor
+            elem.clear()        # liberar el subárbol ya procesado
+    return soap_uri, resultado
+
+
+class ClienteSOAP(SoapClient):
+    "Cliente SOAP con mapas (respuestas) y plantillas (solicitudes) precompilados"
+
+    def __init__(self, *args, **kwargs):
+        self.analizar = kwargs.pop("analizar", True)
+        operaciones = kwargs.pop("plantillas", ())
+        SoapClient.__init__(self, *args, **kwargs)
+        self.mapas = {}             # operación: mapa compilado (o None)
+        self.mapa_actual = None
+        self.resultado_rapido = self.xml_response_rapido = None
+        # operación: plantilla del sobre (None si no se pudo compilar)
+        self.plantillas = dict.fromkeys(operaciones, False)
+        self.xml_plantilla = None
+
+    def obtener_plantilla(self, method):
+        "Devuelve (y guarda) la plantilla compilada de la solicitud"
+        plantilla = self.plantillas.get(method)
+        if plantilla is False:
+            try:
+                plantilla = Plantilla(self, method)
+            except PlantillaNoCompatible as e:
+                if DEBUG: print("No se compila la plantilla %s: %s" % (method, e))
+                plantilla = None
+            self.plantillas[method] = plantilla
+        return plantilla
+
+    def obtener_mapa(self, method):
+        "Devuelve (y guarda) el mapa compilado de la respuesta de la operación"
+        if method not in self.mapas:
+            try:
+                output = self.get_operation(method)['output']
+                self.mapas[method] = output and compilar(output)
+            except NoCompatible as e:
+                if DEBUG: print("No se compila %s: %s" % (method, e))
+                self.mapas[method] = None
+        return self.mapas[method]
+
+    def wsdl_call_with_args(self, method, args, kwargs):
+        mapa = self.analizar and self.services and self.obtener_mapa(method)
+        if not mapa and method not in self.plantillas:
+            return SoapClient.wsdl_call_with_args(self, method, args, kwargs)
+        self.mapa_actual = mapa or None
+        self.resultado_rapido = None
+        try:
+            resp = SoapClient.wsdl_call_with_args(self, method, args, kwargs)
+        finally:
+            self.mapa_actual = self.xml_plantilla = None
+        if self.resultado_rapido is None:
+            return resp             # se analizó por el camino normal
+        # restauro la respuesta real (para XmlResponse, depuración, etc.)
+        self.xml_response, self.xml_response_rapido = self.xml_response_rapido, None
+        resultado, self.resultado_rapido = self.resultado_rapido, None
+        return resultado and list(resultado.values())[0]
+
+    def wsdl_call_get_params(self, method, input, args, kwargs):
+        plantilla = not args and kwargs and self.obtener_plantilla(method)
+        if plantilla:
+            try:
+                self.xml_plantilla = plantilla.armar(kwargs)
+                # call arma sólo el sobre vacío (se reemplaza en send)
+                return plantilla.metodo, []
+            except PlantillaNoCompatible as e:
+                if DEBUG: print("Plantilla no aplicable:", e)
+        return SoapClient.wsdl_call_get_params(self, method, input, args, kwargs)
+
+    def send(self, method, xml):
+        if self.xml_plantilla is not None:
+            xml = self.xml_request = self.xml_plantilla
+            self.xml_plantilla = None
+        contenido = SoapClient.send(self, method, xml)
+        if self.mapa_actual is None or contenido is None:
+            return contenido
+        try:
+            soap_uri, resultado = analizar(contenido, self.mapa_actual)
+        except (NoCompatible, ElementTree.ParseError) as e:
+            if DEBUG: print("Analizador rápido no aplicable:", e)
+            return contenido
+        self.resultado_rapido = resultado
+        self.xml_response_rapido = contenido
+        # pysimplesoap solo analiza un sobre mínimo (sin datos)
+        return VACIO % (soap_uri, list(self.mapa_actual)[0])
+
+
+def comparar(xml, tipos, repeticiones=10, strict=True):
+    "Mide ambos analizadores sobre la respuesta y verifica que coincidan"
+    mapa = compilar(tipos)
+    t0 = time.perf_counter()
+    for i in range(repeticiones):
+        response = SimpleXMLElement(xml)
+        soap_uri = response.get_namespace_uri(response.get_prefix())
+        esperado = response('Body', ns=soap_uri).children().unmarshall(tipos, strict=strict)
+    t1 = time.perf_counter()
+    for i in range(repeticiones):
+        obtenido = analizar(xml, mapa)[1]
+    t2 = time.perf_counter()
+    return {
+        'iguales': esperado == obtenido,
+        'pysimplesoap': (t1 - t0) / repeticiones,
+        'rapido': (t2 - t1) / repeticiones,
+        }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Uso: %s wsdl operacion respuesta.xml [repeticiones]" % sys.argv[0])
+        sys.exit(1)
+    wsdl, operacion, archivo = sys.argv[1:4]
+    repeticiones = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    client = SoapClient(wsdl=wsdl)
+    tipos = client.get_operation(operacion)['output']
+    with open(archivo, "rb") as f:
+        xml = f.read()
+    res = comparar(xml, tipos, repeticiones)
+    print("Respuestas iguales:", res['iguales'])
+    print("pysimplesoap: %.2f ms  rápido: %.2f ms  (x%.1f)" % (
+          res['pysimplesoap'] * 1000, res['rapido'] * 1000,
+          res['pysimplesoap'] / res['rapido']))
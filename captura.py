@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Captura acotada de solicitudes y respuestas XML para depuración"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# Política de captura de los XML de cada llamada (ver decorador
+# utils.inicializar_y_capturar_excepciones):
+#   Captura(0)      deshabilitada: XmlRequest / XmlResponse quedan vacíos
+#                   y el cliente SOAP no conserva el último mensaje
+#   Captura(N)      últimas N llamadas en memoria (buffer circular)
+#   CapturaDisco    además graba una muestra de las llamadas en una carpeta,
+#                   rotando (borrando) los archivos más antiguos
+# Sin captura configurada (predeterminado) se conserva sólo la última
+# llamada en XmlRequest / XmlResponse, como siempre.
+#
+# Uso:
+#   from pyafipws import captura
+#   captura.activar(captura.CapturaDisco("/var/log/afip", muestra=0.01))
+#   wsfev1.Captura = captura.Captura(0)      # sólo para esta instancia
+
+import collections
+import os
+import random
+import threading
+import time
+
+DEBUG = False
+
+
+def a_bytes(xml):
+    "Devuelve el mensaje como bytes (sin copiar si ya lo es)"
+    if xml is None:
+        return b""
+    if isinstance(xml, str):
+        return xml.encode("utf8")
+    return xml
+
+
+class Captura:
+    "Conserva en memoria las últimas N llamadas (0: deshabilitada)"
+
+    def __init__(self, cantidad=1):
+        self.cantidad = cantidad
+        # (fecha, servicio, método, solicitud, respuesta, falla)
+        self.llamadas = collections.deque(maxlen=cantidad)
+
+    def registrar(self, ws, metodo, falla=None):
+        "Captura la llamada y devuelve (XmlRequest, XmlResponse)"
+        client = ws.client
+        solicitud = a_bytes(client.xml_request)
+        respuesta = a_bytes(client.xml_response)
+        llamada = (time.time(), ws.__class__.__name__, metodo,
+                   solicitud, respuesta, falla)
+        self.guardar(llamada)
+        if not self.cantidad:
+            # no retener los mensajes (ni en el cliente SOAP)
+            client.xml_request = client.xml_response = ""
+            if hasattr(client, "content"):
+                client.content = None
+            return "", ""
+        self.llamadas.append(llamada)
+        return solicitud, respuesta
+
+    def guardar(self, llamada):
+        "Procesa la llamada capturada (ver CapturaDisco)"
+
+    def ultimas(self):
+        "Devuelve la lista de las llamadas capturadas (más antigua primero)"
+        return list(self.llamadas)
+
+
+class CapturaDisco(Captura):
+    "Graba una muestra de las llamadas en archivos (con rotación)"
+
+    SUFIJOS = ("_solicitud.xml", "_respuesta.xml")
+
+    def __init__(self, carpeta, muestra=1.0, maximo=1000, fallas=True,
+                 cantidad=1):
+        Captura.__init__(self, cantidad)
+        self.carpeta = carpeta
+        self.muestra = muestra      # fracción de llamadas a grabar (0 a 1)
+        self.maximo = maximo        # cantidad de llamadas a conservar
+        self.fallas = fallas        # grabar siempre las llamadas con falla
+        self.secuencia = 0
+        self.lock = threading.Lock()
+        if not os.path.isdir(carpeta):
+            os.makedirs(carpeta)
+        # archivos de ejecuciones anteriores (también se rotan)
+        nombres = set()
+        for nombre in os.listdir(carpeta):
+            for sufijo in self.SUFIJOS:
+                if nombre.endswith(sufijo):
+                    nombres.add(nombre[:-len(sufijo)])
+        self.archivos = collections.deque(sorted(nombres))
+
+    def guardar(self, llamada):
+        fecha, servicio, metodo, solicitud, respuesta, falla = llamada
+        if not (falla and self.fallas) and random.random() >= self.muestra:
+            return
+        with self.lock:
+            self.secuencia += 1
+            nombre = "%s_%d_%06d_%s_%s" % (
+                time.strftime("%Y%m%d%H%M%S", time.localtime(fecha)),
+                os.getpid(), self.secuencia, servicio, metodo)
+            try:
+                for sufijo, xml in zip(self.SUFIJOS, (solicitud, respuesta)):
+                    with open(os.path.join(self.carpeta, nombre + sufijo), "wb") as f:
+                        f.write(xml)
+            except (IOError, OSError) as e:
+                # la depuración nunca debe interrumpir la llamada al servicio
+                if DEBUG: print("Error grabando captura:", e)
+                return
+            self.archivos.append(nombre)
+            while len(self.archivos) > self.maximo:
+                self.borrar(self.archivos.popleft())
+
+    def borrar(self, nombre):
+        for sufijo in self.SUFIJOS:
+            try:
+                os.remove(os.path.join(self.carpeta, nombre + sufijo))
+            except OSError:
+                pass
+
+
+def activar(captura):
+    "Establece la política de captura para todos los webservices"
+    from . import utils
+    utils.CAPTURA = captura
+    return captura
+
+
+def desactivar():
+    "Vuelve al comportamiento predeterminado (conservar la última llamada)"
+    from . import utils
+    captura, utils.CAPTURA = utils.CAPTURA, None
+    return captura
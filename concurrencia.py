@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Limitador adaptativo (AIMD) de solicitudes simultáneas por servidor de AFIP"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# Cada servidor (wsfev1, wsmtxca, wslpg, ...) tiene un límite de solicitudes
+# en curso compartido por todas las interfaces del proceso (ej. los hilos de
+# wscdc.constatar_lote o simulador --hilos), que se ajusta como el control de
+# congestión de TCP (aumento aditivo, disminución multiplicativa):
+#   - respuesta con latencia normal y el límite en uso: +1 por "ventana"
+#   - tiempo agotado, error de red o estado HTTP >= 500: límite a la mitad
+#     (a lo sumo una vez por latencia, ante fallas simultáneas)
+#   - respuesta lenta (mayor a tolerancia * latencia base): sin cambios
+# Si se alcanza el límite, las solicitudes esperan turno (sin error); pasada
+# la espera máxima se envían igual (ej. solicitudes colgadas sin timeout).
+# Estado para monitoreo: concurrencia.estados() (y metricas, Prometheus)
+
+import threading
+import time
+
+from .reintentos import RegistroServidores, TransporteHttp
+
+DEBUG = False
+
+
+def estado_http(respuesta):
+    "Devuelve el código de estado HTTP de la respuesta (httplib2 o dict)"
+    estado = getattr(respuesta, "status", None)
+    if estado is None and isinstance(respuesta, dict):
+        estado = respuesta.get("status")
+    try:
+        return int(estado)
+    except (TypeError, ValueError):
+        return 0
+
+
+class Limitador:
+    "Límite de solicitudes simultáneas (aumento aditivo, disminución multiplicativa)"
+
+    def __init__(self, servidor, inicial=4, minimo=1, maximo=64,
+                 tolerancia=2.0, factor=0.5, espera=30):
+        self.servidor = servidor
+        self.limite = float(inicial)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.tolerancia = tolerancia    # latencia "sana": tolerancia * base
+        self.factor = factor            # reducción ante fallas
+        self.espera = espera            # segundos máximos esperando turno
+        self.base = None                # latencia mínima observada (segundos)
+        self.en_curso = 0
+        self.reducciones = 0
+        self.excedidas = 0              # enviadas sin turno (espera agotada)
+        self.ultima_reduccion = 0
+        self.condicion = threading.Condition()
+
+    def adquirir(self):
+        "Espera turno para enviar, devuelve si el límite está en uso"
+        with self.condicion:
+            vencimiento = time.monotonic() + self.espera
+            while self.en_curso >= int(self.limite):
+                restante = vencimiento - time.monotonic()
+                if restante <= 0:
+                    self.excedidas += 1
+                    break
+                self.condicion.wait(restante)
+            self.en_curso += 1
+            return self.en_curso >= int(self.limite)
+
+    def liberar(self, duracion, ok, saturado=True):
+        "Registra el resultado de la solicitud y ajusta el límite"
+        with self.condicion:
+            self.en_curso -= 1
+            ahora = time.monotonic()
+            if not ok:
+                # una sola reducción por latencia (fallas simultáneas)
+                if ahora - self.ultima_reduccion > (self.base or duracion):
+                    self.limite = max(self.minimo, self.limite * self.factor)
+                    self.ultima_reduccion = ahora
+                    self.reducciones += 1
+            else:
+                if self.base is None or duracion < self.base:
+                    self.base = duracion
+                else:
+                    # olvidar lentamente la mínima (cambios de red)
+                    self.base += (duracion - self.base) * 0.01
+                if saturado and duracion <= self.base * self.tolerancia:
+                    self.limite = min(self.maximo,
+                                      self.limite + 1.0 / self.limite)
+            self.condicion.notify_all()
+
+    def resumen(self):
+        "Devuelve el estado (para monitoreo)"
+        return {'limite': int(self.limite), 'en_curso': self.en_curso,
+                'latencia_base': self.base or 0,
+                'reducciones': self.reducciones,
+                'excedidas': self.excedidas}
+
+
+class Limitadores(RegistroServidores):
+    "Registro de los limitadores por servidor (compartido entre instancias)"
+
+    def __init__(self, **opciones):
+        # opciones: ver Limitador
+        RegistroServidores.__init__(self, Limitador, **opciones)
+
+
+class TransporteLimitado(TransporteHttp):
+    "Envoltorio del transporte HTTP del cliente SOAP (limita la concurrencia)"
+
+    def __init__(self, http, limitadores):
+        TransporteHttp.__init__(self, http)
+        self.limitadores = limitadores
+
+    def request(self, uri, *args, **kwargs):
+        limitador = self.limitadores.obtener(uri)
+        saturado = limitador.adquirir()
+        inicio = time.monotonic()
+        ok = False
+        try:
+            respuesta, contenido = self.http.request(uri, *args, **kwargs)
+            ok = estado_http(respuesta) < 500
+            return respuesta, contenido
+        finally:
+            limitador.liberar(time.monotonic() - inicio, ok, saturado)
+
+
+# limitadores predeterminados (ver utils.BaseWS.Conectar)
+LIMITADORES = Limitadores()
+
+
+def estados():
+    "Estado de los limitadores de cada servidor (para monitoreo)"
+    return LIMITADORES.estados()
@@ -22,7 +22,8 @@ __version__ = "1.02h"
 
 import os, sys, traceback
 import base64
-from pysimplesoap.simplexml import SimpleXMLElement
+import tempfile
+from xml.etree import ElementTree
 from io import StringIO
 from .utils import WebClient, FileBufferString
 from datetime import datetime
@@ -37,10 +38,43 @@ URL = "http://cot.test.arba.gov.ar/TransporteBienes/SeguridadCliente/presentarRe
 
 # URL = "https://cot.arba.gov.ar/TransporteBienes/SeguridadCliente/presentarRemitos.do"  # prod.
 
+# orden de los campos de cada tipo de registro del archivo TXT
+CAMPOS = {
+    'HEADER': ['CUIT_EMPRESA'],
+    'REMITO': [
+        'FECHA_EMISION', 'CODIGO_UNICO', 'FECHA_SALIDA_TRANSPORTE', 'HORA_SALIDA_TRANSPORTE',
+        'SUJETO_GENERADOR',
+        'DESTINATARIO_CONSUMIDOR_FINAL', 'DESTINATARIO_TIPO_DOCUMENTO', 'DESTINATARIO_DOCUMENTO',
+        'DESTINATARIO_CUIT',
+        'DESTINATARIO_RAZON_SOCIAL', 'DESTINATARIO_TENEDOR', 'DESTINO_DOMICILIO_CALLE',
+        'DESTINO_DOMICILIO_NUMERO',
+        'DESTINO_DOMICILIO_COMPLE', 'DESTINO_DOMICILIO_PISO', 'DESTINO_DOMICILIO_DTO',
+        'DESTINO_DOMICILIO_BARRIO',
+        'DESTINO_DOMICILIO_CODIGOPOSTAL', 'DESTINO_DOMICILIO_LOCALIDAD', 'DESTINO_DOMICILIO_PROVINCIA',
+        'PROPIO_DESTINO_DOMICILIO_CODIGO', 'ENTREGA_DOMICILIO_ORIGEN', 'ORIGEN_CUIT', 'ORIGEN_RAZON_SOCIAL',
+        'EMISOR_TENEDOR', 'ORIGEN_DOMICILIO_CALLE', 'ORIGEN_DOMICILIO_NUMERO ', 'ORIGEN_DOMICILIO_COMPLE',
+        'ORIGEN_DOMICILIO_PISO', 'ORIGEN_DOMICILIO_DTO', 'ORIGEN_DOMICILIO_BARRIO',
+        'ORIGEN_DOMICILIO_CODIGOPOSTAL',
+        'ORIGEN_DOMICILIO_LOCALIDAD', 'ORIGEN_DOMICILIO_PROVINCIA', 'TRANSPORTISTA_CUIT', 'TIPO_RECORRIDO',
+        'RECORRIDO_LOCALIDAD', 'RECORRIDO_CALLE', 'RECORRIDO_RUTA', 'PATENTE_VEHICULO', 'PATENTE_ACOPLADO',
+        'PRODUCTO_NO_TERM_DEV', 'IMPORTE'],
+    'PRODUCTOS': [
+        'CODIGO_UNICO_PRODUCTO', 'ARBA_CODIGO_UNIDAD_MEDIDA', 'CANTIDAD', 'PROPIO_CODIGO_PRODUCTO',
+        'PROPIO_DESCRIPCION_PRODUCTO', 'PROPIO_DESCRIPCION_UNIDAD_MEDIDA', 'CANTIDAD_AJUSTADA'
+    ],
+    'FOOTER': ['CANTIDAD_TOTAL_REMITOS'],
+    'NOMBREREMITOTXT': ['CUIT_EMPRESA', 'NUM_PLANTA', 'NUM_PUERTA', 'FECHA_EMISION', 'NUM_SECUENCIA']
+}
+
+# campos generales de la respuesta (elementos directos de la raz)
+CAMPOS_RESPUESTA = ['tipoError', 'codigoError', 'mensajeError', 'cuitEmpresa',
+                    'numeroComprobante', 'nombreArchivo', 'codigoIntegridad']
+
 
 class COT:
     "Interfaz para el servicio de Remito Electronico ARBA"
     _public_methods_ = ['Conectar', 'PresentarRemito', 'LeerErrorValidacion',
+                        'GenerarArchivoRemitos',
                         'LeerValidacionRemito',
                         'AnalizarXml', 'ObtenerTagXml']
     _public_attrs_ = ['Usuario', 'Password', 'XmlResponse',
@@ -77,7 +111,17 @@ class COT:
         self.CuitEmpresa = self.NumeroComprobante = ""
         self.NombreArchivo = self.CodigoIntegridad = ""
         self.NumeroUnico = self.Procesado = ""
-        self.XmlResponseBase64 = None
+        self.xml = None
+
+    @property
+    def XmlResponseBase64(self):
+        "Respuesta codificada en base64 (se calcula solo si se la solicita)"
+        if not self.XmlResponse:
+            return None
+        content = self.XmlResponse
+        if isinstance(content, str):
+            content = content.encode("latin1")
+        return base64.b64encode(content)
 
     def Conectar(self, url=None, proxy="", wrapper=None, cacert=None, trace=False, wsaa=None, user=None, password=None):
         if HOMO or not url:
@@ -98,58 +142,56 @@ class COT:
                     self.Excepcion = "Archivo no encontrado: %s" % filename
                     return False
 
-                archivo = open(filename, "r")
+                # se enva en bloques (sin cargarlo en memoria)
+                archivo = open(filename, "rb")
             elif self.RemitoFileBufferString:
                 archivo = self.RemitoFileBufferString
             else:
                 self.Excepcion = "No existe archivo a enviar."
                 return False
             if not testing:
-                if self.wsaa:
-                    content = self.client(token=self.wsaa.token, sign=self.wsaa.sign, file=archivo)
-                    if self.client.response.status != 200:
-                        self.Excepcion = "AGIP\nEstado: %s.\nRespuesta: %s." % (
-                            self.client.response.reason, self.client.response.status
-                        )
-                        return False
-                else:
-                    content = self.client(user=self.Usuario, password=self.Password, file=archivo)
-                    if self.client.response.status != 200:
-                        self.Excepcion = "ARBA\nEstado: %s.\nRespuesta: %s." % (
-                            self.client.response.reason, self.client.response.status
-                        )
-                        return False
+                try:
+                    if self.wsaa:
+                        content = self.client(token=self.wsaa.token, sign=self.wsaa.sign, file=archivo)
+                        if self.client.response.status != 200:
+                            self.Excepcion = "AGIP\nEstado: %s.\nRespuesta: %s." % (
+                                self.client.response.reason, self.client.response.status
+                            )
+                            return False
+                    else:
+                        content = self.client(user=self.Usuario, password=self.Password, file=archivo)
+                        if self.client.response.status != 200:
+                            self.Excepcion = "ARBA\nEstado: %s.\nRespuesta: %s." % (
+                                self.client.response.reason, self.client.response.status
+                            )
+                            return False
+                finally:
+                    if filename:
+                        archivo.close()
             else:
                 content = open(testing).read()
             self.XmlResponse = content
-            self.xml = SimpleXMLElement(content)
-            self.XmlResponseBase64 = base64.b64encode(content)
-            if 'tipoError' in self.xml:
-                self.TipoError = str(self.xml.tipoError)
-                self.CodigoError = str(self.xml.codigoError)
-                self.MensajeError = str(self.xml.mensajeError)
-                self.ErrorValidacionesRemitos = True
-            if 'cuitEmpresa' in self.xml:
-                self.CuitEmpresa = str(self.xml.cuitEmpresa)
-                self.NumeroComprobante = str(self.xml.numeroComprobante)
-                self.NombreArchivo = str(self.xml.nombreArchivo)
-                self.CodigoIntegridad = str(self.xml.codigoIntegridad)
-                if 'validacionesRemitos' in self.xml:
-                    for remito in self.xml.validacionesRemitos.remito:
-                        d = {
-                            'NumeroUnico': str(remito.numeroUnico),
-                            'Procesado': str(remito.procesado),
-                            'Errores': [],
-                        }
-                        if 'errores' in remito:
-                            self.ErrorValidacionesRemitos = True
-                            for error in remito.errores.error:
-                                d['Errores'].append((
-                                    str(error.codigo),
-                                    str(error.descripcion)))
-                        self.remitos.append(d)
-                    # establecer valores del primer remito (sin eliminarlo)
-                    self.LeerValidacionRemito(pop=False)
+            # analizo la respuesta de a un remito (el DOM se arma solo si
+            # se usa AnalizarXml / ObtenerTagXml)
+            for tipo, d in iterar_respuesta(content):
+                if tipo == 'remito':
+                    if d['Errores']:
+                        self.ErrorValidacionesRemitos = True
+                    self.remitos.append(d)
+                    continue
+                if 'tipoError' in d:
+                    self.TipoError = d['tipoError']
+                    self.CodigoError = d.get('codigoError', "")
+                    self.MensajeError = d.get('mensajeError', "")
+                    self.ErrorValidacionesRemitos = True
+                if 'cuitEmpresa' in d:
+                    self.CuitEmpresa = d['cuitEmpresa']
+                    self.NumeroComprobante = d.get('numeroComprobante', "")
+                    self.NombreArchivo = d.get('nombreArchivo', "")
+                    self.CodigoIntegridad = d.get('codigoIntegridad', "")
+            if self.remitos:
+                # establecer valores del primer remito (sin eliminarlo)
+                self.LeerValidacionRemito(pop=False)
             return True
         except Exception as e:
             ex = traceback.format_exception(sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
@@ -196,6 +238,7 @@ class COT:
         try:
             if not xml:
                 xml = self.XmlResponse
+            from pysimplesoap.simplexml import SimpleXMLElement
             self.xml = SimpleXMLElement(xml)
             return True
         except Exception as e:
@@ -206,6 +249,8 @@ class COT:
         "Busca en el Xml analizado y devuelve el tag solicitado"
         # convierto el xml a un objeto
         try:
+            if self.xml is None and self.XmlResponse:
+                self.AnalizarXml()
             if self.xml:
                 xml = self.xml
                 # por cada tag, lo busco segun su nombre o posicin
@@ -216,6 +261,31 @@ class COT:
         except Exception as e:
             self.Excepcion = "%s" % (e)
 
+    def GenerarArchivoRemitos(self, cuit_empresa, remitos, nombre, 
+                              carpeta=None, validar=True):
+        "Graba el archivo TXT de a un remito (sin armarlo en memoria)"
+        # remitos: iterable de diccionarios (ver crearRemito), puede ser un
+        # generador que los lea de la base de datos a medida que se graban
+        # nombre: diccionario NOMBREREMITOTXT (ver crearRemito) o el nombre
+        self.limpiar()
+        self.invalidos = []
+        try:
+            if isinstance(nombre, dict):
+                nombre = nombre_archivo(nombre)
+            ruta = os.path.join(carpeta or tempfile.gettempdir(), nombre)
+            with open(ruta, "w") as archivo:
+                cantidad, self.invalidos = escribir_remitos(
+                                archivo, cuit_empresa, remitos, validar)
+            if self.invalidos:
+                self.Excepcion = "Remitos omitidos por errores: %d" % (
+                                 len(self.invalidos))
+            return ruta
+        except Exception as e:
+            ex = traceback.format_exception(sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
+            self.Traceback = ''.join(ex)
+            self.Excepcion = traceback.format_exception_only(sys.exc_info()[0], sys.exc_info()[1])[0]
+            return ""
+
     def crearRemito(self, kwargs):
         """
             # ver https://www.arba.gov.ar/archivos/Publicaciones/nuevodiseniodearchivotxt.pdf explicacion de los kwargs
@@ -281,32 +351,7 @@ class COT:
                 }
             }
         """
-        kwargs_in_order = {
-            'HEADER': ['CUIT_EMPRESA'],
-            'REMITO': [
-                'FECHA_EMISION', 'CODIGO_UNICO', 'FECHA_SALIDA_TRANSPORTE', 'HORA_SALIDA_TRANSPORTE',
-                'SUJETO_GENERADOR',
-                'DESTINATARIO_CONSUMIDOR_FINAL', 'DESTINATARIO_TIPO_DOCUMENTO', 'DESTINATARIO_DOCUMENTO',
-                'DESTINATARIO_CUIT',
-                'DESTINATARIO_RAZON_SOCIAL', 'DESTINATARIO_TENEDOR', 'DESTINO_DOMICILIO_CALLE',
-                'DESTINO_DOMICILIO_NUMERO',
-                'DESTINO_DOMICILIO_COMPLE', 'DESTINO_DOMICILIO_PISO', 'DESTINO_DOMICILIO_DTO',
-                'DESTINO_DOMICILIO_BARRIO',
-                'DESTINO_DOMICILIO_CODIGOPOSTAL', 'DESTINO_DOMICILIO_LOCALIDAD', 'DESTINO_DOMICILIO_PROVINCIA',
-                'PROPIO_DESTINO_DOMICILIO_CODIGO', 'ENTREGA_DOMICILIO_ORIGEN', 'ORIGEN_CUIT', 'ORIGEN_RAZON_SOCIAL',
-                'EMISOR_TENEDOR', 'ORIGEN_DOMICILIO_CALLE', 'ORIGEN_DOMICILIO_NUMERO ', 'ORIGEN_DOMICILIO_COMPLE',
-                'ORIGEN_DOMICILIO_PISO', 'ORIGEN_DOMICILIO_DTO', 'ORIGEN_DOMICILIO_BARRIO',
-                'ORIGEN_DOMICILIO_CODIGOPOSTAL',
-                'ORIGEN_DOMICILIO_LOCALIDAD', 'ORIGEN_DOMICILIO_PROVINCIA', 'TRANSPORTISTA_CUIT', 'TIPO_RECORRIDO',
-                'RECORRIDO_LOCALIDAD', 'RECORRIDO_CALLE', 'RECORRIDO_RUTA', 'PATENTE_VEHICULO', 'PATENTE_ACOPLADO',
-                'PRODUCTO_NO_TERM_DEV', 'IMPORTE'],
-            'PRODUCTOS': [
-                'CODIGO_UNICO_PRODUCTO', 'ARBA_CODIGO_UNIDAD_MEDIDA', 'CANTIDAD', 'PROPIO_CODIGO_PRODUCTO',
-                'PROPIO_DESCRIPCION_PRODUCTO', 'PROPIO_DESCRIPCION_UNIDAD_MEDIDA', 'CANTIDAD_AJUSTADA'
-            ],
-            'FOOTER': ['CANTIDAD_TOTAL_REMITOS'],
-            'NOMBREREMITOTXT': ['CUIT_EMPRESA', 'NUM_PLANTA', 'NUM_PUERTA', 'FECHA_EMISION', 'NUM_SECUENCIA']
-        }
+        kwargs_in_order = CAMPOS
 
         header_mandatory_fields = ['HEADER', 'REMITO', 'FOOTER', 'NOMBREREMITOTXT']
         for f in header_mandatory_fields:
@@ -413,6 +458,99 @@ class COT:
         return True
 
 
+def nombre_archivo(datos):
+    "Arma el nombre del archivo (TB_cuit_planta+puerta_fecha_secuencia.txt)"
+    return 'TB_%s_%s%s_%s_%s.txt' % tuple(
+        datos.get(i, '') for i in CAMPOS['NOMBREREMITOTXT'])
+
+
+def validar_remito(remito, cuit_empresa):
+    "Devuelve los errores del remito (reglas del diseo de registro de ARBA)"
+    # los campos pueden venir como nmeros o texto ('0' / '1', CUIT)
+    def campo(nombre):
+        return str(remito.get(nombre, '') or '').strip()
+    def si(nombre):
+        return campo(nombre) == '1'
+    cuit_empresa = str(cuit_empresa).strip()
+    if not remito.get('PRODUCTOS', {}).get('productos'):
+        yield "Debe existir al menos un producto en el remito a enviar."
+    if not (si('DESTINATARIO_CONSUMIDOR_FINAL') or campo('DESTINATARIO_CUIT')):
+        yield "Cuando DESTINATARIO_CONSUMIDOR_FINAL = 0, el campo DESTINATARIO_CUIT es obligatorio."
+    if not (si('DESTINATARIO_CONSUMIDOR_FINAL') or campo('DESTINATARIO_RAZON_SOCIAL')):
+        yield "Cuando DESTINATARIO_CONSUMIDOR_FINAL = 0, el campo DESTINATARIO_RAZON_SOCIAL es obligatorio."
+    if campo('TRANSPORTISTA_CUIT') == cuit_empresa and not campo('PATENTE_VEHICULO'):
+        yield "Si TRANSPORTISTA_CUIT = CUIT_EMPRESA el campo PATENTE_VEHICULO es obligatorio."
+    if not (si('PRODUCTO_NO_TERM_DEV') or campo('ORIGEN_CUIT') == campo('DESTINATARIO_CUIT')):
+        # 12 enteros y 2 decimales (sin separador), debe ser > 0
+        importe = campo('IMPORTE')
+        if not (importe.isdigit() and int(importe) > 0):
+            yield "Si PRODUCTO_NO_TERM_DEV = 0 y ORIGEN_CUIT != DESTINATARIO_CUIT, el IMPORTE debe ser > 0."
+    if campo('SUJETO_GENERADOR') == 'D' and cuit_empresa != campo('DESTINATARIO_CUIT'):
+        yield "Si SUJETO_GENERADOR == 'D' el DESTINATARIO_CUIT debe ser igual a CUIT_EMPRESA."
+    if si('DESTINATARIO_CONSUMIDOR_FINAL') and si('DESTINATARIO_TENEDOR'):
+        yield "Si DESTINATARIO_CONSUMIDOR_FINAL == 1, DESTINATARIO_TENEDOR debe ser 0"
+    if campo('SUJETO_GENERADOR') == 'E' and campo('ORIGEN_CUIT') != cuit_empresa:
+        yield "Si SUJETO_GENERADOR == 'E' el ORIGEN_CUIT debe ser = CUIT_EMPRESA."
+
+
+def escribir_remitos(archivo, cuit_empresa, remitos, validar=False):
+    "Graba los registros de los remitos de a uno, devuelve (cantidad, errores)"
+    # con validar, los remitos con errores se informan y no se graban
+    fmt_remito = '02' + '|%s' * len(CAMPOS['REMITO']) + '\n'
+    fmt_producto = '03' + '|%s' * len(CAMPOS['PRODUCTOS']) + '\n'
+    archivo.write('01|%s\n' % cuit_empresa)
+    cantidad = 0
+    errores = []
+    for remito in remitos:
+        if validar:
+            invalido = False
+            for error in validar_remito(remito, cuit_empresa):
+                errores.append((remito.get('CODIGO_UNICO', ''), error))
+                invalido = True
+            if invalido:
+                continue
+        archivo.write(fmt_remito % tuple(str(remito.get(i, '')) 
+                                         for i in CAMPOS['REMITO']))
+        for prod in remito['PRODUCTOS'].get('productos', []):
+            archivo.write(fmt_producto % tuple(str(prod.get(i, '')) 
+                                               for i in CAMPOS['PRODUCTOS']))
+        cantidad += 1
+    archivo.write('04|%s' % cantidad)
+    return cantidad, errores
+
+
+def iterar_respuesta(contenido, tamanio_bloque=65536):
+    "Analiza la respuesta de a un remito, devuelve (tipo, datos) sin armar el DOM"
+    # tipo: 'remito' (validacin de cada remito) o 'datos' (campos generales)
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    pila = []
+    datos = {}
+    for i in range(0, len(contenido), tamanio_bloque):
+        parser.feed(contenido[i:i + tamanio_bloque])
+        for evento, elem in parser.read_events():
+            if evento == "start":
+                pila.append(elem)
+                continue
+            pila.pop()
+            if len(pila) == 1 and elem.tag in CAMPOS_RESPUESTA:
+                datos[elem.tag] = (elem.text or "").strip()
+            elif elem.tag == "remito" and pila and pila[-1].tag == "validacionesRemitos":
+                d = {
+                    'NumeroUnico': elem.findtext("numeroUnico", "").strip(),
+                    'Procesado': elem.findtext("procesado", "").strip(),
+                    'Errores': [],
+                }
+                for error in elem.iterfind("errores/error"):
+                    d['Errores'].append((
+                        error.findtext("codigo", "").strip(),
+                        error.findtext("descripcion", "").strip()))
+                # libero el remito ya procesado
+                pila[-1].remove(elem)
+                yield 'remito', d
+    parser.close()
+    yield 'datos', datos
+
+
 # busco el directorio de instalacin (global para que no cambie si usan otra dll)
 if not hasattr(sys, "frozen"):
     basepath = __file__
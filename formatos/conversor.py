@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Módulo con el registro de formatos (lectores / escritores) y conversión"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# Todos los formatos comparten la misma estructura de comprobante (dict con
+# los campos del encabezado y las listas 'detalles', 'ivas', 'tributos',
+# 'permisos', 'cbtes_asoc' y 'datos', ver formato_txt), por lo que:
+#  * un lector recibe el origen y devuelve un iterable de comprobantes
+#  * un escritor recibe un iterable de comprobantes y el destino
+# Los lectores devuelven generadores y los escritores consumen de a un
+# comprobante, por lo que las conversiones no cargan todo en memoria (salvo
+# desde DBF: formato_dbf.iterar lee las tablas completas para relacionarlas).
+
+import importlib
+import os
+import sys
+
+DEBUG = False
+
+# nombre del formato: {'lector': ..., 'escritor': ..., 'extensiones': ...}
+FORMATOS = {}
+
+
+def registrar(nombre, lector=None, escritor=None, extensiones=(), modulo=None):
+    "Agrega (o reemplaza) un formato en el registro"
+    # lector / escritor pueden ser funciones o nombres de funciones del
+    # modulo (se importan recién al usarse, ej. openpyxl, dbf, etc.)
+    FORMATOS[nombre] = {
+        'lector': lector,
+        'escritor': escritor,
+        'extensiones': tuple([ext.lower() for ext in extensiones]),
+        'modulo': modulo,
+        }
+
+
+def obtener_formato(nombre=None, archivo=None):
+    "Busca el nombre del formato (explícito o según extensión del archivo)"
+    if nombre:
+        if nombre not in FORMATOS:
+            raise ValueError("Formato desconocido: %s" % nombre)
+        return nombre
+    if isinstance(archivo, str):
+        ext = os.path.splitext(archivo)[1].lower()
+        for nombre, formato in list(FORMATOS.items()):
+            if ext in formato['extensiones']:
+                return nombre
+    raise ValueError("No se puede determinar el formato de %r" % (archivo, ))
+
+
+def formato_argv(argv=None, predeterminado="txt", formatos=None):
+    "Devuelve el formato solicitado por línea de comandos (/dbf, --json, etc.)"
+    # formatos: los admitidos por el script (ej. en rece1 /xml es otra opción)
+    if argv is None:
+        argv = sys.argv
+    for nombre in formatos or FORMATOS:
+        if "/%s" % nombre in argv or "--%s" % nombre in argv:
+            return nombre
+    return predeterminado
+
+
+def _funcion(nombre, rol):
+    "Resuelve la función lectora / escritora de un formato (import diferido)"
+    formato = FORMATOS[nombre]
+    fn = formato[rol]
+    if fn is None:
+        raise ValueError("El formato %s no admite %s" % (nombre, rol))
+    if isinstance(fn, str):
+        modulo = importlib.import_module(formato['modulo'], __package__)
+        fn = getattr(modulo, fn)
+    return fn
+
+
+def leer(origen, formato=None, **opciones):
+    "Devuelve un iterable de comprobantes (de a uno) del origen"
+    nombre = obtener_formato(formato, origen)
+    if DEBUG: print("leyendo", nombre, origen)
+    return _funcion(nombre, 'lector')(origen, **opciones)
+
+
+def escribir(regs, destino, formato=None, **opciones):
+    "Graba los comprobantes (iterable) en el destino"
+    nombre = obtener_formato(formato, destino)
+    if DEBUG: print("escribiendo", nombre, destino)
+    return _funcion(nombre, 'escritor')(regs, destino, **opciones)
+
+
+def convertir(origen, destino, formato_origen=None, formato_destino=None,
+              mapeo=None, opciones_origen=None, opciones_destino=None):
+    "Convierte los comprobantes del origen al destino (lector-mapeo-escritor)"
+    # mapeo: función opcional que recibe y devuelve un comprobante (dict)
+    regs = leer(origen, formato_origen, **(opciones_origen or {}))
+    if mapeo is not None:
+        regs = map(mapeo, regs)
+
+    def contar(regs):
+        for reg in regs:
+            contar.cantidad += 1
+            yield reg
+    contar.cantidad = 0
+
+    escribir(contar(regs), destino, formato_destino, **(opciones_destino or {}))
+    return contar.cantidad
+
+
+# Formatos incorporados:
+
+registrar("txt", "iterar", "escribir", [".txt"], ".formato_txt")
+registrar("json", "iterar", "escribir", [".json"], ".formato_json")
+registrar("xml", "iterar", "escribir", [".xml"], ".formato_xml")
+registrar("csv", "iterar", "escribir_regs", [".csv", ".xlsx"], ".formato_csv")
+# DBF: origen / destino es el dict de archivos por tabla (ver rece.ini [DBF])
+registrar("dbf", "iterar", "escribir", [".dbf"], ".formato_dbf")
+# SQL: origen / destino es la conexión a la base de datos (DB-API)
+registrar("sql", "leer", "escribir", [], ".formato_sql")
+
+
+if __name__ == "__main__":
+    # ejemplo: python -m pyafipws.formatos.conversor facturas.txt facturas.json
+    if len(sys.argv) < 3:
+        print("Uso: %s origen destino [--compacto]" % sys.argv[0])
+        print("Formatos:", ", ".join(sorted(FORMATOS)))
+        sys.exit(1)
+    opciones_destino = {}
+    if '--compacto' in sys.argv:
+        opciones_destino['compacto'] = True
+    cantidad = convertir(sys.argv[1], sys.argv[2],
+                         opciones_destino=opciones_destino)
+    print("Comprobantes convertidos:", cantidad)
@@ -20,122 +20,130 @@ import csv
 from decimal import Decimal
 import os
 
+CHARSET = 'latin1'
+
 
 def leer(fn="entrada.csv", delimiter=";"):
     "Analiza un archivo CSV y devuelve un diccionario (aplanado)"
+    return list(iterar_filas(fn, delimiter))
+    # TODO: return desaplanar(items)
+
+
+def iterar_filas(fn="entrada.csv", delimiter=";"):
+    "Analiza un archivo CSV y devuelve las filas de a una (generador)"
     ext = os.path.splitext(fn)[1].lower()
-    items = []
     if ext == '.csv':
-        csvfile = open(fn, "rb")
-        # deducir dialecto y delimitador
+        csvfile = open(fn, "r", newline="", encoding=CHARSET)
         try:
-            dialect = csv.Sniffer().sniff(csvfile.read(256), delimiters=[';',','])
-        except csv.Error:
-            dialect = csv.excel
-            dialect.delimiter=delimiter
-        csvfile.seek(0)
-        csv_reader = csv.reader(csvfile, dialect)
-        for row in csv_reader:
-            r = []
-            for c in row:
-                if isinstance(c, str):
-                    c=c.strip()
-                r.append(c)
-            items.append(r)
+            # deducir dialecto y delimitador
+            try:
+                dialect = csv.Sniffer().sniff(csvfile.read(256), delimiters=[';',','])
+            except csv.Error:
+                dialect = csv.excel
+                dialect.delimiter=delimiter
+            csvfile.seek(0)
+            csv_reader = csv.reader(csvfile, dialect)
+            for row in csv_reader:
+                r = []
+                for c in row:
+                    if isinstance(c, str):
+                        c=c.strip()
+                    r.append(c)
+                yield r
+        finally:
+            csvfile.close()
     elif ext == '.xlsx':
         # extraigo los datos de la planilla Excel
+        # (modo solo lectura: se recorre sin cargar toda la planilla)
         from openpyxl import load_workbook
-        wb = load_workbook(filename=fn)
-        ws1 = wb.get_active_sheet()
-        for row in ws1.rows:
-            fila = []
-            for cell in row:
-                fila.append(cell.value)
-            items.append(fila)    
-    return items
-    # TODO: return desaplanar(items)
+        wb = load_workbook(filename=fn, read_only=True)
+        try:
+            ws1 = wb.active
+            for row in ws1.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            wb.close()
+
+
+def iterar(fn="entrada.csv", delimiter=";"):
+    "Analiza un archivo CSV y devuelve los comprobantes de a uno (generador)"
+    return desaplanar_iter(iterar_filas(fn, delimiter))
 
     
+# Columnas de la planilla para los sub-registros (campo interno, columna)
+# (para los detalles, nulo indica si los valores vacios se convierten a None)
+COLUMNAS_DETALLE = [
+    ('codigo', 'codigo', True),
+    ('ds', 'descripcion', True),
+    ('umed', 'umed', True),
+    ('qty', 'cantidad', True),
+    ('precio', 'precio', True),
+    ('importe', 'importe', True),
+    ('iva_id', 'iva_id', True),
+    ('imp_iva', 'imp_iva', True),
+    ('bonif', 'bonif', True),
+    ('despacho', 'numero_despacho', False),
+    ('dato_a', 'dato_a', False),
+    ('dato_b', 'dato_b', False),
+    ('dato_c', 'dato_c', False),
+    ('dato_d', 'dato_d', False),
+    ('dato_e', 'dato_e', False),
+    ]
+
+COLUMNAS_TRIBUTO = [
+    ('tributo_id', 'tributo_id_'),
+    ('desc', 'tributo_desc_'),
+    ('base_imp', 'tributo_base_imp_'),
+    ('alic', 'tributo_alic_'),
+    ('importe', 'tributo_importe_'),
+    ]
+
+COLUMNAS_IVA = [
+    ('iva_id', 'iva_id_'),
+    ('base_imp', 'iva_base_imp_'),
+    ('importe', 'iva_importe_'),
+    ]
+
+COLUMNAS_PERMISO = [
+    ('id_permiso', 'id_permiso_'),
+    ('dst_merc', 'dst_merc_'),
+    ]
+
+COLUMNAS_CMP_ASOC = [
+    ('cbte_tipo', 'cbte_tipo_'),
+    ('cbte_punto_vta', 'cbte_punto_vta_'),
+    ('cbte_nro', 'cbte_nro_'),
+    ]
+
+
+# Columnas obligatorias (al comienzo de la planilla, en este orden)
+COLUMNAS = ["id",
+    "tipo_cbte","punto_vta","cbt_numero","fecha_cbte",
+    "tipo_doc","nro_doc","moneda_id","moneda_ctz",
+    "imp_neto","imp_iva","imp_trib","imp_op_ex","imp_tot_conc","imp_total",
+    "concepto","fecha_venc_pago","fecha_serv_desde","fecha_serv_hasta",
+    "cae","fecha_vto","resultado","motivo","reproceso",
+    "nombre","domicilio","localidad","telefono","categoria","email",
+    'numero_cliente', 'numero_orden_compra', 'condicion_frente_iva',
+    'numero_cotizacion', 'numero_remito', 
+    "obs_generales", "obs_comerciales",
+    ]
+
+
 def aplanar(regs):
     "Convierte una estructura python en planilla CSV (PyRece)"
     
-    from .formato_xml import MAP_ENC
-    
+    # columnas adicionales, en el orden en que aparecen (sin repetir)
+    extras = dict.fromkeys(COLUMNAS)
+
     filas = []
     for reg in regs:
-        fila = {}
-        
-        # recorrer campos obligatorios:
-        for k in MAP_ENC:
-            fila[k] = reg.get(k)
-
-        fila['forma_pago'] = reg.get('forma_pago', "")
-        fila['pdf'] = reg.get('pdf', "")
-
-        # datos adicionales (escalares):            
-        for k, v in list(reg.items()):
-            if k not in MAP_ENC and isinstance(k, (str, int)):
-                fila[k] = v
-
-        
-        # por compatibilidad con pyrece:
-        if reg.get('cbte_nro'):
-            fila['cbt_numero']=reg['cbte_nro']
-
-        for i, det in enumerate(reg['detalles']):
-            li = i+1
-            fila.update({
-                    'codigo%s' % li: det.get('codigo', ""),
-                    'descripcion%s' % li: det.get('ds', ""),
-                    'umed%s' % li: det.get('umed'),
-                    'cantidad%s' % li: det.get('qty'),
-                    'precio%s' % li: det.get('precio'),
-                    'importe%s' % li: det.get('importe'),
-                    'iva_id%s' % li: det.get('iva_id'),
-                    'imp_iva%s' % li: det.get('imp_iva'),
-                    'bonif%s' % li: det.get('bonif'),
-                    'numero_despacho%s' % li: det.get('despacho'),
-                    'dato_a%s' % li: det.get('dato_a'),
-                    'dato_b%s' % li: det.get('dato_b'),
-                    'dato_c%s' % li: det.get('dato_c'),
-                    'dato_d%s' % li: det.get('dato_d'),
-                    'dato_e%s' % li: det.get('dato_e'),
-                    })
-        for i, iva in enumerate(reg['ivas']):
-            li = i+1
-            fila.update({
-                    'iva_id_%s' % li: iva['iva_id'],
-                    'iva_base_imp_%s' % li: iva['base_imp'],
-                    'iva_importe_%s' % li: iva['importe'],
-                    })
-        for i, tributo in enumerate(reg['tributos']):
-            li = i+1
-            fila.update({
-                    'tributo_id_%s' % li: tributo['tributo_id'],
-                    'tributo_base_imp_%s' % li: tributo['base_imp'],
-                    'tributo_desc_%s' % li: tributo['desc'],
-                    'tributo_alic_%s' % li: tributo['alic'],
-                    'tributo_importe_%s' % li: tributo['importe'],
-                    })
+        fila = aplanar_reg(reg)
+        extras.update(dict.fromkeys(fila))
         filas.append(fila)
     
-    
-    cols = ["id",
-        "tipo_cbte","punto_vta","cbt_numero","fecha_cbte",
-        "tipo_doc","nro_doc","moneda_id","moneda_ctz",
-        "imp_neto","imp_iva","imp_trib","imp_op_ex","imp_tot_conc","imp_total",
-        "concepto","fecha_venc_pago","fecha_serv_desde","fecha_serv_hasta",
-        "cae","fecha_vto","resultado","motivo","reproceso",
-        "nombre","domicilio","localidad","telefono","categoria","email",
-        'numero_cliente', 'numero_orden_compra', 'condicion_frente_iva',
-        'numero_cotizacion', 'numero_remito', 
-        "obs_generales", "obs_comerciales",
-        ]
-
-    # filtro y ordeno las columnas
-    l = [k for f in filas for k in list(f.keys())]
-    s = set(l) - set(cols)
-    cols = cols + list(s)
+    # agrego las columnas adicionales luego de las obligatorias
+    cols = list(extras)
  
     ret = [cols]
     for fila in filas:
@@ -144,13 +152,62 @@ def aplanar(regs):
     return ret
 
 
+def aplanar_reg(reg):
+    "Convierte un comprobante en una fila (diccionario columna: valor)"
+
+    from .formato_xml import MAP_ENC
+
+    fila = {}
+    
+    # recorrer campos obligatorios:
+    for k in MAP_ENC:
+        fila[k] = reg.get(k)
+
+    fila['forma_pago'] = reg.get('forma_pago', "")
+    fila['pdf'] = reg.get('pdf', "")
+
+    # datos adicionales (escalares):            
+    for k, v in list(reg.items()):
+        if k not in MAP_ENC and not isinstance(v, (list, tuple, dict)):
+            fila[k] = v
+
+    
+    # por compatibilidad con pyrece:
+    if reg.get('cbte_nro'):
+        fila['cbt_numero']=reg['cbte_nro']
+
+    for li, det in enumerate(reg.get('detalles') or [], 1):
+        for campo, col, nulo in COLUMNAS_DETALLE:
+            fila['%s%s' % (col, li)] = det.get(campo)
+    for li, iva in enumerate(reg.get('ivas') or [], 1):
+        for campo, col in COLUMNAS_IVA:
+            fila['%s%s' % (col, li)] = iva[campo]
+    for li, tributo in enumerate(reg.get('tributos') or [], 1):
+        for campo, col in COLUMNAS_TRIBUTO:
+            fila['%s%s' % (col, li)] = tributo[campo]
+    return fila
+
+
 def desaplanar(filas):
     "Dado una planilla, conviertir en estructura python"
+    return list(desaplanar_iter(filas))
+
+
+def desaplanar_iter(filas):
+    "Dado las filas de una planilla, devuelve los comprobantes (generador)"
 
     from .formato_xml import MAP_ENC
 
+    # la primer fila es el encabezado (nombres de columnas)
+    filas = iter(filas)
+    try:
+        encabezado = next(filas)
+    except StopIteration:
+        return
+
     def max_li(colname): 
-        l = [int(k[len(colname):])+1 for k in filas[0] if k.startswith(colname)]
+        l = [int(k[len(colname):])+1 for k in encabezado 
+             if isinstance(k, str) and k.startswith(colname)]
         if l:
             tmp = max(l)
         if l and tmp:
@@ -159,37 +216,52 @@ def desaplanar(filas):
         else:
             return 0
 
-    regs = []
-    for fila in filas[1:]:
-        dic = dict([(filas[0][i], v) for i, v in enumerate(fila)])
+    def columnas(colname, campos):
+        "Arma la disposicion de columnas por sub-registro (col. de control)"
+        return [("%s%s" % (colname, li), 
+                 [(campo[0], "%s%s" % (campo[1], li)) + tuple(campo[2:]) 
+                  for campo in campos])
+                for li in range(1, max_li(colname))]
+
+    # resuelvo la disposicion de las columnas una unica vez (por encabezado)
+    cols_det = columnas("cantidad", COLUMNAS_DETALLE)
+    cols_trib = columnas("tributo_id_", COLUMNAS_TRIBUTO)
+    cols_iva = columnas("iva_id_", COLUMNAS_IVA)
+    cols_permiso = columnas("id_permiso_", COLUMNAS_PERMISO)
+    cols_cmp_asoc = columnas("cbte_tipo_", COLUMNAS_CMP_ASOC)
+    cols_enc = [k for k in MAP_ENC if k in encabezado]
+
+    def extraer(dic, cols, requerido=bool):
+        "Devuelve los sub-registros presentes (quitando las columnas usadas)"
+        ret = []
+        for col, campos in cols:
+            if requerido(dic[col]):
+                ret.append(dict([(campo, dic.pop(columna)) 
+                                 for campo, columna in campos]))
+        return ret
+
+    for fila in filas:
+        dic = dict(zip(encabezado, fila))
         reg = {}
 
         # por compatibilidad con pyrece:
         reg['cbte_nro'] = dic['cbt_numero']
 
-        for k in MAP_ENC:
+        for k in cols_enc:
             if k in dic:
                 reg[k] = dic.pop(k)
             
-        reg['detalles'] = [{
-                'codigo': ('codigo%s' % li) in dic and dic.pop('codigo%s' % li) or None,
-                'ds': ('descripcion%s' % li) in dic and dic.pop('descripcion%s' % li) or None,
-                'umed': ('umed%s' % li) in dic and dic.pop('umed%s' % li) or None,
-                'qty': ('cantidad%s' % li) in dic and dic.pop('cantidad%s' % li) or None,
-                'precio': ('precio%s' % li) in dic and dic.pop('precio%s' % li) or None,
-                'importe': ('importe%s' % li) in dic and dic.pop('importe%s' % li) or None,
-                'iva_id': ('iva_id%s' % li) in dic and dic.pop('iva_id%s' % li) or None,
-                'imp_iva': ('imp_iva%s' % li) in dic and dic.pop('imp_iva%s'% li) or None,
-                'bonif': ('bonif%s' % li) in dic and dic.pop('bonif%s'% li) or None,
-                'despacho': ('numero_despacho%s' % li) in dic and dic.pop('numero_despacho%s'% li),
-                'dato_a': ('dato_a%s' % li) in dic and dic.pop('dato_a%s' % li),
-                'dato_b': ('dato_b%s' % li) in dic and dic.pop('dato_b%s' % li),
-                'dato_c': ('dato_c%s' % li) in dic and dic.pop('dato_c%s' % li),
-                'dato_d': ('dato_d%s' % li) in dic and dic.pop('dato_d%s' % li),
-                'dato_e': ('dato_e%s' % li) in dic and dic.pop('dato_e%s' % li),
-
-                } for li in range(1, max_li("cantidad")) 
-                  if dic['cantidad%s' % li] is not None]
+        reg['detalles'] = []
+        for col_cantidad, campos in cols_det:
+            if dic[col_cantidad] is None:
+                continue
+            det = {}
+            for campo, col, nulo in campos:
+                valor = col in dic and dic.pop(col)
+                if nulo and not valor:
+                    valor = None
+                det[campo] = valor
+            reg['detalles'].append(det)
                 
         # descartar filas espurias vacias al final
         for det in reg['detalles'][::-1]:
@@ -197,34 +269,10 @@ def desaplanar(filas):
                 break
             del reg['detalles'][-1]             # sino, borro ltimo elemento
         
-        reg['tributos'] = [{
-                'tributo_id': dic.pop('tributo_id_%s'  % li),
-                'desc': dic.pop('tributo_desc_%s'  % li),
-                'base_imp': dic.pop('tributo_base_imp_%s'  % li),
-                'alic': dic.pop('tributo_alic_%s'  % li),
-                'importe': dic.pop('tributo_importe_%s'  % li),
-                } for li in range(1, max_li("tributo_id_"))
-                  if dic['tributo_id_%s'  % li]]
-
-        reg['ivas'] = [{
-                'iva_id': dic.pop('iva_id_%s'  % li),
-                'base_imp': dic.pop('iva_base_imp_%s'  % li),
-                'importe': dic.pop('iva_importe_%s'  % li),
-                } for li in range(1, max_li("iva_id_"))
-                  if dic['iva_id_%s'  % li]]
-
-        reg['permisos'] = [{
-                'id_permiso': dic.pop('id_permiso_%s'  % li),
-                'dst_merc': dic.pop('dst_merc_%s'  % li),
-                } for li in range(1, max_li("id_permiso_"))
-                  if dic['id_permiso_%s'  % li]]
-                  
-        reg['cbtes_asoc'] = [{
-                'cbte_tipo': dic.pop('cbte_tipo_%s'  % li),
-                'cbte_punto_vta': dic.pop('cbte_punto_vta_%s'  % li),
-                'cbte_nro': dic.pop('cbte_nro_%s'  % li),
-                } for li in range(1, max_li("cbte_tipo_"))
-                  if dic['cbte_tipo_%s'  % li]]
+        reg['tributos'] = extraer(dic, cols_trib)
+        reg['ivas'] = extraer(dic, cols_iva)
+        reg['permisos'] = extraer(dic, cols_permiso)
+        reg['cbtes_asoc'] = extraer(dic, cols_cmp_asoc)
                 
         reg['forma_pago'] = dic.pop('forma_pago')
 
@@ -236,36 +284,104 @@ def desaplanar(filas):
                 } for campo, valor in list(dic.items())
                 ]
 
-
-        regs.append(reg)
-
-    return regs
+        yield reg
 
 
 def escribir(filas, fn="salida.csv", delimiter=";"):
     "Dado una lista de comprobantes (diccionarios), aplana y escribe"
     ext = os.path.splitext(fn)[1].lower()
     if ext == '.csv':
-        f = open(fn,"wb")
+        f = open(fn, "w", newline="", encoding=CHARSET)
         csv_writer = csv.writer(f, dialect='excel', delimiter=";")
         # TODO: filas = aplanar(regs)
         for fila in filas:
-            # convertir a ISO-8859-1 (evita error de encoding de csv writer):
-            fila = [celda.encode("latin1") if isinstance(celda, str) else celda
-                    for celda in fila]
             csv_writer.writerow(fila)
         f.close()
     elif ext == '.xlsx':
         from openpyxl import Workbook
-        wb = Workbook()
-        ws1 = wb.get_active_sheet()
+        # modo solo escritura: las filas se vuelcan a medida que se agregan
+        # (no se mantienen las celdas en memoria)
+        wb = Workbook(write_only=True)
+        ws1 = wb.create_sheet()
         for fila in filas:
             ws1.append(fila)
         wb.save(filename=fn)
 
+
+def escribir_regs(regs, fn="salida.csv", delimiter=";"):
+    "Aplana y graba los comprobantes de a uno (sin mantenerlos en memoria)"
+    # las columnas dependen de todos los comprobantes (cantidad de items,
+    # alicuotas, etc.): en una primer pasada las filas se guardan en un
+    # archivo temporal y luego se vuelcan a la planilla ya ordenadas
+    import pickle
+    import tempfile
+    cols = dict.fromkeys(COLUMNAS)
+    tmp = tempfile.TemporaryFile()
+    try:
+        cantidad = 0
+        for reg in regs:
+            fila = aplanar_reg(reg)
+            cols.update(dict.fromkeys(fila))
+            pickle.dump(fila, tmp, pickle.HIGHEST_PROTOCOL)
+            cantidad += 1
+        cols = list(cols)
+
+        def filas():
+            yield cols
+            tmp.seek(0)
+            for i in range(cantidad):
+                fila = pickle.load(tmp)
+                yield [fila.get(k) for k in cols]
+
+        escribir(filas(), fn, delimiter)
+    finally:
+        tmp.close()
+
+
+def benchmark(fn="facturas.xlsx", cantidad=10000):
+    "Mide lectura / escritura de una planilla escalada a cantidad de filas"
+    import resource
+    import shutil
+    import tempfile
+    import time
+
+    filas = leer(fn)
+    datos = filas[1:] or [[None] * len(filas[0])]
+    ext = os.path.splitext(fn)[1].lower()
+    tmp = tempfile.mkdtemp()
+    try:
+        salida = os.path.join(tmp, "benchmark%s" % ext)
+        grande = [filas[0]] + [datos[i % len(datos)] for i in range(cantidad)]
+        t0 = time.time()
+        escribir(grande, salida)
+        t1 = time.time()
+        regs = 0
+        for reg in iterar(salida):
+            regs += 1
+        t2 = time.time()
+        planilla = aplanar(desaplanar(grande))
+        t3 = time.time()
+        print("%s: %d filas" % (fn, cantidad))
+        print(" * escribir:          %8.0f filas/s" % (cantidad / (t1 - t0)))
+        print(" * leer + desaplanar: %8.0f filas/s" % (regs / (t2 - t1)))
+        print(" * desaplanar+aplanar:%8.0f filas/s" % (len(planilla) / (t3 - t2)))
+        print(" * memoria maxima: %d KiB" % 
+              resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    finally:
+        shutil.rmtree(tmp)
+
     
 # pruebas bsicas
 if __name__ == '__main__':
+    import sys
+    if '--benchmark' in sys.argv:
+        # ejemplo: python -m pyafipws.formatos.formato_csv --benchmark 50000
+        i = sys.argv.index('--benchmark')
+        cantidad = len(sys.argv) > i + 1 and int(sys.argv[i + 1]) or 10000
+        for fn in ("facturas.csv", "facturas.xlsx"):
+            benchmark(os.path.join(os.path.dirname(__file__), "..", "datos", fn),
+                      cantidad)
+        sys.exit(0)
     ##import pdb; pdb.set_trace()
     filas = leer("facturas-wsfev1-bis.csv")
     regs1 = desaplanar(filas)
@@ -90,6 +90,27 @@ def dar_nombre_campo(clave):
     return nombre.lower()
 
 
+def abrir_tabla(filename, campos=None):
+    "Abre la tabla DBF (la crea si se indican los campos) para leer / grabar"
+    if campos:
+        tabla = dbf.Table(filename, campos, codepage=CODEPAGE)
+    else:
+        tabla = dbf.Table(filename, codepage=CODEPAGE)
+    if hasattr(dbf, "READ_WRITE"):
+        # versiones nuevas: la tabla se crea / abre cerrada
+        tabla.open(mode=dbf.READ_WRITE)
+    return tabla
+
+
+def campos_registro(reg):
+    "Devuelve un diccionario con los valores de un registro DBF"
+    if hasattr(dbf, "scatter"):
+        campos = dbf.scatter(reg, as_type=dict)
+    else:
+        campos = reg.scatter_fields()
+    return dict([(k.lower(), v) for k, v in list(campos.items())])
+
+
 def leer(archivos=None, carpeta=None):
     "Leer las tablas dbf y devolver una lista de diccionarios con las facturas"
     if DEBUG: print("Leyendo DBF...")
@@ -111,14 +132,16 @@ def leer(archivos=None, carpeta=None):
         if carpeta is not None:
             filename = os.path.join(carpeta, filename)
         if DEBUG: print("leyendo tabla", nombre, filename)
-        tabla = dbf.Table(filename, codepage=CODEPAGE)
+        tabla = abrir_tabla(filename)
         for reg in tabla:
             r = {}
-            d = reg.scatter_fields() 
+            d = campos_registro(reg)
             for fmt in formato:
                 clave, longitud, tipo = fmt[0:3]
                 nombre = dar_nombre_campo(clave)
                 v = d.get(nombre)
+                if isinstance(v, str):
+                    v = v.rstrip()
                 r[clave] = v
             # agrego 
             if formato==ENCABEZADO:
@@ -137,51 +160,63 @@ def leer(archivos=None, carpeta=None):
     return regs
 
 
+def iterar(archivos=None, carpeta=None):
+    "Devuelve las facturas de a una (las tablas se relacionan por id)"
+    # nota: los sub-registros estan en otras tablas, por lo que es necesario
+    # recorrerlas completas antes de devolver el primer comprobante
+    for reg in list(leer(archivos, carpeta).values()):
+        yield reg
+
+
 def escribir(regs, archivos=None, carpeta=None):
     "Grabar en talbas dbf la lista de diccionarios con la factura"
     if DEBUG: print("Creando DBF...")
-    if not archivos: filenames = {}
-    
-    for reg in regs:
-        formatos = [('Encabezado', ENCABEZADO, [reg]), 
-                    ('Detalle', DETALLE, reg.get('detalles', [])), 
-                    ('Iva', IVA, reg.get('ivas', [])), 
-                    ('Tributo', TRIBUTO, reg.get('tributos', [])),
-                    ('Permiso', PERMISO, reg.get('permisos', [])), 
-                    ('Comprobante Asociado', CMP_ASOC, reg.get('cbtes_asoc', [])),
-                    ('Dato', DATO, reg.get('datos', [])), 
-                    ]
-        for nombre, formato, l in formatos:
-            claves, campos = definir_campos(formato)
-            filename = archivos.get(nombre.lower(), "%s.dbf" % nombre[:8])
-            # construir ruta absoluta si se especifica carpeta
-            if carpeta is not None:
-                filename = os.path.join(carpeta, filename)
-            if DEBUG: print("leyendo tabla", nombre, filename)
-            tabla = dbf.Table(filename, campos)
-
-            for d in l:
-                r = {}
-                for fmt in formato:
-                    clave, longitud, tipo = fmt[0:3]
-                    if clave=='id':
-                        v = reg['id']
-                    else:
-                        v = d.get(clave, None)
-                    if DEBUG: print(clave,v, tipo)
-                    if v is None and tipo == A:
-                        v = ''
-                    if (v is None or v=='') and tipo in (I, N):
-                        v = 0
-                    if tipo == A:
-                        if isinstance(v, str):
-                            v = v.encode('utf8', 'ignore')
-                        elif isinstance(v, str):
-                            v = v.decode('latin1', 'ignore').encode('utf8', 'ignore')
+    if not archivos: archivos = {}
+    tablas = {}
+    try:
+        for i, reg in enumerate(regs):
+            # el id relaciona el encabezado con los sub-registros
+            if not reg.get('id'):
+                reg = dict(reg, id=i + 1)
+            formatos = [('Encabezado', ENCABEZADO, [reg]), 
+                        ('Detalle', DETALLE, reg.get('detalles', [])), 
+                        ('Iva', IVA, reg.get('ivas', [])), 
+                        ('Tributo', TRIBUTO, reg.get('tributos', [])),
+                        ('Permiso', PERMISO, reg.get('permisos', [])), 
+                        ('Comprobante Asociado', CMP_ASOC, reg.get('cbtes_asoc', [])),
+                        ('Dato', DATO, reg.get('datos', [])), 
+                        ]
+            for nombre, formato, l in formatos:
+                if nombre not in tablas:
+                    # crear la tabla una sola vez (y grabar todos los registros)
+                    claves, campos = definir_campos(formato)
+                    filename = archivos.get(nombre.lower(), "%s.dbf" % nombre[:8])
+                    # construir ruta absoluta si se especifica carpeta
+                    if carpeta is not None:
+                        filename = os.path.join(carpeta, filename)
+                    if DEBUG: print("creando tabla", nombre, filename)
+                    tablas[nombre] = abrir_tabla(filename, "; ".join(campos))
+                tabla = tablas[nombre]
+                for d in l:
+                    r = {}
+                    for fmt in formato:
+                        clave, longitud, tipo = fmt[0:3]
+                        if clave=='id':
+                            v = reg['id']
                         else:
-                            v = str(v)
-                    r[dar_nombre_campo(clave)] = v
-                registro = tabla.append(r)
+                            v = d.get(clave, None)
+                        if DEBUG: print(clave,v, tipo)
+                        if v is None and tipo == A:
+                            v = ''
+                        if (v is None or v=='') and tipo in (I, N):
+                            v = 0
+                        if tipo == A:
+                            # caracteres no representables en la pgina de cdigos
+                            v = str(v).encode(CODEPAGE, 'replace').decode(CODEPAGE)
+                        r[dar_nombre_campo(clave)] = v
+                    tabla.append(r)
+    finally:
+        for tabla in list(tablas.values()):
             tabla.close()
 
 
@@ -16,6 +16,7 @@ __author__ = "Mariano Reingart (reingart@gmail.com)"
 __copyright__ = "Copyright (C) 2011 Mariano Reingart"
 __license__ = "GPL 3.0"
 
+import codecs
 from decimal import Decimal
 
 try:
@@ -26,6 +27,10 @@ except ImportError:
     except:
         print("para soporte de JSON debe instalar simplejson")
 
+
+# cantidad de caracteres a leer por vez en el analisis incremental
+TAMANIO_BLOQUE = 64 * 1024
+
         
 def leer(fn="entrada.json"):
     "Analiza un archivo JSON y devuelve un diccionario (confia en que el json este ok)"
@@ -34,12 +39,146 @@ def leer(fn="entrada.json"):
     regs = json.load(jsonfile)
     return regs
 
+
+def iterar(fn="entrada.json", tamanio_bloque=TAMANIO_BLOQUE):
+    "Analiza un archivo JSON y devuelve los comprobantes de a uno (generador)"
+    # acepta ruta o archivo ya abierto (por ej. stdin o un socket)
+    if hasattr(fn, "read"):
+        jsonfile = fn
+    else:
+        jsonfile = open(fn, "rb")
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    # estado del analizador: buffer pendiente, posicion y fin de archivo
+    estado = {'buf': "", 'pos': 0, 'eof': False}
+
+    def leer_bloque():
+        "Agrega un bloque al buffer, descartando lo ya procesado"
+        bloque = jsonfile.read(tamanio_bloque)
+        if not isinstance(bloque, str):
+            bloque = utf8.decode(bloque, final=not bloque)
+        if not bloque:
+            estado['eof'] = True
+        estado['buf'] = estado['buf'][estado['pos']:] + bloque
+        estado['pos'] = 0
+
+    def saltear_espacios():
+        "Avanza hasta el proximo caracter significativo (None si no hay mas)"
+        while True:
+            buf, pos = estado['buf'], estado['pos']
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            estado['pos'] = pos
+            if pos < len(buf):
+                return buf[pos]
+            if estado['eof']:
+                return None
+            leer_bloque()
+
+    try:
+        c = saltear_espacios()
+        if c is None:
+            return
+        if c != "[":
+            # no es una lista de comprobantes: analizo todo el contenido
+            while not estado['eof']:
+                leer_bloque()
+            reg = json.loads(estado['buf'])
+            for reg in (reg if isinstance(reg, list) else [reg]):
+                yield reg
+            return
+        estado['pos'] += 1
+        while True:
+            c = saltear_espacios()
+            if c is None:
+                raise ValueError("JSON incompleto: falta cerrar la lista")
+            if c == "]":
+                return
+            if c == ",":
+                estado['pos'] += 1
+                continue
+            try:
+                reg, fin = decoder.raw_decode(estado['buf'], estado['pos'])
+            except ValueError:
+                # comprobante incompleto en el buffer, leer mas datos
+                if estado['eof']:
+                    raise
+                leer_bloque()
+                continue
+            if fin == len(estado['buf']) and not estado['eof']:
+                # puede ser un valor escalar truncado (por ej. un numero)
+                leer_bloque()
+                continue
+            estado['pos'] = fin
+            yield reg
+    finally:
+        if jsonfile is not fn:
+            jsonfile.close()
+
     
-def escribir(filas, fn="salida.json"):
+def escribir(filas, fn="salida.json", compacto=False):
     "Dado una lista de comprobantes (diccionarios), escribe JSON"
-    import codecs
-    jsonfile = codecs.open(fn, "w")
-    json.dump(filas, jsonfile, sort_keys=True, indent=4, encoding="utf-8",)
-    jsonfile.close()
+    escritor = Escritor(fn, compacto)
+    try:
+        for fila in filas:
+            escritor.escribir(fila)
+    finally:
+        escritor.cerrar()
+
+
+class Escritor:
+    "Graba una lista JSON de comprobantes de a uno (sin armarla en memoria)"
+
+    def __init__(self, fn="salida.json", compacto=False, sort_keys=True):
+        # acepta ruta o archivo ya abierto (por ej. sock.makefile("wb"))
+        if hasattr(fn, "write"):
+            self.archivo = fn
+        else:
+            self.archivo = codecs.open(fn, "w", "utf-8")
+        self.fn = fn
+        self.compacto = compacto
+        self.sort_keys = sort_keys
+        self.cantidad = 0
+
+    def escribir(self, reg):
+        "Serializa y graba un comprobante (diccionario)"
+        if self.compacto:
+            texto = json.dumps(reg, sort_keys=self.sort_keys, default=str,
+                               separators=(",", ":"))
+            sep = self.cantidad and "," or "["
+        else:
+            # mismo formato que json.dump(regs, indent=4) de la lista completa
+            texto = json.dumps(reg, sort_keys=self.sort_keys, default=str,
+                               indent=4)
+            texto = "\n".join(["    " + l for l in texto.split("\n")])
+            sep = self.cantidad and ",\n" or "[\n"
+        self.grabar(sep + texto)
+        self.cantidad += 1
+
+    def grabar(self, texto):
+        "Envia el texto al archivo (binario o de texto) o socket"
+        try:
+            self.archivo.write(texto)
+        except TypeError:
+            self.archivo.write(texto.encode("utf-8"))
+
+    def cerrar(self):
+        "Cierra la lista JSON (y el archivo, si fue abierto por el escritor)"
+        if not self.cantidad:
+            self.grabar("[]")
+        elif self.compacto:
+            self.grabar("]")
+        else:
+            self.grabar("\n]")
+        if self.archivo is not self.fn:
+            self.archivo.close()
+        else:
+            self.archivo.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cerrar()
 
     
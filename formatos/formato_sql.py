@@ -23,6 +23,7 @@ CAE_NULL = None
 FECHA_VTO_NULL = None
 RESULTADO_NULL = None
 NULL = None
+TAMANIO_LOTE = 100      # filas de encabezado a traer por vez (fetchmany)
 
 
 def esquema_sql(tipos_registro, conf={}):
@@ -67,6 +68,12 @@ def esquema_sql(tipos_registro, conf={}):
         yield '\n'.join(sql)    
 
 
+class Campos(dict):
+    "Mapeo de nombres de campos (sin configurar: mismo nombre de columna)"
+    def __missing__(self, clave):
+        return clave
+
+
 def configurar(schema):
     tablas = {}
     campos = {}
@@ -74,7 +81,7 @@ def configurar(schema):
     if not schema:
         for tabla in "encabezado", "detalle", "cmp_asoc", "permiso", "tributo", "iva":
             tablas[tabla] = tabla
-            campos[tabla] = {"id": "id"}
+            campos[tabla] = Campos({"id": "id"})
             campos_rev[tabla] = dict([(v, k) for k, v in list(campos[tabla].items())])
     return tablas, campos, campos_rev
 
@@ -86,6 +93,16 @@ def ejecutar(cur, sql, params=None):
         return cur.execute(sql, params)
 
 
+def iterar_filas(cur, cantidad=TAMANIO_LOTE):
+    "Devuelve las filas de la consulta de a una (trae de a lotes, fetchmany)"
+    while True:
+        rows = cur.fetchmany(cantidad)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
 def max_id(db, schema={}):
     cur = db.cursor()
     tablas, campos, campos_rev = configurar(schema)
@@ -108,12 +125,12 @@ def redondear(formato, clave, valor):
     # corregir redondeo (aparentemente sqlite no guarda correctamente los decimal)
     import decimal
     try:
-        long = [fmt[1] for fmt in formato if fmt[0]==clave]
+        longitud = [fmt[1] for fmt in formato if fmt[0]==clave]
         tipo = [fmt[2] for fmt in formato if fmt[0]==clave]
         if not tipo:
             return valor
         tipo = tipo[0]
-        if DEBUG: print("tipo", tipo, clave, valor, int)
+        if DEBUG: print("tipo", tipo, clave, valor, longitud)
         if valor is None:
             return None
         if valor == "":
@@ -126,8 +143,8 @@ def redondear(formato, clave, valor):
             valor = str(valor)
         if isinstance(valor, str):
             valor = Decimal(valor) 
-        if int and isinstance(int[0], (tuple, list)):
-            decimales = Decimal('1')  / Decimal(10**(int[0][1]))
+        if longitud and isinstance(longitud[0], (tuple, list)):
+            decimales = Decimal('1')  / Decimal(10**(longitud[0][1]))
         else:
             decimales = Decimal('.01')
         valor1 = valor.quantize(decimales, rounding=decimal.ROUND_DOWN)
@@ -222,6 +239,9 @@ def modificar(fact, db, schema={}, webservice="wsfev1", ids=None, conf_db={}):
 def leer(db, schema={}, webservice="wsfev1", ids=None, **kwargs):
     from .formato_txt import ENCABEZADO, DETALLE, TRIBUTO, IVA, CMP_ASOC, PERMISO, DATO
     tablas, campos, campos_rev = configurar(schema)
+    # los encabezados se recorren con su propio cursor (sin cargarlos todos)
+    # y las consultas de los sub-registros usan el segundo cursor
+    cur_enc = db.cursor()
     cur = db.cursor()
     if kwargs:
         query = ("SELECT * FROM %(encabezado)s" % tablas)
@@ -232,15 +252,14 @@ def leer(db, schema={}, webservice="wsfev1", ids=None, **kwargs):
         query = ("SELECT * FROM %(encabezado)s WHERE " % tablas) + " OR ".join(["%(id)s=?" % campos["encabezado"] for id in ids])
     if DEBUG: print("ejecutando",query, ids)
     try:
-        ejecutar(cur, query, ids)
-        rows = cur.fetchall()
-        description = cur.description
-        for row in rows:
+        ejecutar(cur_enc, query, ids)
+        description = cur_enc.description
+        for row in iterar_filas(cur_enc):
             detalles = []
             encabezado = {}
             for i, k in enumerate(description):
                 val = row[i]
-                if isinstance(val,str):
+                if isinstance(val,bytes):
                     val = val.decode(CHARSET)
                 if isinstance(val,str):
                     val = val.strip()
@@ -255,7 +274,7 @@ def leer(db, schema={}, webservice="wsfev1", ids=None, **kwargs):
                 detalle = {}
                 for i, k in enumerate(cur.description):
                     val = it[i]
-                    if isinstance(val,str):
+                    if isinstance(val,bytes):
                         val = val.decode(CHARSET)
                     key = campos_rev["detalle"].get(k[0], k[0].lower())
                     val = redondear(DETALLE, key, val)
@@ -321,6 +340,7 @@ def leer(db, schema={}, webservice="wsfev1", ids=None, **kwargs):
         db.commit()
     finally:
         cur.close()
+        cur_enc.close()
 
 
 def ayuda():
@@ -200,14 +200,14 @@ def escribir_linea_txt(dic, formato):
             if not isinstance(valor, str):
                 valor = str(valor)
             if isinstance(valor, str):
-                valor = valor.encode(CHARSET, "replace")
+                # descarto caracteres no representables en el juego de car.
+                valor = valor.encode(CHARSET, "replace").decode(CHARSET)
             if valor == 'None':
                 valor = ''
             if tipo == N and valor and valor!="NULL":
                 valor = ("%%0%dd" % longitud) % int(valor)
             elif tipo == I and valor:
                 valor = ("%%0%d.%df" % (longitud+1, decimales) % float(valor)).replace(".", "")
-                print("valor", valor)
             else:
                 valor = ("%%-%ds" % longitud) % valor.replace("\n","\v") # reemplazo salto de linea
             # reemplazo saltos de linea por tabulaci{on vertical
@@ -222,13 +222,27 @@ def escribir_linea_txt(dic, formato):
 
 def leer(fn="entrada.txt"):
     "Analiza un archivo TXT y devuelve un diccionario"
-    f_entrada = open(fn,"r")
+    return list(iterar(fn))
+
+
+def iterar(fn="entrada.txt"):
+    "Analiza un archivo TXT y devuelve los comprobantes de a uno (generador)"
+    # acepta ruta o archivo ya abierto (por ej. stdin o un socket)
+    if hasattr(fn, "read"):
+        f_entrada = fn
+    else:
+        f_entrada = open(fn, "rb")
     try:
-        regs = []
         reg = None
         for linea in f_entrada:
-            linea = str(linea, CHARSET)
+            if not isinstance(linea, str):
+                linea = str(linea, CHARSET)
+            if not linea.strip():
+                continue
             if str(linea[0])=='0':
+                # el comprobante anterior ya esta completo, lo devuelvo:
+                if reg is not None:
+                    yield reg
                 encabezado = leer_linea_txt(linea, ENCABEZADO)
                 reg = encabezado
                 if not reg.get('cbt_numero'):
@@ -242,7 +256,6 @@ def leer(fn="entrada.txt"):
                     'detalles': [],
                     'datos': [],
                 })
-                regs.append(reg)
             elif str(linea[0])=='1':
                 detalle = leer_linea_txt(linea, DETALLE)
                 detalle['id'] = encabezado['id']
@@ -270,14 +283,19 @@ def leer(fn="entrada.txt"):
                 print(dato)
             else:
                 print("Tipo de registro incorrecto:", linea[0])
+        if reg is not None:
+            yield reg
     finally:
-        f_entrada.close()
-
-    return regs
+        if f_entrada is not fn:
+            f_entrada.close()
 
 
 def escribir(regs, archivo):
-    f_salida = open(archivo,"a")
+    "Graba los comprobantes de a uno (acepta ruta o archivo ya abierto)"
+    if hasattr(archivo, "write"):
+        f_salida = archivo
+    else:
+        f_salida = open(archivo, "a", encoding=CHARSET)
 
     for reg in regs:
         reg['tipo_reg'] = 0
@@ -304,7 +322,8 @@ def escribir(regs, archivo):
             it['tipo_reg'] = 9
             f_salida.write(escribir_linea_txt(it, DATO))
 
-    f_salida.close()
+    if f_salida is not archivo:
+        f_salida.close()
     
     
 def ayuda():
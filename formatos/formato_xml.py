@@ -16,8 +16,11 @@ __author__ = "Mariano Reingart (reingart@gmail.com)"
 __copyright__ = "Copyright (C) 2010 Mariano Reingart"
 __license__ = "GPL 3.0"
 
-from pysimplesoap.simplexml import SimpleXMLElement
+import datetime
 from decimal import Decimal
+from io import BytesIO
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
 
 # Formato de entrada/salida similar al Facturador Plus, con agregados
 XML_FORMAT = {
@@ -259,6 +262,7 @@ def leer(fn="entrada.xml"):
 
 def desserializar(xml):
     "Analiza un XML y devuelve un diccionario"
+    from pysimplesoap.simplexml import SimpleXMLElement
     xml = SimpleXMLElement(xml)
 
     dic = xml.unmarshall(XML_FORMAT, strict=True)
@@ -266,70 +270,194 @@ def desserializar(xml):
     regs = []
 
     for dic_comprobante in dic['comprobantes']:
-        reg = {
-            'detalles': [],
-            'ivas': [],
-            'tributos': [],
-            'permisos': [],
-            'cmps_asocs': [],
-            }
         comp = dic_comprobante['comprobante']
-        mapear(reg, comp, MAP_ENC)
-        reg['forma_pago']= ''.join([d['formapago']['descripcion'] for d in comp['formaspago']])
-
-
-        for detalles in comp['detalles']:
-            det = detalles['detalle']
-            reg['detalles'].append(mapear({}, det, MAP_DET))
-            
-        for ivas in comp['ivas']:
-            iva = ivas['iva']
-            reg['ivas'].append(mapear({}, iva, MAP_IVA))
-
-        for tributos in comp['tributos']:
-            tributo = tributos['tributo']
-            reg['tributos'].append(mapear({}, tributo, MAP_TRIB))
-
-        regs.append(reg)
+        regs.append(convertir_comprobante(comp))
     return regs
 
+def convertir_comprobante(comp):
+    "Convierte un comprobante facturador-plus (dict) a la estructura interna"
+    reg = {
+        'detalles': [],
+        'ivas': [],
+        'tributos': [],
+        'permisos': [],
+        'cmps_asocs': [],
+        }
+    mapear(reg, comp, MAP_ENC)
+    reg['cbte_nro'] = reg['cbt_numero']     # nombre en TXT / DBF / SQL
+    reg['forma_pago']= ''.join([d['formapago']['descripcion'] or '' 
+                                for d in comp.get('formaspago') or []])
+
+    for detalles in comp.get('detalles') or []:
+        det = detalles['detalle']
+        reg['detalles'].append(mapear({}, det, MAP_DET))
+        
+    for ivas in comp.get('ivas') or []:
+        iva = ivas['iva']
+        reg['ivas'].append(mapear({}, iva, MAP_IVA))
+
+    for tributos in comp.get('tributos') or []:
+        tributo = tributos['tributo']
+        reg['tributos'].append(mapear({}, tributo, MAP_TRIB))
+
+    return reg
+
+def iterar(fn="entrada.xml"):
+    "Analiza un archivo XML y devuelve los comprobantes de a uno (generador)"
+    # analisis incremental: solo se mantiene en memoria el comprobante actual
+    tipos = XML_FORMAT['comprobantes'][0]['comprobante']
+    raiz = None
+    for evento, elem in ElementTree.iterparse(fn, events=("start", "end")):
+        if evento == "start":
+            if raiz is None:
+                raiz = elem
+            continue
+        if elem.tag == "comprobante":
+            yield convertir_comprobante(convertir_elemento(elem, tipos))
+            # liberar el arbol ya procesado (evita que crezca la memoria)
+            elem.clear()
+            raiz.clear()
+
+def convertir_elemento(elem, tipos):
+    "Convierte un elemento (ElementTree) a dict segun tipos (simil unmarshall)"
+    dic = {}
+    for nodo in elem:
+        nombre = nodo.tag
+        if nombre not in tipos:
+            raise TypeError("Tag: %s invalid (type not found)" % (nombre,))
+        fn = tipos[nombre]
+        if isinstance(fn, list):
+            # listas anidadas: [{'detalle': {...}}]
+            valor = dic.setdefault(nombre, [])
+            for hijo in nodo:
+                valor.append(convertir_elemento([hijo], fn[0]))
+        elif isinstance(fn, dict):
+            valor = convertir_elemento(nodo, fn) if len(nodo) else None
+        elif nodo.text:
+            try:
+                valor = fn(nodo.text)
+            except (ValueError, TypeError, ArithmeticError) as e:
+                raise ValueError("Tag: %s: %s" % (nombre, e))
+        else:
+            valor = None
+        dic[nombre] = valor
+    return dic
+
     
-def escribir(regs, fn="salida.xml"):
+def escribir(regs, fn="salida.xml", compacto=True):
     "Dado una lista de comprobantes (diccionarios), convierte y escribe"
-    xml = serializar(regs)
-    open(fn, "wb").write(xml)
+    escritor = Escritor(fn, compacto)
+    try:
+        for reg in regs:
+            escritor.escribir(reg)
+    finally:
+        escritor.cerrar()
 
 def serializar(regs):
     "Dado una lista de comprobantes (diccionarios), convierte a xml"
-    xml = SimpleXMLElement(XML_BASE)
-
-    comprobantes = []
-    for reg in regs:
-        dic = {}
-        for k, v in list(MAP_ENC.items()):
-            dic[v] = reg[k]
-                
-        dic.update({
-                'detalles': [{
-                    'detalle': mapear({}, det, MAP_DET, swap=True),
-                    } for det in reg['detalles']],                
-                'tributos': [{
-                    'tributo': mapear({}, trib, MAP_TRIB, swap=True),
-                    } for trib in reg['tributos']],
-                'ivas': [{
-                    'iva': mapear({}, iva, MAP_IVA, swap=True),
-                    } for iva in reg['ivas']],
-                'formaspago': [{
-                'formapago': {
-                    'codigo': '',
-                    'descripcion': reg['forma_pago'],
-                    }}]
-                })
-        comprobantes.append(dic)
-
-    for comprobante in comprobantes:
-        xml.marshall("comprobante", comprobante)
-    return xml.as_xml()
+    xml = BytesIO()
+    escribir(regs, xml)
+    return xml.getvalue()
+
+def armar_comprobante(reg):
+    "Convierte un comprobante (estructura interna) a dict facturador-plus"
+    dic = {}
+    for k, v in list(MAP_ENC.items()):
+        # los dems formatos (ej. TXT) pueden no incluir todos los campos
+        dic[v] = reg.get(k)
+    if dic['numero'] is None:
+        dic['numero'] = reg.get('cbte_nro')
+            
+    dic.update({
+            'detalles': [{
+                'detalle': mapear({}, det, MAP_DET, swap=True),
+                } for det in reg.get('detalles') or []],
+            'tributos': [{
+                'tributo': mapear({}, trib, MAP_TRIB, swap=True),
+                } for trib in reg.get('tributos') or []],
+            'ivas': [{
+                'iva': mapear({}, iva, MAP_IVA, swap=True),
+                } for iva in reg.get('ivas') or []],
+            'formaspago': [{
+            'formapago': {
+                'codigo': '',
+                'descripcion': reg.get('forma_pago'),
+                }}]
+            })
+    return dic
+
+def marshall(partes, nombre, valor, sangria=None):
+    "Serializa un valor como elemento XML (simil SimpleXMLElement.marshall)"
+    # sangria None: salida compacta, sino nivel de indentacion del elemento
+    pre = sangria is not None and "\n" + "    " * sangria or ""
+    sig = sangria is not None and sangria + 1 or None
+    if isinstance(valor, (dict, list)) and valor:
+        partes.append("%s<%s>" % (pre, nombre))
+        # las listas son de dicts con un elemento: [{'iva': {...}}, ...]
+        for item in (isinstance(valor, dict) and [valor] or valor):
+            for k, v in list(item.items()):
+                marshall(partes, k, v, sig)
+        partes.append("%s</%s>" % (pre, nombre))
+    elif valor is None or isinstance(valor, (dict, list)):
+        partes.append("%s<%s/>" % (pre, nombre))
+    else:
+        if isinstance(valor, bool):
+            valor = valor and 'true' or 'false'
+        elif isinstance(valor, Decimal):
+            valor = '{0:f}'.format(valor)
+        elif isinstance(valor, datetime.datetime):
+            valor = valor.isoformat()
+        elif isinstance(valor, datetime.date):
+            valor = valor.strftime("%Y-%m-%d")
+        elif not isinstance(valor, str):
+            valor = str(valor)
+        partes.append("%s<%s>%s</%s>" % (pre, nombre, 
+                                         escape(valor, {'"': "&quot;"}), nombre))
+
+
+class Escritor:
+    "Graba un XML de comprobantes de a uno (sin armar el arbol en memoria)"
+
+    def __init__(self, fn="salida.xml", compacto=True):
+        # acepta ruta o archivo ya abierto (por ej. sock.makefile("wb"))
+        if hasattr(fn, "write"):
+            self.archivo = fn
+        else:
+            self.archivo = open(fn, "wb")
+        self.fn = fn
+        self.compacto = compacto
+        self.cantidad = 0
+        self.grabar('<?xml version="1.0" encoding="UTF-8"?>')
+        self.grabar(compacto and "<comprobantes>" or "\n<comprobantes>")
+
+    def escribir(self, reg):
+        "Convierte y graba un comprobante (diccionario)"
+        partes = []
+        marshall(partes, "comprobante", armar_comprobante(reg),
+                 not self.compacto and 1 or None)
+        self.grabar("".join(partes))
+        self.cantidad += 1
+
+    def grabar(self, texto):
+        "Envia el texto al archivo (binario o de texto) o socket"
+        try:
+            self.archivo.write(texto.encode("utf-8"))
+        except TypeError:
+            self.archivo.write(texto)
+
+    def cerrar(self):
+        "Cierra el elemento raiz (y el archivo, si fue abierto por el escritor)"
+        self.grabar(self.compacto and "</comprobantes>" or "\n</comprobantes>\n")
+        if self.archivo is not self.fn:
+            self.archivo.close()
+        else:
+            self.archivo.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cerrar()
 
 # pruebas bsicas
 if __name__ == '__main__':
@@ -17,12 +17,13 @@ __copyright__ = "Copyright (C) 2010 Mariano Reingart"
 __license__ = "LGPL 3.0"
 __version__ = "1.01b"
 
-import os, sys, tempfile, traceback
+import os, sys, traceback
+import mimetypes, shelve
 from hashlib import md5
 import hashlib
 from pysimplesoap.simplexml import SimpleXMLElement
 
-from .utils import WebClient
+from .utils import WebClient, FileBufferString
 
 HOMO = False
 CACERT = "conf/arba.crt"   # establecimiento de canal seguro (en producción)
@@ -30,6 +31,8 @@ CACERT = "conf/arba.crt"   # establecimiento de canal seguro (en producción)
 URL = "https://dfe.test.arba.gov.ar/DomicilioElectronico/SeguridadCliente/dfeServicioConsulta.do"  # testing
 ##URL = "https://dfe.arba.gov.ar/DomicilioElectronico/SeguridadCliente/dfeServicioConsulta.do"  # produccion
 
+TAMANIO_LOTE = 100          # cantidad de CUITs por consulta (ConsultarPadron)
+
 
 XML_ENTRADA_BASE = """<?xml version = "1.0" encoding = "ISO-8859-1"?>
 <CONSULTA-ALICUOTA>
@@ -45,10 +48,11 @@ XML_ENTRADA_BASE = """<?xml version = "1.0" encoding = "ISO-8859-1"?>
 class IIBB:
     "Interfaz para el servicio de IIBB ARBA"
     _public_methods_ = ['Conectar', 'ConsultarContribuyentes',
+                        'ConsultarPadron', 'Cerrar',
                         'LeerContribuyente', 'LeerErrorValidacion',
                         'AnalizarXml', 'ObtenerTagXml']
     _public_attrs_ = ['Usuario', 'Password', 'XmlResponse',
-        'Version', 'Excepcion', 'Traceback', 'InstallDir',
+        'Version', 'Excepcion', 'Traceback', 'InstallDir', 'CacheDir',
         'NumeroComprobante', 'CantidadContribuyentes', 'CodigoHash',
         'CuitContribuyente', 'AlicuotaPercepcion', 'AlicuotaRetencion',
         'GrupoPercepcion', 'GrupoRetencion',
@@ -66,6 +70,8 @@ class IIBB:
         self.InstallDir = INSTALL_DIR
         self.client = None
         self.xml = None
+        self.CacheDir = None
+        self.caches = {}
         self.limpiar()
 
     def limpiar(self):
@@ -90,25 +96,32 @@ class IIBB:
 
     def ConsultarContribuyentes(self, fecha_desde, fecha_hasta, cuit_contribuyente):
         "Realiza la consulta remota a ARBA, estableciendo los resultados"
+        # cuit_contribuyente puede ser una lista o varios CUIT separados por ,
         self.limpiar()
         try:
+            cuits = separar_cuits(cuit_contribuyente)
 
-            self.xml = SimpleXMLElement(XML_ENTRADA_BASE)
+            # actualizo la cantidad (asignarla agregaría otro elemento)
+            self.xml = SimpleXMLElement(XML_ENTRADA_BASE.replace(
+                        "<cantidadContribuyentes>1<", 
+                        "<cantidadContribuyentes>%d<" % len(cuits)))
             self.xml.fechaDesde = fecha_desde
             self.xml.fechaHasta = fecha_hasta
-            self.xml.contribuyentes.contribuyente.cuitContribuyente = cuit_contribuyente
+            self.xml.contribuyentes.contribuyente.cuitContribuyente = cuits[0]
+            for cuit in cuits[1:]:
+                contrib = self.xml.contribuyentes.add_child("contribuyente")
+                contrib.add_child("cuitContribuyente", cuit)
 
             xml = self.xml.as_xml()
 
-            xml = xml.encode()
+            if not isinstance(xml, bytes):
+                xml = xml.encode()
             self.CodigoHash = hashlib.new("md5", xml).hexdigest()
             nombre = "DFEServicioConsulta_%s.xml" % self.CodigoHash
 
-            # guardo el xml en el archivo a enviar y luego lo re-abro:
-            archivo = open(os.path.join(tempfile.gettempdir(), nombre), "w")
-            archivo.write(xml.decode('utf-8'))
-            archivo.close()
-            archivo = open(os.path.join(tempfile.gettempdir(), nombre), "r")
+            # envío el xml desde memoria (sin archivo temporal):
+            archivo = FileBufferString(nombre, xml,
+                            mimetypes.guess_type(nombre)[0] or 'text/xml')
 
             if not self.testing:
                 response = self.client(user=self.Usuario, password=self.Password,
@@ -137,6 +150,14 @@ class IIBB:
                         self.contribuyentes.append(c)
                     # establecer valores del primer contrib (sin eliminarlo)
                     self.LeerContribuyente(pop=False)
+            if not self.TipoError:
+                # guardo las alícuotas para no volver a consultarlas
+                cache = self.abrir_cache(fecha_desde, fecha_hasta)
+                for c in self.contribuyentes:
+                    cache[c['CuitContribuytente']] = c
+                if hasattr(cache, "sync"):
+                    # grabo a disco (por si no se llama a Cerrar)
+                    cache.sync()
             return True
         except Exception as e:
                 ex = traceback.format_exception( sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
@@ -147,6 +168,46 @@ class IIBB:
                     self.Excepcion = "<no disponible>"
                 return False
 
+    def ConsultarPadron(self, fecha_desde, fecha_hasta, cuits, 
+                        tamanio_lote=TAMANIO_LOTE):
+        "Obtiene las alícuotas de los CUITs (cache del período o consultas)"
+        cache = self.abrir_cache(fecha_desde, fecha_hasta)
+        cuits = separar_cuits(cuits)
+        pendientes = [cuit for cuit in cuits if cuit not in cache]
+        # consulto los faltantes agrupados (varios contribuyentes por pedido)
+        for i in range(0, len(pendientes), int(tamanio_lote)):
+            ok = self.ConsultarContribuyentes(fecha_desde, fecha_hasta,
+                                    pendientes[i:i + int(tamanio_lote)])
+            if not ok or self.TipoError:
+                return False
+        self.limpiar()
+        self.contribuyentes = [dict(cache[cuit]) for cuit in cuits 
+                               if cuit in cache]
+        self.CantidadContribuyentes = len(self.contribuyentes)
+        # establecer valores del primer contrib (sin eliminarlo)
+        self.LeerContribuyente(pop=False)
+        return True
+
+    def abrir_cache(self, fecha_desde, fecha_hasta):
+        "Devuelve las alícuotas ya obtenidas para el período (uso interno)"
+        periodo = (str(fecha_desde), str(fecha_hasta))
+        if periodo not in self.caches:
+            if self.CacheDir:
+                # diccionario persistente, un archivo por período
+                fn = os.path.join(self.CacheDir, "iibb_%s_%s.dat" % periodo)
+                self.caches[periodo] = shelve.open(fn)
+            else:
+                self.caches[periodo] = {}
+        return self.caches[periodo]
+
+    def Cerrar(self):
+        "Graba y cierra las caches de alícuotas abiertas"
+        caches, self.caches = self.caches, {}
+        for cache in caches.values():
+            if hasattr(cache, "close"):
+                cache.close()
+        return True
+
     def LeerContribuyente(self, pop=True):
         "Leeo el próximo contribuyente"
         # por compatibilidad hacia atras, la primera vez no remueve de la lista
@@ -204,6 +265,13 @@ class IIBB:
             self.Excepcion = "%s" % (e)
 
 
+def separar_cuits(cuits):
+    "Convierte la lista o texto (separado por comas o espacios) de CUITs"
+    if isinstance(cuits, (str, int)):
+        cuits = str(cuits).replace(",", " ").split()
+    return [str(cuit).strip() for cuit in cuits]
+
+
 # busco el directorio de instalación (global para que no cambie si usan otra dll)
 if not hasattr(sys, "frozen"):
     basepath = __file__
@@ -251,7 +319,15 @@ if __name__=="__main__":
                 break
 
     iibb.Conectar(URL, trace='--trace' in sys.argv, cacert=None, testing=test_response)
-    iibb.ConsultarContribuyentes(fecha_desde, fecha_hasta, cuit_contribuyente)
+    if '--cache' in sys.argv:
+        # varios CUIT separados por comas, agrupados y guardados por período
+        iibb.CacheDir = sys.argv[sys.argv.index("--cache") + 1]
+        try:
+            iibb.ConsultarPadron(fecha_desde, fecha_hasta, cuit_contribuyente)
+        finally:
+            iibb.Cerrar()
+    else:
+        iibb.ConsultarContribuyentes(fecha_desde, fecha_hasta, cuit_contribuyente)
 
     if iibb.Excepcion:
         print("Excepcion:", iibb.Excepcion)
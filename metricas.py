@@ -0,0 +1,287 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Módulo de métricas (tiempos y tamaños) de las llamadas a los webservices"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# Uso:
+#   from pyafipws import metricas
+#   registro = metricas.activar(prometheus="/var/lib/node_exporter/afip.prom",
+#                               statsd="localhost:8125")
+# Cada método decorado con utils.inicializar_y_capturar_excepciones registra
+# (por servicio y método): duración total, serialización, red y análisis de
+# la respuesta, bytes enviados / recibidos, reintentos y código de falla.
+# Deshabilitado (predeterminado), el decorador sólo verifica utils.METRICAS.
+
+import atexit
+import bisect
+import os
+import socket
+import threading
+import time
+
+from .reintentos import TransporteHttp
+
+DEBUG = False
+
+# límites de los intervalos de los histogramas (segundos y bytes)
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                    10, 30, 60)
+LIMITES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# medida: (unidad, límites)
+MEDIDAS = {
+    'duracion': ("segundos", LIMITES_SEGUNDOS),
+    'serializacion': ("segundos", LIMITES_SEGUNDOS),
+    'red': ("segundos", LIMITES_SEGUNDOS),
+    'analisis': ("segundos", LIMITES_SEGUNDOS),
+    'solicitud': ("bytes", LIMITES_BYTES),
+    'respuesta': ("bytes", LIMITES_BYTES),
+    }
+
+
+class Histograma:
+    "Histograma acumulativo de valores (intervalos fijos, estilo Prometheus)"
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)     # el último es +Inf
+        self.suma = 0
+        self.cantidad = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.cantidad += 1
+
+    def acumulado(self):
+        "Devuelve pares (límite, cantidad <= límite) incluyendo +Inf"
+        total = 0
+        for limite, cuenta in zip(self.limites + ("+Inf", ), self.cuentas):
+            total += cuenta
+            yield limite, total
+
+
+class Medicion:
+    "Datos de una llamada en curso (se vuelca al registro al finalizar)"
+
+    def __init__(self, registro, servicio, metodo):
+        self.registro = registro
+        self.servicio = servicio
+        self.metodo = metodo
+        self.reintentos = 0
+        self.falla = None
+        self.inicio = time.perf_counter()
+        self.red = 0
+        self.red_inicio = self.red_fin = None
+        self.transporte = self.anterior = None
+
+    def finalizar(self, ws):
+        "Calcula los tiempos y tamaños y los registra"
+        fin = time.perf_counter()
+        if self.transporte is not None:
+            # restauro la medición de la llamada externa (métodos anidados)
+            self.transporte.medicion = self.anterior
+        valores = {'duracion': fin - self.inicio}
+        if self.red_inicio is not None:
+            # serialización: hasta enviar; análisis: desde recibir
+            valores['serializacion'] = self.red_inicio - self.inicio
+            valores['red'] = self.red
+            valores['analisis'] = fin - self.red_fin
+        client = getattr(ws, "client", None)
+        if client is not None and self.red_inicio is not None:
+            valores['solicitud'] = len(client.xml_request or "")
+            valores['respuesta'] = len(client.xml_response or "")
+        self.registro.registrar(self.servicio, self.metodo, valores,
+                                self.reintentos, self.falla)
+
+
+class TransporteMedido(TransporteHttp):
+    "Envoltorio del transporte HTTP del cliente SOAP (mide el tiempo de red)"
+
+    def __init__(self, http):
+        TransporteHttp.__init__(self, http)
+        self.medicion = None
+
+    def request(self, *args, **kwargs):
+        medicion = self.medicion
+        inicio = time.perf_counter()
+        try:
+            return self.http.request(*args, **kwargs)
+        finally:
+            if medicion is not None:
+                medicion.red_fin = time.perf_counter()
+                medicion.red += medicion.red_fin - inicio
+                if medicion.red_inicio is None:
+                    medicion.red_inicio = inicio
+
+
+class Registro:
+    "Registro en memoria de los histogramas por servicio y método"
+
+    def __init__(self, exportadores=None):
+        self.lock = threading.Lock()
+        self.histogramas = {}       # (servicio, metodo, medida): Histograma
+        self.llamadas = {}          # (servicio, metodo): cantidad
+        self.reintentos = {}        # (servicio, metodo): cantidad
+        self.fallas = {}            # (servicio, metodo, codigo): cantidad
+        self.exportadores = list(exportadores or [])
+
+    def iniciar(self, ws, metodo):
+        "Comienza la medición de una llamada (invocado por el decorador)"
+        medicion = Medicion(self, ws.__class__.__name__, metodo)
+        client = getattr(ws, "client", None)
+        if client is not None:
+            http = client.http
+            if not isinstance(http, TransporteMedido):
+                http = client.http = TransporteMedido(http)
+            medicion.transporte, medicion.anterior = http, http.medicion
+            http.medicion = medicion
+        return medicion
+
+    def registrar(self, servicio, metodo, valores, reintentos=0, falla=None):
+        "Agrega los valores medidos de una llamada"
+        clave = (servicio, metodo)
+        with self.lock:
+            self.llamadas[clave] = self.llamadas.get(clave, 0) + 1
+            if reintentos:
+                self.reintentos[clave] = self.reintentos.get(clave, 0) + reintentos
+            if falla:
+                clave_falla = (servicio, metodo, falla)
+                self.fallas[clave_falla] = self.fallas.get(clave_falla, 0) + 1
+            for medida, valor in valores.items():
+                histograma = self.histogramas.get(clave + (medida, ))
+                if histograma is None:
+                    histograma = Histograma(MEDIDAS[medida][1])
+                    self.histogramas[clave + (medida, )] = histograma
+                histograma.observar(valor)
+        for exportador in self.exportadores:
+            try:
+                exportador(servicio, metodo, valores, reintentos, falla)
+            except Exception as e:
+                # las métricas nunca deben interrumpir la llamada al servicio
+                if DEBUG: print("Error exportando métricas:", e)
+
+    def exportar_prometheus(self, archivo):
+        "Graba las métricas en formato texto de Prometheus (node_exporter)"
+        tmp = "%s.%d.tmp" % (archivo, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.texto_prometheus())
+        # reemplazo atómico (el colector nunca lee un archivo incompleto)
+        os.replace(tmp, archivo)
+
+    def texto_prometheus(self):
+        "Devuelve las métricas en formato de exposición de Prometheus"
+        lineas = []
+        with self.lock:
+            for nombre, contadores in (("llamadas", self.llamadas),
+                                       ("reintentos", self.reintentos)):
+                nombre = "pyafipws_%s_total" % nombre
+                lineas.append("# TYPE %s counter" % nombre)
+                for (servicio, metodo), cantidad in sorted(contadores.items()):
+                    lineas.append('%s{servicio="%s",metodo="%s"} %d' % (
+                                  nombre, servicio, metodo, cantidad))
+            lineas.append("# TYPE pyafipws_fallas_total counter")
+            for (servicio, metodo, codigo), cantidad in sorted(self.fallas.items()):
+                lineas.append('pyafipws_fallas_total{servicio="%s",metodo="%s",'
+                              'codigo="%s"} %d' % (servicio, metodo,
+                              codigo.replace('"', "'"), cantidad))
+            # estado de los cortacircuitos (1: abierto, fallando rápido)
+            from .reintentos import estados
+            circuitos = estados()
+            for nombre, clave in (("circuito_abierto", None),
+                                  ("circuito_fallas", "fallas"),
+                                  ("circuito_rechazadas", "rechazadas")):
+                lineas.append("# TYPE pyafipws_%s gauge" % nombre)
+                for servidor, estado in circuitos.items():
+                    valor = estado[clave] if clave else int(estado['estado'] != "cerrado")
+                    lineas.append('pyafipws_%s{servidor="%s"} %d' % (
+                                  nombre, servidor, valor))
+            # límites de concurrencia (AIMD) y solicitudes en curso
+            from .concurrencia import estados
+            limitadores = estados()
+            for nombre, clave in (("concurrencia_limite", "limite"),
+                                  ("concurrencia_en_curso", "en_curso"),
+                                  ("concurrencia_reducciones", "reducciones"),
+                                  ("concurrencia_excedidas", "excedidas")):
+                lineas.append("# TYPE pyafipws_%s gauge" % nombre)
+                for servidor, estado in limitadores.items():
+                    lineas.append('pyafipws_%s{servidor="%s"} %d' % (
+                                  nombre, servidor, estado[clave]))
+            for medida in sorted(MEDIDAS):
+                nombre = "pyafipws_%s_%s" % (medida, MEDIDAS[medida][0])
+                lineas.append("# TYPE %s histogram" % nombre)
+                for (servicio, metodo, m), histograma in sorted(self.histogramas.items()):
+                    if m != medida:
+                        continue
+                    etiquetas = 'servicio="%s",metodo="%s"' % (servicio, metodo)
+                    for limite, cantidad in histograma.acumulado():
+                        lineas.append('%s_bucket{%s,le="%s"} %d' % (
+                                      nombre, etiquetas, limite, cantidad))
+                    lineas.append("%s_sum{%s} %s" % (nombre, etiquetas,
+                                                    repr(histograma.suma)))
+                    lineas.append("%s_count{%s} %d" % (nombre, etiquetas,
+                                                      histograma.cantidad))
+        return "\n".join(lineas) + "\n"
+
+
+class ExportadorStatsd:
+    "Envía cada medición a un servidor statsd (UDP, sin esperar respuesta)"
+
+    def __init__(self, servidor="localhost", puerto=8125, prefijo="pyafipws"):
+        self.direccion = (servidor, int(puerto))
+        self.prefijo = prefijo
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, servicio, metodo, valores, reintentos=0, falla=None):
+        prefijo = "%s.%s.%s" % (self.prefijo, servicio, metodo)
+        lineas = ["%s.llamadas:1|c" % prefijo]
+        for medida, valor in sorted(valores.items()):
+            if MEDIDAS[medida][0] == "segundos":
+                lineas.append("%s.%s:%.3f|ms" % (prefijo, medida, valor * 1000))
+            else:
+                lineas.append("%s.%s:%d|h" % (prefijo, medida, valor))
+        if reintentos:
+            lineas.append("%s.reintentos:%d|c" % (prefijo, reintentos))
+        if falla:
+            lineas.append("%s.fallas.%s:1|c" % (prefijo,
+                          falla.replace(".", "_").replace(":", "_")))
+        try:
+            self.sock.sendto("\n".join(lineas).encode("utf8"), self.direccion)
+        except socket.error as e:
+            if DEBUG: print("Error enviando a statsd:", e)
+
+
+def activar(registro=None, prometheus=None, statsd=None):
+    "Habilita la recolección de métricas en todos los webservices"
+    # prometheus: archivo de texto (se graba al finalizar el proceso)
+    # statsd: "servidor:puerto" para enviar cada medición por UDP
+    from . import utils
+    if registro is None:
+        registro = Registro()
+    if statsd:
+        servidor, _, puerto = statsd.partition(":")
+        registro.exportadores.append(ExportadorStatsd(servidor, puerto or 8125))
+    if prometheus:
+        atexit.register(registro.exportar_prometheus, prometheus)
+    utils.METRICAS = registro
+    return registro
+
+
+def desactivar():
+    "Deshabilita la recolección de métricas (devuelve el registro anterior)"
+    from . import utils
+    registro, utils.METRICAS = utils.METRICAS, None
+    return registro
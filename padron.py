@@ -388,15 +388,20 @@ class PadronAFIP():
         "Llama a la API para descargar una constancia de inscripcion (PDF)"
         if not self.client:
             self.Conectar()
-        self.response = self.client("sr-padron", "v1", "constancia", str(nro_doc))
-        if self.response.startswith("{"):
+        # el PDF se graba a medida que se recibe (sin cargarlo en memoria)
+        self.client.download(filename, "sr-padron", "v1", "constancia", str(nro_doc))
+        with open(filename, "rb") as f:
+            inicio = f.read(1)
+            if inicio == b"{":
+                # en lugar del PDF se recibió el error (JSON)
+                self.response = inicio + f.read()
+        if self.response:
+            os.remove(filename)
             result = json.loads(self.response)
             assert not result["success"]
             self.Excepcion = result['error']['mensaje']
             return False
         else:
-            with open(filename, "wb") as f:
-                f.write(self.response)
             return True
 
     @inicializar_y_capturar_excepciones_simple
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Plantillas precompiladas de los sobres SOAP de las operaciones frecuentes"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# Para cada solicitud pysimplesoap valida los parámetros contra el WSDL, los
+# ordena (sort_dict) y arma el DOM (minidom) elemento por elemento antes de
+# serializarlo. Para las operaciones de mayor volumen (FECAESolicitar,
+# autorizarComprobante) se compila una vez por operación
+# la plantilla del sobre: etiquetas de apertura / cierre ya armadas (con los
+# mismos espacios de nombres que usaría pysimplesoap) en el orden del esquema,
+# y sólo se escapan y escriben los valores, generando el mismo XML.
+# Si los parámetros no se ajustan a la plantilla (tipos inesperados, listas
+# de listas, etc.) se usa el camino normal de pysimplesoap.
+#
+# Uso: atributo Plantillas de cada interfaz (ver utils.BaseWS.Conectar)
+
+from pysimplesoap.client import SimpleXMLElement, soap_namespaces
+from pysimplesoap.helpers import TYPE_MAP, TYPE_MARSHAL_FN
+
+DEBUG = False
+
+# clases de nodo de la plantilla:
+VALOR, ESTRUCTURA, LISTA, LISTA_SIMPLE = range(4)
+
+MAX_PROFUNDIDAD = 30        # evitar tipos recursivos
+
+
+class NoCompatible(Exception):
+    "Los parámetros (o el tipo) no se pueden armar con la plantilla"
+
+
+def escapar(texto):
+    "Escapa el texto igual que minidom (toxml)"
+    if "&" in texto:
+        texto = texto.replace("&", "&amp;")
+    if "<" in texto:
+        texto = texto.replace("<", "&lt;")
+    if '"' in texto:
+        texto = texto.replace('"', "&quot;")
+    if ">" in texto:
+        texto = texto.replace(">", "&gt;")
+    return texto
+
+
+def etiquetas(nombre, ns, prefijo):
+    "Devuelve (apertura, cierre, vacía) como las agrega SimpleXMLElement"
+    if ns and isinstance(ns, str):
+        apertura = '%s xmlns="%s"' % (nombre, escapar(ns))
+    elif ns and prefijo:
+        apertura = nombre = "%s:%s" % (prefijo, nombre)
+    else:
+        apertura = nombre
+    return "<%s>" % apertura, "</%s>" % nombre, "<%s/>" % apertura
+
+
+def compilar(tipos, prefijo, use_ns=None, raiz=False, profundidad=0):
+    "Convierte los tipos de la entrada en la plantilla (claves, nodos)"
+    if not isinstance(tipos, dict) or None in tipos:
+        raise NoCompatible("tipo no soportado: %r" % (tipos, ))
+    if profundidad > MAX_PROFUNDIDAD:
+        raise NoCompatible("tipo recursivo")
+    namespaces = getattr(tipos, "namespaces", {})
+    referencias = getattr(tipos, "references", {})
+    nodos = []
+    for nombre in tipos:
+        tipo = tipos[nombre]
+        if not raiz:
+            # hijos: espacio de nombres del elemento en el esquema
+            ns = namespaces.get(nombre)
+        elif isinstance(tipo, dict) and use_ns:
+            # parámetros: ver SoapClient.wsdl_call_get_params y call
+            if referencias.get(nombre):
+                ns = getattr(tipo, "namespaces", {}).get(None, True)
+            elif nombre in namespaces:
+                ns = namespaces[nombre]
+            else:
+                raise NoCompatible("sin espacio de nombres: %s" % nombre)
+        else:
+            ns = use_ns
+        apertura, cierre, vacio = etiquetas(nombre, ns, prefijo)
+        if isinstance(tipo, dict):
+            clase = ESTRUCTURA
+            sub = compilar(tipo, prefijo, profundidad=profundidad + 1)
+        elif isinstance(tipo, list):
+            if len(tipo) != 1 or tipo[0] is None:
+                raise NoCompatible("lista no soportada: %s" % nombre)
+            tipo = tipo[0]
+            if isinstance(tipo, dict):
+                # los campos de cada elemento van dentro de la etiqueta
+                clase = LISTA
+                sub = compilar(tipo, prefijo, profundidad=profundidad + 1)
+            elif isinstance(tipo, (list, tuple)):
+                raise NoCompatible("lista no soportada: %s" % nombre)
+            else:
+                # cada valor va en una etiqueta con el mismo nombre
+                clase, sub = LISTA_SIMPLE, None
+        elif tipo is None or isinstance(tipo, tuple):
+            raise NoCompatible("tipo no soportado: %s" % nombre)
+        else:
+            clase, sub = VALOR, None
+        nodos.append((nombre, clase, apertura, cierre, vacio, tipo, sub))
+    return frozenset(tipos), nodos
+
+
+def convertir(valor, tipo, nombre):
+    "Valida y convierte el valor simple a texto (igual que marshall)"
+    if isinstance(valor, str):
+        texto = valor
+    elif isinstance(valor, (dict, list, tuple, type)):
+        raise NoCompatible("valor no soportado: %s" % nombre)
+    else:
+        texto = TYPE_MARSHAL_FN.get(type(valor), str)(valor)
+    if type(valor) is not tipo and tipo in TYPE_MAP:
+        try:
+            tipo(valor)
+        except Exception:
+            raise ValueError('Invalid Args Structure. Errors: Type mismatch '
+                             'for argument %s: %r (%s)' % (nombre, valor, tipo))
+    return escapar(texto)
+
+
+def escribir(partes, plantilla, valores):
+    "Agrega los elementos no nulos (orden del esquema), devuelve la cantidad"
+    claves, nodos = plantilla
+    if not isinstance(valores, dict):
+        raise NoCompatible("se esperaba un diccionario: %r" % (valores, ))
+    for clave in valores:
+        if clave not in claves:
+            raise ValueError('Invalid Args Structure. Errors: Argument key %s '
+                             'not in parameter %s' % (clave, sorted(claves)))
+    cantidad = 0
+    for nombre, clase, apertura, cierre, vacio, tipo, sub in nodos:
+        valor = valores.get(nombre)
+        if valor is None:
+            continue            # pysimplesoap no agrega las etiquetas nulas
+        cantidad += 1
+        if clase == VALOR:
+            partes.append(apertura)
+            partes.append(convertir(valor, tipo, nombre))
+            partes.append(cierre)
+            continue
+        inicio = len(partes)
+        partes.append(apertura)
+        if clase == ESTRUCTURA:
+            escribir(partes, sub, valor)
+        else:
+            if not isinstance(valor, list):
+                raise NoCompatible("se esperaba una lista: %s" % nombre)
+            ultimo = len(valor) - 1
+            for i, item in enumerate(valor):
+                if clase == LISTA_SIMPLE:
+                    if item is None:
+                        partes.append(vacio)
+                    else:
+                        partes.append(apertura)
+                        partes.append(convertir(item, tipo, nombre))
+                        partes.append(cierre)
+                elif escribir(partes, sub, item) > 1 and i < ultimo:
+                    # cada elemento con más de un campo va en otra etiqueta
+                    partes.append(cierre)
+                    inicio = len(partes)
+                    partes.append(apertura)
+        if len(partes) == inicio + 1:
+            partes[inicio] = vacio
+        else:
+            partes.append(cierre)
+    return cantidad
+
+
+class Plantilla:
+    "Sobre SOAP precompilado de una operación (mismo XML que pysimplesoap)"
+
+    def __init__(self, client, method):
+        # se compila durante la llamada: namespace y qualified ya actualizados
+        operation = client.get_operation(method)
+        if client.plugins or operation.get('header'):
+            raise NoCompatible("encabezados o plugins no soportados")
+        entrada = operation['input']
+        if not isinstance(entrada, dict) or len(entrada) != 1:
+            raise NoCompatible("entrada no soportada")
+        self.nombre = list(entrada.keys())[0]
+        soap_server = client._SoapClient__soap_server
+        self.metodo = method if soap_server in ('axis', ) else self.nombre
+        prefijo = client._SoapClient__ns
+        soap_ns = client._SoapClient__soap_ns
+        use_ns = None if (soap_server == "jetty" or client.qualified is False) else True
+        self.plantilla = compilar(entrada[self.nombre], prefijo, use_ns, raiz=True)
+        # armo el sobre vacío igual que SoapClient.call y separo el método
+        xml = client._SoapClient__xml % dict(
+            method=self.metodo, namespace=client.namespace, ns=prefijo,
+            soap_ns=soap_ns, soap_uri=soap_namespaces[soap_ns])
+        request = SimpleXMLElement(xml, namespace=prefijo and client.namespace,
+                                   prefix=prefijo)
+        self.vacio = request.as_xml()
+        sobre = self.vacio.decode("utf8")
+        etiqueta = "%s:%s" % (prefijo, self.metodo) if prefijo else self.metodo
+        cierre = "</%s>" % etiqueta
+        if cierre in sobre:
+            i = sobre.rindex(cierre)
+            self.cabecera, self.pie = sobre[:i], sobre[i:]
+        else:
+            i = sobre.index("<%s/>" % etiqueta)
+            self.cabecera = sobre[:i] + "<%s>" % etiqueta
+            self.pie = cierre + sobre[i + len(etiqueta) + 3:]
+
+    def armar(self, valores):
+        "Devuelve el XML de la solicitud (bytes UTF-8)"
+        partes = [self.cabecera]
+        if not escribir(partes, self.plantilla, valores):
+            return self.vacio
+        partes.append(self.pie)
+        return "".join(partes).encode("utf8")
@@ -17,9 +17,14 @@ __copyright__ = "Copyright (C) 2011 Mariano Reingart"
 __license__ = "GPL 3.0"
 __version__ = "1.06f"
 
+import json
 import os
+import queue
 import sys
+import threading
+import time
 import traceback
+import uuid
 
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
@@ -32,15 +37,245 @@ from configparser import SafeConfigParser
 DEBUG = False
 
 
+def conectar_smtp(servidor, usuario=None, clave=None, puerto=25, timeout=60):
+    "Abre una sesin SMTP (SSL / TLS segn el puerto) y autentica"
+    # convertir el nro de puerto a entero porque puede ser string:
+    puerto = int(puerto)
+    if puerto != 465:
+        smtp = smtplib.SMTP(servidor, puerto, timeout=timeout)
+    else:
+        # creo una conexin segura (SSL, no disponible en Python<2.6):
+        smtp = smtplib.SMTP_SSL(servidor, puerto, timeout=timeout)
+    if DEBUG:
+        smtp.set_debuglevel(1)
+    smtp.ehlo()
+    if puerto == 587:
+        # inicio una sesin segura (TLS)
+        smtp.starttls()
+    if usuario and clave:
+        smtp.login(usuario, clave)
+    return smtp
+
+
+def rechazo_definitivo(error):
+    "Indica si el servidor rechaz el mensaje en forma definitiva (5xx)"
+    if isinstance(error, (smtplib.SMTPConnectError, smtplib.SMTPHeloError,
+                          smtplib.SMTPAuthenticationError)):
+        return False        # falla del servidor / sesin, no del mensaje
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # 4xx (casilla llena, greylisting, etc.) se reintenta luego
+        return all(codigo >= 500 for codigo, msg in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and \
+        error.smtp_code >= 500
+
+
+def armar_mensaje(remitente, motivo, destinatarios, texto, html=None, 
+                  adjuntos=(), cc=(), bcc=(), responder_a=None):
+    "Genera el correo multiparte, devuelve (remitente, destinatarios, mensaje)"
+    to = list(destinatarios)
+    msg = MIMEMultipart('related')
+    msg['Subject'] = motivo
+    msg['From'] = remitente
+    msg['Reply-to'] = responder_a or remitente
+    msg['To'] = ', '.join(to)
+    if cc:
+        msg['CC'] = ", ".join(cc)
+        to += cc
+    if bcc:
+        to += bcc
+
+    msg.preamble = 'Mensaje de multiples partes.\n'
+    
+    if html:
+        alt = MIMEMultipart('alternative')
+        msg.attach(alt)
+        part = MIMEText(texto, 'text')
+        alt.attach(part)
+        part = MIMEText(html, 'html')
+        alt.attach(part)
+    else:
+        part = MIMEText(texto)
+        msg.attach(part)
+
+    for archivo in adjuntos:
+        if isinstance(archivo, tuple):
+            nombre, contenido = archivo
+            if hasattr(contenido, "getvalue"):
+                contenido = contenido.getvalue()
+            elif hasattr(contenido, "read"):
+                contenido = contenido.read()
+        else:
+            nombre = archivo
+            with open(archivo, "rb") as f:
+                contenido = f.read()
+        part = MIMEApplication(contenido)
+        part.add_header('Content-Disposition', 'attachment', 
+                            filename=os.path.basename(nombre))
+        msg.attach(part)
+    return msg['From'], to, msg.as_string()
+
+
+class BandejaSalida:
+    "Cola persistente de correos a enviar (un archivo .eml por mensaje)"
+
+    def __init__(self, carpeta="bandeja_salida"):
+        self.carpeta = carpeta
+        self.carpeta_errores = os.path.join(carpeta, "errores")
+        os.makedirs(self.carpeta_errores, exist_ok=True)
+
+    def agregar(self, remitente, destinatarios, mensaje):
+        "Graba el mensaje en la bandeja (escritura atmica), devuelve su nombre"
+        # el nombre comienza con la fecha para respetar el orden de llegada
+        nombre = "%s_%s.eml" % (time.strftime("%Y%m%d%H%M%S"), uuid.uuid4().hex)
+        ruta = os.path.join(self.carpeta, nombre)
+        with open(ruta + ".tmp", "w", encoding="utf8", newline="\n") as f:
+            # primera linea: sobre (remitente y destinatarios) en JSON
+            f.write(json.dumps({'remitente': remitente, 
+                                'destinatarios': list(destinatarios)}))
+            f.write("\n")
+            f.write(mensaje)
+        os.replace(ruta + ".tmp", ruta)
+        return nombre
+
+    def pendientes(self):
+        "Devuelve los nombres de los mensajes a enviar (orden de llegada)"
+        return sorted([fn for fn in os.listdir(self.carpeta) 
+                       if fn.endswith(".eml")])
+
+    def leer(self, nombre):
+        "Devuelve (remitente, destinatarios, mensaje) de un mensaje encolado"
+        with open(os.path.join(self.carpeta, nombre), encoding="utf8", 
+                  newline="\n") as f:
+            sobre = json.loads(f.readline())
+            return sobre['remitente'], sobre['destinatarios'], f.read()
+
+    def enviado(self, nombre):
+        "Quita el mensaje de la bandeja"
+        os.unlink(os.path.join(self.carpeta, nombre))
+
+    def fallido(self, nombre, error):
+        "Mueve el mensaje rechazado a la carpeta de errores (con el motivo)"
+        os.replace(os.path.join(self.carpeta, nombre),
+                   os.path.join(self.carpeta_errores, nombre))
+        with open(os.path.join(self.carpeta_errores, nombre + ".txt"), "w") as f:
+            f.write(str(error))
+
+    def __len__(self):
+        return len(self.pendientes())
+
+
+class Despachador:
+    "Enva la bandeja de salida con un grupo acotado de conexiones SMTP"
+
+    def __init__(self, servidor, usuario=None, clave=None, puerto=25, 
+                 conexiones=4, reintentos=3, mensajes_por_conexion=100,
+                 espera=1, timeout=60):
+        self.servidor = servidor
+        self.usuario = usuario
+        self.clave = clave
+        self.puerto = puerto
+        self.conexiones = conexiones
+        self.reintentos = reintentos
+        self.mensajes_por_conexion = mensajes_por_conexion
+        self.espera = espera
+        self.timeout = timeout
+        self.enviados = 0
+        self.errores = []
+        self.interrupcion = None    # falla temporal que detuvo el envo
+        self.detener = threading.Event()
+        self.lock = threading.Lock()
+
+    def enviar(self, bandeja):
+        "Enva todos los mensajes pendientes, devuelve la cantidad enviada"
+        self.enviados = 0
+        self.errores = []
+        self.interrupcion = None
+        self.detener.clear()
+        cola = queue.Queue()
+        for nombre in bandeja.pendientes():
+            cola.put(nombre)
+        hilos = [threading.Thread(target=self.procesar, args=(bandeja, cola))
+                 for i in range(min(self.conexiones, cola.qsize()))]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return self.enviados
+
+    def procesar(self, bandeja, cola):
+        "Enva mensajes de la cola reutilizando una sesin SMTP (por hilo)"
+        smtp = None
+        cantidad = 0
+        try:
+            while not self.detener.is_set():
+                try:
+                    nombre = cola.get_nowait()
+                except queue.Empty:
+                    break
+                remitente, destinatarios, mensaje = bandeja.leer(nombre)
+                for intento in range(self.reintentos + 1):
+                    try:
+                        if smtp is None:
+                            smtp = conectar_smtp(self.servidor, self.usuario,
+                                                 self.clave, self.puerto,
+                                                 self.timeout)
+                            cantidad = 0
+                        smtp.sendmail(remitente, destinatarios, mensaje)
+                        error = None
+                        break
+                    except (smtplib.SMTPException, OSError) as e:
+                        error = e
+                        if rechazo_definitivo(e):
+                            break       # no reintentar (la sesin sigue)
+                        # sesin cortada, servidor cado o 4xx: reconectar
+                        smtp = self.cerrar(smtp)
+                    if intento == self.reintentos or self.detener.is_set():
+                        break
+                    time.sleep(self.espera * (intento + 1))
+                if error is None:
+                    bandeja.enviado(nombre)
+                    with self.lock:
+                        self.enviados += 1
+                elif rechazo_definitivo(error):
+                    bandeja.fallido(nombre, error)
+                    with self.lock:
+                        self.errores.append("%s: %s" % (nombre, error))
+                    continue
+                else:
+                    # falla temporal: el mensaje queda en la bandeja y se
+                    # detiene esta pasada (el resto se enviar en la prxima)
+                    with self.lock:
+                        if self.interrupcion is None:
+                            self.interrupcion = "%s: %s" % (nombre, error)
+                    self.detener.set()
+                    break
+                cantidad += 1
+                if cantidad >= self.mensajes_por_conexion:
+                    # los servidores suelen limitar los mensajes por sesin
+                    smtp = self.cerrar(smtp)
+        finally:
+            self.cerrar(smtp)
+
+    def cerrar(self, smtp):
+        "Termina la sesin SMTP (ignorando errores de conexiones ya cortadas)"
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+        return None
+
+
 class PyEmail:
     "Interfaz para enviar correos de Factura Electrnica"
     _public_methods_ = ['Conectar', 'Crear', 'Enviar',
                         'AgregarDestinatario', 'Adjuntar', 
                         'AgregarCC', 'AgregarBCC',
+                        'Encolar', 'EnviarPendientes',
                         ]
     _public_attrs_ = [
                     'Motivo', 'Remitente', 'Destinatarios', 'ResponderA',
-                    'MensajeHTML', 'MensajeTexto',
+                    'MensajeHTML', 'MensajeTexto', 'BandejaSalida',
                     'Version', 'Excepcion', 'Traceback',
                     ]
         
@@ -56,30 +291,12 @@ class PyEmail:
         self.adjuntos = []
         self.BCC = []
         self.CC = []
+        self.BandejaSalida = "bandeja_salida"
 
     def Conectar(self, servidor, usuario=None, clave=None, puerto=25):
         "Iniciar conexin al servidor de correo electronico"
         try:
-            # convertir el nro de puerto a entero porque puede ser string:
-            puerto = int(puerto)
-            if puerto != 465:
-                self.smtp = smtplib.SMTP(servidor, puerto)
-            else:
-                # creo una conexin segura (SSL, no disponible en Python<2.6):
-                self.smtp = smtplib.SMTP_SSL(servidor, puerto)
-            if DEBUG:
-                self.smtp.set_debuglevel(1)
-            self.smtp.ehlo()
-            if puerto == 587:
-                # inicio una sesin segura (TLS)
-                self.smtp.starttls()
-            if usuario and clave:
-                # convertir a string (hmac necesita string "bytes")
-                if isinstance(usuario, str):
-                    usuario = usuario.encode("utf8")
-                if isinstance(clave, str):
-                    clave = clave.encode("utf8")
-                self.smtp.login(usuario, clave)
+            self.smtp = conectar_smtp(servidor, usuario, clave, puerto)
             return True
         except Exception as e:
             ex = traceback.format_exception( sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
@@ -110,60 +327,50 @@ class PyEmail:
         self.BCC.append(destinatario)
         return True
 
-    def Adjuntar(self, archivo):
+    def Adjuntar(self, archivo, contenido=None):
         "Agrega un archivo para ser enviado como adjunto"
+        if contenido is not None:
+            # adjunto en memoria (bytes o BytesIO), archivo es solo el nombre
+            archivo = (archivo, contenido)
         self.adjuntos.append(archivo)
         return True
         
+    def armar(self, remitente="", motivo="", destinatario="", mensaje="", archivo=None):
+        "Generar el correo multiparte (uso interno)"
+        to = ([destinatario] if destinatario 
+              else self.Destinatarios)
+        if mensaje:
+            text = mensaje
+            html = None
+        else:
+            text = self.MensajeTexto
+            html = self.MensajeHTML
+        if archivo:
+            self.adjuntos.append(archivo)
+        return armar_mensaje(remitente or self.Remitente, 
+                             motivo or self.Motivo, to, text, html, 
+                             self.adjuntos, self.CC, self.BCC, 
+                             remitente or self.ResponderA)
+
     def Enviar(self, remitente="", motivo="", destinatario="", mensaje="", archivo=None):
         "Generar un correo multiparte y enviarlo"
         try:
-            to = ([destinatario] if destinatario 
-                  else self.Destinatarios)
-            
-            msg = MIMEMultipart('related')
-            msg['Subject'] = motivo or self.Motivo
-            msg['From'] = remitente or self.Remitente
-            msg['Reply-to'] = remitente or self.ResponderA
-            msg['To'] = ', '.join(to)
-            if self.CC:
-                msg['CC'] = ", ".join(self.CC)
-                to += self.CC
-            if self.BCC:
-                to += self.BCC
-
-            msg.preamble = 'Mensaje de multiples partes.\n'
-            
-            if mensaje:
-                text = mensaje
-                html = None
-            else:
-                text = self.MensajeTexto
-                html = self.MensajeHTML
-            
-            if html:
-                alt = MIMEMultipart('alternative')
-                msg.attach(alt)
-                part = MIMEText(text, 'text')
-                alt.attach(part)
-                part = MIMEText(html, 'html')
-                alt.attach(part)
-            else:
-                part = MIMEText(text)
-                msg.attach(part)
-            
-            if archivo:
-                self.adjuntos.append(archivo)
-
-            for archivo in self.adjuntos:
-                part = MIMEApplication(open(archivo,"rb").read())
-                part.add_header('Content-Disposition', 'attachment', 
-                                    filename=os.path.basename(archivo))
-                msg.attach(part)
-
             #print "Enviando email: %s a %s" % (msg['Subject'], msg['To'])
-            self.smtp.sendmail(msg['From'], to, msg.as_string())
+            self.smtp.sendmail(*self.armar(remitente, motivo, destinatario,
+                                           mensaje, archivo))
+            return True
+        except Exception as e:
+            ex = traceback.format_exception( sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
+            self.Traceback = ''.join(ex)
+            self.Excepcion = traceback.format_exception_only( sys.exc_info()[0], sys.exc_info()[1])[0]
+            return False
 
+    def Encolar(self, remitente="", motivo="", destinatario="", mensaje="", archivo=None):
+        "Generar un correo multiparte y guardarlo en la bandeja de salida"
+        try:
+            bandeja = BandejaSalida(self.BandejaSalida)
+            bandeja.agregar(*self.armar(remitente, motivo, destinatario,
+                                        mensaje, archivo))
             return True
         except Exception as e:
             ex = traceback.format_exception( sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
@@ -171,6 +378,25 @@ class PyEmail:
             self.Excepcion = traceback.format_exception_only( sys.exc_info()[0], sys.exc_info()[1])[0]
             return False
 
+    def EnviarPendientes(self, servidor, usuario=None, clave=None, puerto=25, conexiones=4):
+        "Enviar la bandeja de salida (varias conexiones), devuelve la cantidad"
+        try:
+            despachador = Despachador(servidor, usuario, clave, puerto, 
+                                      int(conexiones))
+            enviados = despachador.enviar(BandejaSalida(self.BandejaSalida))
+            if despachador.errores:
+                self.Excepcion = "Mensajes rechazados: %d" % len(despachador.errores)
+                self.Traceback = "\n".join(despachador.errores)
+            if despachador.interrupcion:
+                self.Excepcion = "Envo interrumpido (quedan en la bandeja): %s" % (
+                                 despachador.interrupcion)
+            return enviados
+        except Exception as e:
+            ex = traceback.format_exception( sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2])
+            self.Traceback = ''.join(ex)
+            self.Excepcion = traceback.format_exception_only( sys.exc_info()[0], sys.exc_info()[1])[0]
+            return 0
+
     def Salir(self):
         "Termino la conexin al servidor de correo electronico"
         try:
@@ -239,11 +465,32 @@ if __name__ == '__main__':
             print("VERSION", __version__)
             sys.argv.remove("/debug")
 
+        conf_mail = dict(config.items('MAIL'))
+
+        if '/pendientes' in sys.argv:
+            # envo de la bandeja de salida (ver /encolar)
+            pyemail = PyEmail()
+            pyemail.BandejaSalida = conf_mail.get('bandeja', "bandeja_salida")
+            inicio = time.time()
+            enviados = pyemail.EnviarPendientes(conf_mail['servidor'], 
+                              conf_mail['usuario'], conf_mail['clave'],
+                              conf_mail.get('puerto', 25),
+                              conf_mail.get('conexiones', 4))
+            print("Enviados: %d (%.2f s)" % (enviados, time.time() - inicio))
+            if pyemail.Excepcion:
+                print(pyemail.Excepcion)
+                print(pyemail.Traceback)
+            sys.exit(0)
+
+        encolar = '/encolar' in sys.argv
+        if encolar:
+            sys.argv.remove("/encolar")
+
         if len(sys.argv)<3:
-            print("Parmetros: motivo destinatario [mensaje] [archivo]")
+            print("Parmetros: motivo destinatario [mensaje] [archivo] [/encolar]")
+            print("            /pendientes (envia los mensajes encolados)")
             sys.exit(1)
 
-        conf_mail = dict(config.items('MAIL'))
         motivo = sys.argv[1]
         destinatario = sys.argv[2]
         mensaje = len(sys.argv)>3 and sys.argv[3] or conf_mail['cuerpo']
@@ -255,6 +502,12 @@ if __name__ == '__main__':
         print("Archivo: ", archivo)
         
         pyemail = PyEmail()
+        if encolar:
+            pyemail.BandejaSalida = conf_mail.get('bandeja', "bandeja_salida")
+            ok = pyemail.Encolar(conf_mail['remitente'], 
+                                 motivo, destinatario, mensaje, archivo)
+            print("Encolado:", ok, pyemail.Excepcion)
+            sys.exit(0)
         ok = pyemail.Conectar(conf_mail['servidor'], 
                               conf_mail['usuario'], conf_mail['clave'],
                               conf_mail.get('puerto', 25))
@@ -46,19 +46,248 @@ Opciones:
   --pdf: genera la imgen de factura en PDF
   --dbf: utiliza tablas DBF en lugar del archivo de entrada TXT
   --json: utiliza el formato JSON para el archivo de entrada
+  --lote: genera los PDF de todos los comprobantes del archivo de entrada
+  --unificado archivo.pdf: (con --lote) genera un nico PDF con todos
+  --procesos N: (con --lote) cantidad de procesos (predeterminado: CPUs)
+  --benchmark N: mide la generacin de una factura de N lineas
 
 Ver rece.ini para parmetros de configuracin "
 """
+import ast
 import datetime
 import decimal
+import itertools
 import os
 import sys
 import tempfile
+import time
 import traceback
 from io import StringIO
 from decimal import Decimal
-from fpdf import Template
+from fpdf import FPDF, Template
+from fpdf.template import rgb
 from . import utils
+from .pyi25 import digito_verificador_modulo10, dibujar_pdf
+
+
+# formatos de campos ya analizados (ruta: (fecha de modificacin, campos))
+_FORMATOS = {}
+# imgenes ya procesadas por fpdf (ruta: (fecha de modificacin, info))
+_IMAGENES = {}
+
+
+def leer_valor(v):
+    "Convierte una celda de la planilla CSV a su valor (literal, sin eval)"
+    if not v.startswith("'"): 
+        v = v.replace(",",".")
+    v = v.strip()
+    if v == '':
+        return None
+    return ast.literal_eval(v)
+
+
+def leer_formato(archivo):
+    "Analiza la planilla CSV de campos (una sola vez por ruta y modificacin)"
+    ruta = os.path.abspath(archivo)
+    fecha = fecha_modificacion(ruta)
+    if ruta in _FORMATOS and _FORMATOS[ruta][0] == fecha:
+        return _FORMATOS[ruta][1]
+    campos = []
+    with open(ruta, encoding="latin1") as f:
+        for lno, linea in enumerate(f):
+            if DEBUG: print("procesando linea ", lno, linea)
+            try:
+                campos.append(tuple([leer_valor(v) for v in linea.split(";")]))
+            except (ValueError, SyntaxError) as e:
+                raise ValueError("Valor invlido en %s linea %d: %s" % (
+                                 archivo, lno + 1, e))
+    _FORMATOS[ruta] = fecha, tuple(campos)
+    return _FORMATOS[ruta][1]
+
+
+def fecha_modificacion(archivo):
+    "Devuelve la fecha de modificacin del archivo (None si no existe)"
+    try:
+        return os.path.getmtime(archivo)
+    except (OSError, TypeError):
+        return None
+
+
+class Imagenes(dict):
+    "Imgenes de un PDF que reutiliza las ya procesadas en otros documentos"
+
+    def __contains__(self, nombre):
+        if not dict.__contains__(self, nombre) and nombre in _IMAGENES:
+            fecha, info = _IMAGENES[nombre]
+            if fecha == fecha_modificacion(nombre):
+                info = info.copy()
+                info['i'] = len(self) + 1
+                dict.__setitem__(self, nombre, info)
+        return dict.__contains__(self, nombre)
+
+    def __setitem__(self, nombre, info):
+        # fpdf agrega la imagen recin procesada (se guarda para otros PDF)
+        _IMAGENES[nombre] = fecha_modificacion(nombre), info.copy()
+        dict.__setitem__(self, nombre, info)
+
+
+def precargar_imagen(archivo):
+    "Procesa la imagen por adelantado (queda en memoria para todos los PDF)"
+    pdf = FPDF()
+    pdf.images = Imagenes()
+    pdf.add_page()
+    if archivo not in pdf.images:
+        pdf.image(archivo, 0, 0, 1, 1)
+
+
+# anchos de caracteres por fuente y tamao (ver Plantilla.split_multicell)
+_MEDIDAS = {}
+
+
+def dividir_texto(texto, anchos, ancho_max):
+    "Divide el texto en lineas segn los anchos de caracteres (como fpdf)"
+    s = texto.replace("\r", "")
+    if s.endswith("\n"):
+        s = s[:-1]
+    lineas = []
+    for parrafo in s.split("\n"):
+        n = len(parrafo)
+        j = 0
+        while True:
+            l = 0
+            sep = -1
+            i = j
+            while i < n:
+                c = parrafo[i]
+                if c == " ":
+                    sep = i
+                l += anchos.get(c, 0)
+                if l > ancho_max:
+                    break
+                i += 1
+            else:
+                # ltimo tramo del prrafo (entra completo)
+                lineas.append(parrafo[j:])
+                break
+            if sep == -1:
+                # no hay espacios: cortar la palabra
+                if i == j:
+                    i += 1
+                lineas.append(parrafo[j:i])
+                j = i
+            else:
+                lineas.append(parrafo[j:sep])
+                j = sep + 1
+    return lineas
+
+
+class Linea(object):
+    "Linea de detalle ya dividida (registro compacto para paginar)"
+    __slots__ = ('codigo', 'ds', 'qty', 'umed', 'precio', 'importe', 
+                 'despacho', 'bonif', 'iva_id', 'imp_iva', 
+                 'dato_a', 'dato_b', 'dato_c', 'dato_d', 'dato_e',
+                 'u_mtx', 'cod_mtx')
+
+    def __init__(self, **kwargs):
+        self.update(**kwargs)
+
+    def update(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+    def __getitem__(self, clave):
+        return getattr(self, clave)
+
+    def get(self, clave, predeterminado=None):
+        return getattr(self, clave, predeterminado)
+
+    def __contains__(self, clave):
+        return hasattr(self, clave)
+
+    def __repr__(self):
+        return repr(dict([(k, getattr(self, k)) for k in self.__slots__
+                          if hasattr(self, k)]))
+
+
+class Plantilla(Template):
+    "Plantilla fpdf con las imgenes precargadas"
+
+    def __init__(self, *args, **kwargs):
+        Template.__init__(self, *args, **kwargs)
+        self.pdf.images = Imagenes()
+
+    def load_elements(self, elements):
+        Template.load_elements(self, elements)
+        # conjunto para buscar los campos (en vez de recorrer la lista)
+        self.keys = set(self.keys)
+        self.elementos = {}
+        for element in reversed(self.elements):
+            self.elementos[element['name'].lower()] = element
+
+    def __contains__(self, nombre):
+        return self.has_key(nombre)
+
+    def render(self, outfile, dest="F"):
+        # igual a Template.render, pero ordena los campos una sola vez y
+        # saltea los textos vacos (no dibujan nada en el PDF)
+        pdf = self.pdf
+        elementos = [(element, element['name'].lower(), element['type'].upper())
+                     for element in sorted(self.elements, 
+                                           key=lambda x: x['priority'])]
+        for pg in range(1, self.pg_no+1):
+            pdf.add_page()
+            pdf.set_font('Arial','B',16)
+            pdf.set_auto_page_break(False,margin=0)
+            textos = self.texts[pg]
+            for element, nombre, tipo in elementos:
+                text = textos.get(nombre, element['text'])
+                if not text and tipo == 'T' and 'rotate' not in element:
+                    continue
+                element = element.copy()
+                element['text'] = text
+                if 'rotate' in element:
+                    pdf.rotate(element['rotate'], element['x1'], element['y1'])
+                self.handlers[tipo](pdf, **element)
+                if 'rotate' in element:
+                    pdf.rotate(0)
+        if dest:
+            return pdf.output(outfile, dest)
+
+    def split_multicell(self, text, element_name):
+        "Divide el texto segn el ancho del campo (anchos precalculados)"
+        element = self.elementos.get(element_name.lower())
+        if element is None:
+            return Template.split_multicell(self, text, element_name)
+        style = ""
+        if element['bold']: style += "B"
+        if element['italic']: style += "I"
+        if element['underline']: style += "U"
+        ancho = element['x2'] - element['x1']
+        clave = (element['font'], style, element['size'], ancho)
+        if clave not in _MEDIDAS:
+            pdf = self.pdf
+            pdf.set_font(element['font'], style, element['size'])
+            if pdf.unifontsubset:
+                # fuentes TTF (unicode): medir con fpdf
+                _MEDIDAS[clave] = None
+            else:
+                ancho_max = (ancho - 2 * pdf.c_margin) * 1000.0 / pdf.font_size
+                _MEDIDAS[clave] = pdf.current_font['cw'], ancho_max
+        if _MEDIDAS[clave] is None:
+            return Template.split_multicell(self, text, element_name)
+        anchos, ancho_max = _MEDIDAS[clave]
+        return dividir_texto(str(text), anchos, ancho_max)
+
+    def barcode(self, pdf, x1=0, y1=0, x2=0, y2=0, text='', font="arial", 
+                size=1, foreground=0, *args, **kwargs):
+        # cdigo de barras I25 con las barras precalculadas (ver pyi25)
+        if font.lower().strip() == 'interleaved 2of5 nt' and text:
+            if pdf.draw_color != rgb(foreground):
+                pdf.set_draw_color(*rgb(foreground))
+            dibujar_pdf(pdf, text, x1, y1, w=size, h=y2-y1)
+        else:
+            Template.barcode(self, pdf, x1, y1, x2, y2, text, font, size, 
+                             foreground, *args, **kwargs)
 
 
 class FEPDF:
@@ -69,7 +298,7 @@ class FEPDF:
                         'AgregarDato', 'EstablecerParametro',
                         'CargarFormato', 'AgregarCampo',
                         'CrearPlantilla', 'ProcesarPlantilla', 'GenerarPDF',
-                        'MostrarPDF',
+                        'ObtenerPDF', 'MostrarPDF',
                         ]
     _public_attrs_ = ['Version', 'Excepcion', 'Traceback', 'InstallDir',
                       'Locale', 'FmtCantidad', 'FmtPrecio', 'CUIT',
@@ -332,23 +561,7 @@ class FEPDF:
 
     def digito_verificador_modulo10(self, codigo):
         "Rutina para el clculo del dgito verificador 'mdulo 10'"
-        # http://www.consejo.org.ar/Bib_elect/diciembre04_CT/documentos/rafip1702.htm
-        # Etapa 1: comenzar desde la izquierda, sumar todos los caracteres ubicados en las posiciones impares.
-        codigo = codigo.strip()
-        if not codigo or not codigo.isdigit():
-            return ''
-        etapa1 = sum([int(c) for i,c in enumerate(codigo) if not i%2])
-        # Etapa 2: multiplicar la suma obtenida en la etapa 1 por el nmero 3
-        etapa2 = etapa1 * 3
-        # Etapa 3: comenzar desde la izquierda, sumar todos los caracteres que estn ubicados en las posiciones pares.
-        etapa3 = sum([int(c) for i,c in enumerate(codigo) if i%2])
-        # Etapa 4: sumar los resultados obtenidos en las etapas 2 y 3.
-        etapa4 = etapa2 + etapa3
-        # Etapa 5: buscar el menor nmero que sumado al resultado obtenido en la etapa 4 d un nmero mltiplo de 10. Este ser el valor del dgito verificador del mdulo 10.
-        digito = 10 - (etapa4 - (int(etapa4 / 10) * 10))
-        if digito == 10:
-            digito = 0
-        return str(digito)
+        return digito_verificador_modulo10(codigo)
 
 
     # Funciones pblicas:
@@ -364,19 +577,8 @@ class FEPDF:
         
         if DEBUG: print("abriendo archivo ", archivo)
 
-        for lno, linea in enumerate(open(archivo.encode('latin1')).readlines()):
-            if DEBUG: print("procesando linea ", lno, linea)
-            args = []
-            for i,v in enumerate(linea.split(";")):
-                if not v.startswith("'"): 
-                    v = v.replace(",",".")
-                else:
-                    v = v#.decode('latin1')
-                if v.strip()=='':
-                    v = None
-                else:
-                    v = eval(v.strip())
-                args.append(v)
+        # la planilla se analiza una vez (luego se toma del cach en memoria)
+        for args in leer_formato(archivo):
             self.AgregarCampo(*args)
         return True
 
@@ -428,9 +630,15 @@ class FEPDF:
                     ##field['type'] = "T"
                     ##field['font'] = ""
                     ##field['foreground'] = 0xff0000
+            if field['type'] == 'I' and field['text'] and \
+                    field['text'] not in _IMAGENES:
+                try:
+                    precargar_imagen(field['text'])
+                except Exception as e:
+                    if DEBUG: print("no se pudo precargar", field['text'], e)
 
         # genero el renderizador con propiedades del PDF
-        t = Template(elements=self.elements,
+        t = Plantilla(elements=self.elements,
                  format=papel, orientation=orientacion,
                  title="%s %s %s" % (tipo.encode("latin1", "ignore"), letra, nro),
                  author="CUIT %s" % self.CUIT,
@@ -485,9 +693,9 @@ class FEPDF:
                 for ds in f.split_multicell(ds, 'Item.Descripcion01'):
                     if DEBUG: print("multicell", ds)
                     # agrego un item por linea (sin precio ni importe):
-                    li_items.append(dict(codigo=codigo, ds=ds, qty=qty, 
-                                         umed=umed if not n_li else None, 
-                                         precio=None, importe=None))
+                    li_items.append(Linea(codigo=codigo, ds=ds, qty=qty, 
+                                          umed=umed if not n_li else None, 
+                                          precio=None, importe=None))
                     # limpio cantidad y cdigo (solo en el primero)
                     qty = codigo = None
                     n_li += 1
@@ -520,13 +728,13 @@ class FEPDF:
                 # limpiar texto (campos dbf) y reemplazar saltos de linea:
                 obs = obs.replace('\x00', '').replace('<br/>', '\n')
                 for ds in f.split_multicell(obs, 'Item.Descripcion01'):
-                    li_items.append(dict(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
+                    li_items.append(Linea(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
             if fact.get('obs_comerciales') and 'obs_comerciales' not in f and 'ObservacionesComerciales1' not in f:
                 obs="\n<U>Observaciones Comerciales:</U>\n\n" + fact['obs_comerciales']
                 # limpiar texto (campos dbf) y reemplazar saltos de linea:
                 obs = obs.replace('\x00', '').replace('<br/>', '\n')
                 for ds in f.split_multicell(obs, 'Item.Descripcion01'):
-                    li_items.append(dict(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
+                    li_items.append(Linea(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
 
             # agrego permisos a descripciones (si corresponde)
             permisos =  ['Codigo de Despacho %s - Destino de la mercadera: %s' % (
@@ -541,7 +749,7 @@ class FEPDF:
             elif 'permisos' not in f and permisos:
                 obs="\n<U>Permisos de Embarque:</U>\n\n" + '\n'.join(permisos)
                 for ds in f.split_multicell(obs, 'Item.Descripcion01'):
-                    li_items.append(dict(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
+                    li_items.append(Linea(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
             permisos_ds = ', '.join(permisos)
 
             # agrego comprobantes asociados
@@ -550,9 +758,19 @@ class FEPDF:
             if 'cmps_asoc' not in f and cmps_asoc:
                 obs="\n<U>Comprobantes Asociados:</U>\n\n" + '\n'.join(cmps_asoc)
                 for ds in f.split_multicell(obs, 'Item.Descripcion01'):
-                    li_items.append(dict(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
+                    li_items.append(Linea(codigo=None, ds=ds, qty=None, umed=None, precio=None, importe=None))
             cmps_asoc_ds = ', '.join(cmps_asoc)
 
+            # acumular subtotales por linea (sin IVA facturas A), una sola vez:
+            subtotales = [Decimal("0.00")]
+            for it in li_items:
+                subtotal = subtotales[-1]
+                if it['importe']:
+                    subtotal += Decimal("%.6f" % float(it['importe']))
+                    if letra_fact in ('A', 'M') and it['imp_iva']:
+                        subtotal -= Decimal("%.6f" % float(it['imp_iva']))
+                subtotales.append(subtotal)
+
             # calcular cantidad de pginas:
             lineas = len(li_items)
             if lineas_max>0:
@@ -662,60 +880,52 @@ class FEPDF:
                             f.set(k, '')
 
                     li = 0
-                    k = 0
-                    subtotal = Decimal("0.00")
-                    for it in li_items:
-                        k = k + 1
-                        if k > hoja * (lineas_max - 1):
-                            break
-                        # acumular subtotal (sin IVA facturas A):
-                        if it['importe']:
-                            subtotal += Decimal("%.6f" % float(it['importe']))
-                            if letra_fact in ('A', 'M') and it['imp_iva']:
-                                subtotal -= Decimal("%.6f" % float(it['imp_iva']))
-                        # agregar el item si encuadra en la hoja especificada:
-                        if k > (hoja - 1) * (lineas_max - 1):
-                            if DEBUG: print("it", it)
-                            li += 1
-                            if it['qty'] is not None:
-                                f.set('Item.Cantidad%02d' % li, self.fmt_qty(it['qty']))
-                            if it['codigo'] is not None:
-                                f.set('Item.Codigo%02d' % li, it['codigo'])
-                            if it['umed'] is not None:
-                                if it['umed'] and "Item.Umed_ds01" in f:
-                                    # recortar descripcin:
-                                    umed_ds = self.umeds_ds.get(int(it['umed']))
-                                    s = f.split_multicell(umed_ds, 'Item.Umed_ds01')
-                                    f.set('Item.Umed_ds%02d' % li, s[0])
-                            # solo discriminar IVA en A/M (mostrar tasa en B)
-                            if letra_fact in ('A', 'M', 'B'):
-                                if it.get('iva_id') is not None:
-                                    f.set('Item.IvaId%02d' % li, it['iva_id'])
-                                    if it['iva_id']:
-                                        f.set('Item.AlicuotaIva%02d' % li, self.fmt_iva(it['iva_id']))
-                            if letra_fact in ('A', 'M'):
-                                if it.get('imp_iva') is not None:
-                                    f.set('Item.ImporteIva%02d' % li, self.fmt_pre(it['imp_iva']))
-                            if it.get('despacho') is not None:
-                                f.set('Item.Numero_Despacho%02d' % li, it['despacho'])
-                            if it.get('bonif') is not None:
-                                f.set('Item.Bonif%02d' % li, self.fmt_pre(it['bonif']))
-                            f.set('Item.Descripcion%02d' % li, it['ds'])
-                            if it['precio'] is not None:
-                                f.set('Item.Precio%02d' % li, self.fmt_pre(it['precio']))
-                            if it['importe'] is not None:
-                                f.set('Item.Importe%02d' % li, self.fmt_num(it['importe']))
-
-                            # Datos MTX
-                            if it.get('u_mtx') is not None:
-                                f.set('Item.U_MTX%02d' % li, it['u_mtx'])
-                            if it.get('cod_mtx') is not None:
-                                f.set('Item.COD_MTX%02d' % li, it['cod_mtx'])
-
-                            # datos adicionales de items
-                            for adic in ['dato_a', 'dato_b', 'dato_c', 'dato_d', 'dato_e']:
-                                if adic in it:
-                                    f.set('Item.%s%02d' % (adic, li), it[adic])
+                    # recorro solo los items que encuadran en la hoja:
+                    desde = (hoja - 1) * (lineas_max - 1)
+                    hasta = max(desde, hoja * (lineas_max - 1))
+                    subtotal = subtotales[min(hasta, len(li_items))]
+                    for it in li_items[desde:hasta]:
+                        if DEBUG: print("it", it)
+                        li += 1
+                        if it['qty'] is not None:
+                            f.set('Item.Cantidad%02d' % li, self.fmt_qty(it['qty']))
+                        if it['codigo'] is not None:
+                            f.set('Item.Codigo%02d' % li, it['codigo'])
+                        if it['umed'] is not None:
+                            if it['umed'] and "Item.Umed_ds01" in f:
+                                # recortar descripcin:
+                                umed_ds = self.umeds_ds.get(int(it['umed']))
+                                s = f.split_multicell(umed_ds, 'Item.Umed_ds01')
+                                f.set('Item.Umed_ds%02d' % li, s[0])
+                        # solo discriminar IVA en A/M (mostrar tasa en B)
+                        if letra_fact in ('A', 'M', 'B'):
+                            if it.get('iva_id') is not None:
+                                f.set('Item.IvaId%02d' % li, it['iva_id'])
+                                if it['iva_id']:
+                                    f.set('Item.AlicuotaIva%02d' % li, self.fmt_iva(it['iva_id']))
+                        if letra_fact in ('A', 'M'):
+                            if it.get('imp_iva') is not None:
+                                f.set('Item.ImporteIva%02d' % li, self.fmt_pre(it['imp_iva']))
+                        if it.get('despacho') is not None:
+                            f.set('Item.Numero_Despacho%02d' % li, it['despacho'])
+                        if it.get('bonif') is not None:
+                            f.set('Item.Bonif%02d' % li, self.fmt_pre(it['bonif']))
+                        f.set('Item.Descripcion%02d' % li, it['ds'])
+                        if it['precio'] is not None:
+                            f.set('Item.Precio%02d' % li, self.fmt_pre(it['precio']))
+                        if it['importe'] is not None:
+                            f.set('Item.Importe%02d' % li, self.fmt_num(it['importe']))
+
+                        # Datos MTX
+                        if it.get('u_mtx') is not None:
+                            f.set('Item.U_MTX%02d' % li, it['u_mtx'])
+                        if it.get('cod_mtx') is not None:
+                            f.set('Item.COD_MTX%02d' % li, it['cod_mtx'])
+
+                        # datos adicionales de items
+                        for adic in ['dato_a', 'dato_b', 'dato_c', 'dato_d', 'dato_e']:
+                            if adic in it:
+                                f.set('Item.%s%02d' % (adic, li), it[adic])
 
                     if hojas == hoja:
                         # ltima hoja, imprimo los totales
@@ -905,21 +1115,188 @@ class FEPDF:
     @utils.inicializar_y_capturar_excepciones_simple
     def GenerarPDF(self, archivo=""):
         "Generar archivo de salida en formato PDF"
+        if hasattr(archivo, "write"):
+            # archivo en memoria (BytesIO, respuesta web, etc.)
+            archivo.write(self.ObtenerPDF())
+            return True
         if not archivo:
             dest = "S"  # devolver buffer (string)
         else:
             dest = "F"  # guardar en archivo
         return self.template.render(archivo, dest)
 
+    @utils.inicializar_y_capturar_excepciones_simple
+    def ObtenerPDF(self):
+        "Generar el PDF en memoria y devolver su contenido (bytes)"
+        pdf = self.template.render("", "S")
+        if isinstance(pdf, str):
+            # fpdf maneja los datos binarios como latin1
+            pdf = pdf.encode("latin1")
+        return pdf
+
     @utils.inicializar_y_capturar_excepciones_simple
     def MostrarPDF(self, archivo, imprimir=False):
-        if sys.platform.startswith(("linux", 'java')):
-            os.system("evince ""%s""" % archivo)
-        else:
-            operation = imprimir and "print" or ""
-            os.startfile(archivo, operation)
-        return True
+        return mostrar_pdf(archivo, imprimir)
+
+
+def mostrar_pdf(archivo, imprimir=False):
+    "Abre (o imprime) el PDF con la aplicacin del sistema"
+    if sys.platform.startswith(("linux", 'java')):
+        os.system("evince ""%s""" % archivo)
+    else:
+        operation = imprimir and "print" or ""
+        os.startfile(archivo, operation)
+    return True
+
+
+
+# Generacin por lotes (varios comprobantes con la misma plantilla):
+
+def nombre_archivo(fact, conf_fact):
+    "Arma la ruta del PDF segn los datos de la factura y la configuracin"
+    d = conf_fact.get('directorio', ".")
+    clave_subdir = conf_fact.get('subdirectorio','fecha_cbte')
+    if clave_subdir:
+        d = os.path.join(d, fact[clave_subdir])
+    if not os.path.isdir(d):
+        os.makedirs(d, exist_ok=True)
+    fs = conf_fact.get('archivo','numero').split(",")
+    it = fact.copy()
+    tipo_fact, letra_fact, numero_fact = fact['_fmt_fact']
+    it['tipo'] = tipo_fact.replace(" ", "_")
+    it['letra'] = letra_fact
+    it['numero'] = numero_fact
+    it['mes'] = fact['fecha_cbte'][4:6]
+    it['ao'] = fact['fecha_cbte'][0:4]
+    fn = ''.join([str(it.get(ff,ff)) for ff in fs])
+    fn = fn.encode('ascii', 'replace').decode('ascii').replace('?','_')
+    return os.path.join(d, "%s.pdf" % fn)
+
+
+def procesar_factura(reg, conf_fact, conf_pdf):
+    "Crea la interfaz, carga la plantilla y procesa los datos de la factura"
+    fepdf = FEPDF()
+    fepdf.CargarFormato(conf_fact.get("formato", "factura.csv"))
+    fepdf.FmtCantidad = conf_fact.get("fmt_cantidad", "0.2")
+    fepdf.FmtPrecio = conf_fact.get("fmt_precio", "0.2")
+    fepdf.factura = reg
+    for d in reg.get('datos', []):
+        fepdf.AgregarDato(d['campo'], d['valor'], d['pagina'])
+    for k, v in list(conf_pdf.items()):
+        fepdf.AgregarDato(k, v)
+        if k.upper() == 'CUIT':
+            fepdf.CUIT = v
+    fepdf.CrearPlantilla(papel=conf_fact.get("papel", "legal"), 
+                         orientacion=conf_fact.get("orientacion", "portrait"))
+    return fepdf
+
+
+def ejecutar_lote(funcion, regs, inicializar, args=(), procesos=None):
+    "Aplica la funcin a cada registro (en paralelo si hay varios procesos)"
+    # la funcin y el inicializador deben ser globales (se envan al proceso)
+    import multiprocessing
+    if procesos is None:
+        procesos = multiprocessing.cpu_count()
+    if procesos > 1:
+        pool = multiprocessing.Pool(procesos, inicializar, args)
+        try:
+            for resultado in pool.imap(funcion, regs, chunksize=4):
+                yield resultado
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        inicializar(*args)
+        for reg in regs:
+            yield funcion(reg)
+
+
+# configuracin de cada proceso del lote (ver inicializar_lote):
+_LOTE = {}
+
 
+def inicializar_lote(conf_fact, conf_pdf, unificado=False):
+    "Establece la configuracin del proceso (una vez, no por comprobante)"
+    _LOTE.update(conf_fact=conf_fact, conf_pdf=conf_pdf, unificado=unificado)
+
+
+def generar_factura(reg):
+    "Genera un comprobante del lote, devuelve (archivo, pginas, error)"
+    conf_fact = _LOTE['conf_fact']
+    try:
+        fepdf = procesar_factura(reg, conf_fact, _LOTE['conf_pdf'])
+        fepdf.ProcesarPlantilla(num_copias=int(conf_fact.get("copias", 1)),
+                                lineas_max=int(conf_fact.get("lineas_max", 24)),
+                                qty_pos=conf_fact.get("cant_pos") or 'izq')
+        f = fepdf.template
+        if _LOTE['unificado']:
+            # devuelvo solo los textos de cada pgina (se dibujan al final)
+            return [f.texts[pg] for pg in range(1, f.pg_no + 1)], f.pg_no, None
+        salida = reg.get('pdf') or nombre_archivo(fepdf.factura, conf_fact)
+        fepdf.GenerarPDF(archivo=salida)
+        return salida, f.pg_no, None
+    except Exception as e:
+        return None, 0, "%s: %s" % (reg.get('cbte_nro', reg.get('id')), e)
+
+
+def generar_lote(regs, conf_fact, conf_pdf, unificado=None, procesos=None):
+    "Genera los PDF de los comprobantes (en paralelo) o un nico PDF unificado"
+    cantidad = paginas = 0
+    errores = []
+    regs = iter(regs)
+    if unificado:
+        # el PDF final se arma con la plantilla del primer comprobante
+        primero = next(regs, None)
+        if primero is None:
+            return cantidad, paginas, errores
+        maestro = procesar_factura(dict(primero), conf_fact, conf_pdf).template
+        regs = itertools.chain([primero], regs)
+    resultados = ejecutar_lote(generar_factura, regs, inicializar_lote, 
+                               (conf_fact, conf_pdf, bool(unificado)), procesos)
+    for salida, n, error in resultados:
+        if error:
+            errores.append(error)
+            continue
+        cantidad += 1
+        paginas += n
+        if unificado:
+            for textos in salida:
+                maestro.pg_no += 1
+                maestro.texts[maestro.pg_no] = textos
+        elif DEBUG:
+            print("archivo generado", salida)
+    if unificado:
+        maestro.render(unificado)
+    return cantidad, paginas, errores
+
+
+def benchmark(lineas=5000, formato="factura.csv", lineas_max=24):
+    "Mide el tiempo de armado y generacin de una factura con muchas lineas"
+    fepdf = FEPDF()
+    fepdf.CargarFormato(formato)
+    fepdf.CrearFactura(1, 80, "30000000007", 1, 1, 1, "0.00", "0.00", "0.00",
+                       "0.00", "0.00", "0.00", "20110101", "20110101", 
+                       "20110101", "20110101", "PES", 1, "61123022925855", 
+                       "20110320", "", "Cliente", "Domicilio", 200, "", "", 
+                       "Contado", "", 1, "")
+    ds = "Descripcion del producto %05d " + "Lorem ipsum sit amet " * 3
+    for i in range(lineas):
+        fepdf.AgregarDetalleItem(None, None, "P%05d" % i, ds % i, 1, 7, 
+                                 10.00, 0.00, 5, 2.10, 12.10, "")
+    inicio = time.time()
+    fepdf.CrearPlantilla(papel="A4")
+    fepdf.ProcesarPlantilla(num_copias=1, lineas_max=lineas_max)
+    armado = time.time() - inicio
+    pdf = fepdf.ObtenerPDF()
+    total = time.time() - inicio
+    paginas = fepdf.template.pg_no
+    print("Lineas: %d, Pginas: %d, PDF: %d bytes" % (lineas, paginas, len(pdf)))
+    print("Armado: %.2f s, Total: %.2f s (%.1f pginas/s)" % (
+          armado, total, paginas / (total or 1)))
+    return armado, total
 
 
 # busco el directorio de instalacin (global para que no cambie si usan otra dll)
@@ -977,6 +1354,40 @@ if __name__ == '__main__':
                 formato_txt.ayuda()
             sys.exit(0)
 
+        if '--lote' in sys.argv:
+            # genero todos los comprobantes de la entrada (sin reiniciar)
+            from .formatos import conversor
+            formato = conversor.formato_argv(predeterminado="txt")
+            if formato == "dbf":
+                entrada = dict(config.items('DBF'))
+            else:
+                entrada = conf_fact.get("entrada", "entrada.txt")
+            if '--unificado' in sys.argv:
+                unificado = sys.argv[sys.argv.index("--unificado") + 1]
+            else:
+                unificado = None
+            if '--procesos' in sys.argv:
+                procesos = int(sys.argv[sys.argv.index("--procesos") + 1])
+            else:
+                procesos = None
+            inicio = time.time()
+            regs = conversor.leer(entrada, formato)
+            cantidad, paginas, errores = generar_lote(regs, conf_fact, 
+                                            conf_pdf, unificado, procesos)
+            segundos = time.time() - inicio
+            for error in errores:
+                print("Error:", error)
+            print("Comprobantes: %d, Pginas: %d, Errores: %d" % (
+                  cantidad, paginas, len(errores)))
+            print("Tiempo: %.2f s (%.1f pginas/s)" % (
+                  segundos, paginas / (segundos or 1)))
+            sys.exit(1 if errores else 0)
+
+        if '--benchmark' in sys.argv:
+            lineas = int(sys.argv[sys.argv.index("--benchmark") + 1])
+            benchmark(lineas, conf_fact.get("formato", "factura.csv"),
+                      int(conf_fact.get("lineas_max", 24)))
+            sys.exit(0)
 
         fepdf = FEPDF()
         
@@ -988,21 +1399,14 @@ if __name__ == '__main__':
         fepdf.FmtPrecio = conf_fact.get("fmt_precio", "0.2")
 
         if '--cargar' in sys.argv:
-            if '--dbf' in sys.argv:
-                from .formatos import formato_dbf
-                conf_dbf = dict(config.items('DBF'))
-                if DEBUG: print("conf_dbf", conf_dbf)
-                regs = list(formato_dbf.leer(conf_dbf).values())
-            elif '--json' in sys.argv:
-                from .formatos import formato_json
-                entrada = conf_fact.get("entrada", "entrada.txt")
-                if DEBUG: print("entrada", entrada)
-                regs = formato_json.leer(entrada)
+            from .formatos import conversor
+            formato = conversor.formato_argv(predeterminado="txt")
+            if formato == "dbf":
+                entrada = dict(config.items('DBF'))
             else:
-                from .formatos import formato_txt
                 entrada = conf_fact.get("entrada", "entrada.txt")
-                if DEBUG: print("entrada", entrada)
-                regs = formato_txt.leer(entrada)
+            if DEBUG: print("entrada", formato, entrada)
+            regs = list(conversor.leer(entrada, formato))
             if DEBUG: 
                 print(regs)
                 input("continuar...")
@@ -1165,21 +1569,14 @@ if __name__ == '__main__':
             reg['id'] = 0
             reg['datos'] = fepdf.datos
             reg['err_code'] = 'OK'
-            if '--dbf' in sys.argv:
-                from .formatos import formato_dbf
-                conf_dbf = dict(config.items('DBF'))
-                if DEBUG: print("conf_dbf", conf_dbf)
-                regs = formato_dbf.escribir([reg], conf_dbf)
-            elif '--json' in sys.argv:
-                from .formatos import formato_json
-                archivo =  conf_fact.get("entrada", "entrada.txt")
-                if DEBUG: print("Escribiendo", archivo)
-                regs = formato_json.escribir([reg], archivo)
+            from .formatos import conversor
+            formato = conversor.formato_argv(predeterminado="txt")
+            if formato == "dbf":
+                archivo = dict(config.items('DBF'))
             else:
-                from .formatos import formato_txt
-                archivo =  conf_fact.get("entrada", "entrada.txt")
-                if DEBUG: print("Escribiendo", archivo)
-                regs = formato_txt.escribir([reg], archivo)
+                archivo = conf_fact.get("entrada", "entrada.txt")
+            if DEBUG: print("Escribiendo", formato, archivo)
+            conversor.escribir([reg], archivo, formato)
 
 
         # datos fijos:
@@ -1201,25 +1598,14 @@ if __name__ == '__main__':
             salida = fact['pdf']
         else:
             # genero el nombre de archivo segn datos de factura
-            d = conf_fact.get('directorio', ".")
-            clave_subdir = conf_fact.get('subdirectorio','fecha_cbte')
-            if clave_subdir:
-                d = os.path.join(d, fact[clave_subdir])
-            if not os.path.isdir(d):
-                os.makedirs(d)
-            fs = conf_fact.get('archivo','numero').split(",")
-            it = fact.copy()
-            tipo_fact, letra_fact, numero_fact = fact['_fmt_fact']
-            it['tipo'] = tipo_fact.replace(" ", "_")
-            it['letra'] = letra_fact
-            it['numero'] = numero_fact
-            it['mes'] = fact['fecha_cbte'][4:6]
-            it['ao'] = fact['fecha_cbte'][0:4]
-            fn = ''.join([str(it.get(ff,ff)) for ff in fs])
-            fn = fn.encode('ascii', 'replace').replace('?','_')
-            salida = os.path.join(d, "%s.pdf" % fn)
+            salida = nombre_archivo(fact, conf_fact)
         if DEBUG:
             print("archivo generado", salida)
-        fepdf.GenerarPDF(archivo=salida)
-        if '--mostrar' in sys.argv:
+        if salida == "-":
+            # escribir el PDF en la salida estndar (sin archivos temporales)
+            fepdf.GenerarPDF(archivo=sys.stdout.buffer)
+            sys.stdout.flush()
+        else:
+            fepdf.GenerarPDF(archivo=salida)
+        if '--mostrar' in sys.argv and salida != "-":
             fepdf.MostrarPDF(archivo=salida,imprimir='--imprimir' in sys.argv)
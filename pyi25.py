@@ -17,15 +17,111 @@ __copyright__ = "Copyright (C) 2011 Mariano Reingart"
 __license__ = "GPL 3.0"
 __version__ = "1.02e"
 
+import functools
+import io
 import os
 import sys
 import traceback
-from PIL import Image, ImageFont, ImageDraw
+
+
+# cdigos ancho/angostos (wide/narrow) para los dgitos
+BARRAS = ("nnwwn", "wnnnw", "nwnnw", "wwnnn", "nnwnw", "wnwnn", "nwwnn", 
+          "nnnww", "wnnwn", "nwnwn", "nn", "wn")
+
+
+@functools.lru_cache(maxsize=1024)
+def secuencia(codigo):
+    "Devuelve la secuencia de anchos (w/n) alternando barras y espacios"
+    # agregar un 0 al principio si el nmero de dgitos es impar
+    if len(codigo) % 2:
+        codigo = "0" + codigo
+    # agregar cdigos de inicio y final
+    codigo = "::" + codigo.lower() + ";:" # A y Z en el original
+    seq = []
+    for i in range(0, len(codigo), 2):
+        # obtener el prximo par de dgitos
+        bar = ord(codigo[i]) - ord("0")
+        space = ord(codigo[i + 1]) - ord("0")
+        if not 0 <= bar < len(BARRAS) or not 0 <= space < len(BARRAS):
+            raise ValueError("Caracter invalido para I25: %r" % codigo[i:i+2])
+        # crear la sequencia barras (1er dgito=barras, 2do=espacios)
+        for s in range(len(BARRAS[bar])):
+            seq.append(BARRAS[bar][s])
+            seq.append(BARRAS[space][s])
+    return "".join(seq)
+
+
+@functools.lru_cache(maxsize=1024)
+def calcular_barras(codigo, ancho=3, angosto=1):
+    "Calcula las barras (posicin, ancho) y el ancho total del cdigo"
+    xpos = 0
+    ret = []
+    for s, c in enumerate(secuencia(codigo)):
+        width = angosto if c == "n" else ancho
+        # las barras son las posiciones pares (las impares son espacios)
+        if not s % 2:
+            ret.append((xpos, width))
+        xpos = xpos + width
+    return tuple(ret), xpos
+
+
+def dibujar_pdf(pdf, codigo, x, y, w=1.0, h=10.0):
+    "Dibuja el cdigo de barras en el PDF (fpdf) con rectngulos vectoriales"
+    # mismas proporciones que FPDF.interleaved2of5 (angosto = ancho / 3)
+    pdf.set_fill_color(0)
+    for xpos, width in calcular_barras(codigo, 3, 1)[0]:
+        pdf.rect(x + xpos * w / 3.0, y, width * w / 3.0, h, 'F')
+
+
+@functools.lru_cache(maxsize=256)
+def generar_imagen(codigo, basewidth=3, width=None, height=30, 
+                   extension="PNG"):
+    "Genera la imgen del cdigo de barras en memoria (bytes)"
+    from PIL import Image
+
+    wide = basewidth
+    narrow = int(basewidth / 3)
+    if not width:
+        width = ((len(codigo) + len(codigo) % 2) * 3) * basewidth + (10 * narrow)
+
+    # armo una fila de pixeles (blanco) y dibujo las barras (negro)
+    fila = bytearray(b"\xff" * width)
+    for xpos, ancho in calcular_barras(codigo, wide, narrow)[0]:
+        fila[xpos:xpos + ancho] = b"\x00" * ancho
+    del fila[width:]
+    im = Image.frombytes("L", (width, 1), bytes(fila)).convert("1")
+    # todas las filas son iguales: estirar verticalmente
+    im = im.resize((width, height), Image.NEAREST)
+
+    salida = io.BytesIO()
+    im.save(salida, extension.upper())
+    return salida.getvalue()
+
+
+def digito_verificador_modulo10(codigo):
+    "Rutina para el clculo del dgito verificador 'mdulo 10'"
+    # http://www.consejo.org.ar/Bib_elect/diciembre04_CT/documentos/rafip1702.htm
+    # Etapa 1: comenzar desde la izquierda, sumar todos los caracteres ubicados en las posiciones impares.
+    codigo = codigo.strip()
+    if not codigo or not codigo.isdigit():
+        return ''
+    etapa1 = sum([int(c) for i,c in enumerate(codigo) if not i%2])
+    # Etapa 2: multiplicar la suma obtenida en la etapa 1 por el nmero 3
+    etapa2 = etapa1 * 3
+    # Etapa 3: comenzar desde la izquierda, sumar todos los caracteres que estn ubicados en las posiciones pares.
+    etapa3 = sum([int(c) for i,c in enumerate(codigo) if i%2])
+    # Etapa 4: sumar los resultados obtenidos en las etapas 2 y 3.
+    etapa4 = etapa2 + etapa3
+    # Etapa 5: buscar el menor nmero que sumado al resultado obtenido en la etapa 4 d un nmero mltiplo de 10. Este ser el valor del dgito verificador del mdulo 10.
+    digito = 10 - (etapa4 - (int(etapa4 / 10) * 10))
+    if digito == 10:
+        digito = 0
+    return str(digito)
 
 
 class PyI25:
     "Interfaz para generar PDF de Factura Electrnica"
-    _public_methods_ = ['GenerarImagen', 
+    _public_methods_ = ['GenerarImagen', 'ObtenerImagen',
                         'DigitoVerificadorModulo10'
                         ]
     _public_attrs_ = ['Version', 'Excepcion', 'Traceback']
@@ -45,79 +141,41 @@ class PyI25:
         #  * http://www.fpdf.org/en/script/script67.php
         #  * http://code.activestate.com/recipes/426069/
 
-        wide = basewidth
-        narrow = int(basewidth / 3)
-
-        # cdigos ancho/angostos (wide/narrow) para los dgitos
-        bars = ("nnwwn", "wnnnw", "nwnnw", "wwnnn", "nnwnw", "wnwnn", "nwwnn", 
-                "nnnww", "wnnwn", "nwnwn", "nn", "wn")
-
-        # agregar un 0 al principio si el nmero de dgitos es impar
-        if len(codigo) % 2:
-            codigo = "0" + codigo
-
-        if not width:
-            width = (len(codigo) * 3) * basewidth + (10 * narrow)
-            print(width)
-            #width = 380
-        # crear una nueva imgen
-        im = Image.new("1",(width, height))
-
-        # agregar cdigos de inicio y final
-        codigo = "::" + codigo.lower() + ";:" # A y Z en el original
-
-        # crear un drawer
-        draw = ImageDraw.Draw(im)
-
-        # limpiar la imgen
-        draw.rectangle(((0, 0), (im.size[0], im.size[1])), fill=256)
-
-        xpos = 0    
-        # dibujar los cdigos de barras
-        for i in range(0,len(codigo),2):
-            # obtener el prximo par de dgitos
-            bar = ord(codigo[i]) - ord("0")
-            space = ord(codigo[i + 1]) - ord("0")
-            # crear la sequencia barras (1er dgito=barras, 2do=espacios)
-            seq = ""
-            for s in range(len(bars[bar])):
-                seq = seq + bars[bar][s] + bars[space][s]
-
-            for s in range(len(seq)):
-                if seq[s] == "n":
-                    width = narrow
-                else:
-                    width = wide
-
-                # dibujar barras impares (las pares son espacios)
-                if not s % 2:
-                    draw.rectangle(((xpos,0),(xpos+width-1,height)),fill=0)
-                xpos = xpos + width 
-       
-        im.save(archivo, extension.upper())
+        # la imgen se genera en memoria (una sola vez por cdigo y tamao)
+        imagen = generar_imagen(codigo, basewidth, width, height, extension)
+        if hasattr(archivo, "write"):
+            archivo.write(imagen)
+        else:
+            with open(archivo, "wb") as f:
+                f.write(imagen)
         return True 
 
+    def ObtenerImagen(self, codigo, basewidth=3, width=None, height=30, 
+                      extension="PNG"):
+        "Devolver la imgen del cdigo de barras (bytes, sin usar archivos)"
+        return generar_imagen(codigo, basewidth, width, height, extension)
+
     def DigitoVerificadorModulo10(self, codigo):
         "Rutina para el clculo del dgito verificador 'mdulo 10'"
-        # http://www.consejo.org.ar/Bib_elect/diciembre04_CT/documentos/rafip1702.htm
-        # Etapa 1: comenzar desde la izquierda, sumar todos los caracteres ubicados en las posiciones impares.
-        codigo = codigo.strip()
-        if not codigo or not codigo.isdigit():
-            return ''
-        etapa1 = sum([int(c) for i,c in enumerate(codigo) if not i%2])
-        # Etapa 2: multiplicar la suma obtenida en la etapa 1 por el nmero 3
-        etapa2 = etapa1 * 3
-        # Etapa 3: comenzar desde la izquierda, sumar todos los caracteres que estn ubicados en las posiciones pares.
-        etapa3 = sum([int(c) for i,c in enumerate(codigo) if i%2])
-        # Etapa 4: sumar los resultados obtenidos en las etapas 2 y 3.
-        etapa4 = etapa2 + etapa3
-        # Etapa 5: buscar el menor nmero que sumado al resultado obtenido en la etapa 4 d un nmero mltiplo de 10. Este ser el valor del dgito verificador del mdulo 10.
-        digito = 10 - (etapa4 - (int(etapa4 / 10) * 10))
-        if digito == 10:
-            digito = 0
-        return str(digito)
+        return digito_verificador_modulo10(codigo)
 
 
+def generar_lote(entrada, carpeta=".", verificador=True):
+    "Genera las imgenes PNG de los cdigos del archivo (uno por linea)"
+    pyi25 = PyI25()
+    n = 0
+    with open(entrada) as f:
+        for barras in f:
+            barras = barras.strip()
+            if not barras:
+                continue
+            if verificador:
+                barras = barras + digito_verificador_modulo10(barras)
+            archivo = os.path.join(carpeta, "%s.png" % barras)
+            pyi25.GenerarImagen(barras, archivo)
+            n += 1
+    return n
+
 
 if __name__ == '__main__':
 
@@ -168,6 +226,17 @@ if __name__ == '__main__':
         
         pyi25 = PyI25()
 
+        if '--lote' in sys.argv:
+            # generar las imgenes de varios cdigos (uno por linea)
+            entrada = sys.argv[sys.argv.index("--lote")+1]
+            carpeta = "."
+            if '--carpeta' in sys.argv:
+                carpeta = sys.argv[sys.argv.index("--carpeta")+1]
+            n = generar_lote(entrada, carpeta,
+                             not '--noverificador' in sys.argv)
+            print("imagenes generadas", n)
+            sys.exit(0)
+
         if '--barras' in sys.argv:
             barras = sys.argv[sys.argv.index("--barras")+1]
         else:
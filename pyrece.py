@@ -27,14 +27,11 @@ import unicodedata
 import traceback
 from configparser import SafeConfigParser
 from . import wsaa, wsfev1, wsfexv1
-from .utils import SimpleXMLElement, SoapClient, SoapFault, date
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
-from smtplib import SMTP
+from . import utils
+from .utils import date
 
 #from PyFPDF.ejemplos.form import Form
-from .pyfepdf import FEPDF
+# pyfepdf (fpdf, PIL) y pyemail se importan al generar / enviar facturas
 
 # Formatos de archivos:
 from .formatos import formato_xml, formato_csv, formato_dbf, formato_txt, formato_json
@@ -248,7 +245,7 @@ class PyRece(gui.Controller):
             gui.alert("Último comprobante: %s\n" 
                 "Tipo: %s (%s)\nPunto de Venta: %s" % (ultcmp, self.tipos[tipocbte], 
                     tipocbte, ptovta), 'Consulta Último Nro. Comprobante')
-        except SoapFault as e:
+        except utils.SoapFault as e:
             self.log(self.client.xml_request)
             self.log(self.client.xml_response)
             self.error(e.faultcode, e.faultstring.encode("ascii","ignore"))
@@ -302,7 +299,7 @@ class PyRece(gui.Controller):
                     tipocbte, ptovta, nrocbte, self.ws.FechaCbte), 
                     'Consulta Comprobante')
 
-        except SoapFault as e:
+        except utils.SoapFault as e:
             self.log(self.client.xml_request)
             self.log(self.client.xml_response)
             self.error(e.faultcode, e.faultstring.encode("ascii","ignore"))
@@ -319,7 +316,7 @@ class PyRece(gui.Controller):
                 ultnro = None
             gui.alert("Último ID (máximo): %s" % (ultnro), 
                 'Consulta Último ID')
-        except SoapFault as e:
+        except utils.SoapFault as e:
             self.log(self.client.xml_request)
             self.log(self.client.xml_response)
             self.error(e.faultcode, e.faultstring.encode("ascii","ignore"))
@@ -410,7 +407,7 @@ class PyRece(gui.Controller):
                 gui.alert('Autenticado OK!', 'Advertencia')
             else:
                 gui.alert('Respuesta: %s' % ws.XmlResponse, 'No se pudo autenticar: %s' % ws.Excepcion)
-        except SoapFault as e:
+        except utils.SoapFault as e:
             self.error(e.faultcode, e.faultstring.encode("ascii","ignore"))
         except Exception as e:
             self.error('Excepción',str(e))
@@ -691,7 +688,7 @@ class PyRece(gui.Controller):
                     'Rechazadas: %d' % (procesadas, ok, rechazadas), 
                     'Autorización')
             self.grabar()
-        except SoapFault as e:
+        except utils.SoapFault as e:
             self.error(e.faultcode, e.faultstring.encode("ascii","ignore"))
         except KeyError as e:
             self.error("Error",'Campo obligatorio no encontrado: %s' % e)
@@ -866,7 +863,7 @@ class PyRece(gui.Controller):
                 self.progreso(len(self.items))
                 gui.alert('Proceso finalizado OK!\n\nAceptadas: %d\nRechazadas: %d' % (ok, rechazadas), 'Autorización')
                 self.grabar()
-        except SoapFault as e:
+        except utils.SoapFault as e:
             self.log(self.client.xml_request)
             self.log(self.client.xml_response)
             self.error(e.faultcode, e.faultstring.encode("ascii","ignore"))
@@ -885,14 +882,14 @@ class PyRece(gui.Controller):
 
     def on_btnEnviar_click(self, event):
         try:
-            ok = no = 0
+            no = 0
+            encolados = []
             self.progreso(0)
             for i, item in self.get_selected_items():
                 if not item['cae'] in ("", "NULL"):
                     archivo = self.generar_factura(item)
                     if item.get('email'):
-                        self.enviar_mail(item,archivo)
-                        ok += 1
+                        encolados.append(self.enviar_mail(item,archivo))
                     else:
                         no += 1
                         self.log("No se envia factura %s por no tener EMAIL" % item['cbt_numero'])
@@ -900,13 +897,20 @@ class PyRece(gui.Controller):
                     self.log("No se envia factura %s por no tener CAE" % item['cbt_numero'])
                     no += 1
                 self.progreso(i)
+            ok, rechazados, pendientes, interrupcion = self.enviar_pendientes(encolados)
+            no += rechazados
             self.progreso(len(self.items))
-            gui.alert('Proceso finalizado OK!\n\nEnviados: %d\nNo enviados: %d' % (ok, no), 'Envio de Email')
+            if interrupcion:
+                gui.alert('Envio interrumpido: %s\n\nEnviados: %d\nNo enviados: %d\n'
+                          'Pendientes (quedan en la bandeja de salida): %d' % (
+                          interrupcion, ok, no, pendientes), 'Envio de Email')
+            else:
+                gui.alert('Proceso finalizado OK!\n\nEnviados: %d\nNo enviados: %d' % (ok, no), 'Envio de Email')
         except Exception as e:
             self.error('Excepción',str(e))
             
     def generar_factura(self, fila, mostrar=False):
-        
+        from .pyfepdf import FEPDF
         fepdf = FEPDF()
         fact = formato_csv.desaplanar([self.cols] + [[item[k] for k in self.cols] for item in [fila]])[0]
         fact['cbte_nro'] = fact['cbt_numero']
@@ -976,43 +980,39 @@ class PyRece(gui.Controller):
         return salida
         
     def enviar_mail(self, item, archivo):
+        "Encola el correo con la factura, devuelve su nombre en la bandeja"
+        from .pyemail import armar_mensaje, BandejaSalida
         archivo = self.generar_factura(item)
         if item['email']:
-            msg = MIMEMultipart()
-            msg['Subject'] = conf_mail['motivo'].replace("NUMERO",str(item['cbt_numero']))
-            msg['From'] = conf_mail['remitente']
-            msg['Reply-to'] = msg['From']
-            msg['To'] = item['email']
-            msg.preamble = 'Mensaje de multiples partes.\n'
-            if not 'html' in conf_mail:
-                part = MIMEText(conf_mail['cuerpo'])
-                msg.attach(part)
-            else:
-                alt = MIMEMultipart('alternative')
-                msg.attach(alt)
-                text = MIMEText(conf_mail['cuerpo'])
-                alt.attach(text)
-                # We reference the image in the IMG SRC attribute by the ID we give it below
-                html = MIMEText(conf_mail['html'], 'html')
-                alt.attach(html)
-            part = MIMEApplication(open(archivo,"rb").read())
-            part.add_header('Content-Disposition', 'attachment', filename=os.path.basename(archivo))
-            msg.attach(part)
-
-            try:
-                self.log("Enviando email: %s a %s" % (msg['Subject'], msg['To']))
-                if not self.smtp:
-                    self.smtp = SMTP(conf_mail['servidor'], conf_mail.get('puerto', 25))
-                    if conf_mail['usuario'] and conf_mail['clave']:
-                        self.smtp.ehlo()
-                        self.smtp.login(conf_mail['usuario'], conf_mail['clave'])
-                to = [msg['To']]
-                bcc = conf_mail.get('bcc', None)
-                if bcc:
-                    to.append(bcc)
-                self.smtp.sendmail(msg['From'], to, msg.as_string())
-            except Exception as e:
-                self.error('Excepción',str(e))
+            motivo = conf_mail['motivo'].replace("NUMERO",str(item['cbt_numero']))
+            bcc = conf_mail.get('bcc', None)
+            mensaje = armar_mensaje(conf_mail['remitente'], motivo,
+                                    [item['email']], conf_mail['cuerpo'],
+                                    conf_mail.get('html'), [archivo],
+                                    bcc=bcc and [bcc] or [])
+            self.log("Encolando email: %s a %s" % (motivo, item['email']))
+            bandeja = BandejaSalida(conf_mail.get('bandeja', "bandeja_salida"))
+            return bandeja.agregar(*mensaje)
+
+    def enviar_pendientes(self, encolados):
+        "Envía la bandeja de salida, devuelve los resultados de los encolados"
+        from .pyemail import BandejaSalida, Despachador
+        despachador = Despachador(conf_mail['servidor'], conf_mail['usuario'],
+                                  conf_mail['clave'], conf_mail.get('puerto', 25),
+                                  int(conf_mail.get('conexiones', 4)))
+        bandeja = BandejaSalida(conf_mail.get('bandeja', "bandeja_salida"))
+        despachador.enviar(bandeja)
+        for error in despachador.errores:
+            self.log("Email rechazado: %s" % error)
+        # sólo se cuentan los mensajes de este envío (no los de otras pasadas)
+        pendientes = len(set(encolados) & set(bandeja.pendientes()))
+        rechazados = len([nombre for nombre in encolados if os.path.exists(
+                          os.path.join(bandeja.carpeta_errores, nombre))])
+        if despachador.interrupcion:
+            self.log("Envio interrumpido (quedan %d en la bandeja): %s" % (
+                     len(bandeja), despachador.interrupcion))
+        return (len(encolados) - pendientes - rechazados, rechazados,
+                pendientes, despachador.interrupcion)
             
         
 if __name__ == '__main__':
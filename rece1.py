@@ -18,6 +18,7 @@ __license__ = "GPL 3.0"
 __version__ = "1.37a"
 
 import datetime
+import itertools
 import os
 import sys
 import time
@@ -26,8 +27,10 @@ import warnings
 
 # revisar la instalacin de pyafip.ws:
 from . import wsfev1
-from .utils import SimpleXMLElement, SoapClient, SoapFault, date
+from . import utils
+from .utils import date
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, abrir_conf
+from .formatos.conversor import formato_argv
 
 
 HOMO = wsfev1.HOMO
@@ -35,6 +38,7 @@ DEBUG = False
 XML = False
 TIMEOUT = 30
 CONFIG_FILE = "rece.ini"
+FORMATOS = ("dbf", "json")     # adems de TXT (ver formatos.conversor)
 
 LICENCIA = """
 rece1.py: Interfaz de texto para generar Facturas Electrnica Mercado Interno V1
@@ -139,7 +143,8 @@ TIPO_DOC = {80: 'CUIT', 86: 'CUIL', 96: 'DNI', 99: '', 87: "CDI"}
 
 def autorizar(ws, entrada, salida, informar_caea=False):
     encabezados = []
-    if '/dbf' in sys.argv:
+    formato = formato_argv(formatos=FORMATOS)
+    if formato == "dbf":
         tributos = []
         ivas = []
         cbtasocs = []
@@ -178,50 +183,36 @@ def autorizar(ws, entrada, salida, informar_caea=False):
                 # compatibilidad hacia atrs, descartar si hay ms de 1 factura
                 warnings.warn("Para mltiples registros debe usar campo id!")
                 break
-    elif '/json' in sys.argv:
-        # ya viene estructurado
-        import json
-        encabezados = json.load(entrada)
+    elif formato == "json":
+        # ya viene estructurado (se analiza incrementalmente, de a uno)
+        from .formatos.formato_json import iterar
+        encabezados = iterar(entrada)
     else:
         # la estructura est implcita en el rden de los registros (lneas)
-        for linea in entrada:
-            if str(linea[0])=='0':
-                encabezado = leer(linea, ENCABEZADO)
-                encabezados.append(encabezado)
-                if DEBUG: print(len(encabezados), "Leida factura %(cbt_desde)s" % encabezado) 
-            elif str(linea[0])=='1':
-                tributo = leer(linea, TRIBUTO)
-                encabezado.setdefault("tributos", []).append(tributo)
-            elif str(linea[0])=='2':
-                iva = leer(linea, IVA)
-                encabezado.setdefault("ivas", []).append(iva)
-            elif str(linea[0])=='3':
-                cbtasoc = leer(linea, CMP_ASOC)
-                encabezado.setdefault("cbtasocs", []).append(cbtasoc)
-            elif str(linea[0])=='6':
-                opcional = leer(linea, OPCIONAL)
-                encabezado.setdefault("opcionales", []).append(opcional)
-            elif str(linea[0])=='7':
-                comprador = leer(linea, COMPRADOR)
-                encabezado.setdefault("compradores", []).append(comprador)
-            else:
-                print("Tipo de registro incorrecto:", linea[0])
+        encabezados = leer_facturas(entrada)
+
+    # cada factura se graba en la salida apenas se obtiene su CAE
+    # (si no hay resultados no se escribe la salida)
+    dicts = procesar_facturas(ws, encabezados, informar_caea)
+    primera = next(dicts, None)
+    if primera is not None:
+        escribir_facturas(itertools.chain([primera], dicts), salida)
 
-    if not encabezados:
-        raise RuntimeError("No se pudieron leer los registros de la entrada")
 
-    # ajusto datos para pruebas en depuracin (nro de cbte. / fecha)
-    if '--testing' in sys.argv and DEBUG:
-        encabezado['punto_vta'] = 9998
-        cbte_nro = int(ws.CompUltimoAutorizado(encabezado['tipo_cbte'], 
-                                               encabezado['punto_vta'])) + 1
-        encabezado['cbt_desde'] = cbte_nro
-        encabezado['cbt_hasta'] = cbte_nro
-        encabezado['fecha_cbte'] = datetime.datetime.now().strftime("%Y%m%d")
-
-    # recorrer los registros para obtener CAE (dicts tendr los procesados)
-    dicts = []
+def procesar_facturas(ws, encabezados, informar_caea=False):
+    "Recorre los registros para obtener CAE (devuelve los procesados de a uno)"
+    # (cada factura se autoriza apenas se termina de leer de la entrada)
+    leidos = 0
     for encabezado in encabezados:
+        leidos += 1
+        # ajusto datos para pruebas en depuracin (nro de cbte. / fecha)
+        if '--testing' in sys.argv and DEBUG:
+            encabezado['punto_vta'] = 9998
+            cbte_nro = int(ws.CompUltimoAutorizado(encabezado['tipo_cbte'], 
+                                                   encabezado['punto_vta'])) + 1
+            encabezado['cbt_desde'] = cbte_nro
+            encabezado['cbt_hasta'] = cbte_nro
+            encabezado['fecha_cbte'] = datetime.datetime.now().strftime("%Y%m%d")
         if informar_caea:
             if '/testing' in sys.argv:
                 encabezado['cae'] = '21073372218437'
@@ -271,24 +262,67 @@ def autorizar(ws, entrada, salida, informar_caea=False):
                 'reproceso': ws.Reproceso,
                 'emision_tipo': ws.EmisionTipo,
                 })
-            dicts.append(dic)
             print("NRO:", dic['cbt_desde'], "Resultado:", dic['resultado'], "%s:" % ws.EmisionTipo,dic['cae'],"Obs:",dic['motivos_obs'].encode("ascii", "ignore"), "Err:", dic['err_msg'].encode("ascii", "ignore"), "Reproceso:", dic['reproceso'])
-    if dicts:
-        escribir_facturas(dicts, salida)
+            yield dic
+
+    if not leidos:
+        raise RuntimeError("No se pudieron leer los registros de la entrada")
+
+
+def leer_facturas(entrada):
+    "Analiza el archivo de texto y devuelve las facturas de a una (generador)"
+    encabezado = None
+    leidas = 0
+    for linea in entrada:
+        if str(linea[0])=='0':
+            # la factura anterior ya est completa (no hay ms sub-registros)
+            if encabezado is not None:
+                yield encabezado
+            encabezado = leer(linea, ENCABEZADO)
+            leidas += 1
+            if DEBUG: print(leidas, "Leida factura %(cbt_desde)s" % encabezado) 
+        elif str(linea[0])=='1':
+            tributo = leer(linea, TRIBUTO)
+            encabezado.setdefault("tributos", []).append(tributo)
+        elif str(linea[0])=='2':
+            iva = leer(linea, IVA)
+            encabezado.setdefault("ivas", []).append(iva)
+        elif str(linea[0])=='3':
+            cbtasoc = leer(linea, CMP_ASOC)
+            encabezado.setdefault("cbtasocs", []).append(cbtasoc)
+        elif str(linea[0])=='6':
+            opcional = leer(linea, OPCIONAL)
+            encabezado.setdefault("opcionales", []).append(opcional)
+        elif str(linea[0])=='7':
+            comprador = leer(linea, COMPRADOR)
+            encabezado.setdefault("compradores", []).append(comprador)
+        else:
+            print("Tipo de registro incorrecto:", linea[0])
+    if encabezado is not None:
+        yield encabezado
+
 
 def escribir_facturas(encabezados, archivo, agrega=False):
-    if '/json' in sys.argv:
-        import json
-        facturas = []
+    formato = formato_argv(formatos=FORMATOS)
+    dic = {}
+    if formato == "dbf":
+        # las tablas DBF se graban al final con todos los registros
+        encabezados = list(encabezados)
+    if formato == "json":
+        from .formatos.formato_json import Escritor
+        # se graba de a una factura (--compacto: sin indentar, ms chico)
+        escritor = Escritor(archivo, compacto='--compacto' in sys.argv)
         for dic in encabezados:
             factura = dic.copy()
-            facturas.append(factura)
             # ajsutes por compatibilidad hacia atras y con pyfepdf
             factura['fecha_vto'] = factura.get('fch_venc_cae')
             if 'iva' in factura:
                 factura['ivas'] = factura.get('iva', [])
                 del factura['iva']
-        json.dump(facturas, archivo, sort_keys=True, indent=4)
+            escritor.escribir(factura)
+        # la lista se cierra slo si no hubo errores (si no, queda
+        # incompleta y no se confunde con un resultado vlido)
+        escritor.cerrar()
     else:
         for dic in encabezados:
             dic['tipo_reg'] = 0
@@ -314,7 +348,7 @@ def escribir_facturas(encabezados, archivo, agrega=False):
                     it['tipo_reg'] = 7
                     archivo.write(escribir(it, COMPRADOR))
 
-    if '/dbf' in sys.argv:
+    if formato == "dbf":
         formatos = [('Encabezado', ENCABEZADO, encabezados), 
                     ('Tributo', TRIBUTO, dic.get('tributos', [])), 
                     ('Iva', IVA, dic.get('iva', [])), 
@@ -340,6 +374,7 @@ if __name__ == "__main__":
         print()
         print("Opciones: ")
         print(" /ayuda: este mensaje")
+        print(" /residente: autoriza con el servicio residente (ver residente.py)")
         print(" /dummy: consulta estado de servidores")
         print(" /prueba: genera y autoriza una factura de prueba (no usar en produccin!)")
         print(" /ult: consulta ltimo nmero de comprobante")
@@ -365,6 +400,13 @@ if __name__ == "__main__":
     else:
         entrada = config.get('WSFEv1','ENTRADA')
     salida = config.get('WSFEv1','SALIDA')
+
+    if '/residente' in sys.argv:
+        # autorizar con el servicio residente (ya conectado), ver residente.py
+        from .residente import cliente
+        codigo = cliente("rece1", entrada, salida)
+        if codigo is not None:
+            sys.exit(codigo)
     
     if config.has_option('WSAA','URL') and not HOMO:
         wsaa_url = config.get('WSAA','URL')
@@ -715,7 +757,7 @@ if __name__ == "__main__":
             try:
                 if DEBUG: print("Autorizando usando entrada:", entrada)
                 autorizar(ws, f_entrada, f_salida, '/informarcaea' in sys.argv)
-            except SoapFault:
+            except utils.SoapFault:
                 XML = True
                 raise
         finally:
@@ -725,7 +767,7 @@ if __name__ == "__main__":
                 depurar_xml(ws.client, RUTA_XML)
         sys.exit(0)
     
-    except SoapFault as e:
+    except utils.SoapFault as e:
         print("SoapFault:", e.faultcode, e.faultstring.encode("ascii","ignore"))
         sys.exit(3)
     except Exception as e:
@@ -208,6 +208,7 @@ if __name__ == "__main__":
         print()
         print("Opciones: ")
         print(" /ayuda: este mensaje")
+        print(" /residente: autoriza con el servicio residente (ver residente.py)")
         print(" /dummy: consulta estado de servidores")
         print(" /prueba: genera y autoriza una factura de prueba (no usar en produccin!)")
         print(" /ult: consulta ltimo nmero de comprobante")
@@ -231,6 +232,13 @@ if __name__ == "__main__":
     cuit = config.get('WSBFE','CUIT')
     entrada = config.get('WSBFE','ENTRADA')
     salida = config.get('WSBFE','SALIDA')
+
+    if '/residente' in sys.argv:
+        # autorizar con el servicio residente (ya conectado), ver residente.py
+        from .residente import cliente
+        codigo = cliente("receb1", entrada, salida)
+        if codigo is not None:
+            sys.exit(codigo)
     
     if config.has_option('WSAA','URL') and not HOMO:
         wsaa_url = config.get('WSAA','URL')
@@ -25,7 +25,8 @@ import traceback
 
 # revisar la instalacin de pyafip.ws:
 from . import wsmtx
-from .utils import SimpleXMLElement, SoapClient, SoapFault, date
+from . import utils
+from .utils import date
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, abrir_conf
 
 
@@ -253,6 +254,7 @@ if __name__ == "__main__":
         print()
         print("Opciones: ")
         print(" /ayuda: este mensaje")
+        print(" /residente: autoriza con el servicio residente (ver residente.py)")
         print(" /dummy: consulta estado de servidores")
         print(" /prueba: genera y autoriza una factura de prueba (no usar en produccin!)")
         print(" /ult: consulta ltimo nmero de comprobante")
@@ -278,6 +280,13 @@ if __name__ == "__main__":
     else:
         entrada = config.get('WSMTXCA','ENTRADA')
     salida = config.get('WSMTXCA','SALIDA')
+
+    if '/residente' in sys.argv:
+        # autorizar con el servicio residente (ya conectado), ver residente.py
+        from .residente import cliente
+        codigo = cliente("recem", entrada, salida)
+        if codigo is not None:
+            sys.exit(codigo)
     
     if config.has_option('WSAA','URL') and not HOMO:
         wsaa_url = config.get('WSAA','URL')
@@ -608,7 +617,7 @@ if __name__ == "__main__":
             try:
                 if DEBUG: print("Autorizando usando entrada:", entrada)
                 autorizar(ws, f_entrada, f_salida, '/informarcaea' in sys.argv)
-            except SoapFault:
+            except utils.SoapFault:
                 XML = True
                 raise
         finally:
@@ -618,7 +627,7 @@ if __name__ == "__main__":
                 depurar_xml(ws.client)
         sys.exit(0)
     
-    except SoapFault as e:
+    except utils.SoapFault as e:
         print(e.faultcode, e.faultstring.encode("ascii","ignore"))
         sys.exit(3)
     except Exception as e:
@@ -26,8 +26,10 @@ import traceback
 
 # revisar la instalacin de pyafip.ws:
 from . import wsct
-from .utils import SimpleXMLElement, SoapClient, SoapFault, date
+from . import utils
+from .utils import date
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, abrir_conf
+from .formatos.conversor import formato_argv
 
 
 HOMO = wsct.HOMO
@@ -35,6 +37,7 @@ DEBUG = False
 PDB = False
 XML = False
 CONFIG_FILE = "rece.ini"
+FORMATOS = ("dbf", "json")     # adems de TXT (ver formatos.conversor)
 
 LICENCIA = """
 recet.py: Interfaz de texto para generar Facturas Electrnica Turismo
@@ -138,7 +141,8 @@ def autorizar(ws, entrada, salida, informar_caea=False):
     encabezado = []
     detalles = []
     formas_pago = []
-    if '/dbf' in sys.argv:
+    formato = formato_argv(formatos=FORMATOS)
+    if formato == "dbf":
         formatos = [('Encabezado', ENCABEZADO, encabezado), 
                     ('Tributo', TRIBUTO, tributos), 
                     ('Iva', IVA, ivas), 
@@ -146,7 +150,7 @@ def autorizar(ws, entrada, salida, informar_caea=False):
                     ('Detalles', DETALLE, detalles)]
         dic = leer_dbf(formatos, conf_dbf)
         encabezado = encabezado[0]
-    elif '/json' in sys.argv:
+    elif formato == "json":
         encabezado = json.load(entrada)
         for lista, clave in ((detalles, "detalles"), (ivas, "iva"),
                              (tributos, "tributos"), (cbtasocs, "cbtes_asoc"),
@@ -232,7 +236,8 @@ def autorizar(ws, entrada, salida, informar_caea=False):
         print("NRO:", dic['cbte_nro'], "Resultado:", dic['resultado'], "%s:" % ws.EmisionTipo,dic['cae'],"Obs:",dic['motivos_obs'].encode("ascii", "ignore"), "Err:", dic['err_msg'].encode("ascii", "ignore"), "Reproceso:", dic['reproceso'])
 
 def escribir_factura(dic, archivo, agrega=False):
-    if '/dbf' in sys.argv:
+    formato = formato_argv(formatos=FORMATOS)
+    if formato == "dbf":
         formatos = [('Encabezado', ENCABEZADO, [dic]), 
                     ('Tributo', TRIBUTO, dic.get('tributos', [])), 
                     ('Iva', IVA, dic.get('iva', [])), 
@@ -241,7 +246,7 @@ def escribir_factura(dic, archivo, agrega=False):
                     ('Forma Pago', FORMA_PAGO, dic.get('formas_pago', [])),
                    ]
         guardar_dbf(formatos, agrega, conf_dbf)
-    elif '/json' in sys.argv:
+    elif formato == "json":
         json.dump(dic, archivo, sort_keys=True, indent=4)
     else:
         dic['tipo_reg'] = TIPOS_REG[0]
@@ -285,6 +290,7 @@ if __name__ == "__main__":
         print()
         print("Opciones: ")
         print(" /ayuda: este mensaje")
+        print(" /residente: autoriza con el servicio residente (ver residente.py)")
         print(" /dummy: consulta estado de servidores")
         print(" /prueba: genera y autoriza una factura de prueba (no usar en produccin!)")
         print(" /ult: consulta ltimo nmero de comprobante")
@@ -311,6 +317,13 @@ if __name__ == "__main__":
     else:
         entrada = config.get('WSCT','ENTRADA')
     salida = config.get('WSCT','SALIDA')
+
+    if '/residente' in sys.argv:
+        # autorizar con el servicio residente (ya conectado), ver residente.py
+        from .residente import cliente
+        codigo = cliente("recet", entrada, salida)
+        if codigo is not None:
+            sys.exit(codigo)
     
     if config.has_option('WSAA','URL') and not HOMO:
         wsaa_url = config.get('WSAA','URL')
@@ -516,7 +529,7 @@ if __name__ == "__main__":
             try:
                 if DEBUG: print("Autorizando usando entrada:", entrada)
                 autorizar(ws, f_entrada, f_salida, '/informarcaea' in sys.argv)
-            except SoapFault:
+            except utils.SoapFault:
                 XML = True
                 raise
         finally:
@@ -526,7 +539,7 @@ if __name__ == "__main__":
                 depurar_xml(ws.client)
         sys.exit(0)
     
-    except SoapFault as e:
+    except utils.SoapFault as e:
         print(e.faultcode, e.faultstring.encode("ascii","ignore"))
         sys.exit(3)
     except Exception as e:
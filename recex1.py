@@ -25,7 +25,8 @@ import traceback
 
 # revisar la instalación de pyafip.ws:
 from . import wsfexv1
-from .utils import SimpleXMLElement, SoapClient, SoapFault, date
+from . import utils
+from .utils import date
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, abrir_conf
 
 
@@ -232,6 +233,7 @@ if __name__ == "__main__":
         print()
         print("Opciones: ")
         print(" /ayuda: este mensaje")
+        print(" /residente: autoriza con el servicio residente (ver residente.py)")
         print(" /dummy: consulta estado de servidores")
         print(" /prueba: genera y autoriza una factura de prueba (no usar en producción!)")
         print(" /ult: consulta último número de comprobante")
@@ -250,6 +252,13 @@ if __name__ == "__main__":
     cuit = config.get('WSFEXv1','CUIT')
     entrada = config.get('WSFEXv1','ENTRADA')
     salida = config.get('WSFEXv1','SALIDA')
+
+    if '/residente' in sys.argv:
+        # autorizar con el servicio residente (ya conectado), ver residente.py
+        from .residente import cliente
+        codigo = cliente("recex1", entrada, salida)
+        if codigo is not None:
+            sys.exit(codigo)
     
     if config.has_option('WSAA','URL') and not HOMO:
         wsaa_url = config.get('WSAA','URL')
@@ -0,0 +1,266 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Política de reintentos y cortacircuitos para las llamadas a los webservices"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# Reintentos (decorador utils.inicializar_y_capturar_excepciones):
+#   - espera exponencial con variación aleatoria ("full jitter") entre intentos
+#   - las consultas (idempotentes) se reintentan ante cualquier error de red
+#     (conexión reiniciada, tiempo de espera agotado, respuesta incompleta)
+#   - las autorizaciones sólo si la solicitud no llegó a AFIP (conexión
+#     rechazada, servidor no encontrado), para no duplicar comprobantes;
+#     luego se recuperan con Reprocesar / CompConsultar.
+# Cortacircuitos (transporte HTTP de cada cliente, ver BaseWS.Conectar):
+#   - por servidor (URL): luego de N fallas de red seguidas deja de intentar
+#     durante un tiempo (CircuitoAbierto) y luego deja pasar una prueba.
+#   - estado para monitoreo: reintentos.estados() (y metricas, Prometheus)
+# RegistroServidores y TransporteHttp son comunes a los envoltorios del
+# transporte (ver también concurrencia y metricas).
+
+import errno
+import random
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+DEBUG = False
+
+# errores en los que la solicitud no se envió (se puede reintentar siempre)
+ERRORES_CONEXION = (errno.ECONNREFUSED, 10061)
+# reinicio / cancelación de la conexión (winsock, reintentados históricamente)
+ERRORES_WINDOWS = (10054, 10053)
+# errores de red luego de enviar (sólo se reintentan las consultas)
+ERRORES_RED = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE,
+               errno.ETIMEDOUT, errno.EHOSTUNREACH, errno.ENETUNREACH, 10060)
+
+# métodos idempotentes (consultas) según el nombre
+PREFIJOS_CONSULTA = ("Consultar", "Dummy", "CompConsultar", "CompUltimoAutorizado",
+                     "CompTotXRequest", "CAEAConsultar", "ConstatarComprobante",
+                     "ParamGet", "Get", "Buscar", "CTGsPendientes", "LoginCMS")
+
+# estados HTTP que indican servidor degradado (cuentan como falla)
+ESTADOS_FALLA = (502, 503, 504)
+
+
+class CircuitoAbierto(RuntimeError):
+    "El servidor está degradado: no se intenta la llamada (fallo rápido)"
+
+
+def importado(modulo, nombre):
+    "Devuelve la clase si el módulo ya fue importado (sino no pudo lanzarse)"
+    modulo = sys.modules.get(modulo)
+    return getattr(modulo, nombre, None) if modulo else None
+
+
+def es_error_red(error):
+    "Indica si la excepción corresponde a un error de red / transporte"
+    if isinstance(error, (socket.timeout, socket.gaierror, ConnectionError)):
+        return True
+    for modulo, nombre in (("http.client", "HTTPException"),
+                           ("httplib2", "HttpLib2Error")):
+        clase = importado(modulo, nombre)
+        if clase and isinstance(error, clase):
+            return True
+    return isinstance(error, OSError) and getattr(error, "errno", None) in \
+        ERRORES_CONEXION + ERRORES_WINDOWS + ERRORES_RED
+
+
+class Politica:
+    "Política de reintentos (espera exponencial con variación aleatoria)"
+
+    def __init__(self, base=0.5, maximo=10, consultas=PREFIJOS_CONSULTA):
+        self.base = base            # espera inicial (segundos)
+        self.maximo = maximo        # espera máxima entre intentos
+        self.consultas = tuple(consultas)
+
+    def idempotente(self, ws, metodo):
+        "Indica si el método se puede repetir sin efectos (consulta)"
+        if metodo in getattr(ws, "MetodosIdempotentes", ()):
+            return True
+        return metodo.startswith(self.consultas)
+
+    def reintentar(self, ws, metodo, error):
+        "Indica si se debe reintentar la llamada luego del error"
+        if isinstance(error, CircuitoAbierto) or not es_error_red(error):
+            return False
+        numero = getattr(error, "errno", None)
+        if isinstance(error, (ConnectionRefusedError, socket.gaierror)) or \
+           numero in ERRORES_CONEXION or numero in ERRORES_WINDOWS:
+            return True
+        clase = importado("httplib2", "ServerNotFoundError")
+        if clase and isinstance(error, clase):
+            return True
+        # la solicitud pudo haber sido procesada: sólo consultas
+        return self.idempotente(ws, metodo)
+
+    def espera(self, intento):
+        "Segundos a esperar antes del reintento (0 = primero)"
+        return random.uniform(0, min(self.maximo, self.base * 2 ** intento))
+
+
+class Circuito:
+    "Cortacircuito de un servidor (falla rápido mientras está degradado)"
+
+    CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+    def __init__(self, servidor, umbral=5, espera=30):
+        self.servidor = servidor
+        self.umbral = umbral        # fallas seguidas para abrir el circuito
+        self.espera = espera        # segundos abierto antes de probar
+        self.estado = self.CERRADO
+        self.fallas = 0
+        self.aperturas = 0
+        self.rechazadas = 0
+        self.apertura = None
+        self.prueba = False         # hay una llamada de prueba en curso
+        self.lock = threading.Lock()
+
+    def permitir(self):
+        "Verifica si se puede intentar la llamada (lanza CircuitoAbierto)"
+        with self.lock:
+            if self.estado == self.CERRADO:
+                return
+            if self.estado == self.ABIERTO and \
+               time.time() - self.apertura >= self.espera:
+                self.estado = self.SEMIABIERTO
+            if self.estado == self.SEMIABIERTO and not self.prueba:
+                self.prueba = True
+                return
+            self.rechazadas += 1
+        raise CircuitoAbierto("Servidor %s degradado (%d fallas), "
+                              "reintente en %d segundos" % (
+                              self.servidor, self.fallas, self.espera))
+
+    def exito(self):
+        with self.lock:
+            self.estado = self.CERRADO
+            self.fallas = 0
+            self.prueba = False
+
+    def falla(self):
+        with self.lock:
+            self.fallas += 1
+            if self.estado == self.SEMIABIERTO or self.fallas >= self.umbral:
+                if self.estado != self.ABIERTO:
+                    self.aperturas += 1
+                self.estado = self.ABIERTO
+                self.apertura = time.time()
+            self.prueba = False
+
+    def liberar(self):
+        "Libera la prueba si la llamada terminó sin informar éxito ni falla"
+        with self.lock:
+            if self.estado == self.SEMIABIERTO:
+                self.prueba = False
+
+    def resumen(self):
+        "Devuelve el estado (para monitoreo)"
+        return {'estado': self.estado, 'fallas': self.fallas,
+                'aperturas': self.aperturas, 'rechazadas': self.rechazadas}
+
+
+def nombre_servidor(uri):
+    "Devuelve la clave del servidor (esquema, host y ruta de la URL)"
+    url = urlparse(uri)
+    return "%s://%s%s" % (url.scheme, url.netloc, url.path)
+
+
+class RegistroServidores:
+    "Registro de un estado por servidor (compartido entre instancias)"
+
+    def __init__(self, clase, **opciones):
+        self.clase = clase              # se crea con clase(servidor, **opciones)
+        self.opciones = opciones
+        self.servidores = {}
+        self.lock = threading.Lock()
+
+    def obtener(self, uri):
+        "Devuelve el estado del servidor de la URL (lo crea si no existe)"
+        servidor = nombre_servidor(uri)
+        estado = self.servidores.get(servidor)
+        if estado is None:
+            with self.lock:
+                estado = self.servidores.setdefault(
+                    servidor, self.clase(servidor, **self.opciones))
+        return estado
+
+    def estados(self):
+        return dict([(servidor, estado.resumen()) for servidor, estado
+                     in sorted(self.servidores.items())])
+
+
+class Cortacircuitos(RegistroServidores):
+    "Registro de los circuitos por servidor (compartido entre instancias)"
+
+    def __init__(self, umbral=5, espera=30):
+        RegistroServidores.__init__(self, Circuito, umbral=umbral,
+                                    espera=espera)
+
+
+class TransporteHttp:
+    "Envoltorio del transporte HTTP del cliente SOAP (delega en el original)"
+
+    def __init__(self, http):
+        self.http = http
+
+    def request(self, *args, **kwargs):
+        return self.http.request(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        # close, add_credentials, add_certificate, etc.
+        return getattr(self.http, attr)
+
+
+class TransporteProtegido(TransporteHttp):
+    "Envoltorio del transporte HTTP del cliente SOAP (cortacircuitos)"
+
+    def __init__(self, http, cortacircuitos):
+        TransporteHttp.__init__(self, http)
+        self.cortacircuitos = cortacircuitos
+
+    def request(self, uri, *args, **kwargs):
+        circuito = self.cortacircuitos.obtener(uri)
+        circuito.permitir()
+        try:
+            respuesta, contenido = self.http.request(uri, *args, **kwargs)
+        except Exception as e:
+            if es_error_red(e):
+                circuito.falla()
+            else:
+                circuito.exito()
+            raise
+        else:
+            if getattr(respuesta, "status", None) in ESTADOS_FALLA:
+                circuito.falla()
+            else:
+                circuito.exito()
+        finally:
+            # interrumpida (KeyboardInterrupt, SystemExit): no bloquear el
+            # circuito semiabierto con una prueba que nunca termina
+            circuito.liberar()
+        return respuesta, contenido
+
+
+# política y cortacircuitos predeterminados (ver utils)
+POLITICA = Politica()
+CORTACIRCUITOS = Cortacircuitos()
+
+
+def estados():
+    "Estado de los circuitos de cada servidor (para monitoreo)"
+    return CORTACIRCUITOS.estados()
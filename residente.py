@@ -0,0 +1,372 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Servicio residente para los scripts rece* (interfaz conectada y autenticada)"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# Los ERP que ejecutan rece1.py (o recem, recex1, recet, receb1) por cada
+# comprobante pagan en cada ejecución el inicio del intérprete, la lectura
+# de rece.ini, la autenticación con WSAA y el análisis del WSDL.
+# El servicio residente lo hace una sola vez y luego procesa los trabajos
+# (de a uno, en orden de llegada) con la función autorizar del script:
+#   - socket Unix: una línea JSON por trabajo y otra por resultado
+#   - carpeta (spool): <id>.trabajo (JSON) -> <id>.resultado (JSON)
+# Cada trabajo indica los archivos de entrada / salida y las opciones del
+# script (/json, /dbf, /informarcaea, --compacto), con los mismos formatos.
+# El ticket de acceso se renueva al expirar, y ante errores de red se
+# vuelve a conectar en el próximo trabajo.
+#
+# Uso:
+#   python -m pyafipws.residente rece1 [--socket ruta] [--spool carpeta]
+#   python -m pyafipws.rece1 /residente [/json] [/entrada archivo] ...
+# Si el servicio no está activo, el script autoriza como siempre.
+
+import importlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from . import reintentos, utils
+
+DEBUG = False
+
+# script: (módulo de la interfaz, clase, sección de rece.ini, servicio WSAA)
+DRIVERS = {
+    'rece1': ("wsfev1", "WSFEv1", "WSFEv1", "wsfe"),
+    'recem': ("wsmtx", "WSMTXCA", "WSMTXCA", "wsmtxca"),
+    'recex1': ("wsfexv1", "WSFEXv1", "WSFEXv1", "wsfex"),
+    'recet': ("wsct", "WSCT", "WSCT", "wsct"),
+    'receb1': ("wsbfev1", "WSBFEv1", "WSBFE", "wsbfe"),
+}
+
+# opciones de los scripts que se envían con cada trabajo
+OPCIONES = ("/json", "/dbf", "/informarcaea", "--compacto")
+
+# scripts cuya función autorizar admite informar_caea
+CAEA = ("rece1", "recem", "recet")
+
+ESPERA_SPOOL = 60       # segundos a esperar que el servicio tome el trabajo
+ESPERA_RESULTADO = 600  # segundos a esperar el resultado (trabajo tomado)
+
+
+def ruta_socket(script):
+    "Devuelve la ruta predeterminada del socket del servicio"
+    return os.path.join(tempfile.gettempdir(), "pyafipws_%s.sock" % script)
+
+
+def error(mensaje):
+    "Resultado de un trabajo fallido (código de salida 5, como los scripts)"
+    return {'codigo': 5, 'mensaje': mensaje}
+
+
+def opcion(argv, nombre, predeterminado=None):
+    "Devuelve el valor que sigue a la opción en la línea de comandos"
+    if nombre in argv and argv.index(nombre) + 1 < len(argv):
+        return argv[argv.index(nombre) + 1]
+    return predeterminado
+
+
+class Residente:
+    "Mantiene la interfaz del script conectada y procesa los trabajos"
+
+    def __init__(self, script, config_file="rece.ini", ws=None):
+        if script not in DRIVERS:
+            raise ValueError("Script no soportado: %s" % script)
+        self.script = script
+        self.config_file = config_file
+        self.modulo = importlib.import_module("." + script, __package__)
+        self.modulo.conf_dbf = {}
+        self.wsaa = None
+        self.trabajos = 0
+        self.lock = threading.Lock()    # un trabajo a la vez (sys.argv)
+        self.ws = ws
+        if ws is None:
+            self.conectar()
+
+    def conectar(self):
+        "Lee la configuración, conecta la interfaz y obtiene el ticket de acceso"
+        interfaz, clase, seccion, servicio = DRIVERS[self.script]
+        homo = self.modulo.HOMO
+        config = utils.abrir_conf(self.config_file, DEBUG)
+
+        def valor(seccion, clave, predeterminado=None):
+            if config.has_option(seccion, clave):
+                return config.get(seccion, clave)
+            return predeterminado
+
+        if config.has_section('DBF'):
+            self.modulo.conf_dbf = dict(config.items('DBF'))
+        if config.has_section('PROXY') and not homo:
+            proxy = dict(("proxy_%s" % k, v) for k, v in config.items('PROXY'))
+            proxy['proxy_port'] = int(proxy['proxy_port'])
+        else:
+            proxy = {}
+        cacert = valor(seccion, 'CACERT')
+        wrapper = valor(seccion, 'WRAPPER')
+        url = None if homo else valor(seccion, 'URL')
+
+        modulo = importlib.import_module("." + interfaz, __package__)
+        ws = getattr(modulo, clase)()
+        ws.LanzarExcepciones = True
+        ws.Conectar("", url, proxy=proxy, cacert=cacert, wrapper=wrapper,
+                    timeout=int(valor(seccion, 'TIMEOUT', 30)))
+        ws.Cuit = config.get(seccion, 'CUIT')
+        if valor(seccion, 'REPROCESAR') is not None:
+            ws.Reprocesar = valor(seccion, 'REPROCESAR') == 'S'
+        self.credenciales = (servicio, config.get('WSAA', 'CERT'),
+                             config.get('WSAA', 'PRIVATEKEY'),
+                             None if homo else valor('WSAA', 'URL'),
+                             proxy, cacert, wrapper)
+        self.ws = ws
+        self.autenticar()
+        ws.LanzarExcepciones = False
+
+    def autenticar(self):
+        "Obtiene (o renueva) el ticket de acceso"
+        from .wsaa import WSAA
+        servicio, cert, privatekey, url, proxy, cacert, wrapper = self.credenciales
+        self.wsaa = WSAA()
+        ta = self.wsaa.Autenticar(servicio, cert, privatekey, url, proxy=proxy,
+                                  cacert=cacert, wrapper=wrapper)
+        if not ta:
+            raise RuntimeError("Imposible autenticar con WSAA: %s" %
+                               self.wsaa.Excepcion)
+        self.ws.SetTicketAcceso(ta)
+
+    def procesar(self, trabajo):
+        "Autoriza los comprobantes del trabajo, devuelve código y mensaje"
+        opciones = [o for o in trabajo.get('opciones', []) if o in OPCIONES]
+        entrada, salida = trabajo['entrada'], trabajo['salida']
+        with self.lock:
+            argv = sys.argv
+            # los scripts leen las opciones de la línea de comandos
+            sys.argv = [self.script] + opciones
+            try:
+                codigo, mensaje = self.autorizar(entrada, salida, opciones)
+            finally:
+                sys.argv = argv
+            self.trabajos += 1
+        if DEBUG: print("trabajo", self.trabajos, entrada, codigo, mensaje)
+        return {'codigo': codigo, 'mensaje': mensaje}
+
+    def autorizar(self, entrada, salida, opciones):
+        # códigos de salida como el script: 3 = SoapFault, 5 = otros errores
+        try:
+            if self.ws is None:
+                self.conectar()
+            elif self.wsaa and self.wsaa.Expirado():
+                self.autenticar()
+            args = ()
+            if "/informarcaea" in opciones and self.script in CAEA:
+                args = (True, )
+            with open(entrada, "r") as f_entrada, open(salida, "w") as f_salida:
+                self.modulo.autorizar(self.ws, f_entrada, f_salida, *args)
+            return 0, ""
+        except Exception as e:
+            if reintentos.es_error_red(e):
+                self.ws = None          # volver a conectar (próximo trabajo)
+            if utils.es_soap_fault(e):
+                return 3, "SoapFault: %s %s" % (e.faultcode, e.faultstring)
+            mensaje = str(e) or repr(e)
+            try:
+                with open(salida, "w") as f_salida:
+                    self.escribir_error(mensaje, f_salida)
+            except Exception as e:
+                mensaje += " (no se pudo informar en la salida: %s)" % e
+            return 5, mensaje
+
+    def escribir_error(self, mensaje, archivo):
+        "Informa el error en la salida con el formato del script"
+        if hasattr(self.modulo, "escribir_facturas"):
+            self.modulo.escribir_facturas([{'err_msg': mensaje}], archivo)
+        else:
+            # recem, recex1, recet y receb1 graban de a un comprobante
+            self.modulo.escribir_factura({'err_msg': mensaje}, archivo)
+
+    def procesar_archivo(self, ruta):
+        "Procesa el trabajo de la carpeta y graba el resultado"
+        base = ruta[:-len(".trabajo")]
+        try:
+            with open(ruta) as f:
+                trabajo = json.load(f)
+            os.remove(ruta)             # trabajo tomado (ver cliente)
+        except (IOError, OSError, ValueError):
+            return                      # incompleto o tomado por otro proceso
+        try:
+            resultado = self.procesar(trabajo)
+        except Exception as e:
+            # siempre responder (ver ManejadorTrabajos)
+            resultado = error("Error del servicio residente: %s" % (
+                              str(e) or repr(e)))
+        with open(base + ".tmp", "w") as f:
+            json.dump(resultado, f)
+        os.replace(base + ".tmp", base + ".resultado")
+
+    def vigilar(self, carpeta, intervalo=0.05, detener=None):
+        "Procesa los trabajos dejados en la carpeta (<id>.trabajo)"
+        while not (detener and detener.is_set()):
+            nombres = sorted(nombre for nombre in os.listdir(carpeta)
+                             if nombre.endswith(".trabajo"))
+            for nombre in nombres:
+                self.procesar_archivo(os.path.join(carpeta, nombre))
+            if not nombres:
+                time.sleep(intervalo)
+
+
+class ManejadorTrabajos(socketserver.StreamRequestHandler):
+    "Recibe los trabajos (una línea JSON cada uno) y devuelve los resultados"
+
+    def handle(self):
+        for linea in self.rfile:
+            # siempre responder: sin respuesta el cliente no sabe si se
+            # enviaron los comprobantes a AFIP (no debe reintentar)
+            try:
+                resultado = self.server.residente.procesar(json.loads(linea))
+            except (ValueError, KeyError) as e:
+                resultado = error("Trabajo inválido: %s" % e)
+            except Exception as e:
+                resultado = error("Error del servicio residente: %s" % (
+                                  str(e) or repr(e)))
+            self.wfile.write(json.dumps(resultado).encode("utf8") + b"\n")
+
+
+class ServidorUnix(socketserver.UnixStreamServer):
+    "Servidor de trabajos por socket Unix (sólo accesible por el usuario)"
+
+    def __init__(self, ruta, residente):
+        if os.path.exists(ruta):
+            os.remove(ruta)             # socket de una ejecución anterior
+        self.residente = residente
+        socketserver.UnixStreamServer.__init__(self, ruta, ManejadorTrabajos)
+        os.chmod(ruta, 0o600)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def enviar_socket(ruta, trabajo):
+    "Envía el trabajo al servicio, devuelve el resultado (None: inactivo)"
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            s.connect(ruta)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None                 # no hay servicio escuchando
+        # desde aquí el trabajo pudo haberse procesado: ante cualquier falla
+        # se informa error (no se debe autorizar nuevamente en forma local)
+        try:
+            s.sendall(json.dumps(trabajo).encode("utf8") + b"\n")
+            respuesta = s.makefile("rb").readline()
+        except OSError as e:
+            return error("Error de comunicación con el servicio residente: %s" % e)
+    finally:
+        s.close()
+    try:
+        if not respuesta.endswith(b"\n"):
+            raise ValueError("respuesta incompleta")
+        return json.loads(respuesta)
+    except ValueError as e:
+        return error("Respuesta inválida del servicio residente: %s %r" % (
+                     e, respuesta[:100]))
+
+
+def enviar_spool(carpeta, trabajo, espera=ESPERA_SPOOL,
+                 espera_resultado=ESPERA_RESULTADO, intervalo=0.01):
+    "Deja el trabajo en la carpeta y espera el resultado (None: inactivo)"
+    base = os.path.join(carpeta, uuid.uuid4().hex)
+    with open(base + ".tmp", "w") as f:
+        json.dump(trabajo, f)
+    os.replace(base + ".tmp", base + ".trabajo")
+    limite = time.time() + espera
+    tomado = False
+    while not os.path.exists(base + ".resultado"):
+        if not tomado and not os.path.exists(base + ".trabajo"):
+            tomado = True
+            limite = time.time() + espera_resultado
+        if time.time() > limite:
+            if not tomado:
+                try:
+                    os.remove(base + ".trabajo")
+                    return None         # nadie tomó el trabajo
+                except OSError:
+                    continue            # lo acaba de tomar el servicio
+            # el servicio tomó el trabajo pero no respondió (¿se detuvo?)
+            return error("Sin resultado del servicio residente luego de %d "
+                         "segundos (trabajo %s)" % (espera_resultado, base))
+        time.sleep(intervalo)
+    with open(base + ".resultado") as f:
+        resultado = json.load(f)
+    os.remove(base + ".resultado")
+    return resultado
+
+
+def cliente(script, entrada, salida, argv=None):
+    "Envía el trabajo al servicio residente, devuelve el código de salida"
+    argv = sys.argv if argv is None else argv
+    trabajo = {'entrada': os.path.abspath(entrada),
+               'salida': os.path.abspath(salida),
+               'opciones': [o for o in argv if o in OPCIONES]}
+    if '/spool' in argv:
+        resultado = enviar_spool(opcion(argv, '/spool'), trabajo)
+    else:
+        resultado = enviar_socket(opcion(argv, '/socket', ruta_socket(script)),
+                                  trabajo)
+    if resultado is None:
+        return None                     # servicio inactivo: procesar localmente
+    if resultado['mensaje']:
+        print(resultado['mensaje'])
+    return resultado['codigo']
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or '--ayuda' in sys.argv:
+        print(__doc__)
+        print("Uso: %s script [--conf rece.ini] [--socket ruta] [--spool carpeta]" % sys.argv[0])
+        print("Scripts:", ", ".join(sorted(DRIVERS)))
+        sys.exit(0)
+    if '--debug' in sys.argv:
+        DEBUG = True
+
+    script = sys.argv[1]
+    residente = Residente(script, opcion(sys.argv, '--conf', "rece.ini"))
+    spool = opcion(sys.argv, '--spool')
+    servidor = None
+    if not spool or '--socket' in sys.argv:
+        ruta = opcion(sys.argv, '--socket', ruta_socket(script))
+        servidor = ServidorUnix(ruta, residente)
+        print("Servicio %s escuchando en %s" % (script, ruta))
+    try:
+        if spool:
+            if servidor:
+                threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            print("Servicio %s vigilando %s" % (script, spool))
+            residente.vigilar(spool)
+        else:
+            servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if servidor:
+            servidor.server_close()
@@ -17,9 +17,15 @@ __copyright__ = "Copyright (C) 2016 Mariano Reingart"
 __license__ = "GPL 3.0"
 __version__ = "1.01a"
 
+import heapq
+import itertools
 import sys 
+import tempfile
 from .utils import leer, escribir, C, N, A, I, B, get_install_dir
 
+# cantidad de lineas ordenadas en memoria por tramo (ordenamiento externo)
+TAMANIO_LOTE = 100000
+
 
 # Diseño de registro de Importación de comprobantes de Ventas
 
@@ -60,6 +66,122 @@ REGINFO_CV_VENTAS_CBTE_ALICUOTA = [
     ]
 
 
+CLAVE_CBTE = ('tipo_cbte', 'punto_vta', 'cbt_desde')
+CLAVE_ALICUOTA = ('tipo_cbte', 'punto_vta', 'cbt_numero')
+
+
+def clave_linea(formato, campos):
+    "Devuelve una función que extrae la clave numérica de una linea"
+    rangos = {}
+    comienzo = 0
+    for fmt in formato:
+        rangos[fmt[0]] = (comienzo, comienzo + fmt[1])
+        comienzo += fmt[1]
+    rangos = [rangos[campo] for campo in campos]
+    def clave(linea):
+        return tuple([int(linea[desde:hasta].strip() or 0) 
+                      for desde, hasta in rangos])
+    return clave
+
+
+def esta_ordenado(archivo, clave):
+    "Verifica (recorriendo el archivo) si las lineas están ordenadas por clave"
+    anterior = None
+    with open(archivo) as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            actual = clave(linea)
+            if anterior is not None and actual < anterior:
+                return False
+            anterior = actual
+    return True
+
+
+def ordenar(archivo, clave, tamanio_lote=TAMANIO_LOTE):
+    "Devuelve las lineas ordenadas por clave (tramos en archivos temporales)"
+    tramos = []
+    try:
+        with open(archivo) as f:
+            while True:
+                lote = list(itertools.islice(f, tamanio_lote))
+                if not lote:
+                    break
+                lote = [linea.rstrip("\r\n") + "\n" for linea in lote
+                        if linea.strip()]
+                lote.sort(key=clave)    # estable: respeta el orden original
+                tramo = tempfile.TemporaryFile("w+")
+                tramo.writelines(lote)
+                tramo.seek(0)
+                tramos.append(tramo)
+                del lote
+        for linea in heapq.merge(*tramos, key=clave):
+            yield linea
+    finally:
+        for tramo in tramos:
+            tramo.close()
+
+
+def leer_lineas(archivo, clave, tamanio_lote=TAMANIO_LOTE):
+    "Devuelve las lineas del archivo en orden (lo ordena solo si es necesario)"
+    if esta_ordenado(archivo, clave):
+        with open(archivo) as f:
+            for linea in f:
+                if linea.strip():
+                    yield linea
+    else:
+        for linea in ordenar(archivo, clave, tamanio_lote):
+            yield linea
+
+
+def combinar(cabeceras, alicuotas):
+    "Asocia las alícuotas a su comprobante (merge-join, ambos ordenados)"
+    alicuotas = iter(alicuotas)
+    iva = next(alicuotas, None)
+    for reg in cabeceras:
+        key = tuple([reg[campo] for campo in CLAVE_CBTE])
+        while iva is not None:
+            key_iva = tuple([iva[campo] for campo in CLAVE_ALICUOTA])
+            if key_iva > key:
+                break
+            elif key_iva < key:
+                # alícuota sin comprobante en CAB.txt
+                raise KeyError(key_iva)
+            reg["imp_neto"] = reg.get("imp_neto", 0.00) + iva["base_imp"]
+            reg["imp_iva"] = reg.get("imp_iva", 0.00) + iva["importe"]
+            reg.setdefault("iva", []).append(iva)
+            iva = next(alicuotas, None)
+        yield reg
+    if iva is not None:
+        raise KeyError(tuple([iva[campo] for campo in CLAVE_ALICUOTA]))
+
+
+def procesar(cab="CAB.txt", ali="ALI.txt", caea="", concepto=1,
+             fecha_serv_desde=None, fecha_serv_hasta=None,
+             tamanio_lote=TAMANIO_LOTE):
+    "Devuelve los comprobantes (de a uno, ordenados) con sus alícuotas de IVA"
+    lineas = leer_lineas(cab, clave_linea(REGINFO_CV_VENTAS_CBTE, CLAVE_CBTE),
+                         tamanio_lote)
+    lineas_iva = leer_lineas(ali, clave_linea(REGINFO_CV_VENTAS_CBTE_ALICUOTA, 
+                                              CLAVE_ALICUOTA), tamanio_lote)
+    alicuotas = (leer(linea, REGINFO_CV_VENTAS_CBTE_ALICUOTA) 
+                 for linea in lineas_iva)
+
+    def cabeceras():
+        for linea in lineas:
+            reg = leer(linea, REGINFO_CV_VENTAS_CBTE)
+            reg["cae"] = caea
+            reg["concepto"] = concepto
+            if concepto == 2:
+                reg["fecha_serv_desde"] = fecha_serv_desde
+                reg["fecha_serv_hasta"] = fecha_serv_hasta
+            else:
+                del reg['fecha_venc_pago']
+            yield reg
+
+    return combinar(cabeceras(), alicuotas)
+
+
 if __name__ == "__main__":
 
     print("Usando formato registro RG3685 (regimen informativo compras/ventas)")
@@ -76,33 +198,19 @@ if __name__ == "__main__":
         concepto = 2
     else:
         concepto = 1
+        fecha_serv_desde = fecha_serv_hasta = None
+
+    if '--lote' in sys.argv:
+        TAMANIO_LOTE = int(sys.argv[sys.argv.index("--lote")+1])
 
-    ops = {}
-    for linea in open("CAB.txt"):
-        reg = leer(linea, REGINFO_CV_VENTAS_CBTE)
-        reg["cae"] = caea
-        reg["concepto"] = concepto
-        if concepto == 2:
-            reg["fecha_serv_desde"] = fecha_serv_desde
-            reg["fecha_serv_hasta"] = fecha_serv_hasta
-        else:
-            del reg['fecha_venc_pago']
-        key = (reg["tipo_cbte"], reg["punto_vta"], reg["cbt_desde"])
-        ops[key] = reg
-        print(key)
-
-    for linea in open("ALI.txt"):
-        iva = leer(linea, REGINFO_CV_VENTAS_CBTE_ALICUOTA)
-        key = (iva["tipo_cbte"], iva["punto_vta"], iva["cbt_numero"])
-        reg = ops[key]
-        reg["imp_neto"] = reg.get("imp_neto", 0.00) + iva["base_imp"]
-        reg["imp_iva"] = reg.get("imp_iva", 0.00) + iva["importe"]
-        reg.setdefault("iva", []).append(iva)
+    # los comprobantes se procesan de a uno (ordenados por tipo, punto de 
+    # venta y número), sin cargar CAB.txt / ALI.txt completos en memoria
+    facts = procesar("CAB.txt", "ALI.txt", caea, concepto,
+                     fecha_serv_desde, fecha_serv_hasta, TAMANIO_LOTE)
 
     from . import rece1
-    facts = sorted(list(ops.values()), 
-                key=lambda f: (f["tipo_cbte"], f["punto_vta"], f["cbt_desde"]))
-    rece1.escribir_facturas(facts, open("entrada.txt", "w"))
+    with open("entrada.txt", "w") as salida:
+        rece1.escribir_facturas(facts, salida)
     
     print("Hecho.")
 
@@ -0,0 +1,674 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Simulador local de los webservices de AFIP y mediciones de rendimiento"
+
+__author__ = "Mariano Reingart (reingart@gmail.com)"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+# El simulador atiende (por HTTP, en localhost) los servicios WSAA, WSFEv1,
+# WSMTXCA, WSFEXv1, WSLPG, WSCDC y padrón A4/A5:
+#  * GET /<servicio>?wsdl devuelve <carpeta_wsdl>/<servicio>.wsdl (descargado
+#    previamente de homologación) con la ubicación reemplazada por la local
+#  * POST /<servicio> responde la operación del Body: si existe el archivo
+#    <carpeta_respuestas>/<servicio>/<operacion>.xml (ej. grabado con /xml)
+#    lo devuelve tal cual, sino arma una respuesta según la solicitud
+#    (numeración correlativa, CAE / COE, fechas, una respuesta por detalle)
+# Se puede configurar la demora (latencia), la inyección de errores (SOAP
+# Fault o corte de la conexión) y la capacidad (solicitudes simultáneas,
+# excedida responde HTTP 503 y demora el doble), incluso en ejecución.
+#
+# Uso:
+#   python -m pyafipws.simulador --wsdl carpeta [--puerto 8080] [--demora 0.2]
+#   python -m pyafipws.simulador --wsdl carpeta --benchmark wsfev1 --cantidad 500
+#   python -m pyafipws.simulador --wsdl carpeta --benchmark rece1 --rece carpeta
+
+import datetime
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+try:
+    import resource
+except ImportError:
+    resource = None     # Windows: no se informa la memoria
+
+DEBUG = False
+
+# servicio: (estilo, sufijo de la respuesta)
+#  * "net": elementos calificados (xmlns predeterminado, ASP.NET)
+#  * "java": elementos sin calificar (Axis / JAX-WS)
+SERVICIOS = {
+    'wsaa': ("java", "Response"),
+    'wsfev1': ("net", "Response"),
+    'wsmtxca': ("java", "Response"),
+    'wsfexv1': ("net", "Response"),
+    'wslpg': ("java", "Resp"),
+    'wscdc': ("net", "Response"),
+    'ws_sr_padron': ("java", "Response"),
+    }
+
+# (servicio, operacion): función que arma el contenido de la respuesta
+RESPUESTAS = {}
+
+ENVELOPE = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="%(soap_uri)s"><soap:Body>%(body)s</soap:Body></soap:Envelope>"""
+
+FAULT = """<soap:Fault><faultcode>soap:Server</faultcode><faultstring>%s</faultstring></soap:Fault>"""
+
+
+def respuesta(servicio, *operaciones):
+    "Decorador para registrar la función que responde las operaciones"
+    def registrar(fn):
+        for operacion in operaciones:
+            RESPUESTAS[servicio, operacion] = fn
+        return fn
+    return registrar
+
+
+def nombre_local(tag):
+    "Devuelve el nombre del elemento sin el espacio de nombres"
+    return tag.rsplit("}", 1)[-1]
+
+
+def buscar(elemento, nombre, predeterminado=""):
+    "Devuelve el texto del primer subelemento con el nombre (sin ns)"
+    for sub in elemento.iter():
+        if nombre_local(sub.tag) == nombre:
+            return sub.text or ""
+    return predeterminado
+
+
+def buscar_todos(elemento, nombre):
+    "Devuelve todos los subelementos con el nombre (sin ns)"
+    return [sub for sub in elemento.iter() if nombre_local(sub.tag) == nombre]
+
+
+def xml(**campos):
+    "Arma los elementos XML (en orden), escapando los valores simples"
+    partes = []
+    for nombre, valor in campos.items():
+        valor = str(valor)
+        if not valor.startswith("<"):
+            valor = escape(valor)       # los subelementos ya vienen armados
+        partes.append("<%s>%s</%s>" % (nombre, valor, nombre))
+    return "".join(partes)
+
+
+# Respuestas predeterminadas (solo los campos que utilizan las interfaces):
+
+@respuesta("wsaa", "loginCms")
+def login_cms(servidor, solicitud):
+    ahora = datetime.datetime.now()
+    ta = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<loginTicketResponse version="1.0"><header><source>CN=wsaahomo</source>
+<destination>SERIALNUMBER=CUIT 20267565393</destination>
+<uniqueId>%d</uniqueId><generationTime>%s</generationTime>
+<expirationTime>%s</expirationTime></header><credentials>
+<token>%s</token><sign>%s</sign></credentials></loginTicketResponse>""" % (
+        servidor.numerar("wsaa"),
+        ahora.isoformat(timespec="seconds"),
+        (ahora + datetime.timedelta(hours=12)).isoformat(timespec="seconds"),
+        "PD94bWwgdG9rZW4gc2ltdWxhZG8/Pg==", "c2lnbiBzaW11bGFkbw==")
+    return "<loginCmsReturn>%s</loginCmsReturn>" % escape(ta)
+
+
+@respuesta("wsfev1", "FEDummy")
+@respuesta("wsfexv1", "FEXDummy")
+@respuesta("wscdc", "ComprobanteDummy")
+def dummy_net(servidor, solicitud):
+    resultado = xml(AppServer="OK", DbServer="OK", AuthServer="OK")
+    return "<%sResult>%s</%sResult>" % (solicitud.operacion, resultado,
+                                        solicitud.operacion)
+
+
+@respuesta("wsmtxca", "dummy")
+@respuesta("wslpg", "dummy")
+@respuesta("ws_sr_padron", "dummy")
+def dummy_java(servidor, solicitud):
+    resultado = xml(appserver="OK", dbserver="OK", authserver="OK")
+    if solicitud.servicio == "wsmtxca":
+        return resultado
+    return xml(**{'return': resultado})
+
+
+@respuesta("wsfev1", "FECompUltimoAutorizado")
+def fe_ultimo(servidor, solicitud):
+    pto_vta, tipo = buscar(solicitud, "PtoVta"), buscar(solicitud, "CbteTipo")
+    resultado = xml(PtoVta=pto_vta, CbteTipo=tipo,
+                    CbteNro=servidor.ultimo("wsfev1", tipo, pto_vta))
+    return xml(FECompUltimoAutorizadoResult=resultado)
+
+
+@respuesta("wsfev1", "FECAESolicitar")
+def fe_cae_solicitar(servidor, solicitud):
+    pto_vta, tipo = buscar(solicitud, "PtoVta"), buscar(solicitud, "CbteTipo")
+    fecha = datetime.date.today()
+    detalles = []
+    for det in buscar_todos(solicitud, "FECAEDetRequest"):
+        hasta = buscar(det, "CbteHasta")
+        servidor.ultimo("wsfev1", tipo, pto_vta, int(hasta or 0))
+        detalles.append(xml(FECAEDetResponse=xml(
+            Concepto=buscar(det, "Concepto"), DocTipo=buscar(det, "DocTipo"),
+            DocNro=buscar(det, "DocNro"), CbteDesde=buscar(det, "CbteDesde"),
+            CbteHasta=hasta, CbteFch=buscar(det, "CbteFch"), Resultado="A",
+            CAE=servidor.cae(), CAEFchVto=(fecha + datetime.timedelta(days=10)).strftime("%Y%m%d"),
+            )))
+    cabecera = xml(Cuit=buscar(solicitud, "Cuit"), PtoVta=pto_vta,
+                   CbteTipo=tipo,
+                   FchProceso=datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
+                   CantReg=len(detalles), Resultado="A", Reproceso="N")
+    return xml(FECAESolicitarResult=xml(FeCabResp=cabecera,
+                                        FeDetResp="".join(detalles)))
+
+
+@respuesta("wsmtxca", "consultarUltimoComprobanteAutorizado")
+def mtx_ultimo(servidor, solicitud):
+    nro = servidor.ultimo("wsmtxca", buscar(solicitud, "codigoTipoComprobante"),
+                          buscar(solicitud, "numeroPuntoVenta"))
+    return xml(numeroComprobante=nro)
+
+
+@respuesta("wsmtxca", "autorizarComprobante")
+def mtx_autorizar(servidor, solicitud):
+    tipo = buscar(solicitud, "codigoTipoComprobante")
+    pto_vta = buscar(solicitud, "numeroPuntoVenta")
+    nro = buscar(solicitud, "numeroComprobante")
+    servidor.ultimo("wsmtxca", tipo, pto_vta, int(nro or 0))
+    fecha = datetime.date.today()
+    comprobante = xml(
+        cuit=buscar(solicitud, "cuitRepresentada"), codigoTipoComprobante=tipo,
+        numeroPuntoVenta=pto_vta, numeroComprobante=nro,
+        fechaEmision=buscar(solicitud, "fechaEmision") or fecha.isoformat(),
+        CAE=servidor.cae(),
+        fechaVencimientoCAE=(fecha + datetime.timedelta(days=10)).isoformat())
+    return xml(resultado="A", comprobanteResponse=comprobante)
+
+
+@respuesta("wsfexv1", "FEXGetLast_CMP")
+def fex_ultimo(servidor, solicitud):
+    nro = servidor.ultimo("wsfexv1", buscar(solicitud, "Cbte_Tipo"),
+                          buscar(solicitud, "Pto_venta"))
+    resultado = xml(Cbte_nro=nro, Cbte_fecha=datetime.date.today().strftime("%Y%m%d"))
+    return xml(FEXGetLast_CMPResult=xml(FEXResult_LastCMP=resultado))
+
+
+@respuesta("wsfexv1", "FEXGetLast_ID")
+def fex_ultimo_id(servidor, solicitud):
+    resultado = xml(Id=servidor.ultimo("wsfexv1", "id", ""))
+    return xml(FEXGetLast_IDResult=xml(FEXResultGet=resultado))
+
+
+@respuesta("wsfexv1", "FEXAuthorize")
+def fex_autorizar(servidor, solicitud):
+    tipo, pto_vta = buscar(solicitud, "Cbte_Tipo"), buscar(solicitud, "Punto_vta")
+    nro = buscar(solicitud, "Cbte_nro")
+    servidor.ultimo("wsfexv1", tipo, pto_vta, int(nro or 0))
+    servidor.ultimo("wsfexv1", "id", "", int(buscar(solicitud, "Id") or 0))
+    fecha = datetime.date.today()
+    resultado = xml(
+        Id=buscar(solicitud, "Id"), Cuit=buscar(solicitud, "Cuit"),
+        Cbte_tipo=tipo, Punto_vta=pto_vta, Cbte_nro=nro, Cae=servidor.cae(),
+        Fch_venc_Cae=(fecha + datetime.timedelta(days=10)).strftime("%Y%m%d"),
+        Fch_cbte=buscar(solicitud, "Fecha_cbte"), Resultado="A",
+        Reproceso="N", Motivos_Obs="")
+    return xml(FEXAuthorizeResult=xml(FEXResultAuth=resultado))
+
+
+@respuesta("wslpg", "liquidacionUltimoNroOrdenConsultar")
+def lpg_ultimo(servidor, solicitud):
+    nro = servidor.ultimo("wslpg", "liq", buscar(solicitud, "ptoEmision"))
+    return xml(liqUltNroOrdenReturn=xml(nroOrden=nro))
+
+
+@respuesta("wslpg", "liquidacionAutorizar")
+def lpg_autorizar(servidor, solicitud):
+    pto_emision, nro_orden = buscar(solicitud, "ptoEmision"), buscar(solicitud, "nroOrden")
+    servidor.ultimo("wslpg", "liq", pto_emision, int(nro_orden or 0))
+    autorizacion = xml(
+        nroOrden=nro_orden, coe=servidor.cae()[:12], estado="AC",
+        fechaLiquidacion=datetime.date.today().isoformat(),
+        precioOperacion=buscar(solicitud, "precioRefTn", "0"),
+        subTotal="0.00", importeIva="0.00", operacionConIva="0.00",
+        totalPesoNeto=buscar(solicitud, "pesoNeto", "0"),
+        totalDeduccion="0.00", totalRetencion="0.00",
+        totalRetencionAfip="0.00", totalOtrasRetenciones="0.00",
+        totalNetoAPagar="0.00", totalIvaRg2300_07="0.00",
+        totalPagoSegunCondicion="0.00")
+    return xml(liqReturn=xml(autorizacion=autorizacion))
+
+
+@respuesta("wscdc", "ComprobanteConstatar")
+def cdc_constatar(servidor, solicitud):
+    comprobante = xml(
+        CbteModo=buscar(solicitud, "CbteModo"),
+        CuitEmisor=buscar(solicitud, "CuitEmisor"),
+        PtoVta=buscar(solicitud, "PtoVta"), CbteTipo=buscar(solicitud, "CbteTipo"),
+        CbteNro=buscar(solicitud, "CbteNro"), CbteFch=buscar(solicitud, "CbteFch"),
+        ImpTotal=buscar(solicitud, "ImpTotal"),
+        CodAutorizacion=buscar(solicitud, "CodAutorizacion"),
+        DocTipoReceptor=buscar(solicitud, "DocTipoReceptor"),
+        DocNroReceptor=buscar(solicitud, "DocNroReceptor"))
+    resultado = xml(CmpResp=comprobante, Resultado="A",
+                    FchProceso=datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
+    return xml(ComprobanteConstatarResult=resultado)
+
+
+@respuesta("ws_sr_padron", "getPersona")
+def padron_persona(servidor, solicitud):
+    id_persona = buscar(solicitud, "idPersona")
+    datos = xml(idPersona=id_persona, tipoPersona="FISICA", tipoClave="CUIT",
+                estadoClave="ACTIVO", apellido="SIMULADO", nombre="CONTRIBUYENTE",
+                domicilioFiscal=xml(direccion="CALLE FALSA 123", codPostal="1000",
+                                    idProvincia="0", localidad="CABA",
+                                    tipoDomicilio="FISCAL"))
+    # A4: persona (plano); A5: datosGenerales (y regímenes por separado)
+    if "a4" in solicitud.espacio_nombres.lower():
+        return xml(personaReturn=xml(persona=datos))
+    return xml(personaReturn=xml(datosGenerales=datos))
+
+
+class Solicitud:
+    "Datos de la operación solicitada (elemento del Body)"
+
+    def __init__(self, servicio, contenido):
+        envelope = ElementTree.fromstring(contenido)
+        self.soap_uri = envelope.tag[1:].split("}")[0]
+        body = [e for e in envelope if nombre_local(e.tag) == "Body"][0]
+        self.elemento = body[0]
+        self.servicio = servicio
+        self.operacion = nombre_local(self.elemento.tag)
+        self.espacio_nombres = self.elemento.tag[1:].split("}")[0] \
+                               if self.elemento.tag.startswith("{") else ""
+
+    def iter(self):
+        return self.elemento.iter()
+
+
+class ServidorAFIP(ThreadingHTTPServer):
+    "Servidor HTTP local que simula los webservices de AFIP"
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, puerto=0, carpeta_wsdl=None, carpeta_respuestas=None,
+                 demora=0, variacion=0, errores=0, cortes=0, servidor="127.0.0.1",
+                 capacidad=None):
+        ThreadingHTTPServer.__init__(self, (servidor, puerto), ManejadorSOAP)
+        self.carpeta_wsdl = carpeta_wsdl
+        self.carpeta_respuestas = carpeta_respuestas
+        self.demora = demora            # segundos por solicitud
+        self.variacion = variacion      # segundos adicionales (al azar)
+        self.errores = errores          # probabilidad de SOAP Fault
+        self.cortes = cortes            # probabilidad de cortar la conexión
+        self.capacidad = capacidad      # solicitudes simultáneas (None: sin límite)
+        self.en_curso = 0
+        self.rechazadas = 0
+        self.lock = threading.Lock()
+        self.numeros = {}
+        self.solicitudes = 0
+        self.hilo = None
+
+    def url(self, servicio):
+        "Devuelve la dirección para conectar la interfaz al servicio simulado"
+        return "http://%s:%d/%s" % (self.server_address[0],
+                                    self.server_address[1], servicio)
+
+    def iniciar(self):
+        "Atiende las solicitudes en un hilo secundario"
+        self.hilo = threading.Thread(target=self.serve_forever)
+        self.hilo.daemon = True
+        self.hilo.start()
+        return self
+
+    def detener(self):
+        self.shutdown()
+        self.server_close()
+
+    def numerar(self, *clave):
+        "Devuelve el próximo número correlativo"
+        with self.lock:
+            self.numeros[clave] = self.numeros.get(clave, 0) + 1
+            return self.numeros[clave]
+
+    def ultimo(self, servicio, tipo, pto_vta, nro=None):
+        "Devuelve (o actualiza) el último comprobante autorizado"
+        clave = (servicio, str(tipo), str(pto_vta))
+        with self.lock:
+            if nro is not None and nro > self.numeros.get(clave, 0):
+                self.numeros[clave] = nro
+            return self.numeros.get(clave, 0)
+
+    def cae(self):
+        return "7%013d" % self.numerar("cae")
+
+    def wsdl(self, servicio):
+        "Lee el WSDL del servicio y corrige la ubicación (servidor local)"
+        if not self.carpeta_wsdl:
+            return None
+        fn = os.path.join(self.carpeta_wsdl, "%s.wsdl" % servicio)
+        if not os.path.exists(fn):
+            return None
+        with open(fn, "rb") as f:
+            contenido = f.read()
+        return re.sub(br'(<[\w:]*address\b[^>]*\blocation=")[^"]*(")',
+                      br'\g<1>' + self.url(servicio).encode("ascii") + br'\2',
+                      contenido)
+
+    def responder(self, servicio, contenido):
+        "Arma la respuesta XML a la solicitud SOAP (None si no es posible)"
+        solicitud = Solicitud(servicio, contenido)
+        if self.carpeta_respuestas:
+            fn = os.path.join(self.carpeta_respuestas, servicio,
+                              "%s.xml" % solicitud.operacion)
+            if os.path.exists(fn):
+                with open(fn, "rb") as f:
+                    return 200, f.read()
+        if self.errores and random.random() < self.errores:
+            body = FAULT % "Simulador: error inyectado"
+            return 500, (ENVELOPE % dict(soap_uri=solicitud.soap_uri,
+                                         body=body)).encode("utf8")
+        fn = RESPUESTAS.get((servicio, solicitud.operacion))
+        if fn is None:
+            body = FAULT % ("Simulador: operacion no implementada %s" %
+                            solicitud.operacion)
+            return 500, (ENVELOPE % dict(soap_uri=solicitud.soap_uri,
+                                         body=body)).encode("utf8")
+        estilo, sufijo = SERVICIOS[servicio]
+        nombre = solicitud.operacion + sufijo
+        if estilo == "net":
+            body = '<%s xmlns="%s">%s</%s>' % (nombre, solicitud.espacio_nombres,
+                                              fn(self, solicitud), nombre)
+        else:
+            body = '<ns2:%s xmlns:ns2="%s">%s</ns2:%s>' % (
+                nombre, solicitud.espacio_nombres, fn(self, solicitud), nombre)
+        return 200, (ENVELOPE % dict(soap_uri=solicitud.soap_uri,
+                                     body=body)).encode("utf8")
+
+
+class ManejadorSOAP(BaseHTTPRequestHandler):
+    "Atiende las solicitudes HTTP (conexiones persistentes)"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True      # evita demoras de 40 ms (ACK diferido)
+
+    def log_message(self, formato, *args):
+        if DEBUG:
+            BaseHTTPRequestHandler.log_message(self, formato, *args)
+
+    def servicio(self):
+        return self.path.split("?")[0].strip("/").split("/")[0]
+
+    def enviar(self, estado, contenido, tipo="text/xml; charset=utf-8"):
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def do_GET(self):
+        contenido = self.server.wsdl(self.servicio())
+        if contenido is None:
+            self.enviar(404, b"WSDL no encontrado", "text/plain")
+        else:
+            self.enviar(200, contenido)
+
+    def do_POST(self):
+        servidor = self.server
+        contenido = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with servidor.lock:
+            servidor.solicitudes += 1
+            servidor.en_curso += 1
+            saturado = servidor.capacidad is not None and \
+                servidor.en_curso > servidor.capacidad
+        try:
+            demora = servidor.demora + random.uniform(0, servidor.variacion)
+            if saturado:
+                # simula un servidor sobrecargado (más lento y rechaza)
+                time.sleep(demora * 2)
+                with servidor.lock:
+                    servidor.rechazadas += 1
+                self.enviar(503, b"Servicio no disponible", "text/plain")
+                return
+            if demora:
+                time.sleep(demora)
+            self.atender(servidor, contenido)
+        finally:
+            with servidor.lock:
+                servidor.en_curso -= 1
+
+    def atender(self, servidor, contenido):
+        if servidor.cortes and random.random() < servidor.cortes:
+            # simula un corte de la conexión (sin respuesta)
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        servicio = self.servicio()
+        if servicio not in SERVICIOS:
+            self.enviar(404, b"Servicio no simulado", "text/plain")
+            return
+        try:
+            estado, respuesta = servidor.responder(servicio, contenido)
+        except Exception as e:
+            if DEBUG: raise
+            estado, respuesta = 500, str(e).encode("utf8")
+        self.enviar(estado, respuesta)
+
+
+# Mediciones de rendimiento (comprobantes por segundo, latencias y memoria):
+
+def percentil(valores, p):
+    "Devuelve el percentil p (0-100) de los valores (ordenados)"
+    if not valores:
+        return 0
+    i = min(len(valores) - 1, int(round(p / 100.0 * (len(valores) - 1))))
+    return valores[i]
+
+
+def memoria(hijos=False):
+    "Devuelve el máximo de memoria residente (KiB) del proceso o sus hijos"
+    if resource is None:
+        return None
+    uso = resource.getrusage(resource.RUSAGE_CHILDREN if hijos
+                             else resource.RUSAGE_SELF)
+    if sys.platform == "darwin":
+        return uso.ru_maxrss // 1024
+    return uso.ru_maxrss
+
+
+def medir(funcion, regs, hilos=1, hijos=False):
+    "Ejecuta funcion(reg) para cada registro y devuelve las estadísticas"
+    # funcion puede devolver la cantidad de comprobantes procesados (ej. lote)
+    regs = iter(regs)
+    lock = threading.Lock()
+    latencias = []
+    errores = []
+    cantidad = [0]
+
+    def trabajar():
+        while True:
+            with lock:
+                reg = next(regs, None)
+            if reg is None:
+                return
+            t0 = time.perf_counter()
+            try:
+                n = funcion(reg)
+            except Exception as e:
+                with lock:
+                    errores.append(str(e))
+                continue
+            t = time.perf_counter() - t0
+            with lock:
+                latencias.append(t)
+                cantidad[0] += n if isinstance(n, int) and not isinstance(n, bool) else 1
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajar) for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    segundos = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        'cantidad': cantidad[0],
+        'errores': len(errores),
+        'segundos': segundos,
+        'por_segundo': cantidad[0] / segundos if segundos else 0,
+        'p50': percentil(latencias, 50),
+        'p99': percentil(latencias, 99),
+        'memoria': memoria(hijos),
+        }
+
+
+def crear_interfaz(clase, url, cache=None, cuit="20267565393"):
+    "Crea y conecta una interfaz al servicio simulado (credenciales ficticias)"
+    ws = clase()
+    ws.LanzarExcepciones = True
+    ws.Conectar(cache, url)
+    ws.Cuit = cuit
+    ws.Token = ws.Sign = "simulado"
+    return ws
+
+
+def benchmark_wsfev1(servidor, cantidad=100, hilos=1, cache=None):
+    "Autoriza facturas de a una (CAESolicitar) con WSFEv1"
+    from .wsfev1 import WSFEv1
+    locales = threading.local()
+    numeros = iter(range(1, cantidad + 1))
+
+    def autorizar(nro):
+        ws = getattr(locales, "ws", None)
+        if ws is None:
+            ws = locales.ws = crear_interfaz(WSFEv1, servidor.url("wsfev1"), cache)
+        fecha = datetime.date.today().strftime("%Y%m%d")
+        ws.CrearFactura(concepto=1, tipo_doc=80, nro_doc="30000000007",
+                        tipo_cbte=1, punto_vta=4000, cbt_desde=nro, cbt_hasta=nro,
+                        imp_total="121.00", imp_neto="100.00", imp_iva="21.00",
+                        fecha_cbte=fecha)
+        ws.AgregarIva(5, "100.00", "21.00")
+        if not ws.CAESolicitar():
+            raise RuntimeError(ws.ErrMsg or ws.Excepcion)
+
+    return medir(autorizar, numeros, hilos)
+
+
+def benchmark_wscdc(servidor, cantidad=100, hilos=4, cache=None):
+    "Constata comprobantes en lote (constatar_lote, en paralelo)"
+    from .wscdc import WSCDC, constatar_lote
+    fecha = datetime.date.today().strftime("%Y%m%d")
+    regs = [dict(cbte_modo="CAE", cuit_emisor="20267565393", pto_vta=4002,
+                 cbte_tipo=1, cbte_nro=nro, cbte_fch=fecha, imp_total="121.00",
+                 cod_autorizacion="6%013d" % nro, doc_tipo_receptor=80,
+                 doc_nro_receptor="30000000007")
+            for nro in range(1, cantidad + 1)]
+
+    def lote(regs):
+        crear = lambda: crear_interfaz(WSCDC, servidor.url("wscdc"), cache)
+        return len(list(constatar_lote(regs, crear, hilos=hilos)))
+
+    return medir(lote, [regs])
+
+
+def benchmark_rece(carpeta, driver="rece1", cantidad=10, argumentos=()):
+    "Ejecuta el driver (un proceso por vez, como un ERP) en la carpeta"
+    # la carpeta debe tener el rece.ini con las URL del simulador, la entrada
+    # y el certificado / ticket de acceso (ver WSAA.Autenticar)
+    comando = [sys.executable, "-m", "pyafipws.%s" % driver] + list(argumentos)
+    entorno = dict(os.environ)
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    entorno['PYTHONPATH'] = os.pathsep.join([raiz, entorno.get('PYTHONPATH', "")])
+
+    def ejecutar(i):
+        proceso = subprocess.run(comando, cwd=carpeta, env=entorno,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if proceso.returncode != 0:
+            raise RuntimeError(proceso.stdout.decode("latin1", "replace")[-200:])
+
+    return medir(ejecutar, range(cantidad), hijos=True)
+
+
+BENCHMARKS = {
+    'wsfev1': benchmark_wsfev1,
+    'wscdc': benchmark_wscdc,
+    }
+
+
+def mostrar(nombre, estadisticas):
+    "Imprime las estadísticas de la medición"
+    print("%s: %d comprobantes (%d errores) en %.2f s" % (
+          nombre, estadisticas['cantidad'], estadisticas['errores'],
+          estadisticas['segundos']))
+    print("  %.1f comprobantes/s  p50 %.1f ms  p99 %.1f ms  memoria %s KiB" % (
+          estadisticas['por_segundo'], estadisticas['p50'] * 1000,
+          estadisticas['p99'] * 1000, estadisticas['memoria']))
+
+
+if __name__ == "__main__":
+    def opcion(nombre, predeterminado=None, tipo=str):
+        if nombre in sys.argv:
+            return tipo(sys.argv[sys.argv.index(nombre) + 1])
+        return predeterminado
+
+    if '--ayuda' in sys.argv:
+        print("Uso: %s --wsdl carpeta [--respuestas carpeta] [--puerto N]" % sys.argv[0])
+        print("     [--demora seg] [--variacion seg] [--errores prob] [--cortes prob]")
+        print("     [--capacidad N]")
+        print("     [--benchmark %s|rece1|recem|recex1] [--cantidad N] [--hilos N]"
+              % "|".join(sorted(BENCHMARKS)))
+        print("     [--rece carpeta] [--cache carpeta] [--rapido]")
+        sys.exit(0)
+
+    DEBUG = '--debug' in sys.argv
+    servidor = ServidorAFIP(opcion("--puerto", 0, int), opcion("--wsdl"),
+                            opcion("--respuestas"), opcion("--demora", 0, float),
+                            opcion("--variacion", 0, float),
+                            opcion("--errores", 0, float),
+                            opcion("--cortes", 0, float),
+                            capacidad=opcion("--capacidad", None, int))
+    benchmark = opcion("--benchmark")
+    if not benchmark:
+        for servicio in sorted(SERVICIOS):
+            print(servicio, servidor.url(servicio))
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if '--rapido' in sys.argv:
+        # comparar con el analizador rápido de respuestas (ver analizador)
+        from .utils import BaseWS
+        BaseWS.AnalizadorRapido = True
+    servidor.iniciar()
+    cantidad = opcion("--cantidad", 100, int)
+    try:
+        if benchmark in BENCHMARKS:
+            estadisticas = BENCHMARKS[benchmark](
+                servidor, cantidad, opcion("--hilos", 1, int), opcion("--cache"))
+        else:
+            estadisticas = benchmark_rece(opcion("--rece", "."), benchmark,
+                                          cantidad)
+        mostrar(benchmark, estadisticas)
+        print("  solicitudes atendidas:", servidor.solicitudes)
+        if servidor.rechazadas:
+            print("  solicitudes rechazadas (503):", servidor.rechazadas)
+    finally:
+        servidor.detener()
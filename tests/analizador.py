@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del analizador rápido de respuestas SOAP (vs. pysimplesoap)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import datetime
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import analizador
+
+# tipos de la respuesta según el WSDL (como los devuelve pysimplesoap)
+ERR = [{'Code': int, 'Msg': str}]
+FECAE = {'FECAESolicitarResponse': {'FECAESolicitarResult': {
+    'FeCabResp': {'Cuit': int, 'PtoVta': int, 'CbteTipo': int,
+                  'FchProceso': str, 'CantReg': int, 'Resultado': str,
+                  'Reproceso': str},
+    'FeDetResp': {'FECAEDetResponse': [{
+        'Concepto': int, 'DocTipo': int, 'DocNro': int, 'CbteDesde': int,
+        'CbteHasta': int, 'CbteFch': str, 'Resultado': str, 'CAE': str,
+        'CAEFchVto': str, 'Observaciones': {'Obs': ERR}}]},
+    'Events': {'Evt': ERR},
+    'Errors': {'Err': ERR}}}}
+
+DETALLE = """<FECAEDetResponse><Concepto>1</Concepto><DocTipo>80</DocTipo>
+<DocNro>30000000007</DocNro><CbteDesde>%(nro)d</CbteDesde>
+<CbteHasta>%(nro)d</CbteHasta><CbteFch>20241231</CbteFch>
+<Resultado>A</Resultado><CAE>7%(nro)013d</CAE><CAEFchVto>20250110</CAEFchVto>
+%(obs)s</FECAEDetResponse>"""
+
+OBS = """<Observaciones><Obs><Code>10</Code><Msg>Dto &amp; ñandú</Msg></Obs>
+<Obs><Code>11</Code><Msg></Msg></Obs></Observaciones>"""
+
+RESPUESTA = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+<soap:Body><FECAESolicitarResponse xmlns="http://ar.gov.afip.dif.FEV1/">
+<FECAESolicitarResult><FeCabResp><Cuit>20267565393</Cuit><PtoVta>1</PtoVta>
+<CbteTipo>1</CbteTipo><FchProceso>20241231</FchProceso><CantReg>250</CantReg>
+<Resultado>A</Resultado><Reproceso>N</Reproceso></FeCabResp>
+<FeDetResp>%s</FeDetResp><Events><Evt><Code>1</Code><Msg>x</Msg></Evt></Events>
+<Errors/></FECAESolicitarResult></FECAESolicitarResponse></soap:Body>
+</soap:Envelope>"""
+
+MTX = {'autorizarComprobanteResponse': {
+    'resultado': str,
+    'comprobanteResponse': {'CAE': int, 'fechaEmision': datetime.date,
+                            'importeTotal': Decimal},
+    'arrayErrores': [{'codigoDescripcion': {'codigo': int, 'descripcion': str}}],
+    }}
+
+RESPUESTA_MTX = """<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/">
+<S:Body><ns2:autorizarComprobanteResponse xmlns:ns2="http://impl.service.wsmtxca.afip.gov.ar/service/">
+<resultado>R</resultado><comprobanteResponse><CAE>61234567890123</CAE>
+<fechaEmision>2024-12-31</fechaEmision><importeTotal>121.50</importeTotal>
+</comprobanteResponse><arrayErrores><codigoDescripcion><codigo>102</codigo>
+<descripcion>Duplicado</descripcion></codigoDescripcion></arrayErrores>
+</ns2:autorizarComprobanteResponse></S:Body></S:Envelope>"""
+
+
+class TestAnalizador(unittest.TestCase):
+
+    def test_fecae(self):
+        "Mismos diccionarios que pysimplesoap (250 comprobantes)"
+        detalles = "".join([DETALLE % dict(nro=i, obs=OBS if i % 7 == 0 else "")
+                            for i in range(1, 251)])
+        xml = (RESPUESTA % detalles).encode("utf8")
+        res = analizador.comparar(xml, FECAE, repeticiones=1)
+        self.assertTrue(res['iguales'])
+        ret = analizador.analizar(xml, analizador.compilar(FECAE))[1]
+        result = ret['FECAESolicitarResponse']['FECAESolicitarResult']
+        self.assertEqual(len(result['FeDetResp']['FECAEDetResponse']), 250)
+        self.assertIsNone(result['Errors'])
+
+    def test_tipos(self):
+        "Conversión de fechas, decimales y listas contenedoras (wsmtxca)"
+        res = analizador.comparar(RESPUESTA_MTX, MTX, repeticiones=1)
+        self.assertTrue(res['iguales'])
+        ret = analizador.analizar(RESPUESTA_MTX, analizador.compilar(MTX))[1]
+        ret = ret['autorizarComprobanteResponse']
+        self.assertEqual(ret['comprobanteResponse']['fechaEmision'],
+                         datetime.date(2024, 12, 31))
+        self.assertEqual(ret['comprobanteResponse']['importeTotal'],
+                         Decimal("121.50"))
+        self.assertEqual(ret['arrayErrores'][0]['codigoDescripcion']['codigo'], 102)
+
+    def test_no_compatible(self):
+        "SOAP Fault y etiquetas no declaradas usan el camino normal"
+        mapa = analizador.compilar(MTX)
+        fault = RESPUESTA_MTX.replace("<resultado>R</resultado>",
+                                      "<S:Fault><faultcode>S:Server</faultcode></S:Fault>")
+        self.assertRaises(analizador.NoCompatible, analizador.analizar, fault, mapa)
+        extra = RESPUESTA_MTX.replace("<resultado>", "<nuevo/><resultado>")
+        self.assertRaises(analizador.NoCompatible, analizador.analizar, extra, mapa)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la captura acotada de XML (memoria y disco con rotación)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import captura, utils
+
+
+class ClientePrueba:
+    "Cliente SOAP simulado (sólo los mensajes)"
+    xml_request = xml_response = None
+
+
+class ServicioPrueba(utils.BaseWS):
+
+    def __init__(self):
+        utils.BaseWS.__init__(self)
+        self.client = ClientePrueba()
+
+    @utils.inicializar_y_capturar_excepciones
+    def Llamar(self, nro, falla=False):
+        self.client.xml_request = "<solicitud nro='%d'>ñ</solicitud>" % nro
+        self.client.xml_response = b"<respuesta nro='%d'/>" % nro
+        if falla:
+            raise RuntimeError("falla simulada")
+        return True
+
+
+class TestCaptura(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.ws = ServicioPrueba()
+        self.ws.LanzarExcepciones = False
+
+    def tearDown(self):
+        captura.desactivar()
+        shutil.rmtree(self.carpeta)
+
+    def test_predeterminada(self):
+        "Sin captura configurada se conserva la última llamada"
+        self.ws.Llamar(1)
+        self.assertEqual(self.ws.XmlResponse, b"<respuesta nro='1'/>")
+
+    def test_buffer(self):
+        "Últimas N llamadas en memoria (como bytes)"
+        self.ws.Captura = captura.Captura(3)
+        for i in range(10):
+            self.ws.Llamar(i)
+        llamadas = self.ws.Captura.ultimas()
+        self.assertEqual([llamada[3] for llamada in llamadas],
+                         [("<solicitud nro='%d'>ñ</solicitud>" % i).encode("utf8")
+                          for i in (7, 8, 9)])
+        self.assertEqual(self.ws.XmlRequest, llamadas[-1][3])
+        self.assertEqual(llamadas[-1][1:3], ("ServicioPrueba", "Llamar"))
+
+    def test_deshabilitada(self):
+        "Sin captura no se retienen los mensajes"
+        captura.activar(captura.Captura(0))
+        self.ws.Llamar(1)
+        self.assertEqual(self.ws.XmlRequest, "")
+        self.assertEqual(self.ws.client.xml_response, "")
+
+    def test_disco(self):
+        "Muestra en disco con rotación (las fallas se graban siempre)"
+        captura.activar(captura.CapturaDisco(self.carpeta, muestra=0,
+                                             maximo=5))
+        for i in range(20):
+            self.ws.Llamar(i, falla=i % 2)
+        archivos = sorted(os.listdir(self.carpeta))
+        self.assertEqual(len(archivos), 10)
+        self.assertTrue(archivos[-1].endswith("_ServicioPrueba_Llamar_solicitud.xml"))
+        with open(os.path.join(self.carpeta, archivos[-2]), "rb") as f:
+            self.assertEqual(f.read(), b"<respuesta nro='19'/>")
+        # una nueva instancia continúa la rotación de los archivos existentes
+        disco = captura.CapturaDisco(self.carpeta, maximo=5)
+        self.ws.Captura = disco
+        self.ws.Llamar(20)
+        self.assertEqual(len(os.listdir(self.carpeta)), 10)
+        self.assertEqual(len(disco.archivos), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
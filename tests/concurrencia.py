@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del limitador adaptativo de concurrencia (con el servidor simulado)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import sys
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import concurrencia, simulador
+
+
+class HttpPrueba:
+    "Transporte HTTP mínimo (una conexión por solicitud, seguro entre hilos)"
+
+    def request(self, uri, method="POST", body=b"", headers=None):
+        solicitud = urllib.request.Request(uri, body, headers or {}, method=method)
+        try:
+            with urllib.request.urlopen(solicitud, timeout=10) as respuesta:
+                return respuesta, respuesta.read()
+        except urllib.error.HTTPError as e:
+            return e, e.read()
+
+
+class TestConcurrencia(unittest.TestCase):
+
+    def setUp(self):
+        self.servidor = None
+
+    def tearDown(self):
+        if self.servidor:
+            self.servidor.detener()
+
+    def ejecutar(self, limitadores, hilos, cantidad, **opciones):
+        "Envía solicitudes simultáneas al servidor simulado"
+        self.servidor = simulador.ServidorAFIP(**opciones).iniciar()
+        # servicio no simulado: respuesta inmediata (404) sin armar el XML
+        url = self.servidor.url("prueba")
+        transporte = concurrencia.TransporteLimitado(HttpPrueba(), limitadores)
+        def enviar():
+            for i in range(cantidad):
+                transporte.request(url, "POST", b"<x/>")
+        trabajadores = [threading.Thread(target=enviar) for i in range(hilos)]
+        for trabajador in trabajadores:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+        return limitadores.estados()[url]
+
+    def test_sobrecarga(self):
+        "Ante rechazos (503) el límite se reduce y se respeta la capacidad"
+        limitadores = concurrencia.Limitadores(inicial=12)
+        estado = self.ejecutar(limitadores, 12, 10, demora=0.02, capacidad=4)
+        self.assertTrue(estado['reducciones'] >= 1)
+        self.assertTrue(estado['limite'] < 12)
+        self.assertEqual(estado['en_curso'], 0)
+        # sin limitador se rechazarían 2 de cada 3 (12 hilos, capacidad 4)
+        self.assertTrue(self.servidor.rechazadas < 120 / 2)
+
+    def test_aumento(self):
+        "Con latencia normal el límite aumenta mientras se lo utiliza"
+        limitadores = concurrencia.Limitadores(inicial=2, maximo=6)
+        estado = self.ejecutar(limitadores, 8, 10, demora=0.01)
+        self.assertTrue(estado['limite'] > 2)
+        self.assertTrue(estado['limite'] <= 6)
+        self.assertEqual(self.servidor.rechazadas, 0)
+
+    def test_limitador(self):
+        "Una sola reducción ante fallas simultáneas"
+        limitador = concurrencia.Limitador("prueba", inicial=8)
+        saturados = [limitador.adquirir() for i in range(8)]
+        self.assertEqual(saturados[-1], True)
+        for i in range(8):
+            limitador.liberar(0.1, False)
+        self.assertEqual(limitador.resumen()['limite'], 4)
+        self.assertEqual(limitador.resumen()['reducciones'], 1)
+
+    def test_espera(self):
+        "Pasada la espera máxima se envía sin turno (no se bloquea)"
+        limitador = concurrencia.Limitador("prueba", inicial=1, espera=0.05)
+        limitador.adquirir()
+        inicio = time.monotonic()
+        limitador.adquirir()
+        self.assertTrue(time.monotonic() - inicio >= 0.05)
+        self.assertEqual(limitador.resumen()['en_curso'], 2)
+        self.assertEqual(limitador.resumen()['excedidas'], 1)
+        # al liberarse un turno, la espera termina antes
+        limitador.liberar(0.1, True, False)
+        hilo = threading.Timer(0.01, limitador.liberar, (0.1, True, False))
+        hilo.start()
+        limitador.espera = 10
+        inicio = time.monotonic()
+        limitador.adquirir()
+        self.assertTrue(time.monotonic() - inicio < 5)
+        self.assertEqual(limitador.resumen()['excedidas'], 1)
+        hilo.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
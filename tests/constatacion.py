@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la constatación masiva (wscdc --constatar --lote) sin conexión"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2013 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import utils, wscdc
+
+
+class ServicioPrueba(wscdc.WSCDC):
+    "Constata sin conectarse a AFIP (rechaza los CAE que terminan en 9)"
+    consultas = []
+
+    @utils.inicializar_y_capturar_excepciones
+    def ConstatarComprobante(self, cbte_modo, cuit_emisor, pto_vta, cbte_tipo,
+                             cbte_nro, cbte_fch, imp_total, cod_autorizacion,
+                             **kwargs):
+        self.consultas.append(cbte_nro)
+        if str(cod_autorizacion).endswith("9"):
+            self.Resultado = "R"
+            self.observaciones = [{'code': 100, 'msg': "No existe"}]
+        else:
+            self.Resultado = "A"
+        self.FchProceso = "20261019"
+        return True
+
+
+def comprobante(nro, cae="63523178385550"):
+    return {'cbte_modo': "CAE", 'cuit_emisor': "20267565393", 'pto_vta': 4002,
+            'cbte_tipo': 1, 'cbte_nro': nro, 'cbte_fch': "20261019",
+            'imp_total': "121.00", 'cod_autorizacion': cae,
+            'doc_tipo_receptor': 80, 'doc_nro_receptor': "30500010912"}
+
+
+class TestConstatarLote(unittest.TestCase):
+
+    def setUp(self):
+        ServicioPrueba.consultas = []
+
+    def test_lote(self):
+        "Sin repetidos, usando y completando la cache de respuestas"
+        cache = {wscdc.clave_comprobante(comprobante(1)):
+                    {'resultado': "A", 'fch_proceso': "20260101",
+                     'observaciones': [], 'errores': []}}
+        regs = [comprobante(1), comprobante(2), comprobante(2),
+                comprobante(3, "63523178385559")]
+        res = {reg['cbte_nro']: reg for reg in
+               wscdc.constatar_lote(regs, ServicioPrueba, cache, hilos=2)}
+        self.assertEqual(sorted(res), [1, 2, 3])
+        self.assertEqual(sorted(ServicioPrueba.consultas), [2, 3])
+        self.assertEqual(res[1]['fch_proceso'], "20260101")
+        self.assertEqual(res[2]['resultado'], "A")
+        self.assertEqual(res[3]['resultado'], "R")
+        self.assertEqual(res[3]['observaciones'][0]['code'], 100)
+        self.assertEqual(len(cache), 3)
+        # la segunda vez no se consulta nuevamente
+        list(wscdc.constatar_lote(regs, ServicioPrueba, cache, hilos=2))
+        self.assertEqual(len(ServicioPrueba.consultas), 2)
+
+    def test_error_conexion(self):
+        "Si no se puede crear la interfaz se informa en cada comprobante"
+        def crear_wscdc():
+            raise RuntimeError("sin conexion")
+        cache = {}
+        res = list(wscdc.constatar_lote([comprobante(1), comprobante(2)],
+                                        crear_wscdc, cache, hilos=2))
+        self.assertEqual(len(res), 2)
+        for reg in res:
+            self.assertEqual(reg['resultado'], "")
+            self.assertEqual(reg['errores'][0]['msg'], "sin conexion")
+        self.assertEqual(cache, {})
+
+    def test_error_lectura(self):
+        "Un error al leer la entrada se relanza (no se pierde en el hilo)"
+        def leer():
+            yield comprobante(1)
+            raise ValueError("linea invalida")
+        regs = []
+        with self.assertRaises(ValueError):
+            for reg in wscdc.constatar_lote(leer(), ServicioPrueba, hilos=2):
+                regs.append(reg)
+        self.assertEqual([reg['cbte_nro'] for reg in regs], [1])
+
+    def test_error_cache(self):
+        "Un error al grabar la cache se relanza al finalizar el lote"
+        class CacheRota(dict):
+            def __setitem__(self, clave, valor):
+                raise IOError("disco lleno")
+        with self.assertRaises(IOError):
+            list(wscdc.constatar_lote([comprobante(i) for i in range(10)],
+                                      ServicioPrueba, CacheRota(), hilos=2))
+
+    def test_escribir_lote(self):
+        "Con --json se graba una única lista JSON con todos los resultados"
+        carpeta = tempfile.mkdtemp()
+        sys.argv.append("--json")
+        try:
+            salida = os.path.join(carpeta, "salida.json")
+            regs = wscdc.constatar_lote([comprobante(1), comprobante(2)],
+                                        ServicioPrueba)
+            self.assertEqual(wscdc.escribir_lote(regs, salida), 2)
+            with open(salida) as f:
+                regs = json.load(f)
+            self.assertEqual(sorted(reg['cbte_nro'] for reg in regs), [1, 2])
+        finally:
+            sys.argv.remove("--json")
+            shutil.rmtree(carpeta)
+
+    def test_leer_dbf(self):
+        "Con --dbf se constatan todas las filas de la tabla"
+        def leer_dbf(formatos, conf_dbf):
+            # filas de la tabla Encabezado (como las devuelve utils.leer_dbf)
+            for nombre, formato, ld in formatos:
+                for i in (1, 2, 3):
+                    if isinstance(ld, dict):
+                        ld.update(comprobante(i))
+                    else:
+                        ld.append(comprobante(i))
+        leer_dbf_original = wscdc.leer_dbf
+        wscdc.leer_dbf, wscdc.conf_dbf = leer_dbf, {}
+        sys.argv.append("--dbf")
+        try:
+            regs = wscdc.constatar_lote(wscdc.iterar_archivo("entrada.dbf"),
+                                        ServicioPrueba, hilos=2)
+            self.assertEqual(sorted(reg['cbte_nro'] for reg in regs), [1, 2, 3])
+            self.assertEqual(sorted(ServicioPrueba.consultas), [1, 2, 3])
+        finally:
+            sys.argv.remove("--dbf")
+            wscdc.leer_dbf = leer_dbf_original
+            del wscdc.conf_dbf
+
+
+class TestLimiteTasa(unittest.TestCase):
+
+    def test_esperar(self):
+        "Las consultas se espacian aun entre varios hilos"
+        limite = wscdc.LimiteTasa(50)
+        momentos = []
+
+        def consultar():
+            for i in range(3):
+                limite.esperar()
+                momentos.append(time.monotonic())
+        hilos = [threading.Thread(target=consultar) for i in range(3)]
+        inicio = time.monotonic()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        momentos.sort()
+        # 9 consultas a 50 por segundo: la primera inmediata, luego cada 20ms
+        self.assertGreaterEqual(momentos[-1] - inicio, 8 * 0.02 - 0.005)
+        self.assertEqual(len(momentos), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del remito electrónico automático de ARBA (COT) sin conexión"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010 Mariano Reingart"
+__license__ = "LGPL 3.0"
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import cot
+
+CUIT = "30716396416"
+
+NOMBRE = {'CUIT_EMPRESA': CUIT, 'NUM_PLANTA': '000', 'NUM_PUERTA': '000',
+          'FECHA_EMISION': '20261019', 'NUM_SECUENCIA': '000001'}
+
+RESPUESTA = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<TBCOMPROBANTE_RESPONSE>
+    <cuitEmpresa>30716396416</cuitEmpresa>
+    <numeroComprobante>123456</numeroComprobante>
+    <nombreArchivo>TB_30716396416_000000_20261019_000001.txt</nombreArchivo>
+    <codigoIntegridad>abc123</codigoIntegridad>
+    <validacionesRemitos>
+        <remito>
+            <numeroUnico>0910999990006816</numeroUnico>
+            <procesado>SI</procesado>
+        </remito>
+        <remito>
+            <numeroUnico>0910999990006817</numeroUnico>
+            <procesado>NO</procesado>
+            <errores>
+                <error>
+                    <codigo>R01</codigo>
+                    <descripcion>Dato invalido</descripcion>
+                </error>
+            </errores>
+        </remito>
+    </validacionesRemitos>
+</TBCOMPROBANTE_RESPONSE>
+"""
+
+
+def remito(codigo="0910999990006816", **kwargs):
+    datos = {
+        'FECHA_EMISION': '20261019', 'CODIGO_UNICO': codigo,
+        'FECHA_SALIDA_TRANSPORTE': '20261020', 'SUJETO_GENERADOR': 'E',
+        'DESTINATARIO_CONSUMIDOR_FINAL': 0, 'DESTINATARIO_CUIT': '30682115722',
+        'DESTINATARIO_RAZON_SOCIAL': 'COMPUMUNDO S.A', 'DESTINATARIO_TENEDOR': 0,
+        'ORIGEN_CUIT': CUIT, 'TRANSPORTISTA_CUIT': '20045162673',
+        'PATENTE_VEHICULO': '', 'PRODUCTO_NO_TERM_DEV': 0, 'IMPORTE': 1234,
+        'PRODUCTOS': {'productos': [{
+            'CODIGO_UNICO_PRODUCTO': '847150', 'ARBA_CODIGO_UNIDAD_MEDIDA': '3',
+            'CANTIDAD': '100', 'PROPIO_CODIGO_PRODUCTO': '23891',
+            'PROPIO_DESCRIPCION_PRODUCTO': 'COMP. SP-3960 VP',
+            'PROPIO_DESCRIPCION_UNIDAD_MEDIDA': '1', 'CANTIDAD_AJUSTADA': 100}]},
+    }
+    datos.update(kwargs)
+    return datos
+
+
+class TestValidarRemito(unittest.TestCase):
+
+    def errores(self, **kwargs):
+        return list(cot.validar_remito(remito(**kwargs), CUIT))
+
+    def test_valido(self):
+        "Un remito completo no tiene errores (campos número o texto)"
+        self.assertEqual(self.errores(), [])
+        self.assertEqual(self.errores(DESTINATARIO_CONSUMIDOR_FINAL='0',
+                                      DESTINATARIO_TENEDOR='0',
+                                      PRODUCTO_NO_TERM_DEV='0',
+                                      IMPORTE='000000001234'), [])
+
+    def test_consumidor_final(self):
+        "'0' (texto) no es consumidor final: el destinatario es obligatorio"
+        for valor in (0, '0'):
+            errores = self.errores(DESTINATARIO_CONSUMIDOR_FINAL=valor,
+                                   DESTINATARIO_CUIT='',
+                                   DESTINATARIO_RAZON_SOCIAL='')
+            self.assertEqual(len(errores), 2)
+        for valor in (1, '1'):
+            self.assertEqual(self.errores(DESTINATARIO_CONSUMIDOR_FINAL=valor,
+                                          DESTINATARIO_CUIT='',
+                                          DESTINATARIO_RAZON_SOCIAL=''), [])
+
+    def test_tenedor(self):
+        "Consumidor final con DESTINATARIO_TENEDOR = 1 es error ('0' no)"
+        self.assertEqual(self.errores(DESTINATARIO_CONSUMIDOR_FINAL='1',
+                                      DESTINATARIO_TENEDOR='0'), [])
+        errores = self.errores(DESTINATARIO_CONSUMIDOR_FINAL='1',
+                               DESTINATARIO_TENEDOR='1')
+        self.assertIn("DESTINATARIO_TENEDOR", errores[0])
+
+    def test_importe(self):
+        "El IMPORTE es obligatorio salvo devolución u origen = destino"
+        for valor in (0, '0', '', '000000000000', None):
+            errores = self.errores(IMPORTE=valor)
+            self.assertEqual(len(errores), 1)
+            self.assertIn("IMPORTE", errores[0])
+        self.assertEqual(self.errores(IMPORTE=0, PRODUCTO_NO_TERM_DEV='1'), [])
+        self.assertEqual(len(self.errores(IMPORTE=0, PRODUCTO_NO_TERM_DEV='0')), 1)
+        self.assertEqual(self.errores(IMPORTE='', DESTINATARIO_CUIT=CUIT,
+                                      SUJETO_GENERADOR='E'), [])
+
+    def test_otras_reglas(self):
+        "Productos, patente y CUIT según el sujeto generador"
+        self.assertEqual(len(self.errores(PRODUCTOS={'productos': []})), 1)
+        self.assertEqual(len(self.errores(TRANSPORTISTA_CUIT=int(CUIT))), 1)
+        self.assertEqual(self.errores(TRANSPORTISTA_CUIT=CUIT,
+                                      PATENTE_VEHICULO='AB123CD'), [])
+        self.assertEqual(len(self.errores(ORIGEN_CUIT='20267565393')), 1)
+        self.assertEqual(len(self.errores(SUJETO_GENERADOR='D')), 1)
+
+
+class TestGenerarArchivoRemitos(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.carpeta)
+
+    def test_generar(self):
+        "El archivo es igual al de crearRemito, omitiendo los inválidos"
+        remitos = [remito(), remito("0910999990006817", IMPORTE=0),
+                   remito("0910999990006818")]
+        ws = cot.COT()
+        ruta = ws.GenerarArchivoRemitos(CUIT, (r for r in remitos), NOMBRE,
+                                        self.carpeta)
+        self.assertEqual(os.path.basename(ruta),
+                         "TB_30716396416_000000_20261019_000001.txt")
+        self.assertEqual([i[0] for i in ws.invalidos], ["0910999990006817"])
+        self.assertIn("1", ws.Excepcion)
+        esperado = cot.COT()
+        esperado.crearRemito({'HEADER': {'CUIT_EMPRESA': CUIT},
+                              'REMITO': {'REMITOS': [remitos[0], remitos[2]]},
+                              'FOOTER': {}, 'NOMBREREMITOTXT': NOMBRE})
+        with open(ruta) as f:
+            self.assertEqual(f.read(), esperado.RemitoFileBufferString.content)
+
+    def test_sin_validar(self):
+        "Sin validar se graban todos los remitos"
+        ws = cot.COT()
+        ruta = ws.GenerarArchivoRemitos(CUIT, [remito(), remito(IMPORTE=0)],
+                                        "remitos.txt", self.carpeta,
+                                        validar=False)
+        with open(ruta) as f:
+            lineas = f.read().split("\n")
+        self.assertEqual([l[:2] for l in lineas], ["01", "02", "03", "02", "03", "04"])
+        self.assertEqual(lineas[-1], "04|2")
+        self.assertEqual(ws.invalidos, [])
+
+
+class TestRespuesta(unittest.TestCase):
+
+    def test_iterar_respuesta(self):
+        "La respuesta se analiza de a un remito (aun en bloques pequeños)"
+        for tamanio in (7, 65536):
+            res = list(cot.iterar_respuesta(RESPUESTA, tamanio))
+            self.assertEqual([tipo for tipo, d in res],
+                             ['remito', 'remito', 'datos'])
+            self.assertEqual(res[0][1], {'NumeroUnico': "0910999990006816",
+                                         'Procesado': "SI", 'Errores': []})
+            self.assertEqual(res[1][1]['Errores'], [("R01", "Dato invalido")])
+            self.assertEqual(res[2][1]['numeroComprobante'], "123456")
+
+    def test_presentar_remito(self):
+        "PresentarRemito (testing) expone los datos y las validaciones"
+        carpeta = tempfile.mkdtemp()
+        try:
+            respuesta = os.path.join(carpeta, "respuesta.xml")
+            with open(respuesta, "w") as f:
+                f.write(RESPUESTA)
+            ws = cot.COT()
+            ws.RemitoFileBufferString = "pendiente"
+            self.assertTrue(ws.PresentarRemito(testing=respuesta))
+        finally:
+            shutil.rmtree(carpeta)
+        self.assertEqual(ws.CuitEmpresa, CUIT)
+        self.assertEqual(ws.CodigoIntegridad, "abc123")
+        self.assertTrue(ws.ErrorValidacionesRemitos)
+        self.assertEqual(ws.NumeroUnico, "0910999990006816")
+        self.assertTrue(ws.LeerValidacionRemito())
+        self.assertTrue(ws.LeerValidacionRemito())
+        self.assertEqual(ws.Procesado, "NO")
+        self.assertTrue(ws.LeerErrorValidacion())
+        self.assertEqual(ws.CodigoError, "R01")
+        self.assertFalse(ws.LeerValidacionRemito())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas para los formatos de archivos de intercambio (TXT, JSON, XML, CSV)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import io
+import json
+import os
+import sys
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws.formatos import formato_txt, formato_json, formato_xml, formato_csv
+
+DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datos")
+
+
+class TestLecturaIncremental(unittest.TestCase):
+
+    def test_txt(self):
+        "Lectura de a un comprobante (TXT)"
+        fn = os.path.join(DATOS, "facturas.txt")
+        regs = list(formato_txt.iterar(fn))
+        self.assertEqual(regs, formato_txt.leer(fn))
+        self.assertEqual(regs[0]['cbte_nro'], 7)
+        self.assertTrue(regs[0]['detalles'])
+
+    def test_json(self):
+        "Lectura de a un comprobante (JSON) con distintos tamaños de bloque"
+        fn = os.path.join(DATOS, "facturas.json")
+        regs = formato_json.leer(fn)
+        for tamanio_bloque in (1, 7, 1024):
+            self.assertEqual(list(formato_json.iterar(fn, tamanio_bloque)), regs)
+        # datos arbitrarios con caracteres multibyte (utf8) cortados al medio:
+        datos = [{'id': i, 'ds': "ñandú" * i} for i in range(20)]
+        f = io.BytesIO(json.dumps(datos, ensure_ascii=False).encode("utf8"))
+        self.assertEqual(list(formato_json.iterar(f, 3)), datos)
+
+    def test_xml(self):
+        "Lectura de a un comprobante (XML) sin armar el DOM completo"
+        fn = os.path.join(DATOS, "facturas.xml")
+        regs = list(formato_xml.iterar(fn))
+        self.assertEqual(len(regs), 1)
+        self.assertEqual(regs[0]['cbt_numero'], 7)
+        self.assertEqual(regs[0]['forma_pago'], "30 Dias")
+        self.assertEqual(len(regs[0]['detalles']), 1)
+        self.assertEqual(regs[0]['ivas'][0]['iva_id'], 5)
+
+    def test_csv(self):
+        "Lectura de a un comprobante (CSV)"
+        fn = os.path.join(DATOS, "facturas.csv")
+        regs = list(formato_csv.iterar(fn))
+        self.assertEqual(regs, formato_csv.desaplanar(formato_csv.leer(fn)))
+        self.assertEqual(regs[0]['detalles'][0]['codigo'], "P1675G")
+
+    def test_xlsx(self):
+        "Lectura y grabación de planillas Excel (modo solo lectura/escritura)"
+        try:
+            import openpyxl
+        except ImportError:
+            self.skipTest("openpyxl no instalado")
+        import tempfile
+        filas = formato_csv.leer(os.path.join(DATOS, "facturas.csv"))
+        fn = os.path.join(tempfile.mkdtemp(), "facturas.xlsx")
+        formato_csv.escribir(filas + filas[1:] * 10, fn)
+        regs = list(formato_csv.iterar(fn))
+        self.assertEqual(len(regs), 11)
+        self.assertEqual(regs[-1]['detalles'][0]['codigo'], "P1675G")
+        os.unlink(fn)
+
+
+class TestEscrituraIncremental(unittest.TestCase):
+
+    def test_json(self):
+        "Grabación de a un comprobante (JSON indentado y compacto)"
+        regs = formato_json.leer(os.path.join(DATOS, "facturas.json")) * 3
+        salida = io.StringIO()
+        formato_json.escribir(iter(regs), salida)
+        self.assertEqual(salida.getvalue(), 
+                         json.dumps(regs, sort_keys=True, indent=4))
+        salida = io.BytesIO()
+        formato_json.escribir(iter(regs), salida, compacto=True)
+        self.assertNotIn(b"\n", salida.getvalue())
+        self.assertEqual(json.loads(salida.getvalue().decode("utf8")), regs)
+
+    def test_xml(self):
+        "Grabación de a un comprobante (XML) y relectura"
+        regs = list(formato_xml.iterar(os.path.join(DATOS, "facturas.xml")))
+        for compacto in (True, False):
+            salida = io.BytesIO()
+            formato_xml.escribir(regs * 2, salida, compacto)
+            salida.seek(0)
+            self.assertEqual(list(formato_xml.iterar(salida)), regs * 2)
+
+
+class TestConversor(unittest.TestCase):
+
+    def test_convertir(self):
+        "Conversión TXT -> JSON -> CSV según extensión (registro de formatos)"
+        import tempfile
+        from pyafipws.formatos import conversor
+        regs = formato_txt.leer(os.path.join(DATOS, "facturas.txt"))
+        carpeta = tempfile.mkdtemp()
+        fn_json = os.path.join(carpeta, "facturas.json")
+        fn_csv = os.path.join(carpeta, "facturas.csv")
+        n = conversor.convertir(os.path.join(DATOS, "facturas.txt"), fn_json)
+        self.assertEqual(n, len(regs))
+        self.assertEqual(formato_json.leer(fn_json), regs)
+        n = conversor.convertir(fn_json, fn_csv,
+                                mapeo=lambda reg: dict(reg, obs_generales="x"))
+        self.assertEqual(n, len(regs))
+        regs_csv = list(conversor.leer(fn_csv))
+        self.assertEqual([reg['obs_generales'] for reg in regs_csv], ["x"] * n)
+        self.assertEqual(conversor.formato_argv(["rece1.py", "/dbf"]), "dbf")
+        # formatos admitidos por el script (en rece1 /xml es otra opción)
+        self.assertEqual(conversor.formato_argv(["rece1.py", "/xml", "/json"],
+                                                formatos=("dbf", "json")), "json")
+        self.assertRaises(ValueError, conversor.obtener_formato, None, "a.pdf")
+
+    def destino(self, formato, nombre):
+        "Devuelve el destino (archivo, carpeta o base de datos) y sus opciones"
+        import sqlite3
+        from pyafipws.formatos import formato_sql
+        from pyafipws.formatos.formato_txt import ENCABEZADO, DETALLE, \
+            TRIBUTO, IVA, CMP_ASOC, PERMISO
+        ruta = os.path.join(self.carpeta, nombre)
+        if formato == "dbf":
+            os.mkdir(ruta)
+            return {}, {'carpeta': ruta}
+        if formato == "sql":
+            db = sqlite3.connect(ruta + ".db")
+            tablas = [('encabezado', ENCABEZADO), ('detalle', DETALLE),
+                      ('tributo', TRIBUTO), ('iva', IVA),
+                      ('cmp_asoc', CMP_ASOC), ('permiso', PERMISO)]
+            for sql in formato_sql.esquema_sql(tablas):
+                db.execute(sql)
+            return db, {}
+        return "%s.%s" % (ruta, formato), {}
+
+    def leer(self, origen, formato, opciones):
+        from pyafipws.formatos import conversor
+        if formato == "sql":
+            # todos los comprobantes (no sólo los pendientes de autorizar)
+            opciones = dict(opciones, todos=True)
+        return conversor.leer(origen, formato, **opciones)
+
+    def test_pares(self):
+        "Conversión entre todos los pares de formatos (y relectura)"
+        import decimal
+        import shutil
+        import sqlite3
+        import tempfile
+        from pyafipws.formatos import conversor, formato_dbf
+        formatos = ["txt", "json", "xml", "csv", "sql"]
+        try:
+            import openpyxl
+            formatos.append("xlsx")
+        except ImportError:
+            pass
+        try:
+            import dbf
+            formatos.append("dbf")
+            formato_dbf.DEBUG = False
+        except ImportError:
+            pass
+        sqlite3.register_adapter(decimal.Decimal, str)
+        self.carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.carpeta)
+        fn = os.path.join(DATOS, "facturas.txt")
+        original = formato_txt.leer(fn)[0]
+        for origen in formatos:
+            fmt_origen = "csv" if origen == "xlsx" else origen
+            archivo, opciones = self.destino(origen, "origen_%s" % origen)
+            conversor.convertir(fn, archivo, "txt", fmt_origen,
+                                opciones_destino=opciones)
+            for destino in formatos:
+                with self.subTest(origen=origen, destino=destino):
+                    fmt_destino = "csv" if destino == "xlsx" else destino
+                    salida, opciones_destino = self.destino(
+                        destino, "%s_%s" % (origen, destino))
+                    n = conversor.escribir(
+                        self.leer(archivo, fmt_origen, opciones), salida,
+                        fmt_destino, **opciones_destino)
+                    regs = list(self.leer(salida, fmt_destino,
+                                          opciones_destino))
+                    self.assertEqual(len(regs), 1)
+                    reg = regs[0]
+                    self.assertEqual(int(reg['cbte_nro']), original['cbte_nro'])
+                    self.assertEqual(float(reg['imp_total']),
+                                     float(original['imp_total']))
+                    self.assertEqual(str(reg['cae']), original['cae'])
+                    self.assertEqual(reg['detalles'][0]['codigo'],
+                                     original['detalles'][0]['codigo'])
+                    self.assertEqual(len(reg['ivas']), len(original['ivas']))
+
+    def test_sql(self):
+        "Lectura SQL de a lotes de encabezados (con sus sub-registros)"
+        import decimal
+        import shutil
+        import sqlite3
+        import tempfile
+        from pyafipws.formatos import conversor, formato_sql
+        sqlite3.register_adapter(decimal.Decimal, str)
+        self.carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.carpeta)
+        original = formato_txt.leer(os.path.join(DATOS, "facturas.txt"))[0]
+        cantidad = formato_sql.TAMANIO_LOTE * 2 + 5
+        regs = []
+        for i in range(cantidad):
+            reg = dict(original, cbte_nro=i + 1, id=i + 1)
+            reg['detalles'] = [dict(original['detalles'][0], codigo="P%d" % i)]
+            regs.append(reg)
+        db, opciones = self.destino("sql", "lotes")
+        conversor.escribir(iter(regs), db, "sql")
+        leidos = list(self.leer(db, "sql", opciones))
+        self.assertEqual([int(reg['cbte_nro']) for reg in leidos],
+                         list(range(1, cantidad + 1)))
+        for reg in leidos:
+            self.assertEqual([it['codigo'] for it in reg['detalles']],
+                             ["P%d" % (int(reg['cbte_nro']) - 1)])
+            self.assertEqual(len(reg['ivas']), len(original['ivas']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del padrón de alícuotas de IIBB ARBA (cache por período) sin conexión"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010 Mariano Reingart"
+__license__ = "LGPL 3.0"
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import iibb
+
+CONTRIBUYENTE = """
+    <contribuyente>
+      <cuitContribuyente>%s</cuitContribuyente>
+      <alicuotaPercepcion>1.5</alicuotaPercepcion>
+      <alicuotaRetencion>0.5</alicuotaRetencion>
+      <grupoPercepcion>3</grupoPercepcion>
+      <grupoRetencion>2</grupoRetencion>
+    </contribuyente>"""
+
+RESPUESTA = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<DFEServicioConsulta>
+  <contribuyentes>%s
+  </contribuyentes>
+  <numeroComprobante>1</numeroComprobante>
+  <cantidadContribuyentes>%d</cantidadContribuyentes>
+</DFEServicioConsulta>
+"""
+
+
+class PadronPrueba(iibb.IIBB):
+    "Responde las consultas con las alícuotas de los CUITs solicitados"
+
+    def ConsultarContribuyentes(self, fecha_desde, fecha_hasta, cuits):
+        cuits = iibb.separar_cuits(cuits)
+        self.consultas.append(cuits)
+        with open(self.testing, "w") as f:
+            f.write(RESPUESTA % ("".join(CONTRIBUYENTE % cuit for cuit in cuits),
+                                 len(cuits)))
+        return iibb.IIBB.ConsultarContribuyentes(self, fecha_desde,
+                                                 fecha_hasta, cuits)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.carpeta)
+
+    def crear(self, carpeta=None):
+        padron = PadronPrueba()
+        padron.Conectar(testing=os.path.join(self.carpeta, "respuesta.xml"))
+        padron.consultas = []
+        padron.CacheDir = carpeta
+        return padron
+
+    def test_memoria(self):
+        "Sin carpeta se consultan sólo los CUITs faltantes (en lotes)"
+        padron = self.crear()
+        self.assertTrue(padron.ConsultarPadron("20260301", "20260331",
+                            "30123456780,20267565393, 30500010912",
+                            tamanio_lote=2))
+        self.assertEqual(padron.consultas, [["30123456780", "20267565393"],
+                                            ["30500010912"]])
+        self.assertEqual(padron.CantidadContribuyentes, 3)
+        self.assertEqual(padron.CuitContribuyente, "30123456780")
+        self.assertEqual(padron.AlicuotaPercepcion, "1.5")
+        # aciertos y faltantes: sólo se consulta el nuevo CUIT
+        self.assertTrue(padron.ConsultarPadron("20260301", "20260331",
+                            ["20267565393", "20111111112"]))
+        self.assertEqual(padron.consultas[2:], [["20111111112"]])
+        self.assertEqual([c['CuitContribuytente'] for c in padron.contribuyentes],
+                         ["20267565393", "20111111112"])
+        # otro período no usa la cache anterior
+        self.assertTrue(padron.ConsultarPadron("20260401", "20260430",
+                                               "20267565393"))
+        self.assertEqual(padron.consultas[3:], [["20267565393"]])
+        self.assertTrue(padron.Cerrar())
+
+    def test_persistente(self):
+        "Con carpeta las alícuotas se conservan al cerrar y reabrir"
+        padron = self.crear(self.carpeta)
+        self.assertTrue(padron.ConsultarPadron("20260301", "20260331",
+                                               "30123456780"))
+        self.assertTrue(padron.Cerrar())
+        self.assertEqual(padron.caches, {})
+        padron = self.crear(self.carpeta)
+        self.assertTrue(padron.ConsultarPadron("20260301", "20260331",
+                                               "30123456780 20267565393"))
+        self.assertEqual(padron.consultas, [["20267565393"]])
+        self.assertTrue(padron.LeerContribuyente())
+        self.assertEqual(padron.AlicuotaRetencion, "0.5")
+        self.assertTrue(padron.LeerContribuyente())
+        self.assertEqual(padron.CuitContribuyente, "20267565393")
+        self.assertFalse(padron.LeerContribuyente())
+        padron.Cerrar()
+
+    def test_error(self):
+        "Las respuestas con error no se guardan en la cache"
+        padron = self.crear()
+        with open(padron.testing, "w") as f:
+            f.write("<DFEServicioConsulta><tipoError>1</tipoError>"
+                    "<codigoError>2</codigoError><mensajeError>X"
+                    "</mensajeError></DFEServicioConsulta>")
+        self.assertTrue(iibb.IIBB.ConsultarContribuyentes(padron, "20260301",
+                                                "20260331", "30123456780"))
+        self.assertEqual(padron.CodigoError, "2")
+        self.assertEqual(dict(padron.abrir_cache("20260301", "20260331")), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del tiempo de inicio (importación demorada de dependencias)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import os
+import subprocess
+import sys
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+# tiempo máximo para importar wsfev1 (milisegundos, sin iniciar python)
+UMBRAL_MS = 60
+
+# dependencias que no deben importarse hasta usarlas
+PESADOS = ("pysimplesoap", "httplib2", "M2Crypto", "fpdf", "PIL", "wx",
+           "http.client", "ssl", "email.parser", "html.parser", "multiprocessing")
+
+
+def importar(modulo, *opciones):
+    "Importa el módulo en un intérprete nuevo, devuelve (salida, errores)"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    codigo = ("import sys; import pyafipws.%s; print(' '.join("
+              "[m for m in %r if m in sys.modules]))" % (modulo, PESADOS))
+    proceso = subprocess.run([sys.executable] + list(opciones) + ["-c", codigo],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             env=env, universal_newlines=True, check=True)
+    return proceso.stdout.split(), proceso.stderr
+
+
+class TestImportacion(unittest.TestCase):
+
+    def test_dependencias(self):
+        "Las interfaces y scripts no importan dependencias pesadas al inicio"
+        for modulo in ("wsfev1", "wsmtx", "wsfexv1", "wsaa", "wslpg",
+                       "rece1", "recem", "cot"):
+            importados, errores = importar(modulo)
+            self.assertEqual(importados, [], modulo)
+
+    def test_tiempo(self):
+        "import wsfev1 se mantiene bajo el umbral (-X importtime)"
+        tiempos = []
+        for i in range(3):
+            importados, errores = importar("wsfev1", "-X", "importtime")
+            for linea in errores.splitlines():
+                # import time: self [us] | cumulative | imported package
+                campos = linea.split("|")
+                if len(campos) == 3 and campos[2].strip() == "pyafipws.wsfev1":
+                    tiempos.append(int(campos[1]) / 1000.)
+        self.assertEqual(len(tiempos), 3)
+        self.assertTrue(min(tiempos) < UMBRAL_MS,
+                        "import wsfev1: %.1f ms" % min(tiempos))
+
+
+if __name__ == '__main__':
+    unittest.main()
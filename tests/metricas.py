@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del registro de métricas (histogramas y exportadores)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import os
+import socket
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import metricas
+
+
+class TestMetricas(unittest.TestCase):
+
+    def test_prometheus(self):
+        "Histogramas acumulativos por servicio y método (formato texto)"
+        registro = metricas.Registro()
+        for duracion in (0.003, 0.2, 7):
+            registro.registrar("WSFEv1", "CAESolicitar",
+                               {'duracion': duracion, 'solicitud': 2000})
+        registro.registrar("WSFEv1", "CAESolicitar", {'duracion': 0.01},
+                           reintentos=2, falla="soap:Server")
+        fn = os.path.join(tempfile.mkdtemp(), "afip.prom")
+        registro.exportar_prometheus(fn)
+        lineas = open(fn).read().splitlines()
+        etiquetas = 'servicio="WSFEv1",metodo="CAESolicitar"'
+        for linea in (
+            'pyafipws_llamadas_total{%s} 4' % etiquetas,
+            'pyafipws_reintentos_total{%s} 2' % etiquetas,
+            'pyafipws_fallas_total{%s,codigo="soap:Server"} 1' % etiquetas,
+            'pyafipws_duracion_segundos_bucket{%s,le="0.005"} 1' % etiquetas,
+            'pyafipws_duracion_segundos_bucket{%s,le="0.25"} 3' % etiquetas,
+            'pyafipws_duracion_segundos_bucket{%s,le="+Inf"} 4' % etiquetas,
+            'pyafipws_solicitud_bytes_count{%s} 3' % etiquetas,
+            ):
+            self.assertIn(linea, lineas)
+        self.assertEqual(os.listdir(os.path.dirname(fn)), ["afip.prom"])
+
+    def test_statsd(self):
+        "Envío de cada medición por UDP"
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(5)
+        exportador = metricas.ExportadorStatsd(*sock.getsockname())
+        registro = metricas.Registro([exportador])
+        registro.registrar("WSCDC", "ConstatarComprobante",
+                           {'duracion': 0.5, 'respuesta': 800}, falla="500")
+        lineas = sock.recv(4096).decode("utf8").splitlines()
+        self.assertIn("pyafipws.WSCDC.ConstatarComprobante.duracion:500.000|ms",
+                      lineas)
+        self.assertIn("pyafipws.WSCDC.ConstatarComprobante.respuesta:800|h",
+                      lineas)
+        self.assertIn("pyafipws.WSCDC.ConstatarComprobante.fallas.500:1|c",
+                      lineas)
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de las plantillas de sobres SOAP (mismo XML que pysimplesoap)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import datetime
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pysimplesoap.client import SoapClient
+from pyafipws.analizador import ClienteSOAP
+
+# WSDL reducidos (sólo la operación a probar)
+CARPETA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xml")
+WSFEV1 = os.path.join(CARPETA, "wsfev1_fecae.wsdl")
+WSMTX = os.path.join(CARPETA, "wsmtx_autorizar.wsdl")
+
+
+def detalle(nro):
+    return {
+        'Concepto': 1, 'DocTipo': 80, 'DocNro': '30000000007',
+        'CbteDesde': nro, 'CbteHasta': nro, 'CbteFch': '20241231',
+        'ImpTotal': Decimal('122.50'), 'ImpTotConc': 0, 'ImpNeto': '100.00',
+        'ImpOpEx': 0.0, 'ImpTrib': 1.5, 'ImpIVA': Decimal("21"),
+        'FchServDesde': None, 'MonId': 'PES', 'MonCotiz': 1,
+        'CbtesAsoc': None,
+        'Tributos': {'Tributo': [{'Id': 99, 'Desc': 'Imp. <municipal> & "ñ"',
+                                  'BaseImp': 100, 'Alic': 1.5, 'Importe': 1.5}]},
+        'Iva': {'AlicIva': [{'Id': 5, 'BaseImp': 100, 'Importe': 21},
+                            {'Id': 3, 'BaseImp': 0, 'Importe': 0}]},
+        'Opcionales': {'Opcional': [{'Id': '2101', 'Valor': ''}]},
+        'PeriodoAsoc': {'FchDesde': None},
+        }
+
+
+def fecae(cantidad):
+    return dict(
+        Auth={'Token': 'PD94&bWw', 'Sign': 'aGVs<bG8=', 'Cuit': 20267565393},
+        FeCAEReq={'FeCabReq': {'CantReg': cantidad, 'PtoVta': 1, 'CbteTipo': 1},
+                  'FeDetReq': {'FECAEDetRequest': [detalle(i) for i in
+                                                   range(1, cantidad + 1)]}})
+
+
+AUTORIZAR_MTX = dict(
+    authRequest={'token': 't', 'sign': 's', 'cuitRepresentada': '20267565393'},
+    comprobanteCAERequest={
+        'codigoTipoComprobante': 1, 'numeroPuntoVenta': 4000,
+        'numeroComprobante': 12, 'fechaEmision': datetime.date(2024, 12, 31),
+        'importeTotal': Decimal('121.50'), 'observaciones': None,
+        'arrayItems': {'item': [
+            {'descripcion': 'Café & "té"', 'cantidad': Decimal('1.5'),
+             'codigoUnidadMedida': 7, 'codigoCondicionIVA': 5,
+             'importeItem': Decimal('100')},
+            {'descripcion': 'Flete', 'codigoUnidadMedida': 7,
+             'codigoCondicionIVA': 5, 'importeItem': 21}]},
+        'arraySubtotalesIVA': {'subtotalIVA': [{'codigo': 5,
+                                                'importe': Decimal('21')}]},
+        })
+
+
+def solicitud(client, metodo, parametros):
+    "Arma la solicitud sin enviarla (ubicación 'test' de pysimplesoap)"
+    for service in client.services.values():
+        for port in service['ports'].values():
+            port['location'] = "test"
+    try:
+        getattr(client, metodo)(**parametros)
+    except TypeError:
+        pass                    # sin respuesta para analizar
+    return client.xml_request
+
+
+class TestPlantillas(unittest.TestCase):
+
+    def comparar(self, wsdl, ns, metodo, parametros):
+        esperado = solicitud(SoapClient(wsdl=wsdl, ns=ns), metodo, parametros)
+        client = ClienteSOAP(wsdl=wsdl, ns=ns, analizar=False,
+                             plantillas=[metodo])
+        obtenido = solicitud(client, metodo, parametros)
+        self.assertEqual(obtenido, esperado)
+        return client
+
+    def test_fecae(self):
+        "FECAESolicitar (.NET, 250 comprobantes): mismo XML"
+        client = self.comparar(WSFEV1, None, "FECAESolicitar", fecae(250))
+        self.assertTrue(client.plantillas["FECAESolicitar"])
+        self.assertIn(b"Imp. &lt;municipal&gt; &amp; &quot;\xc3\xb1&quot;",
+                      client.xml_request)
+
+    def test_mtx(self):
+        "autorizarComprobante (java, prefijo ser): mismo XML"
+        client = self.comparar(WSMTX, "ser", "autorizarComprobante",
+                               AUTORIZAR_MTX)
+        self.assertTrue(client.plantillas["autorizarComprobante"])
+
+    def test_no_compatible(self):
+        "Parámetros que no se ajustan a la plantilla: camino normal"
+        parametros = fecae(1)
+        parametros['FeCAEReq']['FeDetReq']['FECAEDetRequest'] = detalle(1)
+        self.comparar(WSFEV1, None, "FECAESolicitar", parametros)
+        parametros = fecae(1)
+        parametros['FeCAEReq']['FeCabReq']['Inexistente'] = 1
+        client = ClienteSOAP(wsdl=WSFEV1, analizar=False,
+                             plantillas=["FECAESolicitar"])
+        self.assertRaises(ValueError, solicitud, client, "FECAESolicitar",
+                          parametros)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del envío de correos (bandeja de salida) con un servidor SMTP local"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import io
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import pyemail
+
+
+class ServidorSMTP(socketserver.ThreadingTCPServer):
+    "Servidor SMTP mínimo para pruebas (corta la sesión cada N mensajes)"
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mensajes_por_sesion=None):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0),
+                                                 SesionSMTP)
+        self.mensajes_por_sesion = mensajes_por_sesion
+        self.mensajes = []
+        self.sesiones = 0
+        self.lock = threading.Lock()
+
+
+class SesionSMTP(socketserver.StreamRequestHandler):
+
+    def responder(self, linea):
+        self.wfile.write(linea.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.sesiones += 1
+        cantidad = 0
+        self.responder("220 localhost ESMTP prueba")
+        for linea in self.rfile:
+            comando = linea.decode("ascii").strip().upper()
+            if comando.startswith(("EHLO", "HELO")):
+                self.responder("250 localhost")
+            elif comando.startswith("MAIL FROM"):
+                if servidor.mensajes_por_sesion == cantidad:
+                    return          # corta la conexión (sin responder)
+                self.responder("250 OK")
+            elif comando.startswith("RCPT TO"):
+                if "RECHAZADO" in comando:
+                    self.responder("550 No existe")
+                elif "DEMORADO" in comando:
+                    self.responder("451 Intente luego")
+                else:
+                    self.responder("250 OK")
+            elif comando == "DATA":
+                self.responder("354 Fin con .")
+                datos = []
+                for linea in self.rfile:
+                    if linea == b".\r\n":
+                        break
+                    datos.append(linea)
+                with servidor.lock:
+                    servidor.mensajes.append(b"".join(datos))
+                cantidad += 1
+                self.responder("250 OK")
+            elif comando == "QUIT":
+                self.responder("221 Chau")
+                return
+            else:
+                self.responder("250 OK")
+
+
+class TestBandejaSalida(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.servidor = ServidorSMTP(mensajes_por_sesion=7)
+        threading.Thread(target=self.servidor.serve_forever).start()
+        self.puerto = self.servidor.server_address[1]
+
+    def tearDown(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def encolar(self, cantidad, destinatario="cliente%d@example.com"):
+        pyemail_ = pyemail.PyEmail()
+        pyemail_.BandejaSalida = self.carpeta
+        for i in range(cantidad):
+            pyemail_.Crear("facturacion@example.com", "Factura %d" % i)
+            pyemail_.Adjuntar("factura%d.pdf" % i, io.BytesIO(b"%PDF-" * 50))
+            ok = pyemail_.Encolar(destinatario=destinatario % i,
+                                  mensaje="Adjunto factura")
+            self.assertTrue(ok, pyemail_.Excepcion)
+
+    def test_enviar_pendientes(self):
+        "Envío en paralelo con reconexión cuando el servidor corta la sesión"
+        self.encolar(50)
+        bandeja = pyemail.BandejaSalida(self.carpeta)
+        self.assertEqual(len(bandeja), 50)
+        despachador = pyemail.Despachador("127.0.0.1", puerto=self.puerto,
+                                          conexiones=4, espera=0)
+        self.assertEqual(despachador.enviar(bandeja), 50)
+        self.assertEqual(despachador.errores, [])
+        self.assertEqual(len(bandeja), 0)
+        self.assertEqual(len(self.servidor.mensajes), 50)
+        self.assertGreater(self.servidor.sesiones, 4)
+        self.assertIn(b"factura7.pdf", b"".join(self.servidor.mensajes))
+
+    def test_rechazados(self):
+        "Los mensajes rechazados quedan en la carpeta de errores"
+        self.encolar(3, "rechazado%d@example.com")
+        pyemail_ = pyemail.PyEmail()
+        pyemail_.BandejaSalida = self.carpeta
+        enviados = pyemail_.EnviarPendientes("127.0.0.1", puerto=self.puerto)
+        self.assertEqual(enviados, 0)
+        self.assertTrue(pyemail_.Excepcion)
+        errores = os.listdir(os.path.join(self.carpeta, "errores"))
+        self.assertEqual(len([fn for fn in errores if fn.endswith(".eml")]), 3)
+        self.assertEqual(len(pyemail.BandejaSalida(self.carpeta)), 0)
+
+    def test_falla_temporal(self):
+        "Ante fallas temporales (4xx) los mensajes quedan en la bandeja"
+        self.encolar(5, "demorado%d@example.com")
+        bandeja = pyemail.BandejaSalida(self.carpeta)
+        despachador = pyemail.Despachador("127.0.0.1", puerto=self.puerto,
+                                          conexiones=2, reintentos=1, espera=0)
+        self.assertEqual(despachador.enviar(bandeja), 0)
+        self.assertEqual(despachador.errores, [])
+        self.assertIn("451", despachador.interrupcion)
+        self.assertEqual(len(bandeja), 5)
+        self.assertEqual(os.listdir(bandeja.carpeta_errores), [])
+
+    def test_servidor_caido(self):
+        "Sin conexión se detiene el envío y no se descarta ningún mensaje"
+        self.encolar(10)
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+        s.close()                   # nadie escucha en el puerto
+        bandeja = pyemail.BandejaSalida(self.carpeta)
+        despachador = pyemail.Despachador("127.0.0.1", puerto=puerto,
+                                          espera=0)
+        self.assertEqual(despachador.enviar(bandeja), 0)
+        self.assertTrue(despachador.interrupcion)
+        self.assertEqual(len(bandeja), 10)
+        self.assertEqual(os.listdir(bandeja.carpeta_errores), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
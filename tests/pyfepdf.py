@@ -0,0 +1,255 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la generación de PDF de factura electrónica (sin conexión)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from fpdf import Template
+
+from pyafipws import pyfepdf
+
+PLANTILLAS = os.path.join(os.path.dirname(os.path.dirname(
+                          os.path.abspath(__file__))), "plantillas")
+FORMATO = os.path.join(PLANTILLAS, "factura.csv")
+LOGO = os.path.join(PLANTILLAS, "logo.png")
+
+
+def factura(nro, lineas=3):
+    "Arma los datos de un comprobante (como los lee --lote de la entrada)"
+    fepdf = pyfepdf.FEPDF()
+    fepdf.CrearFactura(1, 80, "30000000007", 1, 1, nro, "121.00", "0.00",
+                       "100.00", "21.00", "0.00", "0.00", "20261019", "",
+                       None, None, "PES", 1, "61123022925855", "20261031", "",
+                       "Cliente %d" % nro, "Domicilio", 200, "", "",
+                       "Contado", "", 1, "")
+    for i in range(lineas):
+        fepdf.AgregarDetalleItem(None, None, "P%05d" % i, "Producto %d" % i, 1,
+                                 7, 10.00, 0.00, 5, 2.10, 12.10, "")
+    return fepdf.factura
+
+
+class TestPlantilla(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.carpeta)
+
+    def test_formato(self):
+        "La planilla CSV se analiza una vez (se vuelve a leer si cambia)"
+        formato = os.path.join(self.carpeta, "formato.csv")
+        shutil.copy(FORMATO, formato)
+        campos = pyfepdf.leer_formato(formato)
+        self.assertIs(pyfepdf.leer_formato(formato), campos)
+        # cada interfaz recibe sus propios campos (no modifica la cache)
+        fepdf = pyfepdf.FEPDF()
+        self.assertTrue(fepdf.CargarFormato(formato))
+        self.assertEqual(len(fepdf.elements), len(campos))
+        fepdf.elements[0]['text'] = "modificado"
+        otro = pyfepdf.FEPDF()
+        otro.CargarFormato(formato)
+        self.assertNotEqual(otro.elements[0]['text'], "modificado")
+        # al modificar el archivo se analiza nuevamente
+        with open(formato, "a", encoding="latin1") as f:
+            f.write("'extra';'T';1.0;1.0;2.0;2.0;'Arial';8.0;0.0;0.0;0.0;0.0;"
+                    "16777215.0;'L';'';0.0\n")
+        os.utime(formato, (0, os.path.getmtime(formato) + 10))
+        self.assertEqual(len(pyfepdf.leer_formato(formato)), len(campos) + 1)
+
+    def test_valores(self):
+        "Las celdas son literales (no se evalúa código)"
+        self.assertEqual(pyfepdf.leer_valor("'Arial'"), "Arial")
+        self.assertEqual(pyfepdf.leer_valor("12,5"), 12.5)
+        self.assertIsNone(pyfepdf.leer_valor("  "))
+        self.assertRaises(ValueError, pyfepdf.leer_valor, "__import__('os')")
+        formato = os.path.join(self.carpeta, "invalido.csv")
+        with open(formato, "w") as f:
+            f.write("'campo';'T';open('x')\n")
+        with self.assertRaises(ValueError) as ctx:
+            pyfepdf.leer_formato(formato)
+        self.assertIn("linea 1", str(ctx.exception))
+
+    def test_imagenes(self):
+        "Las imágenes procesadas se reutilizan entre documentos"
+        logo = os.path.join(self.carpeta, "logo.png")
+        shutil.copy(LOGO, logo)
+        pyfepdf.precargar_imagen(logo)
+        self.assertIn(logo, pyfepdf._IMAGENES)
+        imagenes = pyfepdf.Imagenes()
+        self.assertIn(logo, imagenes)
+        self.assertEqual(imagenes[logo]['i'], 1)
+        # si la imagen cambia no se reutiliza la anterior
+        os.utime(logo, (0, os.path.getmtime(logo) + 10))
+        self.assertNotIn(logo, pyfepdf.Imagenes())
+
+    def test_plantilla(self):
+        "Plantilla admite 'in' (fpdf 1.7.2 no lo implementa)"
+        fepdf = pyfepdf.FEPDF()
+        fepdf.CargarFormato(FORMATO)
+        plantilla = pyfepdf.Plantilla(elements=fepdf.elements)
+        self.assertIn("cae", plantilla)
+        self.assertIn("CAE", plantilla)
+        self.assertNotIn("inexistente", plantilla)
+        self.assertIsInstance(plantilla.pdf.images, pyfepdf.Imagenes)
+
+
+class TestDividirTexto(unittest.TestCase):
+
+    def test_anchos(self):
+        "Corta en el último espacio que entra (o la palabra si no hay)"
+        anchos = dict.fromkeys("abcdefghijklmnopqrstuvwxyz ", 1)
+        self.assertEqual(pyfepdf.dividir_texto("hola mundo feliz", anchos, 10),
+                         ["hola mundo", "feliz"])
+        self.assertEqual(pyfepdf.dividir_texto("abcdefghijkl", anchos, 5),
+                         ["abcde", "fghij", "kl"])
+        self.assertEqual(pyfepdf.dividir_texto("uno\r\n\ndos\n", anchos, 10),
+                         ["uno", "", "dos"])
+        self.assertEqual(pyfepdf.dividir_texto("", anchos, 10), [""])
+
+    def test_fpdf(self):
+        "Mismo resultado que fpdf (multi_cell split_only) en el detalle"
+        fepdf = pyfepdf.FEPDF()
+        fepdf.CargarFormato(FORMATO)
+        plantilla = pyfepdf.Plantilla(elements=fepdf.elements)
+        original = Template(elements=fepdf.elements)
+        azar = random.Random(3685)
+        palabras = ["Producto", "de", "prueba", "ñandú", "X" * 80, "12,50",
+                    "(caja)", "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "\n", ""]
+        textos = ["", "corto", "Lorem ipsum sit amet " * 10, "W" * 200,
+                  "linea 1\nlinea 2\n\n", "con  dobles   espacios  " * 5]
+        for i in range(200):
+            textos.append(" ".join(azar.choice(palabras)
+                                   for j in range(azar.randint(1, 40))))
+        for texto in textos:
+            self.assertEqual(
+                plantilla.split_multicell(texto, 'Item.Descripcion01'),
+                original.split_multicell(texto, 'Item.Descripcion01'),
+                texto)
+
+
+class TestLote(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.conf_fact = {'formato': FORMATO, 'directorio': self.carpeta,
+                          'papel': "A4", 'archivo': "numero",
+                          'lineas_max': 24, 'copias': 1}
+        self.conf_pdf = {'CUIT': "30-00000000-7"}
+
+    def tearDown(self):
+        shutil.rmtree(self.carpeta)
+
+    def generar(self, regs, **kwargs):
+        return pyfepdf.generar_lote(regs, self.conf_fact, self.conf_pdf,
+                                    **kwargs)
+
+    def test_archivos(self):
+        "Un PDF por comprobante (en el subdirectorio de la fecha)"
+        for procesos in (1, 2):
+            cantidad, paginas, errores = self.generar(
+                (factura(i) for i in (1, 2, 3)), procesos=procesos)
+            self.assertEqual((cantidad, paginas, errores), (3, 3, []))
+            archivos = sorted(os.listdir(os.path.join(self.carpeta, "20261019")))
+            self.assertEqual(archivos, ["0001-00000001.pdf", "0001-00000002.pdf",
+                                        "0001-00000003.pdf"])
+            with open(os.path.join(self.carpeta, "20261019", archivos[0]), "rb") as f:
+                self.assertTrue(f.read().startswith(b"%PDF"))
+            shutil.rmtree(os.path.join(self.carpeta, "20261019"))
+
+    def test_unificado(self):
+        "Un único PDF con las páginas de todos los comprobantes"
+        salida = os.path.join(self.carpeta, "lote.pdf")
+        cantidad, paginas, errores = self.generar(
+            [factura(1), factura(2, lineas=30)], unificado=salida, procesos=1)
+        self.assertEqual((cantidad, paginas, errores), (2, 3, []))
+        with open(salida, "rb") as f:
+            self.assertEqual(f.read().count(b"/Type /Page\n"), 3)
+        self.assertEqual(os.listdir(self.carpeta), ["lote.pdf"])
+        self.assertEqual(self.generar([], unificado=salida), (0, 0, []))
+
+    def test_errores(self):
+        "Un comprobante con error se informa y no detiene el lote"
+        invalido = factura(2)
+        del invalido['cae']
+        cantidad, paginas, errores = self.generar(
+            [factura(1), invalido, factura(3)], procesos=1)
+        self.assertEqual((cantidad, paginas), (2, 2))
+        self.assertEqual(len(errores), 1)
+        self.assertTrue(errores[0].startswith("2: "))
+
+
+class TestMemoria(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.directorio = os.getcwd()
+        os.chdir(self.carpeta)
+
+    def tearDown(self):
+        os.chdir(self.directorio)
+        shutil.rmtree(self.carpeta)
+
+    def procesar(self):
+        fepdf = pyfepdf.procesar_factura(factura(1), {'formato': FORMATO,
+                                         'papel': "A4"}, {'CUIT': "30-00000000-7"})
+        fepdf.ProcesarPlantilla(num_copias=1, lineas_max=24, qty_pos='izq')
+        return fepdf
+
+    def test_obtener_pdf(self):
+        "El PDF se devuelve como bytes (sin grabar archivos)"
+        pdf = self.procesar().ObtenerPDF()
+        self.assertIsInstance(pdf, bytes)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        self.assertEqual(os.listdir(self.carpeta), [])
+
+    def test_archivo_en_memoria(self):
+        "GenerarPDF acepta un archivo ya abierto (BytesIO)"
+        salida = io.BytesIO()
+        self.assertTrue(self.procesar().GenerarPDF(archivo=salida))
+        self.assertTrue(salida.getvalue().startswith(b"%PDF"))
+        self.assertIn(b"/Type /Page\n", salida.getvalue())
+        self.assertEqual(os.listdir(self.carpeta), [])
+
+    def test_salida_estandar(self):
+        "Con salida = - el script escribe el PDF en la salida estándar"
+        from pyafipws.formatos import conversor
+        conversor.escribir([dict(factura(1), datos=[])], "entrada.txt", "txt")
+        with open("rece.ini", "w") as f:
+            f.write("[FACTURA]\nformato=%s\nentrada=entrada.txt\nsalida=-\n"
+                    "papel=A4\n[PDF]\nCUIT=30-00000000-7\n" % FORMATO)
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(pyfepdf.__file__)))
+        entorno = dict(os.environ, PYTHONPATH=raiz)
+        pdf = subprocess.check_output([sys.executable, "-m", "pyafipws.pyfepdf",
+                                       "rece.ini", "--cargar"], env=entorno)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        self.assertTrue(pdf.rstrip().endswith(b"%%EOF"))
+        self.assertEqual(sorted(os.listdir(self.carpeta)),
+                         ["entrada.txt", "rece.ini"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del generador de códigos de barras Interleaved 2 of 5"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import pyi25
+
+BARRAS = "202675653930240016120303473904220110529"
+
+
+class TestLote(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.entrada = os.path.join(self.carpeta, "codigos.txt")
+        with open(self.entrada, "w") as f:
+            f.write("%s\n\n  %s  \r\n%s" % (BARRAS, BARRAS[:-1] + "0",
+                                            BARRAS[:-2]))
+        self.salida = os.path.join(self.carpeta, "imagenes")
+        os.mkdir(self.salida)
+
+    def tearDown(self):
+        shutil.rmtree(self.carpeta)
+
+    def test_lote(self):
+        "Una imagen por código (agregando el dígito verificador)"
+        self.assertEqual(pyi25.generar_lote(self.entrada, self.salida), 3)
+        codigo = BARRAS + pyi25.digito_verificador_modulo10(BARRAS)
+        self.assertEqual(sorted(os.listdir(self.salida)), sorted([
+            "%s.png" % codigo,
+            "%s0%s.png" % (BARRAS[:-1], pyi25.digito_verificador_modulo10(
+                                            BARRAS[:-1] + "0")),
+            "%s%s.png" % (BARRAS[:-2], pyi25.digito_verificador_modulo10(
+                                           BARRAS[:-2]))]))
+        with open(os.path.join(self.salida, "%s.png" % codigo), "rb") as f:
+            imagen = f.read()
+        self.assertTrue(imagen.startswith(b"\x89PNG"))
+        self.assertEqual(imagen, pyi25.PyI25().ObtenerImagen(codigo))
+
+    def test_sin_verificador(self):
+        "Con --noverificador se usa el código tal cual"
+        self.assertEqual(pyi25.generar_lote(self.entrada, self.salida, False), 3)
+        self.assertIn("%s.png" % BARRAS, os.listdir(self.salida))
+        self.assertIn("%s.png" % BARRAS[:-2], os.listdir(self.salida))
+
+    def test_invalido(self):
+        "Un código con caracteres inválidos es error"
+        with open(self.entrada, "w") as f:
+            f.write("12A4\n")
+        self.assertRaises(ValueError, pyi25.generar_lote, self.entrada,
+                          self.salida, False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la autorización por lotes de rece1 (salida incremental) sin conexión"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2010 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import rece1, utils, wsfev1
+
+
+class ServicioPrueba(wsfev1.WSFEv1):
+    "Autoriza sin conectarse a AFIP (CAE según el número de comprobante)"
+
+    @utils.inicializar_y_capturar_excepciones
+    def CAESolicitar(self):
+        self.Resultado, self.Obs = "A", ""
+        self.CAE = "7%013d" % int(self.factura['cbt_desde'])
+        self.Vencimiento = "20261031"
+        return self.CAE
+
+
+def factura(nro):
+    return {'tipo_cbte': 1, 'punto_vta': 4002, 'cbt_desde': nro,
+            'cbt_hasta': nro, 'fecha_cbte': "20261019", 'concepto': 1,
+            'tipo_doc': 80, 'nro_doc': "30500010912", 'imp_total': "121.00",
+            'imp_tot_conc': "0.00", 'imp_neto': "100.00", 'imp_iva': "21.00",
+            'imp_trib': "0.00", 'imp_op_ex': "0.00", 'moneda_id': "PES",
+            'moneda_ctz': "1.000000",
+            'ivas': [{'iva_id': 5, 'base_imp': "100.00", 'importe': "21.00"}]}
+
+
+class TestAutorizar(unittest.TestCase):
+
+    def setUp(self):
+        self.argv = sys.argv
+        sys.argv = ["rece1", "/json"]
+
+    def tearDown(self):
+        sys.argv = self.argv
+
+    def autorizar(self, entrada):
+        salida = io.StringIO()
+        try:
+            rece1.autorizar(ServicioPrueba(), io.StringIO(entrada), salida)
+        finally:
+            self.salida = salida.getvalue()
+
+    def test_json(self):
+        "Cada factura se graba al obtener su CAE (lista JSON completa)"
+        self.autorizar(json.dumps([factura(1), factura(2)]))
+        facturas = json.loads(self.salida)
+        self.assertEqual([f['cae'] for f in facturas],
+                         ["70000000000001", "70000000000002"])
+        self.assertEqual(facturas[1]['fecha_vto'], "20261031")
+
+    def test_sin_facturas(self):
+        "Sin resultados no se escribe la salida"
+        self.assertRaises(RuntimeError, self.autorizar, "[]")
+        self.assertEqual(self.salida, "")
+
+    def test_error(self):
+        "Ante un error la lista queda incompleta (no parece un JSON válido)"
+        entrada = json.dumps([factura(1), factura(2)])[:-40]
+        self.assertRaises(ValueError, self.autorizar, entrada)
+        self.assertIn("70000000000001", self.salida)
+        self.assertRaises(ValueError, json.loads, self.salida)
+
+
+class TestDBF(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.argv = sys.argv
+        sys.argv = ["rece1", "/dbf"]
+        rece1.conf_dbf = dict((nombre, os.path.join(self.carpeta, "%s.dbf" % i))
+                              for i, nombre in enumerate(["encabezado",
+                                  "tributo", "iva", "comprobante asociado",
+                                  "datos opcionales", "compradores"]))
+
+    def tearDown(self):
+        sys.argv = self.argv
+        del rece1.conf_dbf
+        shutil.rmtree(self.carpeta)
+
+    def test_sin_facturas(self):
+        "Sin comprobantes se crean las tablas vacías"
+        rece1.escribir_facturas([], io.StringIO(), agrega=True)
+        self.assertEqual(sorted(a for a in os.listdir(self.carpeta)
+                                if a.endswith(".dbf")),
+                         ["%d.dbf" % i for i in range(6)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la política de reintentos y del cortacircuitos"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import socket
+import sys
+import time
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import reintentos, utils
+
+
+class ServicioPrueba(utils.BaseWS):
+    "Simula fallas de red antes de responder"
+    PoliticaReintentos = reintentos.Politica(base=0.001, maximo=0.01)
+
+    def __init__(self, errores, reintentos=3):
+        utils.BaseWS.__init__(self, reintentos)
+        self.simulados = list(errores)     # (errores lo limpia el decorador)
+        self.llamadas = 0
+
+    def llamar(self):
+        self.llamadas += 1
+        if self.simulados:
+            raise self.simulados.pop(0)
+        return True
+
+    @utils.inicializar_y_capturar_excepciones
+    def ConsultarUltimoComprobante(self):
+        return self.llamar()
+
+    @utils.inicializar_y_capturar_excepciones
+    def CAESolicitar(self):
+        return self.llamar()
+
+
+class HttpPrueba:
+    "Transporte HTTP simulado (lanza los errores indicados)"
+
+    def __init__(self):
+        self.errores = []
+
+    def request(self, uri, method="POST", body=None, headers=None):
+        if self.errores:
+            raise self.errores.pop(0)
+        return {'status': "200"}, b"<ok/>"
+
+
+class TestReintentos(unittest.TestCase):
+
+    def test_consulta(self):
+        "Las consultas se reintentan ante reinicios y tiempos agotados"
+        ws = ServicioPrueba([ConnectionResetError(104, "reset"),
+                             socket.timeout("timed out")])
+        self.assertTrue(ws.ConsultarUltimoComprobante())
+        self.assertEqual(ws.llamadas, 3)
+
+    def test_autorizacion(self):
+        "Las autorizaciones sólo si la solicitud no llegó al servidor"
+        ws = ServicioPrueba([ConnectionRefusedError(111, "refused"),
+                             ConnectionResetError(104, "reset")])
+        self.assertRaises(ConnectionResetError, ws.CAESolicitar)
+        self.assertEqual(ws.llamadas, 2)
+
+    def test_limite(self):
+        "Se respeta la cantidad de reintentos y no se reintentan otros errores"
+        ws = ServicioPrueba([socket.timeout("timed out")] * 5, reintentos=2)
+        self.assertRaises(socket.timeout, ws.ConsultarUltimoComprobante)
+        self.assertEqual(ws.llamadas, 3)
+        ws = ServicioPrueba([ValueError("dato inválido")])
+        self.assertRaises(ValueError, ws.ConsultarUltimoComprobante)
+        self.assertEqual(ws.llamadas, 1)
+
+    def test_cortacircuitos(self):
+        "Falla rápido con el circuito abierto y luego deja pasar una prueba"
+        http = HttpPrueba()
+        cortacircuitos = reintentos.Cortacircuitos(umbral=3, espera=0.05)
+        transporte = reintentos.TransporteProtegido(http, cortacircuitos)
+        url = "https://wswhomo.afip.gov.ar/wsfev1/service.asmx"
+        http.errores = [socket.timeout("timed out")] * 3
+        for i in range(3):
+            self.assertRaises(socket.timeout, transporte.request, url)
+        self.assertRaises(reintentos.CircuitoAbierto, transporte.request, url)
+        estado = cortacircuitos.estados()[url]
+        self.assertEqual((estado['estado'], estado['rechazadas']), ("abierto", 1))
+        # otro servidor no se ve afectado
+        transporte.request("https://fwshomo.afip.gov.ar/wsmtxca/services/MTXCAService")
+        time.sleep(0.06)
+        transporte.request(url)
+        self.assertEqual(cortacircuitos.estados()[url]['estado'], "cerrado")
+
+    def test_prueba_interrumpida(self):
+        "Si la llamada de prueba se interrumpe se permite otra prueba"
+        http = HttpPrueba()
+        cortacircuitos = reintentos.Cortacircuitos(umbral=1, espera=0.05)
+        transporte = reintentos.TransporteProtegido(http, cortacircuitos)
+        url = "https://wswhomo.afip.gov.ar/wsfev1/service.asmx"
+        http.errores = [socket.timeout("timed out"), KeyboardInterrupt()]
+        self.assertRaises(socket.timeout, transporte.request, url)
+        time.sleep(0.06)
+        self.assertRaises(KeyboardInterrupt, transporte.request, url)
+        self.assertEqual(cortacircuitos.estados()[url]['estado'], "semiabierto")
+        transporte.request(url)
+        self.assertEqual(cortacircuitos.estados()[url]['estado'], "cerrado")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del servicio residente de los scripts rece* (socket y carpeta)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import recem, residente, utils, wsfev1, wsmtx
+
+
+class ServicioPrueba(wsfev1.WSFEv1):
+    "Autoriza sin conectarse a AFIP (CAE según el número de comprobante)"
+    solicitudes = 0
+
+    @utils.inicializar_y_capturar_excepciones
+    def CAESolicitar(self):
+        self.solicitudes += 1
+        self.Resultado, self.Obs = "A", ""
+        self.CAE = "7%013d" % int(self.factura['cbt_desde'])
+        self.Vencimiento = "20261031"
+        return self.CAE
+
+
+class ServicioMatrix(wsmtx.WSMTXCA):
+    "Autoriza (WSMTXCA) sin conectarse a AFIP"
+
+    @utils.inicializar_y_capturar_excepciones
+    def AutorizarComprobante(self):
+        self.Resultado, self.Obs, self.EmisionTipo = "A", "", "CAE"
+        self.CAE = "6%013d" % int(self.factura['cbt_desde'])
+        self.Vencimiento = "2026-10-31"
+        return self.CAE
+
+
+def factura(nro):
+    return {'tipo_cbte': 1, 'punto_vta': 4002, 'cbt_desde': nro,
+            'cbt_hasta': nro, 'fecha_cbte': "20261019", 'concepto': 1,
+            'tipo_doc': 80, 'nro_doc': "30500010912", 'imp_total': "121.00",
+            'imp_tot_conc': "0.00", 'imp_neto': "100.00", 'imp_iva': "21.00",
+            'imp_trib': "0.00", 'imp_op_ex': "0.00", 'moneda_id': "PES",
+            'moneda_ctz': "1.000000",
+            'ivas': [{'iva_id': 5, 'base_imp': "100.00", 'importe': "21.00"}]}
+
+
+class TestResidente(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.ws = ServicioPrueba()
+        self.residente = residente.Residente("rece1", ws=self.ws)
+        self.entrada = os.path.join(self.carpeta, "entrada.json")
+        self.salida = os.path.join(self.carpeta, "salida.json")
+        with open(self.entrada, "w") as f:
+            json.dump([factura(1), factura(2)], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.carpeta)
+
+    def verificar(self, codigo):
+        self.assertEqual(codigo, 0)
+        with open(self.salida) as f:
+            facturas = json.load(f)
+        self.assertEqual([f['cae'] for f in facturas],
+                         ["70000000000001", "70000000000002"])
+        self.assertEqual(facturas[0]['resultado'], "A")
+
+    def test_socket(self):
+        "Los trabajos se procesan por el socket con la interfaz ya conectada"
+        ruta = os.path.join(self.carpeta, "rece1.sock")
+        servidor = residente.ServidorUnix(ruta, self.residente)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        try:
+            argv = ["rece1", "/residente", "/json", "/socket", ruta]
+            for i in range(3):
+                self.verificar(residente.cliente("rece1", self.entrada,
+                                                 self.salida, argv))
+            # un error se informa en la salida (como el script)
+            codigo = residente.cliente("rece1", self.entrada + ".x",
+                                       self.salida, argv)
+            self.assertEqual(codigo, 5)
+            with open(self.salida) as f:
+                self.assertIn("entrada.json.x", json.load(f)[0]['err_msg'])
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+        self.assertEqual((self.ws.solicitudes, self.residente.trabajos), (6, 4))
+        self.assertFalse(os.path.exists(ruta))
+
+    def test_spool(self):
+        "Los trabajos se procesan dejándolos en una carpeta vigilada"
+        spool = os.path.join(self.carpeta, "spool")
+        os.mkdir(spool)
+        detener = threading.Event()
+        hilo = threading.Thread(target=self.residente.vigilar,
+                                args=(spool, 0.01, detener))
+        hilo.start()
+        try:
+            argv = ["rece1", "/residente", "/json", "/spool", spool]
+            self.verificar(residente.cliente("rece1", self.entrada,
+                                             self.salida, argv))
+        finally:
+            detener.set()
+            hilo.join()
+        self.assertEqual(os.listdir(spool), [])
+
+    def test_recem(self):
+        "Otros scripts (formato TXT, salida de a un comprobante, errores)"
+        self.residente = residente.Residente("recem", ws=ServicioMatrix())
+        entrada = os.path.join(self.carpeta, "entrada.txt")
+        salida = os.path.join(self.carpeta, "salida.txt")
+        encabezado = factura(7)
+        del encabezado['ivas']
+        encabezado['imp_subtotal'] = "100.00"
+        with open(entrada, "w") as f:
+            recem.escribir_factura(encabezado, f)
+        ruta = os.path.join(self.carpeta, "recem.sock")
+        servidor = residente.ServidorUnix(ruta, self.residente)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        try:
+            argv = ["recem", "/residente", "/socket", ruta]
+            self.assertEqual(residente.cliente("recem", entrada, salida, argv), 0)
+            with open(salida) as f:
+                dic = utils.leer(f.readline(), recem.ENCABEZADO)
+            self.assertEqual((dic['cae'], dic['resultado']), ("60000000000007", "A"))
+            # error: se informa en la salida con el formato del script
+            codigo = residente.cliente("recem", entrada + ".x", salida, argv)
+            self.assertEqual(codigo, 5)
+            with open(salida) as f:
+                dic = utils.leer(f.readline(), recem.ENCABEZADO)
+            self.assertIn("entrada.txt.x", dic['err_msg'])
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+
+    def test_informar_caea(self):
+        "/informarcaea sólo se pasa a los scripts que lo admiten"
+        self.assertIn("rece1", residente.CAEA)
+        self.assertNotIn("recex1", residente.CAEA)
+        self.assertNotIn("receb1", residente.CAEA)
+        llamadas = []
+        self.residente.script = "recex1"
+        self.residente.modulo = type(sys)("prueba")
+        self.residente.modulo.autorizar = lambda *args: llamadas.append(args)
+        resultado = self.residente.procesar({'entrada': self.entrada,
+                                             'salida': self.salida,
+                                             'opciones': ["/informarcaea"]})
+        self.assertEqual(resultado['codigo'], 0)
+        self.assertEqual(len(llamadas[0]), 3)
+
+    def test_sin_respuesta(self):
+        "Sin respuesta (completa) del servicio es error, no servicio inactivo"
+        ruta = os.path.join(self.carpeta, "roto.sock")
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(ruta)
+        s.listen(1)
+
+        def atender():
+            conexion, direccion = s.accept()
+            conexion.makefile("rb").readline()
+            conexion.sendall(b'{"codigo": 0')      # se detiene a mitad
+            conexion.close()
+        hilo = threading.Thread(target=atender)
+        hilo.start()
+        try:
+            argv = ["rece1", "/residente", "/socket", ruta]
+            codigo = residente.cliente("rece1", self.entrada, self.salida, argv)
+        finally:
+            hilo.join()
+            s.close()
+        self.assertEqual(codigo, 5)
+        # el servicio tomó el trabajo de la carpeta pero no responde
+        spool = os.path.join(self.carpeta, "spool")
+        os.mkdir(spool)
+
+        def tomar():
+            while True:
+                trabajos = [n for n in os.listdir(spool) if n.endswith(".trabajo")]
+                if trabajos:
+                    os.remove(os.path.join(spool, trabajos[0]))
+                    break
+                time.sleep(0.01)
+        hilo = threading.Thread(target=tomar)
+        hilo.start()
+        resultado = residente.enviar_spool(spool, {}, espera=5,
+                                           espera_resultado=0.1)
+        hilo.join()
+        self.assertEqual(resultado['codigo'], 5)
+
+    def test_inactivo(self):
+        "Sin servicio el cliente devuelve None (el script procesa localmente)"
+        argv = ["rece1", "/residente", "/socket",
+                os.path.join(self.carpeta, "inexistente.sock")]
+        self.assertIsNone(residente.cliente("rece1", self.entrada,
+                                            self.salida, argv))
+        spool = os.path.join(self.carpeta, "spool")
+        os.mkdir(spool)
+        self.assertIsNone(residente.enviar_spool(spool, {}, espera=0.05))
+        self.assertEqual(os.listdir(spool), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
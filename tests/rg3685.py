@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la importación RG3685 (CAB.txt / ALI.txt, merge-join ordenado)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2016 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import rg3685
+from pyafipws.utils import escribir
+
+
+def cabecera(tipo, pto_vta, nro, total):
+    return escribir({'fecha_cbte': "20160101", 'tipo_cbte': tipo,
+                     'punto_vta': pto_vta, 'cbt_desde': nro, 'cbt_hasta': nro,
+                     'tipo_doc': 80, 'nro_doc': 30500010912,
+                     'nombre': "Cliente %d" % nro, 'imp_total': total,
+                     'moneda_id': "PES", 'moneda_ctz': 1,
+                     'cant_alicuota_iva': 1, 'codigo_operacion': " "},
+                    rg3685.REGINFO_CV_VENTAS_CBTE)
+
+
+def alicuota(tipo, pto_vta, nro, base_imp, iva_id, importe):
+    return escribir({'tipo_cbte': tipo, 'punto_vta': pto_vta,
+                     'cbt_numero': nro, 'base_imp': base_imp,
+                     'iva_id': iva_id, 'importe': importe},
+                    rg3685.REGINFO_CV_VENTAS_CBTE_ALICUOTA)
+
+
+class TestRG3685(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.cab = os.path.join(self.carpeta, "CAB.txt")
+        self.ali = os.path.join(self.carpeta, "ALI.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.carpeta)
+
+    def grabar(self, archivo, lineas):
+        with open(archivo, "w") as f:
+            f.writelines(lineas)
+
+    def procesar(self, **kwargs):
+        return [(reg['tipo_cbte'], reg['punto_vta'], reg['cbt_desde'],
+                 reg.get('imp_neto'), reg.get('imp_iva'), len(reg.get('iva', [])))
+                for reg in rg3685.procesar(self.cab, self.ali, **kwargs)]
+
+    def test_ordenado(self):
+        "Archivos ordenados: se combinan sin ordenar (sumando las alícuotas)"
+        self.grabar(self.cab, [cabecera(1, 2, 1, 121), cabecera(1, 2, 2, 0),
+                               cabecera(6, 1, 1, 131.5)])
+        self.grabar(self.ali, [alicuota(1, 2, 1, 100, 5, 21),
+                               alicuota(6, 1, 1, 100, 5, 21),
+                               alicuota(6, 1, 1, 100, 4, 10.5)])
+        clave = rg3685.clave_linea(rg3685.REGINFO_CV_VENTAS_CBTE,
+                                   rg3685.CLAVE_CBTE)
+        self.assertTrue(rg3685.esta_ordenado(self.cab, clave))
+        self.assertEqual(self.procesar(), [(1, 2, 1, 100, 21, 1),
+                                           (1, 2, 2, None, None, 0),
+                                           (6, 1, 1, 200, 31.5, 2)])
+
+    def test_desordenado(self):
+        "Archivos desordenados: ordenamiento externo por tramos (estable)"
+        cabeceras = [cabecera(6, 1, 3, 0), cabecera(1, 10, 1, 0),
+                     cabecera(1, 2, 20, 0), cabecera(1, 2, 3, 0),
+                     cabecera(6, 1, 1, 0)]
+        self.grabar(self.cab, cabeceras)
+        self.grabar(self.ali, [alicuota(6, 1, 1, 100, 4, 10.5),
+                               alicuota(1, 2, 20, 10, 5, 2.1),
+                               alicuota(6, 1, 1, 100, 5, 21),
+                               "\n",
+                               alicuota(1, 10, 1, 50, 5, 10.5)])
+        clave = rg3685.clave_linea(rg3685.REGINFO_CV_VENTAS_CBTE,
+                                   rg3685.CLAVE_CBTE)
+        self.assertFalse(rg3685.esta_ordenado(self.cab, clave))
+        res = self.procesar(tamanio_lote=2)
+        self.assertEqual([r[:3] for r in res], [(1, 2, 3), (1, 2, 20),
+                                                (1, 10, 1), (6, 1, 1),
+                                                (6, 1, 3)])
+        self.assertEqual(res[1][3:], (10, 2.1, 1))
+        self.assertEqual(res[3][3:], (200, 31.5, 2))
+        # mismo resultado ordenando todo en memoria
+        self.assertEqual(self.procesar(tamanio_lote=1000), res)
+        # las alícuotas del mismo comprobante respetan el orden original
+        regs = list(rg3685.procesar(self.cab, self.ali, tamanio_lote=1))
+        self.assertEqual([iva['iva_id'] for iva in regs[3]['iva']], [4, 5])
+
+    def test_concepto(self):
+        "Datos adicionales: CAEA y fechas de servicio"
+        self.grabar(self.cab, [cabecera(1, 2, 1, 121)])
+        self.grabar(self.ali, [alicuota(1, 2, 1, 100, 5, 21)])
+        reg, = rg3685.procesar(self.cab, self.ali, "12345678901234", 2,
+                               "20160101", "20160131")
+        self.assertEqual((reg['cae'], reg['concepto']), ("12345678901234", 2))
+        self.assertEqual(reg['fecha_serv_hasta'], "20160131")
+        reg, = rg3685.procesar(self.cab, self.ali)
+        self.assertNotIn('fecha_venc_pago', reg)
+
+    def test_alicuota_sin_comprobante(self):
+        "Una alícuota sin comprobante en CAB.txt es error"
+        self.grabar(self.cab, [cabecera(1, 2, 2, 0)])
+        for ali in ([alicuota(1, 2, 1, 100, 5, 21)],
+                    [alicuota(1, 2, 3, 100, 5, 21)]):
+            self.grabar(self.ali, ali)
+            with self.assertRaises(KeyError):
+                list(rg3685.procesar(self.cab, self.ali))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del simulador local de los webservices de AFIP"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import simulador, utils, wsfev1
+
+WSDL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xml",
+                    "wsfev1_fecae.wsdl")
+
+SOLICITUD = """<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+<soap:Body><FECAESolicitar xmlns="http://ar.gov.afip.dif.FEV1/">
+<Auth><Token>t</Token><Sign>s</Sign><Cuit>20267565393</Cuit></Auth>
+<FeCAEReq><FeCabReq><CantReg>%d</CantReg><PtoVta>4000</PtoVta><CbteTipo>1</CbteTipo>
+</FeCabReq><FeDetReq>%s</FeDetReq></FeCAEReq></FECAESolicitar></soap:Body>
+</soap:Envelope>"""
+
+DETALLE = """<FECAEDetRequest><Concepto>1</Concepto><DocTipo>80</DocTipo>
+<DocNro>30000000007</DocNro><CbteDesde>%d</CbteDesde><CbteHasta>%d</CbteHasta>
+<CbteFch>20241231</CbteFch></FECAEDetRequest>"""
+
+
+class TestSimulador(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        with open(os.path.join(self.carpeta, "wsfev1.wsdl"), "w") as f:
+            f.write('<definitions><service><port><soap:address '
+                    'location="https://wswhomo.afip.gov.ar/wsfev1/service.asmx"/>'
+                    '</port></service></definitions>')
+        self.servidor = simulador.ServidorAFIP(carpeta_wsdl=self.carpeta)
+        self.servidor.iniciar()
+
+    def tearDown(self):
+        self.servidor.detener()
+        shutil.rmtree(self.carpeta)
+
+    def enviar(self, servicio, xml):
+        req = urllib.request.Request(self.servidor.url(servicio),
+                                     xml.encode("utf8"),
+                                     {'Content-Type': 'text/xml'})
+        return ElementTree.fromstring(urllib.request.urlopen(req).read())
+
+    def test_wsdl(self):
+        "El WSDL apunta al servidor local"
+        wsdl = urllib.request.urlopen(self.servidor.url("wsfev1") + "?WSDL").read()
+        self.assertIn(self.servidor.url("wsfev1").encode("ascii"), wsdl)
+        self.assertNotIn(b"afip.gov.ar", wsdl)
+
+    def test_cae_solicitar(self):
+        "Una respuesta por comprobante y numeración correlativa"
+        detalles = "".join([DETALLE % (i, i) for i in (1, 2, 3)])
+        respuesta = self.enviar("wsfev1", SOLICITUD % (3, detalles))
+        caes = [simulador.buscar(det, "CAE") for det in
+                simulador.buscar_todos(respuesta, "FECAEDetResponse")]
+        self.assertEqual(len(set(caes)), 3)
+        self.assertEqual(simulador.buscar(respuesta, "Resultado"), "A")
+        self.assertEqual(self.servidor.ultimo("wsfev1", 1, 4000), 3)
+
+    def test_errores(self):
+        "Inyección de SOAP Fault"
+        self.servidor.errores = 1
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.enviar("wsfev1", SOLICITUD % (1, DETALLE % (1, 1)))
+        self.assertEqual(ctx.exception.code, 500)
+        self.assertIn(b"faultstring", ctx.exception.read())
+
+    def test_conectar(self):
+        "Sólo se conserva http para los servidores locales (simulador)"
+        self.assertTrue(utils.es_local("http://127.0.0.1:8080/wsfev1"))
+        self.assertTrue(utils.es_local("http://localhost/wsfev1?WSDL"))
+        self.assertFalse(utils.es_local("http://wswhomo.afip.gov.ar/wsfev1"))
+        shutil.copy(WSDL, os.path.join(self.carpeta, "wsfev1.wsdl"))
+        ws = wsfev1.WSFEv1()
+        self.assertTrue(ws.Conectar(wsdl=self.servidor.url("wsfev1")))
+        ubicaciones = [port['location'] for service in ws.client.services.values()
+                       for port in service['ports'].values()]
+        self.assertEqual(ubicaciones, [self.servidor.url("wsfev1")])
+        # WSDL de AFIP con http: se corrige a https
+        with open(WSDL) as f:
+            contenido = f.read().replace("https://wswhomo", "http://wswhomo")
+        fn = os.path.join(self.carpeta, "afip.wsdl")
+        with open(fn, "w") as f:
+            f.write(contenido)
+        ws = wsfev1.WSFEv1()
+        self.assertTrue(ws.Conectar(wsdl=fn))
+        ubicaciones = [port['location'] for service in ws.client.services.values()
+                       for port in service['ports'].values()]
+        self.assertEqual(ubicaciones,
+                         ["https://wswhomo.afip.gov.ar/wsfev1/service.asmx"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas del cliente web (envío multipart y descargas en bloques)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2011 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import utils
+
+
+class Manejador(BaseHTTPRequestHandler):
+    "Devuelve el hash del cuerpo recibido o descarga en bloques (chunked)"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        pass
+
+    def do_POST(self):
+        self.server.conexiones.add(self.client_address)
+        largo = int(self.headers["Content-Length"])
+        cuerpo = self.rfile.read(largo)
+        self.server.cuerpos.append(cuerpo)
+        respuesta = hashlib.md5(cuerpo).hexdigest().encode("ascii")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(respuesta)))
+        self.end_headers()
+        self.wfile.write(respuesta)
+
+    def do_GET(self):
+        self.server.conexiones.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(100):
+            bloque = (b"%%PDF-%03d " % i) * 1000
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(bloque), bloque))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class TestWebClient(unittest.TestCase):
+
+    def setUp(self):
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.servidor.conexiones = set()
+        self.servidor.cuerpos = []
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/" % self.servidor.server_address[1]
+        self.carpeta = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        shutil.rmtree(self.carpeta)
+
+    def test_envio(self):
+        "Envío multipart de un archivo (largo conocido) reutilizando la conexión"
+        nombre = os.path.join(self.carpeta, "remitos.txt")
+        with open(nombre, "wb") as f:
+            f.write(b"02|\xf1and\xfa|1\r\n" * 100000)
+        client = utils.WebClient(self.url)
+        for i in range(3):
+            with open(nombre, "r") as archivo:
+                boundary, cuerpo = client.multipart_encode({'user': "usuario",
+                                                            'file': archivo})
+                self.assertEqual(len(cuerpo), len(b"".join(cuerpo)))
+                respuesta = client(user="usuario", file=archivo)
+            self.assertEqual(client.response.status, 200)
+        enviado = self.servidor.cuerpos[-1]
+        self.assertEqual(respuesta, hashlib.md5(enviado).hexdigest().encode())
+        # el archivo se envía tal cual (bytes) aunque esté abierto como texto
+        self.assertTrue(b"02|\xf1and\xfa|1\r\n" * 100000 in enviado)
+        self.assertTrue(b'name="user"\r\n\r\nusuario\r\n' in enviado)
+        self.assertEqual(len(self.servidor.conexiones), 1)
+
+    def test_descarga(self):
+        "Descarga en bloques (chunked) a un archivo o a una función"
+        client = utils.WebClient(self.url)
+        client.method = "GET"
+        client.enctype = None
+        nombre = os.path.join(self.carpeta, "constancia.pdf")
+        respuesta = client.download(nombre, "constancia", "20267565393")
+        self.assertEqual(respuesta["content-type"], "application/pdf")
+        self.assertEqual(os.path.getsize(nombre), 100 * 9000)
+        bloques = []
+        client.download(bloques.append, "constancia")
+        self.assertTrue(1 < len(bloques) and max(map(len, bloques)) <= client.block_size)
+        with open(nombre, "rb") as f:
+            self.assertEqual(b"".join(bloques), f.read())
+        self.assertEqual(len(self.servidor.conexiones), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
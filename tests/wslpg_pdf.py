@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTIBILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+"Pruebas de la generación por lotes de formularios C 1116 B/C (sin conexión)"
+
+__author__ = "Mariano Reingart <reingart@gmail.com>"
+__copyright__ = "Copyright (C) 2013 Mariano Reingart"
+__license__ = "GPL 3.0"
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.append("/home/reingart")        # TODO: proper packaging
+
+from pyafipws import wslpg
+from pyafipws import wslpg_datos as datos
+
+FORMATO = os.path.join(os.path.dirname(os.path.dirname(
+                       os.path.abspath(__file__))), "plantillas",
+                       "liquidacion_form_c1116b_wslpg.csv")
+
+
+def liquidacion(nro_orden, **kwargs):
+    liq = {'coe': 330100000000 + nro_orden, 'pto_emision': 55,
+           'nro_orden': nro_orden, 'fecha_liquidacion': "2026-10-19",
+           'estado': "AC", 'cod_tipo_ajuste': None, 'cod_tipo_operacion': 1,
+           'cod_grano': 31, 'cod_puerto': 14, 'cod_prov_procedencia': 12,
+           'cod_localidad_procedencia': 5544, 'cuit_comprador': "20400000000",
+           'cuit_vendedor': 23000000019, 'precio_ref_tn': 2000,
+           'total_deduccion': 0, 'total_retencion': 0,
+           'deducciones': [], 'retenciones': [], 'certificados': []}
+    liq.update(kwargs)
+    return liq
+
+
+def contenido_pdf(archivo):
+    "Devuelve el contenido de las páginas (descomprimido) del PDF"
+    with open(archivo, "rb") as f:
+        pdf = f.read()
+    return b"".join([zlib.decompress(s) for s in
+                     re.findall(rb"stream\r?\n(.*?)endstream", pdf, re.S)
+                     if s.startswith(b"x")])
+
+
+class TestLote(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp()
+        self.conf_liq = {'formato': FORMATO, 'directorio': self.carpeta,
+                         'copias': 1}
+        self.localidades = datos.LOCALIDADES
+        datos.LOCALIDADES = {'5544': "VILLA GOBERNADOR GALVEZ"}
+
+    def tearDown(self):
+        datos.LOCALIDADES = self.localidades
+        shutil.rmtree(self.carpeta)
+
+    def test_lote(self):
+        "Un PDF por liquidación (procedencia desde la cache de localidades)"
+        for procesos in (1, 2):
+            cantidad, paginas, errores = wslpg.generar_lote(
+                (liquidacion(i) for i in (1, 2, 3)), self.conf_liq,
+                {'CUIT': "20-40000000-0"}, procesos=procesos, cuit="20400000000")
+            self.assertEqual((cantidad, paginas, errores), (3, 3, []))
+            carpeta = os.path.join(self.carpeta, "2026_10_19")
+            self.assertEqual(sorted(os.listdir(carpeta)),
+                             ["55_1.pdf", "55_2.pdf", "55_3.pdf"])
+            contenido = contenido_pdf(os.path.join(carpeta, "55_2.pdf"))
+            self.assertIn(b"VILLA GOBERNADOR GALVEZ", contenido)
+            self.assertIn(b"330100000002", contenido)
+            shutil.rmtree(carpeta)
+
+    def test_errores(self):
+        "Una liquidación con error se informa y no detiene el lote"
+        liqs = [liquidacion(1), liquidacion(2, cod_prov_procedencia="X"),
+                liquidacion(3)]
+        cantidad, paginas, errores = wslpg.generar_lote(liqs, self.conf_liq,
+                                                        {}, procesos=1)
+        self.assertEqual((cantidad, paginas), (2, 2))
+        self.assertEqual(len(errores), 1)
+        self.assertTrue(errores[0].startswith("330100000002: ValueError"))
+
+    def test_nombre_archivo(self):
+        "El nombre del PDF se arma con los campos configurados"
+        conf_liq = dict(self.conf_liq, archivo="coe,nro_orden")
+        ruta = wslpg.nombre_archivo_pdf(liquidacion(7), conf_liq)
+        self.assertEqual(ruta, os.path.join(self.carpeta, "2026_10_19",
+                                            "330100000007_7.pdf"))
+        self.assertTrue(os.path.isdir(os.path.dirname(ruta)))
+
+
+if __name__ == '__main__':
+    unittest.main()
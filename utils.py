@@ -16,30 +16,30 @@ __author__ = "Mariano Reingart <reingart@gmail.com>"
 __copyright__ = "Copyright (C) 2013 Mariano Reingart"
 __license__ = "GPL 3.0"
 
+import collections
 import datetime
 import functools
-import inspect
 import locale
-import socket
 import sys
 import os
 import stat
 import time
 import traceback
 import warnings
-from io import StringIO
 from decimal import Decimal
 from urllib.parse import urlencode
 from urllib.parse import urlparse
 import unicodedata
-import mimetypes
-from email.generator import _make_boundary
-from html.parser import HTMLParser
-from http.cookies import SimpleCookie
 from configparser import SafeConfigParser
 from io import IOBase
 
-from pysimplesoap.client import SimpleXMLElement, SoapClient, SoapFault, parse_proxy, set_http_wrapper
+# las dependencias pesadas (pysimplesoap, httplib2, http.client, ssl, email,
+# html.parser) se importan al usarlas por primera vez, para reducir el
+# tiempo de inicio de los scripts (rece1, etc.) y la DLL en cada ejecución.
+# SimpleXMLElement, SoapClient, SoapFault, etc. siguen disponibles en este
+# módulo (ver __getattr__), pero internamente usar es_soap_fault
+
+from . import concurrencia, reintentos
 
 try:
     import json
@@ -50,13 +50,56 @@ except ImportError:
         print("para soporte de JSON debe instalar simplejson")
         json = None
 
-try:
-    import httplib2
+# nombres importados de pysimplesoap al accederlos (compatibilidad)
+PYSIMPLESOAP = ("SimpleXMLElement", "SoapClient", "SoapFault", "parse_proxy",
+                "set_http_wrapper")
+
+
+def __getattr__(nombre):
+    "Importa al primer acceso (ej. from .utils import SoapFault)"
+    if nombre in PYSIMPLESOAP:
+        from pysimplesoap import client
+        valor = getattr(client, nombre)
+    elif nombre == "httplib2":
+        import httplib2 as valor
+    elif nombre == "HTMLFormParser":
+        valor = html_form_parser()
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, nombre))
+    globals()[nombre] = valor
+    return valor
+
+
+def es_soap_fault(e):
+    "Indica si la excepción es un SoapFault (sin importar pysimplesoap)"
+    # si pysimplesoap no fue importado, la excepción no puede ser de ese tipo
+    client = sys.modules.get("pysimplesoap.client")
+    return client is not None and isinstance(e, client.SoapFault)
+
+
+HTTPLIB2_PARCHEADO = False
+
+
+def parchear_httplib2():
+    "Corrige la negociación SSL de httplib2 (al conectar, una sola vez)"
+    global HTTPLIB2_PARCHEADO
+    if HTTPLIB2_PARCHEADO:
+        return
+    HTTPLIB2_PARCHEADO = True
+    try:
+        import httplib2
+    except ImportError:
+        print("para soporte de SSL debe instalar httplib2")
+        return
+    if not hasattr(httplib2, "_ssl_wrap_socket"):
+        return                  # versiones nuevas (no necesitan el parche)
     # corregir temas de negociacion de SSL en algunas versiones de ubuntu:
     import platform
-    dist, ver, nick = platform.linux_distribution() if sys.version_info > (2, 6) else ("", "", "")
-    release, ver, csd, ptype = platform.win32_ver() if sys.version_info > (2, 6) else ("", "", "", "")
-    from pysimplesoap.client import SoapClient
+    if hasattr(platform, "linux_distribution"):
+        dist, ver, nick = platform.linux_distribution()
+    else:
+        dist = ver = ""         # python 3.8+
+    release, ver, csd, ptype = platform.win32_ver()
     monkey_patch = httplib2._ssl_wrap_socket.__module__ != "httplib2"
     if dist:
         needs_patch = (dist == 'Ubuntu' and ver == '14.04')
@@ -77,12 +120,18 @@ try:
                            ssl_version=ssl.PROTOCOL_TLSv1)
         httplib2._ssl_wrap_socket = _ssl_wrap_socket
 
-except:
-    print("para soporte de WebClient debe instalar httplib2")
-
 
 DEBUG = False
 
+# registro de métricas de las llamadas (ver metricas.activar), None: inactivo
+METRICAS = None
+
+# política de captura de los XML (ver captura.activar), None: sólo la última
+CAPTURA = None
+
+# cantidad máxima de mensajes en la bitácora de depuración (BaseWS.log)
+LOG_MAXIMO = 1000
+
 
 # Funciones para manejo de errores:
 
@@ -135,6 +184,8 @@ def inicializar_y_capturar_excepciones(func):
     "Decorador para inicializar y capturar errores (version para webservices)"
     @functools.wraps(func)
     def capturar_errores_wrapper(self, *args, **kwargs):
+        medicion = METRICAS and METRICAS.iniciar(self, func.__name__)
+        falla = None
         try:
             # inicializo (limpio variables)
             self.Errores = []           # listas de str para lenguajes legados
@@ -151,45 +202,59 @@ def inicializar_y_capturar_excepciones(func):
             # limpio los parámetros
             self.params_in = {}
             self.params_out = {}
-            # llamo a la función (con reintentos)
-            retry = self.reintentos + 1
-            while retry:
+            # llamo a la función (con reintentos según la política)
+            politica = getattr(self, "PoliticaReintentos", None) or reintentos.POLITICA
+            intento = 0
+            while True:
                 try:
-                    retry -= 1
                     return func(self, *args, **kwargs)
-                except socket.error as e:
-                    if e.errno not in (10054, 10053):
-                        # solo reintentar si el error es de conexión
-                        # (10054, 'Connection reset by peer')
-                        # (10053, 'Software caused connection abort')
+                except Exception as e:
+                    # sólo reintentar errores de red (y las autorizaciones
+                    # sólo si la solicitud no llegó al servidor)
+                    if intento >= self.reintentos or \
+                       not politica.reintentar(self, func.__name__, e):
                         raise
-                    else:
-                        if DEBUG: print(e, "Reintentando...")
-                        self.log(exception_info().get("msg", ""))
-
-        except SoapFault as e:
-            # guardo destalle de la excepción SOAP
-            self.ErrCode = str(e.faultcode)
-            self.ErrMsg = str(e.faultstring)
-            self.Excepcion = "%s: %s" % (e.faultcode, e.faultstring, )
-            if self.LanzarExcepciones:
-                raise
+                    espera = politica.espera(intento)
+                    intento += 1
+                    if DEBUG: print(e, "Reintentando en %.2f s..." % espera)
+                    if medicion: medicion.reintentos += 1
+                    self.log(exception_info().get("msg", ""))
+                    time.sleep(espera)
+
         except Exception as e:
-            ex = exception_info()
-            self.Traceback = ex.get("tb", "")
-            try:
-                self.Excepcion = ex.get("msg", "")
-            except:
-                self.Excepcion = "<no disponible>"
-            if self.LanzarExcepciones:
-                raise
+            if es_soap_fault(e):
+                # guardo destalle de la excepción SOAP
+                self.ErrCode = str(e.faultcode)
+                self.ErrMsg = str(e.faultstring)
+                self.Excepcion = "%s: %s" % (e.faultcode, e.faultstring, )
+                falla = self.ErrCode
+                if self.LanzarExcepciones:
+                    raise
             else:
-                self.ErrMsg = self.Excepcion
+                falla = e.__class__.__name__
+                ex = exception_info()
+                self.Traceback = ex.get("tb", "")
+                try:
+                    self.Excepcion = ex.get("msg", "")
+                except:
+                    self.Excepcion = "<no disponible>"
+                if self.LanzarExcepciones:
+                    raise
+                else:
+                    self.ErrMsg = self.Excepcion
         finally:
+            if medicion:
+                medicion.falla = falla
+                medicion.finalizar(self)
             # guardo datos de depuración
             if self.client:
-                self.XmlRequest = self.client.xml_request
-                self.XmlResponse = self.client.xml_response
+                captura = getattr(self, "Captura", None) or CAPTURA
+                if captura is None:
+                    self.XmlRequest = self.client.xml_request
+                    self.XmlResponse = self.client.xml_response
+                else:
+                    self.XmlRequest, self.XmlResponse = captura.registrar(
+                        self, func.__name__, falla)
     return capturar_errores_wrapper
 
 
@@ -211,9 +276,22 @@ def inicializar_y_capturar_excepciones_simple(func):
     return capturar_errores_wrapper
 
 
+def es_local(url):
+    "Devuelve True si la dirección es de este equipo (localhost, 127.x.x.x)"
+    servidor = urlparse(url).hostname or ""
+    return servidor in ("localhost", "::1") or servidor.startswith("127.")
+
+
 class BaseWS:
     "Infraestructura basica para interfaces webservices de AFIP"
 
+    AnalizadorRapido = False
+    Plantillas = ()         # operaciones con sobre precompilado (plantillas)
+    Captura = None          # política de captura de los XML (ver captura)
+    PoliticaReintentos = None   # None: reintentos.POLITICA
+    Cortacircuitos = True   # fallar rápido si el servidor está degradado
+    Concurrencia = True     # limitar las solicitudes simultáneas (AIMD)
+
     def __init__(self, reintentos=1):
         self.reintentos = reintentos
         self.xml = self.client = self.Log = None
@@ -228,6 +306,8 @@ class BaseWS:
 
     def Conectar(self, cache=None, wsdl=None, proxy="", wrapper=None, cacert=None, timeout=30, soap_server=None):
         "Conectar cliente soap del web service"
+        from pysimplesoap.client import SoapClient, parse_proxy, set_http_wrapper
+        parchear_httplib2()
         try:
             # analizar transporte y servidor proxy:
             if wrapper:
@@ -251,6 +331,7 @@ class BaseWS:
                 cacert = None
             elif cacert is True:
                 # usar certificados predeterminados que vienen en la biblioteca
+                import httplib2
                 cacert = os.path.join(httplib2.__path__[0], 'cacerts.txt')
             elif cacert.startswith("-----BEGIN CERTIFICATE-----"):
                 pass
@@ -268,21 +349,49 @@ class BaseWS:
             self.log("Conectando a wsdl=%s cache=%s proxy=%s" % (wsdl, cache, proxy_dict))
             # analizar espacio de nombres (axis vs .net):
             ns = 'ser' if self.WSDL[-5:] == "?wsdl" else None
-            self.client = SoapClient(
+            kwargs = {}
+            if self.AnalizadorRapido or self.Plantillas:
+                # analizar las respuestas sin armar el DOM (ver analizador)
+                # y armar las solicitudes frecuentes con plantillas
+                from .analizador import ClienteSOAP as Cliente
+                kwargs = dict(analizar=self.AnalizadorRapido,
+                              plantillas=self.Plantillas)
+            else:
+                Cliente = SoapClient
+            self.client = Cliente(
                 wsdl = wsdl,        
                 cache = cache,
                 proxy = proxy_dict,
                 cacert = cacert,
                 timeout = timeout,
                 ns = ns, soap_server = soap_server, 
-                trace = "--trace" in sys.argv)
+                trace = "--trace" in sys.argv, **kwargs)
             self.cache = cache  # utilizado por WSLPG y WSAA (Ticket de Acceso)
             self.wsdl = wsdl    # utilizado por TrazaMed (para corregir el location)
+            if self.Concurrencia:
+                # límite adaptativo por servidor compartido (ver concurrencia)
+                if self.Concurrencia is True:
+                    limitadores = concurrencia.LIMITADORES
+                else:
+                    limitadores = self.Concurrencia
+                self.client.http = concurrencia.TransporteLimitado(
+                    self.client.http, limitadores)
+            if self.Cortacircuitos:
+                # circuito por servidor compartido (ver reintentos)
+                if self.Cortacircuitos is True:
+                    cortacircuitos = reintentos.CORTACIRCUITOS
+                else:
+                    cortacircuitos = self.Cortacircuitos
+                self.client.http = reintentos.TransporteProtegido(
+                    self.client.http, cortacircuitos)
             # corrijo ubicación del servidor (puerto http 80 en el WSDL AFIP)
             for service in list(self.client.services.values()):
                 for port  in list(service['ports'].values()):
                     location = port['location']
-                    if location and location.startswith("http://"):
+                    # no corregir servidores locales por http (ej. simulador)
+                    if location and location.startswith("http://") and \
+                       not (wsdl.startswith("http://") and
+                            es_local(wsdl) and es_local(location)):
                         warnings.warn("Corrigiendo WSDL ... %s" % location)
                         location = location.replace("http://", "https://").replace(":80", ":443")
                         # usar servidor real si en el WSDL figura "localhost"
@@ -308,19 +417,18 @@ class BaseWS:
         "Dejar mensaje en bitacora de depuración (método interno)"
         if not isinstance(msg, str):
             msg = str(msg, 'utf8', 'ignore')
-        if not self.Log:
-            self.Log = StringIO()
-        self.Log.write(msg)
-        self.Log.write('\n\r')
+        if self.Log is None:
+            # sólo se conservan los últimos mensajes (memoria acotada)
+            self.Log = collections.deque(maxlen=LOG_MAXIMO)
+        self.Log.append(msg)
         if DEBUG:
             warnings.warn(msg)
 
     def DebugLog(self):
         "Devolver y limpiar la bitácora de depuración"
         if self.Log:
-            msg = self.Log.getvalue()
+            msg = "".join(["%s\n\r" % linea for linea in self.Log])
             # limpiar log
-            self.Log.close()
             self.Log = None
         else:
             msg = ''
@@ -353,6 +461,7 @@ class BaseWS:
                 xml = self.XmlResponse 
             elif xml=='XmlRequest':
                 xml = self.XmlRequest 
+            from pysimplesoap.simplexml import SimpleXMLElement
             self.xml = SimpleXMLElement(xml)
             return True
         except Exception as e:
@@ -384,6 +493,7 @@ class BaseWS:
     def SetTicketAcceso(self, ta_string):
         "Establecer el token y sign desde un ticket de acceso XML"
         if ta_string:
+            from pysimplesoap.simplexml import SimpleXMLElement
             ta = SimpleXMLElement(ta_string)
             self.Token = str(ta.credentials.token)
             self.Sign = str(ta.credentials.sign)
@@ -434,85 +544,161 @@ class FileBufferString:
         self.content = content
         self.contenttype = contenttype
 
+class WebResponse(dict):
+    "HTTP response headers (lowercase keys, compatible with httplib2.Response)"
+
+    def __init__(self, response):
+        dict.__init__(self)
+        for key, value in response.getheaders():
+            key = key.lower()
+            # join repeated headers (i.e. set-cookie) like httplib2
+            self[key] = self[key] + ", " + value if key in self else value
+        self.status = response.status
+        self.reason = response.reason
+        self.version = response.version
+        self['status'] = str(response.status)
+
+
+class MultipartBody:
+    "Multipart encoded FORM data streamed in blocks (files are not loaded)"
+
+    def __init__(self, boundary, parts):
+        self.boundary = boundary
+        self.parts = parts          # bytes or (file, size) to be streamed
+        self.size = sum([len(part) if isinstance(part, bytes) else part[1]
+                         for part in parts])
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # re-iterable (files are rewinded) to resend over a new connection
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                fd = part[0]
+                fd.seek(0)
+                while True:
+                    block = fd.read(WebClient.block_size)
+                    if not block:
+                        break
+                    yield block
+
+    def __str__(self):
+        return "".join([part.decode("utf8", "replace")
+                        if isinstance(part, bytes) else
+                        "<%s: %d bytes>\r\n" % (part[0].name, part[1])
+                        for part in self.parts])
+
+
 class WebClient:
     "Minimal webservice client to do POST request with multipart encoded FORM data"
 
+    block_size = 65536      # bytes read / written at once (files, downloads)
+
     def __init__(self, location, enctype="multipart/form-data", trace=False,
                        cacert=None, timeout=30):
-        kwargs = {}
-        if httplib2.__version__ >= '0.3.0':
-                kwargs['timeout'] = timeout
-
-        kwargs['disable_ssl_certificate_validation'] = cacert is None
-        kwargs['ca_certs'] = cacert
-
-        self.http = httplib2.Http(**kwargs)
+        import ssl
+        if cacert is None:
+            self.context = ssl.create_default_context()
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE
+        else:
+            self.context = ssl.create_default_context(cafile=cacert)
+        self.timeout = timeout
+        self.connection = None      # persistent (reused between calls)
+        self.server = None
         self.trace = trace
         self.location = location
         self.enctype = enctype
         self.cookies = None
         self.method = "POST"
         self.referer = None
+        self.response = None
+        self.content = None
 
     def multipart_encode(self, vars):
-        "Enconde form data (vars dict)"
+        "Enconde form data (vars dict) as a streamed body with known length"
+        import mimetypes
+        from email.generator import _make_boundary
         boundary = _make_boundary()
-        buf = StringIO()
+        parts = []
         for key, value in list(vars.items()):
             if not (isinstance(value, IOBase) or isinstance(value, FileBufferString)):
-                buf.write('--%s\r\n' % boundary)
-                buf.write('Content-Disposition: form-data; name="%s"' % key)
-                buf.write('\r\n\r\n' + value + '\r\n')
+                parts.append(('--%s\r\n'
+                              'Content-Disposition: form-data; name="%s"'
+                              '\r\n\r\n%s\r\n' % (boundary, key, value)).encode("utf8"))
+                continue
+            if isinstance(value, FileBufferString):
+                filename = value.name
+                contenttype = value.contenttype
+                content = value.content
+                if isinstance(content, str):
+                    content = content.encode("utf8")
             else:
-                if isinstance(value, FileBufferString):
-                    filename = value.name
-                    contenttype = value.contenttype
-                    file_size = 0
-                    content = value.content
-                else:
-                    fd = value
-                    file_size = os.fstat(fd.fileno())[stat.ST_SIZE]
-                    filename = os.path.basename(fd.name)
-                    contenttype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
-                    fd.seek(0)
-                    content = fd.read()
-
-                buf.write('--%s\r\n' % boundary)
-                buf.write('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (key, filename))
-                buf.write('Content-Type: %s\r\n' % contenttype)
-                # if file_size:
-                #     buffer += 'Content-Length: %s\r\n' % file_size
-                buf.write('\r\n' + content + '\r\n')
-
-        buf.write('--' + boundary + '--\r\n\r\n')
-        buf = buf.getvalue()
-        return boundary, buf
+                # send the file as is (raw bytes, even if opened in text mode)
+                fd = getattr(value, "buffer", value)
+                file_size = os.fstat(fd.fileno())[stat.ST_SIZE]
+                filename = os.path.basename(value.name)
+                contenttype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                content = (fd, file_size)
+            parts.append(('--%s\r\n'
+                          'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                          'Content-Type: %s\r\n\r\n' % (
+                          boundary, key, filename, contenttype)).encode("utf8"))
+            parts.append(content)
+            parts.append(b'\r\n')
+        parts.append(('--' + boundary + '--\r\n\r\n').encode("utf8"))
+        return boundary, MultipartBody(boundary, parts)
+
+    def connect(self, url):
+        "Open (or reuse) the persistent connection to the server"
+        import http.client
+        server = (url.scheme, url.netloc)
+        if self.connection is None or self.server != server:
+            self.close()
+            if url.scheme == "https":
+                self.connection = http.client.HTTPSConnection(
+                    url.netloc, timeout=self.timeout, context=self.context)
+            else:
+                self.connection = http.client.HTTPConnection(
+                    url.netloc, timeout=self.timeout)
+            self.server = server
+        return self.connection
 
-    def __call__(self, *args, **vars):
-        "Perform a GET/POST request and return the response"
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, *args, **vars):
+        "Send the GET/POST request, return the response (body not read yet)"
+        import http.client
+        from http.cookies import SimpleCookie
 
         location = self.location
-        if isinstance(location, str):
-            location = location.encode("utf8")
+        if isinstance(location, bytes):
+            location = location.decode("utf8")
         # extend the base URI with additional components
         if args:
             location += "/".join(args)
-        if self.method == "GET":
+        if self.method == "GET" and vars:
             location += "?%s" % urlencode(vars)
-            
+
         # prepare the request content suitable to be sent to the server:
-        if self.enctype == "multipart/form-data":
-            boundary, body = self.multipart_encode(vars)
-            content_type = '%s; boundary=%s' % (self.enctype, boundary)
-        elif self.enctype == "application/x-www-form-urlencoded":
-            body = urlencode(vars)
-            content_type = self.enctype
-        else:
-            body = None
-            
-        # add headers according method, cookies, etc.:
-        headers={}        
+        body = None
         if self.method == "POST":
+            if self.enctype == "multipart/form-data":
+                boundary, body = self.multipart_encode(vars)
+                content_type = '%s; boundary=%s' % (self.enctype, boundary)
+            elif self.enctype == "application/x-www-form-urlencoded":
+                body = urlencode(vars).encode("utf8")
+                content_type = self.enctype
+
+        # add headers according method, cookies, etc.:
+        headers={}
+        if body is not None:
             headers.update({
                 'Content-type': content_type,
                 'Content-length': str(len(body)),
@@ -527,18 +713,33 @@ class WebClient:
             print("%s %s" % (self.method, location))
             print('\n'.join(["%s: %s" % (k,v) for k,v in list(headers.items())]))
             print("\n%s" % body)
-        
-        # send the request to the server and store the result:
-        response, content = self.http.request(
-            location.decode('utf-8'), self.method, body=body, headers=headers )
-        self.response = response
-        self.content = content
 
-        if self.trace: 
-            print() 
-            print('\n'.join(["%s: %s" % (k,v) for k,v in list(response.items())]))
-            print(content)
-            print("="*80)
+        # send the request to the server (reusing the connection if possible):
+        url = urlparse(location)
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+        for retry in (True, False):
+            reused = self.connection is not None
+            connection = self.connect(url)
+            try:
+                connection.request(self.method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError):
+                # the server closed the idle connection: retry with a new one
+                self.close()
+                if not (retry and reused):
+                    raise
+            except Exception:
+                self.close()
+                raise
+        self.response = WebResponse(response)
+
+        if self.trace:
+            print()
+            print('\n'.join(["%s: %s" % (k,v) for k,v in list(self.response.items())]))
 
         # Parse and store the cookies (if any)
         if "set-cookie" in self.response:
@@ -546,35 +747,86 @@ class WebClient:
                 self.cookies = SimpleCookie()
             self.cookies.load(self.response["set-cookie"])
 
+        return response
+
+    def read(self, response, write):
+        "Read the response body in blocks (chunked or not), call write(block)"
+        try:
+            while True:
+                block = response.read(self.block_size)
+                if not block:
+                    break
+                write(block)
+        except Exception:
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+
+    def __call__(self, *args, **vars):
+        "Perform a GET/POST request and return the response"
+        blocks = []
+        self.read(self.request(*args, **vars), blocks.append)
+        content = self.content = b"".join(blocks)
+
+        if self.trace:
+            print(content)
+            print("="*80)
+
         return content
 
+    def download(self, destination, *args, **vars):
+        "Perform a GET/POST request and write the response (file or callback)"
+        # destination: filename, file-like object or function (for each block)
+        self.content = None
+        response = self.request(*args, **vars)
+        if callable(destination):
+            self.read(response, destination)
+        elif hasattr(destination, "write"):
+            self.read(response, destination.write)
+        else:
+            with open(destination, "wb") as f:
+                self.read(response, f.write)
+
+        if self.trace:
+            print("<%s: %s bytes>" % (destination, self.response.get("content-length", "?")))
+            print("="*80)
+
+        return self.response
+
 
 class AttrDict(dict):
     "Custom Dict to hold attributes and items"
 
 
-class HTMLFormParser(HTMLParser):
-    "Convert HTML form into custom named-tuple dicts"
+def html_form_parser():
+    "Define HTMLFormParser (importa html.parser sólo si se usa)"
+    from html.parser import HTMLParser
+
+    class HTMLFormParser(HTMLParser):
+        "Convert HTML form into custom named-tuple dicts"
     
-    def __init__(self, *args, **kwargs):
-        HTMLParser.__init__(self, *args, **kwargs)
-        self.forms = {}
+        def __init__(self, *args, **kwargs):
+            HTMLParser.__init__(self, *args, **kwargs)
+            self.forms = {}
         
-    def handle_starttag(self, tag, attrs):
-        attrs = dict(attrs)
-        if 'name' in attrs:
-            name = attrs['name']
-        elif 'id' in attrs:
-            name = attrs['id']
-        else:
-            name = None
-        if tag == 'form':
-            form = AttrDict()
-            for k, v in list(attrs.items()):
-                setattr(form, "_%s" % k, v)
-            self.form = self.forms[name or len(self.forms)] = form
-        elif tag == 'input':
-            self.form[name or len(self.form)] = attrs.get('value')
+        def handle_starttag(self, tag, attrs):
+            attrs = dict(attrs)
+            if 'name' in attrs:
+                name = attrs['name']
+            elif 'id' in attrs:
+                name = attrs['id']
+            else:
+                name = None
+            if tag == 'form':
+                form = AttrDict()
+                for k, v in list(attrs.items()):
+                    setattr(form, "_%s" % k, v)
+                self.form = self.forms[name or len(self.forms)] = form
+            elif tag == 'input':
+                self.form[name or len(self.form)] = attrs.get('value')
+
+    return HTMLFormParser
 
 
 # Funciones para manejo de archivos de texto de campos de ancho fijo:
@@ -618,7 +870,7 @@ def leer(linea, formato, expandir_fechas=False):
                     valor = "%s-%s-%s" % (valor[0:4], valor[4:6], valor[6:8])
                 else:
                     valor = None
-            else:
+            elif isinstance(valor, bytes):
                 valor = valor.decode("ascii","ignore")
             dic[clave] = valor
             comienzo += longitud
@@ -639,8 +891,8 @@ def escribir(dic, formato, contraer_fechas=False):
             if clave.capitalize() in dic:
                 clave = clave.capitalize()
             s = dic.get(clave,"")
-            if isinstance(s, str):
-                s = s.encode("latin1")
+            if isinstance(s, bytes):
+                s = s.decode("latin1")
             if s is None:
                 valor = ""
             else:
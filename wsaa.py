@@ -23,20 +23,26 @@ __version__ = "2.11c"
 
 import hashlib, datetime, email, os, sys, time, traceback, warnings
 import unicodedata
-from pysimplesoap.client import SimpleXMLElement
 from .utils import inicializar_y_capturar_excepciones, BaseWS, get_install_dir, \
      exception_info, safe_console, date
-from dicttoxml import dicttoxml
-try:
-    from M2Crypto import BIO, Rand, SMIME, SSL
-except ImportError:
-    ex = exception_info()
-    warnings.warn("No es posible importar M2Crypto (OpenSSL)")
-    warnings.warn(ex['msg'])            # revisar instalacin y DLLs de OpenSSL
-    BIO = Rand = SMIME = SSL = None
-    # utilizar alternativa (ejecutar proceso por separado) 
-    from subprocess import Popen, PIPE
-    from base64 import b64encode
+
+# M2Crypto, pysimplesoap y dicttoxml se importan al usarlos (ver
+# importar_m2crypto), para no demorar el inicio si el TA est en cache
+BIO = Rand = SMIME = SSL = False
+
+
+def importar_m2crypto():
+    "Importa M2Crypto al firmar (una sola vez), devuelve si est disponible"
+    global BIO, Rand, SMIME, SSL
+    if BIO is False:
+        try:
+            from M2Crypto import BIO, Rand, SMIME, SSL
+        except ImportError:
+            ex = exception_info()
+            warnings.warn("No es posible importar M2Crypto (OpenSSL)")
+            warnings.warn(ex['msg'])    # revisar instalacin y DLLs de OpenSSL
+            BIO = Rand = SMIME = SSL = None
+    return BIO is not None
 
 # Constantes (si se usa el script de linea de comandos)
 WSDL = "https://wsaahomo.afip.gov.ar/ws/services/LoginCms?wsdl"  # El WSDL correspondiente al WSAA 
@@ -63,6 +69,7 @@ DEBUG = False
 
 def create_tra(service=SERVICE,ttl=2400):
     "Crear un Ticket de Requerimiento de Acceso (TRA)"
+    from pysimplesoap.simplexml import SimpleXMLElement
     tra = SimpleXMLElement(
         '<?xml version="1.0" encoding="UTF-8"?>'
         '<loginTicketRequest version="1.0">'
@@ -80,7 +87,7 @@ def create_tra(service=SERVICE,ttl=2400):
 def sign_tra(tra,cert=CERT,privatekey=PRIVATEKEY,passphrase=""):
     "Firmar PKCS#7 el TRA y devolver CMS (recortando los headers SMIME)"
 
-    if BIO:
+    if importar_m2crypto():
         # Firmar el texto (tra) usando m2crypto (openssl bindings para python)
         buf = BIO.MemoryBuffer(bytes(tra, 'utf8'))             # Crear un buffer desde el texto
         #Rand.load_file('randpool.dat', -1)     # Alimentar el PRNG
@@ -112,6 +119,9 @@ def sign_tra(tra,cert=CERT,privatekey=PRIVATEKEY,passphrase=""):
                 return part.get_payload(decode=False)   # devolver CMS
     else:
         # Firmar el texto (tra) usando OPENSSL directamente
+        # utilizar alternativa (ejecutar proceso por separado) 
+        from subprocess import Popen, PIPE
+        from base64 import b64encode
         try:
             if sys.platform.startswith("linux"):
                 openssl = "openssl"
@@ -202,7 +212,7 @@ class WSAA(BaseWS):
     def CrearClavePrivada(self, filename="privada.key", key_length=4096, 
                                 pub_exponent=0x10001, passphrase=""):
         "Crea una clave privada (private key)"
-        from M2Crypto import RSA, EVP
+        from M2Crypto import BIO, RSA, EVP
         
         # only protect if passphrase was given (it will fail otherwise)
         callback = lambda *args, **kwarg: passphrase
@@ -265,6 +275,7 @@ class WSAA(BaseWS):
         "Obtener ticket de autorizacin (TA)"
         results = self.client.loginCms(in0=str(cms))
         ta_xml = results['loginCmsReturn'] #.encode("utf-8")
+        from pysimplesoap.simplexml import SimpleXMLElement
         self.xml = ta = SimpleXMLElement(ta_xml)
         self.Token = str(ta.credentials.token)
         self.Sign = str(ta.credentials.sign)
@@ -276,6 +287,8 @@ class WSAA(BaseWS):
         "Obtener ticket de autorizacin (TA)"
         results = self.client.getLoginTicketFromCMS(cms)
         ltr = results.get('loginTicketResponse', [])
+        from dicttoxml import dicttoxml
+        from pysimplesoap.simplexml import SimpleXMLElement
         ta_xml = dicttoxml(ltr, custom_root='loginCmsReturn', attr_type=False)
         self.xml = ta = SimpleXMLElement(ta_xml)
         self.token = str(ta.credentials.token)
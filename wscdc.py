@@ -21,6 +21,7 @@ __license__ = "GPL 3.0"
 __version__ = "1.02e"
 
 import sys, os, time
+import queue, shelve, threading
 from configparser import SafeConfigParser
 from .utils import inicializar_y_capturar_excepciones, BaseWS, get_install_dir
 from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json
@@ -29,6 +30,7 @@ from .utils import leer, escribir, leer_dbf, guardar_dbf, N, A, I, json
 # Constantes (si se usa el script de linea de comandos)
 WSDL = "https://wswhomo.afip.gov.ar/WSCDC/service.asmx?WSDL" 
 HOMO = False
+DEBUG = False
 CONFIG_FILE = "rece.ini"
 
 # No debera ser necesario modificar nada despues de esta linea
@@ -93,7 +95,7 @@ class WSCDC(BaseWS):
     def inicializar(self):
         BaseWS.inicializar(self)
         self.AppServerStatus = self.DbServerStatus = self.AuthServerStatus = None
-        self.Resultado = self.EmisionTipo = "" 
+        self.Resultado = self.EmisionTipo = self.FchProceso = "" 
         self.CAI = self.CAE = self.CAEA = self.Vencimiento = ''
         self.CbteNro = self.PuntoVenta = self.ImpTotal = None
 
@@ -244,6 +246,24 @@ def escribir_archivo(dic, nombre_archivo, agrega=True):
     archivo.close()
 
 
+def escribir_lote(regs, nombre_archivo):
+    "Graba los resultados de la constatacin masiva, devuelve la cantidad"
+    if '--json' in sys.argv:
+        # una nica lista JSON (no un json.dump por comprobante)
+        from .formatos.formato_json import Escritor
+        with Escritor(nombre_archivo) as escritor:
+            for dic in regs:
+                escritor.escribir(dic)
+        return escritor.cantidad
+    if os.path.exists(nombre_archivo):
+        os.unlink(nombre_archivo)
+    cantidad = 0
+    for dic in regs:
+        escribir_archivo(dic, nombre_archivo)
+        cantidad += 1
+    return cantidad
+
+
 def leer_archivo(nombre_archivo):
     archivo = open(nombre_archivo, "r")
     if '--json' in sys.argv:
@@ -269,6 +289,162 @@ def leer_archivo(nombre_archivo):
     return dic
 
 
+def iterar_archivo(nombre_archivo):
+    "Devuelve los comprobantes del archivo de intercambio (de a uno)"
+    if '--json' in sys.argv:
+        with open(nombre_archivo, "r") as archivo:
+            dic = json.load(archivo)
+        for reg in (dic if isinstance(dic, list) else [dic]):
+            yield reg
+    elif '--dbf' in sys.argv:
+        # cada fila de la tabla es un comprobante
+        regs = []
+        leer_dbf([('Encabezado', ENCABEZADO, regs)], conf_dbf)
+        for reg in regs:
+            yield reg
+    else:
+        with open(nombre_archivo, "r") as archivo:
+            for linea in archivo:
+                if str(linea[0])=='0':
+                    yield leer(linea, ENCABEZADO)
+                elif str(linea[0]) not in "OVE\r\n":
+                    # las observaciones / errores (salida) se ignoran
+                    print("Tipo de registro incorrecto:", linea[0])
+
+
+def clave_comprobante(reg):
+    "Devuelve la clave nica del comprobante (emisor, pto vta, tipo, nro, CAE)"
+    return "%s|%s|%s|%s|%s" % (
+        str(reg['cuit_emisor']).strip(), int(reg['pto_vta']), 
+        int(reg['cbte_tipo']), int(reg['cbte_nro']), 
+        str(reg['cod_autorizacion']).strip())
+
+
+def constatar(wscdc, reg):
+    "Constata el comprobante y completa el registro con la respuesta de AFIP"
+    wscdc.ConstatarComprobante(**reg)
+    # actualizar el diccionario con los datos de devueltos por AFIP
+    reg.update({'resultado': wscdc.Resultado,
+                'fch_proceso': wscdc.FchProceso,
+                })
+    reg['observaciones'] = wscdc.observaciones
+    reg['errores'] = wscdc.errores
+    return reg
+
+
+class LimiteTasa:
+    "Limita la cantidad de consultas por segundo (compartido entre hilos)"
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo
+        self.proximo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def esperar(self):
+        "Bloquea hasta que corresponda realizar la prxima consulta"
+        with self.lock:
+            ahora = time.monotonic()
+            espera = self.proximo - ahora
+            self.proximo = max(ahora, self.proximo) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+
+def constatar_lote(regs, crear_wscdc, cache=None, hilos=4, por_segundo=None):
+    "Constata los comprobantes (sin repetir, en paralelo), genera los resultados"
+    # crear_wscdc: funcin que devuelve una interfaz conectada y autenticada
+    #              (cada hilo usa la suya, el cliente SOAP no es compartible)
+    # cache: diccionario persistente (shelve) con las constataciones previas
+    # los resultados se devuelven a medida que se obtienen (no en orden)
+    # hilos es el mximo: las solicitudes simultneas al servidor las ajusta
+    # el limitador adaptativo compartido por las interfaces (ver concurrencia)
+    # si falla la lectura u otro hilo, la excepcin se relanza al finalizar
+    pendientes = queue.Queue(hilos * 2)
+    resultados = queue.Queue()
+    lock = threading.Lock()
+    limite = por_segundo and LimiteTasa(por_segundo)
+    fallas = []
+    FIN = None
+
+    def leer_pendientes():
+        vistos = set()
+        try:
+            for reg in regs:
+                clave = clave_comprobante(reg)
+                if clave in vistos:
+                    continue
+                vistos.add(clave)
+                with lock:
+                    previo = cache.get(clave) if cache is not None else None
+                if previo is not None:
+                    reg.update(previo)
+                    resultados.put(reg)
+                else:
+                    pendientes.put((clave, reg))
+        except BaseException as e:
+            fallas.append(e)
+        finally:
+            for i in range(hilos):
+                pendientes.put(FIN)
+
+    def procesar():
+        wscdc = None
+        try:
+            while True:
+                item = pendientes.get()
+                if item is FIN:
+                    break
+                clave, reg = item
+                try:
+                    if wscdc is None:
+                        wscdc = crear_wscdc()
+                    if limite:
+                        limite.esperar()
+                    constatar(wscdc, reg)
+                except Exception as e:
+                    # no detener el lote (se informa en el comprobante)
+                    reg.update({'resultado': '', 'fch_proceso': '', 
+                                'observaciones': [], 'errores': []})
+                    reg['errores'].append({'code': -1, 'msg': str(e)})
+                    wscdc = None
+                else:
+                    if wscdc.Excepcion:
+                        reg['errores'].append({'code': -1, 
+                                               'msg': wscdc.Excepcion})
+                    elif reg['resultado'] and not reg['errores'] and cache is not None:
+                        # solo se guardan las respuestas definitivas de AFIP
+                        with lock:
+                            cache[clave] = {'resultado': reg['resultado'],
+                                        'fch_proceso': reg['fch_proceso'],
+                                        'observaciones': reg['observaciones'],
+                                        'errores': []}
+                resultados.put(reg)
+        except BaseException as e:
+            fallas.append(e)
+            # descartar los pendientes para no bloquear al lector
+            while pendientes.get() is not FIN:
+                pass
+        finally:
+            resultados.put(FIN)
+
+    lector = threading.Thread(target=leer_pendientes)
+    lector.daemon = True
+    lector.start()
+    trabajadores = [threading.Thread(target=procesar) for i in range(hilos)]
+    for hilo in trabajadores:
+        hilo.daemon = True
+        hilo.start()
+    activos = hilos
+    while activos:
+        reg = resultados.get()
+        if reg is FIN:
+            activos -= 1
+        else:
+            yield reg
+    if fallas:
+        raise fallas[0]
+
+
 def main():
     "Funcion principal para utilizar la interfaz por linea de comando"
 
@@ -330,7 +506,36 @@ def main():
     wscdc.SetTicketAcceso(ta)
     wscdc.Cuit = cuit
 
-    if "--constatar" in sys.argv:
+    if "--constatar" in sys.argv and "--lote" in sys.argv:
+        # constatacin masiva de todos los comprobantes del archivo
+        hilos = int(config.get('WSCDC', 'HILOS') 
+                    if config.has_option('WSCDC', 'HILOS') else 4)
+        por_segundo = float(config.get('WSCDC', 'POR_SEGUNDO') 
+                    if config.has_option('WSCDC', 'POR_SEGUNDO') else 10)
+        archivo_cache = (config.get('WSCDC', 'CACHE') 
+                    if config.has_option('WSCDC', 'CACHE') 
+                    else "constataciones.dat")
+
+        def crear_wscdc():
+            nuevo = WSCDC()
+            nuevo.Conectar("", url_wscdc)
+            nuevo.SetTicketAcceso(ta)
+            nuevo.Cuit = cuit
+            return nuevo
+
+        cache = shelve.open(archivo_cache)
+        try:
+            def constatados():
+                for dic in constatar_lote(iterar_archivo(ENTRADA), crear_wscdc,
+                                          cache, hilos, por_segundo):
+                    if DEBUG: print(clave_comprobante(dic), dic['resultado'])
+                    yield dic
+            cantidad = escribir_lote(constatados(), SALIDA)
+        finally:
+            cache.close()
+        print("Comprobantes constatados:", cantidad)
+
+    elif "--constatar" in sys.argv:
         if len(sys.argv) < 8:
             if "--prueba" in sys.argv:
                 dic = dict(
@@ -351,13 +556,7 @@ def main():
                 # leer archivo de intercambio:
                 dic = leer_archivo(ENTRADA)
             # constatar el comprobante
-            wscdc.ConstatarComprobante(**dic)
-            # actualizar el diccionario con los datos de devueltos por AFIP
-            dic.update({'resultado': wscdc.Resultado,
-                        'fch_proceso': wscdc.FchProceso,
-                        })
-            dic['observaciones'] = wscdc.observaciones
-            dic['errores'] = wscdc.errores
+            constatar(wscdc, dic)
             escribir_archivo(dic, SALIDA)
         else:
             # usar los datos pasados por linea de comandos:
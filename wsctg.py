@@ -70,7 +70,6 @@ Ver wsctg.ini para parámetros de configuración (URL, certificados, etc.)"
 import os, sys, time, base64
 from .utils import date
 import traceback
-from pysimplesoap.client import SoapFault
 from . import utils
 
 # importo funciones compartidas:
@@ -1184,7 +1183,7 @@ if __name__ == '__main__':
             
         print("hecho.")
         
-    except SoapFault as e:
+    except utils.SoapFault as e:
         print("Falla SOAP:", e.faultcode, e.faultstring.encode("ascii","ignore"))
         sys.exit(3)
     except Exception as e:
@@ -93,6 +93,7 @@ class WSFEv1(BaseWS):
     LanzarExcepciones = LANZAR_EXCEPCIONES
     factura = None
     facturas = None
+    Plantillas = ("FECAESolicitar", )    # sobre SOAP precompilado
 
     def inicializar(self):
         BaseWS.inicializar(self)
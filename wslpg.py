@@ -57,6 +57,9 @@ Opciones:
   --pdf: genera el formulario C 1116 B en formato PDF
   --mostrar: muestra el documento PDF generado (usar con --pdf)
   --imprimir: imprime el documento PDF generado (usar con --mostrar y --pdf)
+  --lote patron: (con --pdf) genera los PDF de todas las liquidaciones de los
+    archivos que coinciden con el patrón (ej. "liq_*.json"), en paralelo
+  --procesos N: (con --lote) cantidad de procesos (predeterminado: CPUs)
 
   --autorizar-lsg: Autoriza una Liquidación Secundaria de Granos (lsgAutorizar)
     --lsg --anular: Anula una LSG (lsgAnular)
@@ -98,8 +101,6 @@ import decimal, datetime
 import traceback
 import pprint
 import warnings
-from pysimplesoap.client import SoapFault
-from fpdf import Template
 from . import utils
 
 # importo funciones compartidas:
@@ -512,6 +513,9 @@ class WSLPG(BaseWS):
     HOMO = HOMO
     WSDL = WSDL
     LanzarExcepciones = False
+    # sobre SOAP precompilado: desactivado hasta verificarlo contra el WSDL
+    # (ej. Plantillas = ("liquidacionAutorizar", ), ver plantillas_soap)
+    Plantillas = ()
     Version = "%s %s" % (__version__, HOMO and 'Homologación' or '')
 
     def inicializar(self):
@@ -2649,19 +2653,10 @@ class WSLPG(BaseWS):
         if DEBUG: print("abriendo archivo ", archivo)
         # inicializo la lista de los elementos:
         self.elements = []
-        for lno, linea in enumerate(open(archivo.encode('latin1')).readlines()):
-            if DEBUG: print("procesando linea ", lno, linea)
-            args = []
-            for i,v in enumerate(linea.split(";")):
-                if not v.startswith("'"): 
-                    v = v.replace(",",".")
-                else:
-                    v = v#.decode('latin1')
-                if v.strip()=='':
-                    v = None
-                else:
-                    v = eval(v.strip())
-                args.append(v)
+        # la planilla se analiza una sola vez (ver pyfepdf.leer_formato)
+        from .pyfepdf import leer_formato     # importa fpdf (sólo para PDF)
+        for args in leer_formato(archivo):
+            args = list(args)
 
             # corrijo path relativo para las imágenes:
             if args[1] == 'I':
@@ -2696,7 +2691,7 @@ class WSLPG(BaseWS):
         # convierto colores de string (en hexadecimal)
         if isinstance(foreground, str): foreground = int(foreground, 16)
         if isinstance(background, str): background = int(background, 16)
-        if isinstance(text, str): text = text.encode("latin1")
+        if isinstance(text, bytes): text = text.decode("latin1")
         field = {
                 'name': nombre, 
                 'type': tipo, 
@@ -2713,8 +2708,9 @@ class WSLPG(BaseWS):
     def CrearPlantillaPDF(self, papel="A4", orientacion="portrait"):
         "Iniciar la creación del archivo PDF"
         
-        # genero el renderizador con propiedades del PDF
-        t = Template(
+        # genero el renderizador con propiedades del PDF (imágenes en cache)
+        from .pyfepdf import Plantilla
+        t = Plantilla(
                  format=papel, orientation=orientacion,
                  title="F 1116 B/C %s" % (self.NroOrden),
                  author="CUIT %s" % self.Cuit,
@@ -2795,7 +2791,9 @@ class WSLPG(BaseWS):
                 cod_prov = int(cod_prov)
                 cod_localidad = str(cod_localidad)
                 provincia = datos.PROVINCIAS[cod_prov]
-                localidad = self.BuscarLocalidades(cod_prov, cod_localidad)
+                # sin conexión (ej. generación por lotes) solo usar la cache
+                localidad = self.BuscarLocalidades(cod_prov, cod_localidad,
+                                        consultar=self.client is not None)
                 return localidad, provincia                
 
             # divido los datos adicionales (debe haber renglones 1 al 9):
@@ -2977,7 +2975,12 @@ class WSLPG(BaseWS):
     def GenerarPDF(self, archivo="", dest="F"):
         "Generar archivo de salida en formato PDF"
         try:
-            self.template.render(archivo, dest=dest)
+            if hasattr(archivo, "write"):
+                # archivo en memoria (BytesIO, respuesta web, etc.)
+                pdf = self.template.render("", dest="S")
+                archivo.write(pdf.encode("latin1"))
+            else:
+                self.template.render(archivo, dest=dest)
             return True
         except Exception as e:
             self.Excepcion = str(e)
@@ -2985,12 +2988,8 @@ class WSLPG(BaseWS):
 
     def MostrarPDF(self, archivo, imprimir=False):
         try:
-            if sys.platform=="linux2":
-                os.system("evince ""%s""" % archivo)
-            else:
-                operation = imprimir and "print" or ""
-                os.startfile(archivo, operation)
-            return True
+            from .pyfepdf import mostrar_pdf
+            return mostrar_pdf(archivo, imprimir)
         except Exception as e:
             self.Excepcion = str(e)
             return False
@@ -3194,6 +3193,131 @@ def leer_archivo(nombre_archivo):
     return dic
     
 
+# Generación de formularios C 1116 B/C (individual o por lotes):
+
+def nombre_archivo_pdf(liq, conf_liq):
+    "Arma la ruta del PDF según los datos de la liquidación y la configuración"
+    d = os.path.join(conf_liq.get('directorio', "."), 
+                     liq['fecha_liquidacion'].replace("-", "_"))
+    if not os.path.isdir(d):
+        if DEBUG: print("Creando directorio!", d) 
+        os.makedirs(d, exist_ok=True)
+    fs = conf_liq.get('archivo','pto_emision,nro_orden').split(",")
+    fn = '_'.join([str(liq.get(ff,ff)) for ff in fs])
+    fn = fn.encode('ascii', 'replace').decode('ascii').replace('?','_')
+    return os.path.join(d, "%s.pdf" % fn)
+
+
+def generar_pdf_liquidacion(wslpg, liq, conf_liq, conf_pdf, ajuste=False):
+    "Completa la plantilla con los datos de la liquidación y genera el PDF"
+    wslpg.params_out = liq
+
+    # establezco formatos (cantidad de decimales) según configuración:
+    wslpg.FmtCantidad = conf_liq.get("fmt_cantidad", "0.2")
+    wslpg.FmtPrecio = conf_liq.get("fmt_precio", "0.2")
+
+    # determino el formato según el tipo de liquidación y datos
+    if not ajuste:
+        # liquidación estándar
+        formatos = [('formato', '')]
+        copias = int(conf_liq.get("copias", 3))
+    else:
+        # ajustes (páginas distintas), revisar si hay debitos/creditos:
+        formatos = [('formato_ajuste_base', '')]
+        copias = 1
+        if liq['ajuste_debito']:
+            formatos.append(('formato_ajuste_debcred', 'ajuste_debito' ))
+        if liq['ajuste_credito']:
+            formatos.append(('formato_ajuste_debcred', 'ajuste_credito'))
+
+    wslpg.CrearPlantillaPDF(
+                papel=conf_liq.get("papel", "legal"), 
+                orientacion=conf_liq.get("orientacion", "portrait"),
+                )
+
+    salida = nombre_archivo_pdf(liq, conf_liq)
+    for num_formato, (formato, clave) in enumerate(formatos):
+        # cargo el formato CSV por defecto (liquidacion....csv)
+        wslpg.CargarFormatoPDF(conf_liq.get(formato))
+        
+        # datos fijos (configuracion):
+        for k, v in list(conf_pdf.items()):
+            wslpg.AgregarDatoPDF(k, v)
+
+        # datos adicionales (tipo de registro 9):
+        for dato in liq.get('datos', []):
+            wslpg.AgregarDatoPDF(dato['campo'], dato['valor'])
+            if DEBUG: print("DATO", dato['campo'], dato['valor'])
+
+        wslpg.ProcesarPlantillaPDF(num_copias=copias,
+                                lineas_max=int(conf_liq.get("lineas_max", 24)),
+                                qty_pos=conf_liq.get("cant_pos") or 'izq',
+                                clave=clave)
+        if wslpg.Excepcion:
+            print("EXCEPCION:", wslpg.Excepcion, file=sys.stderr)
+            if DEBUG: print(wslpg.Traceback, file=sys.stderr)
+
+        if num_formato == len(formatos) - 1:
+            dest = "F"  # si es el último, escribir archivo
+        else:
+            dest = ""   # sino, no escribir archivo todavía
+        wslpg.GenerarPDF(archivo=salida, dest=dest)
+        if DEBUG: print("Generando PDF", salida, dest)
+    return salida
+
+
+# configuración de cada proceso del lote (ver inicializar_lote):
+_LOTE = {}
+
+
+def inicializar_lote(conf_liq, conf_pdf, ajuste=False, localidades=None, 
+                     cuit=None):
+    "Establece la configuración del proceso (una vez, no por liquidación)"
+    if localidades is not None:
+        # copia de la cache de localidades (no compartir el shelve abierto)
+        from . import wslpg_datos as datos
+        datos.LOCALIDADES = localidades
+    _LOTE.update(conf_liq=conf_liq, conf_pdf=conf_pdf, ajuste=ajuste, 
+                 cuit=cuit)
+
+
+def generar_liquidacion(liq):
+    "Genera el PDF de una liquidación del lote, devuelve (archivo, páginas, error)"
+    try:
+        wslpg = WSLPG()
+        wslpg.Cuit = _LOTE['cuit'] or liq.get('cuit_comprador')
+        salida = generar_pdf_liquidacion(wslpg, liq, _LOTE['conf_liq'],
+                                         _LOTE['conf_pdf'], _LOTE['ajuste'])
+        if wslpg.Excepcion:
+            return None, 0, "%s: %s" % (liq.get('coe'), wslpg.Excepcion)
+        return salida, wslpg.template.pg_no, None
+    except Exception as e:
+        return None, 0, "%s: %s" % (liq.get('coe'), e)
+
+
+def generar_lote(liqs, conf_liq, conf_pdf, ajuste=False, procesos=None, 
+                 cuit=None):
+    "Genera los PDF de las liquidaciones (en paralelo), devuelve totales"
+    # la plantilla CSV y las imágenes se procesan una vez por proceso
+    from . import wslpg_datos as datos
+    from .pyfepdf import ejecutar_lote
+    localidades = dict(datos.LOCALIDADES)
+    cantidad = paginas = 0
+    errores = []
+    resultados = ejecutar_lote(generar_liquidacion, liqs, inicializar_lote,
+                               (conf_liq, conf_pdf, ajuste, localidades, 
+                                cuit), procesos)
+    for salida, n, error in resultados:
+        if error:
+            errores.append(error)
+            continue
+        cantidad += 1
+        paginas += n
+        if DEBUG: print("archivo generado", salida)
+    return cantidad, paginas, errores
+
+
+
 # busco el directorio de instalación (global para que no cambie si usan otra dll)
 INSTALL_DIR = WSLPG.InstallDir = get_install_dir()
 
@@ -4428,83 +4552,46 @@ if __name__ == '__main__':
 
         # Generación del PDF:
 
-        if '--pdf' in sys.argv:
+        if '--pdf' in sys.argv and '--lote' in sys.argv:
+
+            # genero los formularios de todas las liquidaciones (temporada)
+            import glob, time
+            conf_liq = dict(config.items('LIQUIDACION'))
+            conf_pdf = dict(config.items('PDF'))
+            patron = sys.argv[sys.argv.index("--lote") + 1]
+            if '--procesos' in sys.argv:
+                procesos = int(sys.argv[sys.argv.index("--procesos") + 1])
+            else:
+                procesos = None
+            liqs = (leer_archivo(fn) for fn in sorted(glob.glob(patron)))
+            inicio = time.time()
+            cantidad, paginas, errores = generar_lote(liqs, conf_liq, conf_pdf,
+                                                      '--ajuste' in sys.argv,
+                                                      procesos, CUIT)
+            for error in errores:
+                print("ERROR:", error, file=sys.stderr)
+            segundos = time.time() - inicio
+            print("Liquidaciones: %d, Páginas: %d, Tiempo: %.2f s (%.1f páginas/s)" % (
+                  cantidad, paginas, segundos, paginas / (segundos or 1)))
+
+        elif '--pdf' in sys.argv:
         
             # cargo los datos del archivo de salida:
-            liq = wslpg.params_out = leer_archivo(SALIDA)
+            liq = leer_archivo(SALIDA)
         
             conf_liq = dict(config.items('LIQUIDACION'))
             conf_pdf = dict(config.items('PDF'))
-        
-            # establezco formatos (cantidad de decimales) según configuración:
-            wslpg.FmtCantidad = conf_liq.get("fmt_cantidad", "0.2")
-            wslpg.FmtPrecio = conf_liq.get("fmt_precio", "0.2")
-
-            # determino el formato según el tipo de liquidación y datos
-            if '--ajuste' not in sys.argv:
-                # liquidación estándar
-                formatos = [('formato', '')]
-                copias = int(conf_liq.get("copias", 3))
-            else:
-                # ajustes (páginas distintas), revisar si hay debitos/creditos:
-                formatos = [('formato_ajuste_base', '')]
-                copias = 1
-                if liq['ajuste_debito']:
-                    formatos.append(('formato_ajuste_debcred', 'ajuste_debito' ))
-                if liq['ajuste_credito']:
-                    formatos.append(('formato_ajuste_debcred', 'ajuste_credito'))
-
-            wslpg.CrearPlantillaPDF(
-                        papel=conf_liq.get("papel", "legal"), 
-                        orientacion=conf_liq.get("orientacion", "portrait"),
-                        )
 
-            for num_formato, (formato, clave) in enumerate(formatos):
-                # cargo el formato CSV por defecto (liquidacion....csv)
-                wslpg.CargarFormatoPDF(conf_liq.get(formato))
-                
-                # datos fijos (configuracion):
-                for k, v in list(conf_pdf.items()):
-                    wslpg.AgregarDatoPDF(k, v)
-
-                # datos adicionales (tipo de registro 9):
-                for dato in liq.get('datos', []):
-                    wslpg.AgregarDatoPDF(dato['campo'], dato['valor'])
-                    if DEBUG: print("DATO", dato['campo'], dato['valor'])
-
-                wslpg.ProcesarPlantillaPDF(num_copias=copias,
-                                        lineas_max=int(conf_liq.get("lineas_max", 24)),
-                                        qty_pos=conf_liq.get("cant_pos") or 'izq',
-                                        clave=clave)
-                if wslpg.Excepcion:
-                    print("EXCEPCION:", wslpg.Excepcion, file=sys.stderr)
-                    if DEBUG: print(wslpg.Traceback, file=sys.stderr)
-
-                salida = conf_liq.get("salida", "")
-
-                # genero el nombre de archivo según datos de factura
-                d = os.path.join(conf_liq.get('directorio', "."), 
-                                 liq['fecha_liquidacion'].replace("-", "_"))
-                if not os.path.isdir(d):
-                    if DEBUG: print("Creando directorio!", d) 
-                    os.makedirs(d)
-                fs = conf_liq.get('archivo','pto_emision,nro_orden').split(",")
-                fn = '_'.join([str(liq.get(ff,ff)) for ff in fs])
-                fn = fn.encode('ascii', 'replace').replace('?','_')
-                salida = os.path.join(d, "%s.pdf" % fn)
-                if num_formato == len(formatos) - 1:
-                    dest = "F"  # si es el último, escribir archivo
-                else:
-                    dest = ""   # sino, no escribir archivo todavía
-                wslpg.GenerarPDF(archivo=salida, dest=dest)
-                print("Generando PDF", salida, dest)
+            salida = generar_pdf_liquidacion(wslpg, liq, conf_liq, conf_pdf,
+                                             '--ajuste' in sys.argv)
+            print("Generando PDF", salida)
             if '--mostrar' in sys.argv:
                 wslpg.MostrarPDF(archivo=salida,
                                  imprimir='--imprimir' in sys.argv)
 
         print("hecho.")
         
-    except SoapFault as e:
+    except utils.SoapFault as e:
         print("Falla SOAP:", e.faultcode, e.faultstring.encode("ascii","ignore"), file=sys.stderr)
         sys.exit(3)
     except Exception as e:
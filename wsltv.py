@@ -73,8 +73,6 @@ import os, sys, shelve
 import decimal, datetime
 import traceback
 import pprint
-from pysimplesoap.client import SoapFault
-from fpdf import Template
 from . import utils
 
 # importo funciones compartidas:
@@ -672,12 +670,8 @@ class WSLTV(BaseWS):
 
     def MostrarPDF(self, archivo, imprimir=False):
         try:
-            if sys.platform=="linux2":
-                os.system("evince ""%s""" % archivo)
-            else:
-                operation = imprimir and "print" or ""
-                os.startfile(archivo, operation)
-            return True
+            from .pyfepdf import mostrar_pdf
+            return mostrar_pdf(archivo, imprimir)
         except Exception as e:
             self.Excepcion = str(e)
             return False
@@ -1045,7 +1039,7 @@ if __name__ == '__main__':
 
         print("hecho.")
         
-    except SoapFault as e:
+    except utils.SoapFault as e:
         print("Falla SOAP:", e.faultcode, e.faultstring.encode("ascii","ignore"), file=sys.stderr)
         sys.exit(3)
     except Exception as e:
@@ -74,6 +74,7 @@ class WSMTXCA(BaseWS):
     Reprocesar = True  # recuperar automaticamente CAE emitidos
     LanzarExcepciones = LANZAR_EXCEPCIONES
     factura = None
+    Plantillas = ("autorizarComprobante", )    # sobre SOAP precompilado
 
     def inicializar(self):
         BaseWS.inicializar(self)